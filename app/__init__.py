@@ -6,6 +6,7 @@ from flask import Flask, jsonify, request, send_from_directory
 from flask_cors import CORS
 from werkzeug.exceptions import HTTPException
 
+from .metrics import install_request_metrics
 from .session_auth import active_session_guard
 
 
@@ -57,18 +58,8 @@ def configure_console_logging(app):
     logging.getLogger("werkzeug").setLevel(level)
 
 
-def create_app():
-    # Route modules import optional integrations (for example OpenAI).  Keep
-    # them out of the package import path so maintenance scripts can import
-    # lightweight modules such as ``app.db`` without needing those settings.
-    from .routes import register_blueprints
-
-    app = Flask(__name__)
-    app.config.update(DEBUG=False, TESTING=False)
-    configure_console_logging(app)
-
-    project_root = os.getcwd()
-    configured_origins = [
+def frontend_origins():
+    return [
         item.strip()
         for item in os.environ.get(
             "FRONTEND_ORIGINS",
@@ -83,6 +74,23 @@ def create_app():
         ).split(",")
         if item.strip()
     ]
+
+
+def create_app():
+    # Route modules import optional integrations (for example OpenAI).  Keep
+    # them out of the package import path so maintenance scripts can import
+    # lightweight modules such as ``app.db`` without needing those settings.
+    from .routes import register_blueprints
+
+    app = Flask(__name__)
+    app.config.update(DEBUG=False, TESTING=False)
+    configure_console_logging(app)
+    # Registered first so the timing covers the session guard and every
+    # other hook.
+    install_request_metrics(app)
+
+    project_root = os.getcwd()
+    configured_origins = frontend_origins()
     CORS(app, resources={r"/api/*": {"origins": configured_origins}})
     app.logger.info("Allowed frontend origins: %s", ", ".join(configured_origins))
 
@@ -181,6 +189,8 @@ def create_app():
 
         normalized = jsonify(payload)
         normalized.status_code = status
+        if "Retry-After" in response.headers:
+            normalized.headers["Retry-After"] = response.headers["Retry-After"]
         return normalized
 
     @app.after_request
@@ -0,0 +1,646 @@
+"""ASGI entry point: an event loop in front of the Flask app.
+
+``run.py`` serves Flask with a fixed waitress thread pool, so every Mongo
+round trip, LLM wait and video download holds a thread.  ``run_asgi.py``
+serves :class:`AsyncServingApp` instead (uvicorn), which splits requests
+three ways:
+
+* **Native async handlers** for the endpoints with the most concurrent
+  requests: video telemetry batches (``/api/video_rewatch_logs/batch``),
+  resume polling (``/api/video_rewatch_logs/resume``), hint state polling
+  (``/api/parsons/hint_state``) and file reads under ``/uploads`` and
+  ``/api/admin_upload/uploads`` (videos and subtitles, with ``Range``).
+  They use pymongo's ``AsyncMongoClient`` and the same validation and
+  payload helpers as the Flask views, so both modes return the same JSON.
+* **The slow lane**: AI-backed and long-running Flask views
+  (``SLOW_LANE_PATHS``) run in worker threads with their own limiter
+  (``ASGI_SLOW_LANE_THREADS``, default 64).  The LLM client is synchronous
+  throughout ``parsons_service``; a thread blocked on the model costs a
+  little memory, and the separate limiter keeps those waits from starving
+  ordinary requests.
+* **Everything else** goes through :class:`WSGIBridge` with
+  ``ASGI_BRIDGE_THREADS`` (default 16) worker threads.  Request bodies are
+  spooled to a temporary file before the view runs and responses stream
+  back chunk by chunk.
+
+Native handlers enforce the same single active session as
+:func:`app.session_auth.active_session_guard`, send the same CORS headers
+as flask-cors, and record the same request metrics under the Flask
+endpoint names.  CORS preflights are left to Flask.
+"""
+
+from __future__ import annotations
+
+import email.utils
+import json
+import mimetypes
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import anyio
+from anyio import from_thread, to_thread
+from pymongo import AsyncMongoClient
+from pymongo.errors import BulkWriteError, PyMongoError
+from werkzeug.security import safe_join
+
+from . import REQUEST_ERROR_MESSAGE, SERVER_ERROR_MESSAGE, create_app, frontend_origins
+from .db import DATABASE_NAME, MONGO_URI, client_options
+from .metrics import record_capacity, record_request, request_finished, request_started
+from .password_verify import shutdown_password_pool, warm_password_pool
+from .routes import admin_upload
+from .routes import parsons as parsons_routes
+from .routes import video_rewatch_logs as video_logs
+from .session_auth import (
+    AUTH_UNAVAILABLE_PAYLOAD,
+    FORBIDDEN_PAYLOAD,
+    SESSION_EXPIRED_PAYLOAD,
+    STUDENT_IDENTITY_MISMATCH_PAYLOAD,
+    identity_claims_match,
+    role_set,
+)
+from .video_playback_state import (
+    VIDEO_PLAYBACK_STATE_COLLECTION,
+    is_settled_state,
+    playback_state_key,
+    playback_state_operations,
+    read_playback_state,
+)
+
+
+BRIDGE_THREADS = max(4, int(os.environ.get("ASGI_BRIDGE_THREADS", "16")))
+SLOW_LANE_THREADS = max(4, int(os.environ.get("ASGI_SLOW_LANE_THREADS", "64")))
+SPOOL_MAX_BYTES = 1024 * 1024
+NATIVE_BODY_LIMIT = 2 * 1024 * 1024
+FILE_CHUNK_SIZE = 256 * 1024
+
+# 會呼叫 LLM 或執行 ffmpeg 的 endpoint，放在獨立的執行緒額度。
+SLOW_LANE_PATHS = {
+    "/api/parsons/hint",
+    "/api/parsons/submit",
+    "/api/parsons/regenerate",
+    "/api/teacher_t5/regenerate",
+    "/api/admin_upload/video",
+}
+
+UPLOAD_ROUTES = (
+    ("/api/admin_upload/uploads/", "admin_upload.serve_uploads", admin_upload.UPLOADS_ROOT),
+    ("/uploads/", "serve_uploads", os.path.join(os.getcwd(), "uploads")),
+)
+
+DELEGATE = object()
+REQUEST_TOO_LARGE_PAYLOAD = {"ok": False, "error": "request_too_large", "message": "request body too large"}
+
+
+class RequestTooLarge(Exception):
+    """A native route's body exceeds ``NATIVE_BODY_LIMIT``; answered with 413."""
+
+
+# ---------------------------------------------------------------------------
+# Request / response helpers
+# ---------------------------------------------------------------------------
+
+class _Request:
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.headers = {
+            name.decode("latin-1").lower(): value.decode("latin-1")
+            for name, value in scope.get("headers") or []
+        }
+        query = parse_qs((scope.get("query_string") or b"").decode("latin-1"), keep_blank_values=True)
+        self.args = {key: values[0] for key, values in query.items()}
+        self._body: Optional[bytes] = None
+
+    async def body(self) -> bytes:
+        if self._body is None:
+            chunks, size = [], 0
+            while True:
+                message = await self.receive()
+                if message["type"] == "http.disconnect":
+                    break
+                chunk = message.get("body") or b""
+                size += len(chunk)
+                if size > NATIVE_BODY_LIMIT:
+                    # 不是 ValueError：json() 的解析錯誤處理不會把它吞掉。
+                    raise RequestTooLarge()
+                chunks.append(chunk)
+                if not message.get("more_body"):
+                    break
+            self._body = b"".join(chunks)
+        return self._body
+
+    def replay_receive(self):
+        """``receive`` for a delegated request, re-sending a body already read."""
+        if self._body is None:
+            return self.receive
+        pending = [{"type": "http.request", "body": self._body, "more_body": False}]
+
+        async def receive():
+            return pending.pop() if pending else await self.receive()
+
+        return receive
+
+    async def json(self) -> Dict[str, Any]:
+        """Like ``request_json_or_beacon``: any content type, dict or ``{}``."""
+        try:
+            data = json.loads((await self.body()).decode("utf-8") or "null")
+        except ValueError:
+            data = None
+        return data if isinstance(data, dict) else {}
+
+
+def _normalized_error(payload: Dict[str, Any], status: int) -> Dict[str, Any]:
+    # 與 create_app 的 normalize_api_error 相同的錯誤格式。
+    if status >= 500:
+        return {"ok": False, "error": "internal_server_error", "message": SERVER_ERROR_MESSAGE}
+    payload = dict(payload)
+    payload["ok"] = False
+    if not isinstance(payload.get("error"), str) or not payload.get("error"):
+        payload["error"] = f"http_{status}"
+    if not isinstance(payload.get("message"), str) or not payload.get("message"):
+        payload["message"] = REQUEST_ERROR_MESSAGE
+    return payload
+
+
+class _Sender:
+    """Wrap ``send`` to add CORS headers and remember status and size."""
+
+    def __init__(self, send, cors_headers: List[Tuple[bytes, bytes]]):
+        self._send = send
+        self.cors_headers = cors_headers
+        self.status = 500
+        self.sent_bytes = 0
+
+    async def start(self, status: int, headers: List[Tuple[bytes, bytes]]) -> None:
+        self.status = status
+        await self._send({"type": "http.response.start", "status": status, "headers": headers + self.cors_headers})
+
+    async def body(self, chunk: bytes, more: bool = False) -> None:
+        self.sent_bytes += len(chunk)
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more})
+
+    async def json(self, payload: Dict[str, Any], status: int = 200) -> None:
+        if status >= 400:
+            payload = _normalized_error(payload, status)
+        body = json.dumps(payload, default=str).encode("utf-8")
+        await self.start(status, [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+        ])
+        await self.body(body)
+
+
+# ---------------------------------------------------------------------------
+# WSGI bridge
+# ---------------------------------------------------------------------------
+
+def wsgi_environ(scope, body) -> Dict[str, Any]:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": (scope.get("query_string") or b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]) if server[1] is not None else "80",
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": str(client[0]),
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        "wsgi.input_terminated": True,
+    }
+    for raw_name, raw_value in scope.get("headers") or []:
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        key = name if name in {"CONTENT_TYPE", "CONTENT_LENGTH"} else f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class WSGIBridge:
+    """Run a WSGI app in worker threads; one thread per request.
+
+    The view and the iteration of its response run in the same thread (and
+    contextvars context), so ``stream_with_context`` generators work; each
+    chunk is handed to the event loop with ``from_thread.run``.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    async def __call__(self, scope, receive, send, limiter) -> None:
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        try:
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                chunk = message.get("body") or b""
+                if chunk:
+                    body.write(chunk)
+                if not message.get("more_body"):
+                    break
+            environ = wsgi_environ(scope, body)
+            environ.setdefault("CONTENT_LENGTH", str(body.tell()))
+            body.seek(0)
+            await to_thread.run_sync(self._run, environ, send, limiter=limiter)
+        finally:
+            body.close()
+
+    def _run(self, environ, send) -> None:
+        state: Dict[str, Any] = {"started": False}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and state["started"]:
+                raise exc_info[1].with_traceback(exc_info[2])
+            state["status"] = int(str(status).split(" ", 1)[0])
+            state["headers"] = [(name.lower().encode("latin-1"), str(value).encode("latin-1")) for name, value in headers]
+            return lambda data: _emit(data)
+
+        def _start():
+            if not state["started"]:
+                state["started"] = True
+                from_thread.run(send, {"type": "http.response.start", "status": state["status"], "headers": state["headers"]})
+
+        def _emit(data):
+            _start()
+            if data:
+                from_thread.run(send, {"type": "http.response.body", "body": bytes(data), "more_body": True})
+
+        iterable = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in iterable:
+                _emit(chunk)
+            _start()
+            from_thread.run(send, {"type": "http.response.body", "body": b""})
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+
+# ---------------------------------------------------------------------------
+# Application
+# ---------------------------------------------------------------------------
+
+class AsyncServingApp:
+    def __init__(self, flask_app=None):
+        self.flask_app = flask_app or create_app()
+        self.bridge = WSGIBridge(self.flask_app.wsgi_app)
+        self.origins = set(frontend_origins())
+        self._mongo: Optional[AsyncMongoClient] = None
+        self._limiters: Optional[Dict[str, anyio.CapacityLimiter]] = None
+        self.native_routes = {
+            ("POST", "/api/video_rewatch_logs/batch"): ("video_rewatch_logs.create_video_rewatch_log_batch", self.video_log_batch),
+            ("GET", "/api/video_rewatch_logs/resume"): ("video_rewatch_logs.get_video_resume_position", self.video_resume),
+            ("GET", "/api/parsons/hint_state"): ("parsons.get_parsons_hint_state", self.hint_state),
+        }
+        record_capacity("asgi_bridge_threads", BRIDGE_THREADS)
+        record_capacity("asgi_slow_lane_threads", SLOW_LANE_THREADS)
+
+    @property
+    def adb(self):
+        # AsyncMongoClient 必須在事件迴圈內建立。
+        if self._mongo is None:
+            self._mongo = AsyncMongoClient(MONGO_URI, **client_options())
+        return self._mongo[DATABASE_NAME]
+
+    def limiter(self, path: str) -> anyio.CapacityLimiter:
+        if self._limiters is None:
+            self._limiters = {
+                "bridge": anyio.CapacityLimiter(BRIDGE_THREADS),
+                "slow": anyio.CapacityLimiter(SLOW_LANE_THREADS),
+            }
+        return self._limiters["slow" if path in SLOW_LANE_PATHS else "bridge"]
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        method, path = scope["method"], scope["path"]
+        native = self.native_routes.get((method, path))
+        upload = next((route for route in UPLOAD_ROUTES if path.startswith(route[0])), None)
+        if method in {"GET", "HEAD"} and upload is not None:
+            native = (upload[1], None)
+        if native is None:
+            await self.bridge(scope, receive, send, self.limiter(path))
+            return
+
+        request = _Request(scope, receive)
+        sender = _Sender(send, self._cors_headers(request))
+        endpoint, handler = native
+        started = time.perf_counter()
+        request_started()
+        in_flight = True
+        try:
+            if handler is None:
+                result = await self.serve_upload(request, sender, upload[2], path[len(upload[0]):])
+            else:
+                result = await handler(request, sender)
+            if result is DELEGATE:
+                # 交給 Flask 的請求由 install_request_metrics 計數，這裡不重複計入。
+                request_finished()
+                in_flight = False
+                await self.bridge(scope, request.replay_receive(), send, self.limiter(path))
+                return
+            record_request(endpoint, method, sender.status, time.perf_counter() - started, sender.sent_bytes)
+        except RequestTooLarge:
+            await sender.json(REQUEST_TOO_LARGE_PAYLOAD, 413)
+            record_request(endpoint, method, 413, time.perf_counter() - started, sender.sent_bytes)
+        except Exception as exc:
+            print("[asgi] native handler failed:", repr(exc))
+            if sender.status == 500 and not sender.sent_bytes:
+                await sender.json({}, 500)
+            record_request(endpoint, method, 500, time.perf_counter() - started, None)
+        finally:
+            if in_flight:
+                request_finished()
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await to_thread.run_sync(warm_password_pool)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                shutdown_password_pool()
+                if self._mongo is not None:
+                    await self._mongo.close()
+                    self._mongo = None
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _cors_headers(self, request: _Request) -> List[Tuple[bytes, bytes]]:
+        origin = request.headers.get("origin")
+        if origin and origin in self.origins and request.path.startswith("/api/"):
+            return [(b"access-control-allow-origin", origin.encode("latin-1")), (b"vary", b"Origin")]
+        return []
+
+    # --- session ----------------------------------------------------------
+
+    async def active_user(self, request: _Request, roles, beacon: bool = False):
+        """``(user, None)`` or ``(None, (payload, status))``; see ``active_session_guard``."""
+        authorization = request.headers.get("authorization", "").strip()
+        token = authorization[7:].strip() if authorization.lower().startswith("bearer ") else ""
+        token = token or request.headers.get("x-user-token", "").strip()
+        if not token and beacon:
+            token = str((await request.json()).get("session_token") or "").strip()
+        if not token:
+            return None, (SESSION_EXPIRED_PAYLOAD, 401)
+
+        try:
+            user = await self.adb.users.find_one({"active_session_id": token})
+        except PyMongoError as exc:
+            print("[asgi] active session lookup failed:", repr(exc))
+            return None, (AUTH_UNAVAILABLE_PAYLOAD, 503)
+        if not user:
+            return None, (SESSION_EXPIRED_PAYLOAD, 401)
+
+        allowed_roles = role_set(roles)
+        role = str(user.get("role") or "student")
+        if allowed_roles is not None and role not in allowed_roles:
+            return None, (FORBIDDEN_PAYLOAD, 403)
+        sources = [request.args]
+        if request.method == "POST":
+            sources.append(await request.json())
+        if role == "student" and not identity_claims_match(user, sources):
+            return None, (STUDENT_IDENTITY_MISMATCH_PAYLOAD, 403)
+        return user, None
+
+    async def touch_session(self, user) -> None:
+        try:
+            await self.adb.users.update_one(
+                {"_id": user["_id"], "active_session_id": user.get("active_session_id")},
+                {"$set": {"active_last_seen_at": video_logs._utc_now()}},
+            )
+        except PyMongoError as exc:
+            print("[asgi] active session last-seen update failed:", repr(exc))
+
+    async def _reply(self, sender: _Sender, user, payload: Dict[str, Any], status: int = 200) -> None:
+        await sender.json(payload, status)
+        if user is not None and status < 400:
+            await self.touch_session(user)
+
+    # --- handlers ---------------------------------------------------------
+
+    async def video_log_batch(self, request: _Request, sender: _Sender):
+        user, denied = await self.active_user(request, {"student"}, beacon=True)
+        if denied is not None:
+            await sender.json(*denied)
+            return None
+        student_id = str(user.get("student_id") or "").strip()
+
+        data = await request.json()
+        if request.headers.get("idempotency-key") or data.get("idempotency_key"):
+            # 帶 Idempotency-Key 的重送需查存回應，交給 Flask 版本的 @idempotent。
+            return DELEGATE
+        error = video_logs._batch_events_error(data)
+        if error is not None:
+            await sender.json(*error)
+            return None
+        events = data["events"]
+
+        adb = self.adb
+        videos = {}
+        for video_id in video_logs._batch_video_ids(events):
+            try:
+                videos[video_id] = await adb.videos.find_one(
+                    video_logs._video_lookup_filter(video_id),
+                    video_logs.VIDEO_LOOKUP_PROJECTION,
+                ) or {}
+            except PyMongoError:
+                videos[video_id] = {}
+        docs, rejected, duplicates = video_logs._build_batch_docs(events, student_id, user, videos, video_logs._utc_now())
+
+        inserted = []
+        if docs:
+            if not video_logs._INDEX_READY:
+                await to_thread.run_sync(video_logs._ensure_indexes)
+            try:
+                await adb.video_rewatch_logs.insert_many(docs, ordered=False)
+                inserted = docs
+            except BulkWriteError as exc:
+                recovered = video_logs._inserted_after_bulk_error(docs, exc)
+                if recovered is None:
+                    await sender.json(video_logs.BATCH_WRITE_FAILED, 503)
+                    return None
+                inserted, skipped = recovered
+                duplicates += skipped
+            except PyMongoError:
+                await sender.json(video_logs.BATCH_WRITE_FAILED, 503)
+                return None
+
+        operations = playback_state_operations(inserted)
+        if operations:
+            try:
+                await adb[VIDEO_PLAYBACK_STATE_COLLECTION].bulk_write(operations, ordered=False)
+            except PyMongoError as exc:
+                print("[video_playback_state] batch update failed:", repr(exc))
+
+        await self._reply(sender, user, video_logs._batch_payload(student_id, user, docs, inserted, duplicates, rejected))
+        return None
+
+    async def video_resume(self, request: _Request, sender: _Sender):
+        user, denied = await self.active_user(request, {"student"})
+        if denied is not None:
+            await sender.json(*denied)
+            return None
+        student_id = str(user.get("student_id") or "").strip()
+        video_id = video_logs._optional_string(request.args.get("video_id"))
+        if not video_id:
+            await sender.json({"ok": False, "message": "missing video_id"}, 400)
+            return None
+
+        try:
+            state = await self.adb[VIDEO_PLAYBACK_STATE_COLLECTION].find_one({"_id": playback_state_key(student_id, video_id)})
+            if not is_settled_state(state):
+                # 尚未建立續播狀態的舊資料只需補一次，沿用同步版本。
+                state = await to_thread.run_sync(read_playback_state, student_id, video_id)
+        except PyMongoError:
+            await sender.json({
+                "ok": False,
+                "error": "video_resume_read_failed",
+                "message": "影片續播位置讀取失敗，請稍後再試。",
+            }, 503)
+            return None
+        await self._reply(sender, user, video_logs._resume_payload(video_id, state))
+        return None
+
+    async def hint_state(self, request: _Request, sender: _Sender):
+        user, denied = await self.active_user(request, {"student"})
+        if denied is not None:
+            await sender.json(*denied)
+            return None
+        student_id = str(user.get("student_id") or "").strip()
+        task_id = str(request.args.get("task_id") or "").strip()
+        if not task_id:
+            await sender.json({"ok": False, "message": "missing task_id"}, 400)
+            return None
+
+        profile = parsons_routes._feedback_profile_from_user(user)
+        ai_state = None
+        if profile.get("feedback_strategy") == "B":
+            try:
+                ai_state = await self.adb.parsons_ai_hint_state.find_one({"student_id": student_id, "task_id": task_id})
+            except PyMongoError as exc:
+                print("[asgi] hint state lookup failed:", repr(exc))
+                await sender.json({
+                    "ok": False,
+                    "error": "hint_state_read_failed",
+                    "message": "提示狀態讀取失敗，請稍後再試。",
+                }, 503)
+                return None
+        quick = parsons_routes._hint_state_quick_payload(profile, ai_state)
+        if quick is None:
+            # B 組尚未產生 AI 提示時需查作答紀錄與提示紀錄，交給 Flask 版本。
+            return DELEGATE
+        await self._reply(sender, user, quick)
+        return None
+
+    async def serve_upload(self, request: _Request, sender: _Sender, root: str, filename: str):
+        path = safe_join(root, filename)
+        if path is None or not os.path.isfile(path):
+            await sender.json({"ok": False, "error": "http_404", "message": "file not found"}, 404)
+            return None
+        stat = await anyio.Path(path).stat()
+        size = stat.st_size
+        etag = f'"{int(stat.st_mtime)}-{size}"'
+        headers = [
+            (b"content-type", (mimetypes.guess_type(path)[0] or "application/octet-stream").encode("latin-1")),
+            (b"accept-ranges", b"bytes"),
+            (b"etag", etag.encode("latin-1")),
+            (b"last-modified", email.utils.formatdate(stat.st_mtime, usegmt=True).encode("latin-1")),
+            (b"cache-control", b"no-cache"),
+        ]
+
+        if _not_modified(request.headers, etag, stat.st_mtime):
+            await sender.start(304, headers)
+            await sender.body(b"")
+            return None
+
+        start, end = 0, size - 1
+        status = 200
+        byte_range = request.headers.get("range")
+        if byte_range and request.headers.get("if-range", etag) == etag:
+            parsed = parse_byte_range(byte_range, size)
+            if parsed is None:
+                await sender.start(416, [(b"content-range", f"bytes */{size}".encode("latin-1"))])
+                await sender.body(b"")
+                return None
+            start, end = parsed
+            status = 206
+            headers.append((b"content-range", f"bytes {start}-{end}/{size}".encode("latin-1")))
+        length = max(0, end - start + 1)
+        headers.append((b"content-length", str(length).encode("ascii")))
+        await sender.start(status, headers)
+
+        if request.method == "HEAD" or length == 0:
+            await sender.body(b"")
+            return None
+        async with await anyio.open_file(path, "rb") as handle:
+            await handle.seek(start)
+            remaining = length
+            while remaining > 0:
+                chunk = await handle.read(min(FILE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await sender.body(chunk, more=remaining > 0)
+        if remaining > 0:
+            await sender.body(b"")
+        return None
+
+
+def _not_modified(headers: Dict[str, str], etag: str, mtime: float) -> bool:
+    if_none_match = headers.get("if-none-match")
+    if if_none_match:
+        return etag in {item.strip() for item in if_none_match.split(",")} or if_none_match.strip() == "*"
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
+def parse_byte_range(value: str, size: int) -> Optional[Tuple[int, int]]:
+    """``(start, end)`` for a single ``bytes=`` range, ``None`` if unsatisfiable."""
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec or size <= 0:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            suffix = int(last)
+            if suffix <= 0:
+                return None
+            return max(0, size - suffix), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def create_asgi_app(flask_app=None) -> AsyncServingApp:
+    return AsyncServingApp(flask_app)
@@ -0,0 +1,352 @@
+"""Resumable, batched document migrations for the maintenance scripts.
+
+The normalization scripts used to walk one cursor and send one
+``update_one`` per document: a round trip per document, no progress output
+and, when the cursor timed out or the laptop slept halfway through, no way
+to continue except starting over.
+
+A script describes its work as a :class:`Migration` (collection, query and
+a ``transform(doc, counters)`` that returns an update document or ``None``)
+and hands it to :func:`run_migration`, which
+
+* splits the matching ``_id`` range into up to ``workers`` partitions and
+  runs them in threads (pymongo releases the GIL while it waits on the
+  server, and the transforms of these scripts are cheap);
+* reads each partition in ``_id`` order, ``batch_size`` documents per query,
+  and writes the updates of a batch with one unordered ``bulk_write``;
+* after every batch stores the partition's last ``_id`` and counters in
+  ``migration_progress`` (one document per migration name), so re-running
+  an interrupted migration continues where each partition stopped;
+* skips updates that would not change the stored document and counts, per
+  field, the ``$set`` / ``$unset`` changes; with ``dry_run`` nothing is
+  written (neither the updates nor the checkpoint) and those counts are the
+  diff summary;
+* prints the scanned count and documents per second every
+  ``REPORT_INTERVAL_SEC``.
+
+A finished migration is kept as ``status: done`` for reference; running it
+again starts a new pass.  ``restart`` discards an unfinished checkpoint.
+
+Transforms must be idempotent: the batch in flight when a run stopped is
+read again on resume.  The projection has to include every field the
+update touches, otherwise the no-op check cannot see them.  Range
+partitions and resume rely on ``$gt`` over ``_id``, which MongoDB only
+compares within one BSON type class (all numbers — int, long, double —
+form one class), so a collection whose ``_id`` values mix classes, e.g.
+numbers and strings, is rejected.
+"""
+
+from __future__ import annotations
+
+import argparse
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+
+MIGRATION_PROGRESS_COLLECTION = "migration_progress"
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_WORKERS = 4
+REPORT_INTERVAL_SEC = 5.0
+
+Transform = Callable[[Dict[str, Any], Counter], Optional[Dict[str, Any]]]
+
+
+@dataclass
+class Migration:
+    name: str
+    collection: str
+    transform: Transform
+    query: Dict[str, Any] = field(default_factory=dict)
+    projection: Optional[Dict[str, Any]] = None
+
+
+@dataclass
+class MigrationReport:
+    name: str
+    collection: str
+    dry_run: bool
+    resumed: bool
+    partitions: int
+    scanned: int
+    changed: int
+    modified: int
+    elapsed_sec: float
+    docs_per_sec: float
+    counters: Dict[str, int]
+    fields: Dict[str, int]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "collection": self.collection,
+            "dry_run": self.dry_run,
+            "resumed": self.resumed,
+            "partitions": self.partitions,
+            "scanned": self.scanned,
+            "changed": self.changed,
+            "modified": self.modified,
+            "elapsed_sec": round(self.elapsed_sec, 3),
+            "docs_per_sec": round(self.docs_per_sec, 1),
+            "counters": dict(self.counters),
+            "fields": dict(self.fields),
+        }
+
+    def summary(self) -> str:
+        mode = "dry-run" if self.dry_run else "applied"
+        line = (
+            f"{mode}: {self.collection} scanned={self.scanned} changed={self.changed} "
+            f"modified={self.modified} {self.docs_per_sec:.0f} docs/s"
+        )
+        extra = ", ".join(f"{key}={value}" for key, value in sorted(self.counters.items()))
+        fields = ", ".join(f"{key}={value}" for key, value in sorted(self.fields.items()))
+        if extra:
+            line += f"\n  {extra}"
+        if fields:
+            line += f"\n  fields: {fields}"
+        return line
+
+
+def add_migration_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Documents per read and bulk_write.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Parallel _id range partitions.")
+    parser.add_argument("--restart", action="store_true", help="Ignore an unfinished checkpoint and start over.")
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+_MISSING = object()
+
+
+def _field_value(doc: Dict[str, Any], path: str) -> Any:
+    value: Any = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def changed_fields(doc: Dict[str, Any], update: Dict[str, Any]) -> List[str]:
+    """``set:<field>`` / ``unset:<field>`` for each part of ``update`` that changes ``doc``."""
+    changes = []
+    for path, value in (update.get("$set") or {}).items():
+        if _field_value(doc, path) != value:
+            changes.append(f"set:{path}")
+    for path in update.get("$unset") or {}:
+        if _field_value(doc, path) is not _MISSING:
+            changes.append(f"unset:{path}")
+    # 其他運算子（$inc、$push …）無法事先比較，視為一定會改變。
+    changes.extend(f"{operator}:*" for operator in update if operator not in {"$set", "$unset"})
+    return changes
+
+
+def _bson_type_class(value: Any) -> str:
+    """MongoDB compares ``$gt`` / ``$lt`` only within one of these classes."""
+    if isinstance(value, bool):
+        return "bool"
+    # int / Int64 / float 在 MongoDB 中同屬數值類別，可互相比較。
+    if isinstance(value, (int, float)):
+        return "number"
+    return type(value).__name__
+
+
+def _partitions(collection, query: Dict[str, Any], workers: int, batch_size: int) -> List[Dict[str, Any]]:
+    def partition(lower, upper):
+        return {
+            "lower": lower,
+            "upper": upper,
+            "last_id": None,
+            "done": False,
+            "scanned": 0,
+            "changed": 0,
+            "modified": 0,
+            "counters": {},
+            "fields": {},
+        }
+
+    first = list(collection.find(query, {"_id": 1}).sort([("_id", 1)]).limit(1))
+    last = list(collection.find(query, {"_id": 1}).sort([("_id", -1)]).limit(1))
+    if not first:
+        return [partition(None, None)]
+    if _bson_type_class(first[0]["_id"]) != _bson_type_class(last[0]["_id"]):
+        raise ValueError(f"{collection.name}: _id values mix BSON types; cannot range-partition")
+
+    total = collection.count_documents(query)
+    # 不足一批的分區只會多出查詢。
+    count = max(1, min(workers, total // batch_size))
+    bounds = []
+    for index in range(1, count):
+        boundary = list(
+            collection.find(query, {"_id": 1}).sort([("_id", 1)]).skip(index * total // count).limit(1)
+        )
+        if boundary and (not bounds or boundary[0]["_id"] > bounds[-1]):
+            bounds.append(boundary[0]["_id"])
+    edges = [None] + bounds + [None]
+    return [partition(edges[index], edges[index + 1]) for index in range(len(edges) - 1)]
+
+
+class _Throughput:
+    def __init__(self, name: str, log: Callable[[str], None], scanned: int = 0):
+        self.name = name
+        self.log = log
+        self.scanned = scanned
+        self.started = time.perf_counter()
+        self.resumed_from = scanned
+        self.reported = self.started
+        self.lock = threading.Lock()
+
+    def add(self, count: int) -> None:
+        with self.lock:
+            self.scanned += count
+            now = time.perf_counter()
+            if now - self.reported < REPORT_INTERVAL_SEC:
+                return
+            self.reported = now
+            rate = (self.scanned - self.resumed_from) / max(now - self.started, 1e-9)
+            self.log(f"[{self.name}] scanned={self.scanned} {rate:.0f} docs/s")
+
+
+def _run_partition(
+    db,
+    migration: Migration,
+    index: int,
+    state: Dict[str, Any],
+    batch_size: int,
+    dry_run: bool,
+    throughput: _Throughput,
+) -> Dict[str, Any]:
+    collection = db[migration.collection]
+    counters: Counter = Counter(state.get("counters") or {})
+    fields: Counter = Counter(state.get("fields") or {})
+    last_id = state.get("last_id")
+    while not state.get("done"):
+        bounds: Dict[str, Any] = {}
+        if last_id is not None:
+            bounds["$gt"] = last_id
+        elif state.get("lower") is not None:
+            bounds["$gte"] = state["lower"]
+        if state.get("upper") is not None:
+            bounds["$lt"] = state["upper"]
+        query = {"$and": [migration.query, {"_id": bounds}]} if bounds else migration.query
+        docs = list(collection.find(query, migration.projection).sort([("_id", 1)]).limit(batch_size))
+        if not docs:
+            state["done"] = True
+            break
+
+        operations = []
+        for doc in docs:
+            update = migration.transform(doc, counters)
+            changes = changed_fields(doc, update) if update else []
+            if not changes:
+                continue
+            fields.update(changes)
+            operations.append(UpdateOne({"_id": doc["_id"]}, update))
+        if operations and not dry_run:
+            state["modified"] += collection.bulk_write(operations, ordered=False).modified_count
+
+        last_id = docs[-1]["_id"]
+        state.update(
+            last_id=last_id,
+            done=len(docs) < batch_size,
+            scanned=state["scanned"] + len(docs),
+            changed=state["changed"] + len(operations),
+            counters=dict(counters),
+            fields=dict(fields),
+        )
+        if not dry_run:
+            db[MIGRATION_PROGRESS_COLLECTION].update_one(
+                {"_id": migration.name},
+                {"$set": {f"partitions.{index}": state, "updated_at": _utc_now()}},
+            )
+        throughput.add(len(docs))
+    return state
+
+
+def run_migration(
+    db,
+    migration: Migration,
+    *,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers: int = DEFAULT_WORKERS,
+    dry_run: bool = False,
+    restart: bool = False,
+    log: Callable[[str], None] = print,
+) -> MigrationReport:
+    """Run ``migration`` against ``db``.
+
+    The counts include the runs this one resumed; ``docs_per_sec`` covers
+    this run only.
+    """
+    batch_size = max(1, int(batch_size))
+    collection = db[migration.collection]
+    progress = None if dry_run else db[MIGRATION_PROGRESS_COLLECTION]
+    checkpoint = progress.find_one({"_id": migration.name}) if progress is not None else None
+    resumed = bool(
+        checkpoint
+        and not restart
+        and checkpoint.get("status") == "running"
+        and checkpoint.get("collection") == migration.collection
+    )
+    if resumed:
+        partitions = checkpoint["partitions"]
+        log(f"[{migration.name}] resuming {sum(1 for state in partitions if not state.get('done'))}/{len(partitions)} partitions")
+    else:
+        partitions = _partitions(collection, migration.query, max(1, int(workers)), batch_size)
+        if progress is not None:
+            progress.replace_one(
+                {"_id": migration.name},
+                {
+                    "_id": migration.name,
+                    "collection": migration.collection,
+                    "status": "running",
+                    "batch_size": batch_size,
+                    "partitions": partitions,
+                    "started_at": _utc_now(),
+                    "updated_at": _utc_now(),
+                },
+                upsert=True,
+            )
+
+    throughput = _Throughput(migration.name, log, sum(int(state.get("scanned") or 0) for state in partitions))
+    with ThreadPoolExecutor(max_workers=len(partitions), thread_name_prefix=f"migrate-{migration.name}") as executor:
+        futures = [
+            executor.submit(_run_partition, db, migration, index, state, batch_size, dry_run, throughput)
+            for index, state in enumerate(partitions)
+        ]
+        states = [future.result() for future in futures]
+    elapsed = time.perf_counter() - throughput.started
+
+    counters: Counter = Counter()
+    fields: Counter = Counter()
+    for state in states:
+        counters.update(state.get("counters") or {})
+        fields.update(state.get("fields") or {})
+    report = MigrationReport(
+        name=migration.name,
+        collection=migration.collection,
+        dry_run=dry_run,
+        resumed=resumed,
+        partitions=len(states),
+        scanned=sum(state["scanned"] for state in states),
+        changed=sum(state["changed"] for state in states),
+        modified=sum(state["modified"] for state in states),
+        elapsed_sec=elapsed,
+        docs_per_sec=(throughput.scanned - throughput.resumed_from) / elapsed if elapsed > 0 else 0.0,
+        counters=dict(counters),
+        fields=dict(fields),
+    )
+    if progress is not None:
+        progress.update_one(
+            {"_id": migration.name},
+            {"$set": {"status": "done", "finished_at": _utc_now(), "updated_at": _utc_now(), "report": report.as_dict()}},
+        )
+    return report
@@ -0,0 +1,73 @@
+"""Version stamps for in-process caches of rarely changing collections.
+
+Each cache has one stamp document in ``cache_versions``.  Writers bump the
+stamp after changing the source collection; readers compare the stamp with
+the one their cache was built from and rebuild only when it moved.  Reading
+a stamp is a primary-key lookup, so a cache can afford to check it every few
+seconds while every waitress thread (or worker process) converges on the
+same data.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from .db import db
+
+
+CACHE_VERSION_COLLECTION = "cache_versions"
+
+_LOCAL_LOCK = threading.Lock()
+_LOCAL_STAMPS: Dict[str, Dict[str, Any]] = {}
+
+
+def read_cache_version(name: str) -> Optional[int]:
+    """Return the shared stamp for ``name``; ``None`` when MongoDB is unavailable."""
+    try:
+        doc = db[CACHE_VERSION_COLLECTION].find_one({"_id": name}, {"version": 1})
+    except PyMongoError:
+        return None
+    try:
+        return int((doc or {}).get("version") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def bump_cache_version(name: str) -> Optional[int]:
+    """Advance the shared stamp after a write to the cached collection."""
+    with _LOCAL_LOCK:
+        _LOCAL_STAMPS.pop(name, None)
+    try:
+        doc = db[CACHE_VERSION_COLLECTION].find_one_and_update(
+            {"_id": name},
+            {"$inc": {"version": 1}, "$currentDate": {"updated_at": True}},
+            upsert=True,
+            projection={"version": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+    except PyMongoError:
+        return None
+    return int((doc or {}).get("version") or 0)
+
+
+def cached_cache_version(name: str, max_age_seconds: float) -> Optional[int]:
+    """Read the stamp at most once per ``max_age_seconds`` in this process.
+
+    A local bump clears the memo, so the writing process sees its own change
+    immediately; other processes see it within ``max_age_seconds``.
+    """
+    now = time.monotonic()
+    with _LOCAL_LOCK:
+        memo = _LOCAL_STAMPS.get(name)
+        if memo and now - memo["checked_at"] < max_age_seconds:
+            return memo["version"]
+
+    version = read_cache_version(name)
+    with _LOCAL_LOCK:
+        _LOCAL_STAMPS[name] = {"version": version, "checked_at": now}
+    return version
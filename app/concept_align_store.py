@@ -0,0 +1,197 @@
+"""Stored concept-alignment results.
+
+Opening or adjusting the concept alignment of a task re-ran the whole
+pipeline: the LLM chapter extraction (segmentation + classification), the
+chapter suggestions and one rerank call per chapter, with ``force_rebuild``
+the only way to ask for a fresh result and nothing kept between requests.
+
+``concept_align_results`` keeps one document per alignment input:
+
+* ``content_hash`` — the solution blocks and the subtitle text the result was
+  computed from, so editing either misses the old entries;
+* ``version_key`` — :func:`derive_concept_version_key` of the task;
+* ``range_start`` / ``range_end`` — the teaching range in subtitle seconds
+  (``None`` for an open end);
+* ``mode`` and ``model`` — the teaching-range mode and the LLM (``rule``
+  when AI is disabled).
+
+An entry with the same key is reused as is.  When only the teaching range
+changed, :func:`find_covering_result` returns the entry of a range that
+contains the new one: its chapters are clamped to the new range and snapped
+again instead of calling the LLM.  The rerank of a chapter is stored under a
+fingerprint of its inputs (:func:`fingerprint`), so chapters the clamp left
+unchanged keep their recommendation.  Entries expire after
+``CONCEPT_ALIGN_RESULT_TTL_DAYS``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+
+from .db import db
+
+
+ALIGN_RESULT_COLLECTION = "concept_align_results"
+ALIGN_RESULT_TTL_DAYS = max(1, int(os.environ.get("CONCEPT_ALIGN_RESULT_TTL_DAYS", "30")))
+# 同一組輸入最多比對這麼多個區間，避免老師反覆微調後每次都掃很多筆。
+MAX_SIBLING_RESULTS = 20
+
+_INDEX_READY = False
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def fingerprint(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def content_hash(solution_blocks: List[Dict[str, Any]], subtitle_text: str) -> str:
+    blocks = [
+        {
+            "text": (block or {}).get("text") or (block or {}).get("code") or "",
+            "meaning": (block or {}).get("semantic_zh") or (block or {}).get("meaning_zh") or "",
+        }
+        for block in solution_blocks or []
+        if isinstance(block, dict)
+    ]
+    return fingerprint(blocks, str(subtitle_text or ""))
+
+
+def _seconds(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return round(float(value), 2)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True)
+class AlignKey:
+    task_id: str
+    content_hash: str
+    version_key: str
+    mode: str
+    model: str
+    range_start: Optional[float] = None
+    range_end: Optional[float] = None
+
+    @classmethod
+    def build(cls, *, task_id, content_hash, version_key, mode, model, range_start=None, range_end=None) -> "AlignKey":
+        return cls(
+            task_id=str(task_id),
+            content_hash=content_hash,
+            version_key=str(version_key or ""),
+            mode=str(mode or ""),
+            model=str(model or ""),
+            range_start=_seconds(range_start),
+            range_end=_seconds(range_end),
+        )
+
+    @property
+    def doc_id(self) -> str:
+        return fingerprint(asdict(self))
+
+    def family(self) -> Dict[str, Any]:
+        """Query for the entries that differ from this key only by the range."""
+        return {
+            "task_id": self.task_id,
+            "content_hash": self.content_hash,
+            "version_key": self.version_key,
+            "mode": self.mode,
+            "model": self.model,
+        }
+
+    def covered_by(self, doc: Dict[str, Any]) -> bool:
+        start, end = doc.get("range_start"), doc.get("range_end")
+        if start is not None and (self.range_start is None or self.range_start < start):
+            return False
+        if end is not None and (self.range_end is None or self.range_end > end):
+            return False
+        return True
+
+
+def ensure_align_result_indexes() -> None:
+    global _INDEX_READY
+    if _INDEX_READY:
+        return
+    try:
+        collection = db[ALIGN_RESULT_COLLECTION]
+        collection.create_index("expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+        collection.create_index(
+            [("task_id", ASCENDING), ("content_hash", ASCENDING), ("version_key", ASCENDING)],
+            name="task_content_version_1",
+        )
+        _INDEX_READY = True
+    except PyMongoError as exc:
+        print("[concept_align_store] index ensure failed:", repr(exc))
+
+
+def load_result(key: AlignKey) -> Optional[Dict[str, Any]]:
+    try:
+        return db[ALIGN_RESULT_COLLECTION].find_one({"_id": key.doc_id})
+    except PyMongoError as exc:
+        print("[concept_align_store] load failed:", repr(exc))
+        return None
+
+
+def find_covering_result(key: AlignKey) -> Optional[Dict[str, Any]]:
+    """The stored result of the narrowest teaching range that contains ``key``'s range."""
+    try:
+        siblings = list(
+            db[ALIGN_RESULT_COLLECTION]
+            .find(key.family())
+            .sort([("updated_at", -1)])
+            .limit(MAX_SIBLING_RESULTS)
+        )
+    except PyMongoError as exc:
+        print("[concept_align_store] lookup failed:", repr(exc))
+        return None
+
+    def width(doc):
+        start, end = doc.get("range_start"), doc.get("range_end")
+        if start is None or end is None:
+            return float("inf")
+        return float(end) - float(start)
+
+    covering = [doc for doc in siblings if doc.get("_id") != key.doc_id and key.covered_by(doc)]
+    return min(covering, key=width) if covering else None
+
+
+def save_result(key: AlignKey, result: Dict[str, Any]) -> None:
+    now = _utc_now()
+    try:
+        ensure_align_result_indexes()
+        db[ALIGN_RESULT_COLLECTION].replace_one(
+            {"_id": key.doc_id},
+            {
+                "_id": key.doc_id,
+                **asdict(key),
+                **result,
+                "updated_at": now,
+                "expires_at": now + timedelta(days=ALIGN_RESULT_TTL_DAYS),
+            },
+            upsert=True,
+        )
+    except PyMongoError as exc:
+        print("[concept_align_store] save failed:", repr(exc))
+
+
+def stored_recommendations(doc: Optional[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """``fingerprint -> recommendation`` of a stored result."""
+    return {
+        str(item.get("fingerprint")): item.get("recommendation") or {}
+        for item in (doc or {}).get("recommendations") or []
+        if isinstance(item, dict) and item.get("fingerprint")
+    }
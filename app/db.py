@@ -2,13 +2,27 @@ import os
 
 from pymongo import MongoClient
 
+from .metrics import mongo_event_listeners, record_capacity
 
-client = MongoClient(
-    os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017"),
-    maxPoolSize=max(20, int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))),
-    waitQueueTimeoutMS=int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")),
-    serverSelectionTimeoutMS=int(os.environ.get("MONGO_SERVER_TIMEOUT_MS", "5000")),
-    connectTimeoutMS=int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "5000")),
-    retryWrites=True,
-)
-db = client[os.environ.get("MONGO_DATABASE", "thesis_system")]
+
+MAX_POOL_SIZE = max(20, int(os.environ.get("MONGO_MAX_POOL_SIZE", "100")))
+
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017")
+DATABASE_NAME = os.environ.get("MONGO_DATABASE", "thesis_system")
+
+
+def client_options():
+    """Pool and timeout settings shared by the sync client and app/asgi.py."""
+    return {
+        "maxPoolSize": MAX_POOL_SIZE,
+        "waitQueueTimeoutMS": int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+        "serverSelectionTimeoutMS": int(os.environ.get("MONGO_SERVER_TIMEOUT_MS", "5000")),
+        "connectTimeoutMS": int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+        "retryWrites": True,
+        "event_listeners": mongo_event_listeners(),
+    }
+
+
+client = MongoClient(MONGO_URI, **client_options())
+db = client[DATABASE_NAME]
+record_capacity("mongo_max_pool_size", MAX_POOL_SIZE)
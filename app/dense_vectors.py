@@ -0,0 +1,253 @@
+"""On-disk dense vectors for the ``local_dense`` subtitle retrieval mode.
+
+The ``openai`` retrieval mode embeds every subtitle segment and every query
+with an HTTP call, so each lookup pays network latency and an API bill.
+``local_dense`` uses a CPU sentence-embedding model instead
+(``PARSONS_RETRIEVAL_LOCAL_MODEL``, MongoDB/mdbr-leaf-ir by default, the
+model ``tools/evaluate_mdbr_leaf_ir.py`` evaluates):
+
+* segment vectors are computed once per subtitle version — in the background
+  right after a subtitle is uploaded or corrected
+  (:func:`submit_background`), or on first use — and written as a
+  row-major float16 matrix ``<key>.f16`` plus a ``<key>.json`` sidecar in
+  ``PARSONS_VECTOR_DIR``.  ``key`` (:func:`vector_key`) hashes the model
+  and the segment texts, so a corrected subtitle gets a new file and an
+  unchanged one is never embedded twice;
+* the files are opened with ``numpy.memmap``; every worker process shares
+  the same page cache, and at most ``MAX_OPEN_VECTOR_FILES`` stay open;
+* a query is encoded locally and scored against the whole matrix with one
+  matrix product (:func:`score`), several queries at once when the caller
+  has them;
+* every write prunes the directory (:func:`prune_vectors`): files unused for
+  ``PARSONS_VECTOR_MAX_AGE_DAYS`` go first, then the least recently opened
+  ones until the directory fits in ``PARSONS_VECTOR_DIR_MAX_MB``.  Opening
+  a file refreshes its sidecar's mtime; a pruned file is rebuilt on its next
+  use.
+
+numpy and sentence-transformers are optional: :func:`available` is false
+without them and the retrieval code falls back to the sparse ``local`` mode.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Sequence
+
+
+DEFAULT_LOCAL_MODEL = "MongoDB/mdbr-leaf-ir"
+MAX_OPEN_VECTOR_FILES = max(1, int(os.getenv("PARSONS_VECTOR_OPEN_FILES", "32")))
+ENCODE_BATCH_SIZE = max(1, int(os.getenv("PARSONS_VECTOR_BATCH_SIZE", "32")))
+VECTOR_DIR_MAX_BYTES = max(0, int(float(os.getenv("PARSONS_VECTOR_DIR_MAX_MB", "1024")) * 1024 * 1024))
+VECTOR_MAX_AGE_SEC = max(0.0, float(os.getenv("PARSONS_VECTOR_MAX_AGE_DAYS", "60")) * 86400)
+
+_ENCODER_LOCK = threading.Lock()
+_ENCODERS: dict = {}
+_OPEN_LOCK = threading.Lock()
+_OPEN: "OrderedDict[str, Any]" = OrderedDict()
+_BACKGROUND_LOCK = threading.Lock()
+_BACKGROUND: Optional[tuple] = None
+
+
+def local_model_name() -> str:
+    return str(os.getenv("PARSONS_RETRIEVAL_LOCAL_MODEL") or DEFAULT_LOCAL_MODEL).strip()
+
+
+def vector_dir() -> str:
+    return os.getenv("PARSONS_VECTOR_DIR") or os.path.join(os.getcwd(), "uploads", "vectors")
+
+
+def available() -> bool:
+    return all(importlib.util.find_spec(name) is not None for name in ("numpy", "sentence_transformers"))
+
+
+def vector_key(texts: Sequence[str], model: str) -> str:
+    payload = json.dumps([model, list(texts)], ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:32]
+
+
+def _paths(key: str):
+    base = os.path.join(vector_dir(), key)
+    return base + ".f16", base + ".json"
+
+
+def _encoder(model: str):
+    # 以 pid 區分：fork 出來的 worker 各自載入模型。
+    with _ENCODER_LOCK:
+        cached = _ENCODERS.get(model)
+        if cached is not None and cached[0] == os.getpid():
+            return cached[1]
+        from sentence_transformers import SentenceTransformer  # lazy import
+
+        encoder = SentenceTransformer(model, device="cpu")
+        _ENCODERS[model] = (os.getpid(), encoder)
+        return encoder
+
+
+def encode(texts: Sequence[str], model: str, *, query: bool = False):
+    """L2-normalised float32 rows, one per text."""
+    encoder = _encoder(model)
+    kwargs = {}
+    # 非對稱模型（如 mdbr-leaf-ir）查詢端要加 query prompt。
+    if query and "query" in (getattr(encoder, "prompts", None) or {}):
+        kwargs["prompt_name"] = "query"
+    return encoder.encode(
+        list(texts),
+        batch_size=ENCODE_BATCH_SIZE,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+        **kwargs,
+    )
+
+
+def write_vectors(key: str, matrix, model: str) -> None:
+    import numpy as np
+
+    vec_path, meta_path = _paths(key)
+    os.makedirs(os.path.dirname(vec_path), exist_ok=True)
+    rows = np.ascontiguousarray(matrix, dtype=np.float16)
+    suffix = f".tmp{os.getpid()}.{threading.get_ident()}"
+    rows.tofile(vec_path + suffix)
+    os.replace(vec_path + suffix, vec_path)
+    # sidecar 最後寫入：有 .json 才代表 .f16 已完整。
+    with open(meta_path + suffix, "w", encoding="utf-8") as f:
+        json.dump({"model": model, "rows": int(rows.shape[0]), "dims": int(rows.shape[1]), "dtype": "float16"}, f)
+    os.replace(meta_path + suffix, meta_path)
+    prune_vectors(keep=key)
+
+
+def prune_vectors(keep: str = "", now: Optional[float] = None) -> int:
+    """Delete stale or excess vector files, least recently opened first; returns the count."""
+    directory = vector_dir()
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return 0
+    now = time.time() if now is None else now
+    entries = []
+    total = 0
+    for name in names:
+        if not name.endswith(".json") or name[:-5] == keep:
+            continue
+        vec_path, meta_path = _paths(name[:-5])
+        try:
+            used_at = os.path.getmtime(meta_path)
+            size = os.path.getsize(vec_path) + os.path.getsize(meta_path)
+        except OSError:
+            continue
+        entries.append((used_at, size, name[:-5]))
+        total += size
+    if keep:
+        try:
+            total += sum(os.path.getsize(path) for path in _paths(keep))
+        except OSError:
+            pass
+
+    removed = 0
+    for used_at, size, key in sorted(entries):
+        too_old = VECTOR_MAX_AGE_SEC > 0 and now - used_at > VECTOR_MAX_AGE_SEC
+        too_big = VECTOR_DIR_MAX_BYTES > 0 and total > VECTOR_DIR_MAX_BYTES
+        if not (too_old or too_big):
+            continue
+        # 先刪 sidecar：其他行程看不到 .json 就不會開啟半刪除的檔案。
+        for path in reversed(_paths(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with _OPEN_LOCK:
+            _OPEN.pop(key, None)
+        total -= size
+        removed += 1
+    return removed
+
+
+def open_vectors(key: str):
+    """The memory-mapped ``(rows, dims)`` float16 matrix of ``key``; ``None`` when not built."""
+    with _OPEN_LOCK:
+        if key in _OPEN:
+            _OPEN.move_to_end(key)
+            return _OPEN[key]
+    vec_path, meta_path = _paths(key)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    import numpy as np
+
+    try:
+        # 以 sidecar 的 mtime 記錄最近使用時間，供 prune_vectors 排序。
+        os.utime(meta_path)
+    except OSError:
+        pass
+    rows, dims = int(meta.get("rows") or 0), int(meta.get("dims") or 0)
+    if rows <= 0 or dims <= 0:
+        return np.zeros((0, max(dims, 1)), dtype=np.float16)
+    try:
+        matrix = np.memmap(vec_path, dtype=np.float16, mode="r", shape=(rows, dims))
+    except (OSError, ValueError) as exc:
+        print("[dense_vectors] open failed:", repr(exc))
+        return None
+    with _OPEN_LOCK:
+        _OPEN[key] = matrix
+        while len(_OPEN) > MAX_OPEN_VECTOR_FILES:
+            _OPEN.popitem(last=False)
+    return matrix
+
+
+def ensure_vectors(texts: Sequence[str], model: str) -> str:
+    """Embed ``texts`` unless their vector file already exists; returns the key."""
+    key = vector_key(texts, model)
+    if open_vectors(key) is None:
+        import numpy as np
+
+        matrix = encode(texts, model) if texts else np.zeros((0, 1), dtype=np.float32)
+        write_vectors(key, matrix, model)
+    return key
+
+
+def score(key: str, queries: Sequence[str], model: str, texts: Sequence[str] = ()):
+    """``(len(queries), rows)`` cosine scores; ``texts`` rebuilds a missing file."""
+    import numpy as np
+
+    matrix = open_vectors(key)
+    if matrix is None:
+        if not texts:
+            return None
+        ensure_vectors(texts, model)
+        matrix = open_vectors(key)
+        if matrix is None:
+            return None
+    q = np.asarray(encode(queries, model, query=True), dtype=np.float32)
+    if matrix.shape[0] == 0:
+        return np.zeros((q.shape[0], 0), dtype=np.float32)
+    return q @ np.asarray(matrix, dtype=np.float32).T
+
+
+def _background_pool() -> ThreadPoolExecutor:
+    global _BACKGROUND
+    with _BACKGROUND_LOCK:
+        if _BACKGROUND is None or _BACKGROUND[0] != os.getpid():
+            # 單執行緒：上傳多份字幕時依序編碼，不與請求搶 CPU。
+            _BACKGROUND = (os.getpid(), ThreadPoolExecutor(max_workers=1, thread_name_prefix="dense-vectors"))
+        return _BACKGROUND[1]
+
+
+def submit_background(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    def run():
+        try:
+            return fn(*args, **kwargs)
+        except Exception as exc:
+            print("[dense_vectors] background build failed:", repr(exc))
+            return None
+
+    return _background_pool().submit(run)
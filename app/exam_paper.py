@@ -0,0 +1,141 @@
+"""Compiled, cached pre/post test papers.
+
+Serving a test question or grading a submission used to re-run the active
+question queries (up to three sorted scans over ``pre_parsons_questions``,
+the role collection and the legacy ``questions``), look the question up
+again by reference and convert it to a task document, and the pretest
+completion check re-read the whole paper on every submission.  When a class
+starts the pretest together every request repeats the same work on the same
+data.
+
+An :class:`ExamPaper` is built once per test role by the compiler in
+:mod:`app.routes.parsons`: the ordered questions, their converted task
+documents and prebuilt question payloads, the expected answers and the
+maximum scores.  Papers are frozen dataclasses shared by every request, so
+callers treat the documents inside as read-only and copy a payload before
+adding fields.  A paper is kept until the ``exam_paper`` stamp moves
+(question imports and migrations, test open / close toggles) or it is older
+than ``EXAM_PAPER_MAX_AGE_SEC``, which bounds how long a question edited
+directly in MongoDB stays stale.  Only one thread per role compiles; the
+others wait and reuse its result.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+from .cache_versions import bump_cache_version, cached_cache_version
+
+
+EXAM_PAPER_CACHE_NAME = "exam_paper"
+
+
+@dataclass(frozen=True)
+class PaperQuestion:
+    index: int
+    task_id: str
+    question_type: str
+    source_doc: Mapping[str, Any]
+    task_doc: Mapping[str, Any]
+    parsed: Mapping[str, Any]
+    payload: Mapping[str, Any]
+    expected_ids: Tuple[str, ...]
+    max_score: float
+
+
+@dataclass(frozen=True)
+class ExamPaper:
+    test_role: str
+    version: Optional[int]
+    questions: Tuple[PaperQuestion, ...]
+    refs: Mapping[str, PaperQuestion] = field(default_factory=dict)
+    compiled_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def total(self) -> int:
+        return len(self.questions)
+
+    @property
+    def expected_task_ids(self) -> list:
+        ids = []
+        for question in self.questions:
+            if question.task_id and question.task_id not in ids:
+                ids.append(question.task_id)
+        return ids
+
+    def max_score(self, task_id: str, default: float = 1.0) -> float:
+        question = self.refs.get(str(task_id or "").strip())
+        return question.max_score if question is not None else default
+
+    def question_at(self, index: Any) -> Tuple[Optional[PaperQuestion], int]:
+        """Question at a 1-based index, clamped like the former skip/limit query."""
+        try:
+            current = max(1, int(index or 1))
+        except (TypeError, ValueError):
+            current = 1
+        if not self.questions:
+            return None, current
+        current = min(current, len(self.questions))
+        return self.questions[current - 1], current
+
+    def find(self, ref: Any) -> Optional[PaperQuestion]:
+        return self.refs.get(str(ref or "").strip())
+
+
+def _check_seconds() -> float:
+    try:
+        return max(0.0, float(os.getenv("EXAM_PAPER_CHECK_SEC", "5")))
+    except ValueError:
+        return 5.0
+
+
+def _max_age_seconds() -> float:
+    try:
+        return max(0.0, float(os.getenv("EXAM_PAPER_MAX_AGE_SEC", "300")))
+    except ValueError:
+        return 300.0
+
+
+_LOCK = threading.Lock()
+_BUILD_LOCKS: Dict[str, threading.Lock] = {}
+_PAPERS: Dict[str, ExamPaper] = {}
+
+
+def _fresh(paper: Optional[ExamPaper], version: Optional[int]) -> bool:
+    if paper is None or version is None or paper.version != version:
+        return False
+    return time.monotonic() - paper.compiled_at < _max_age_seconds()
+
+
+def cached_exam_paper(test_role: str, compile_paper: Callable[[str, Optional[int]], ExamPaper]) -> ExamPaper:
+    """Return the compiled paper for ``test_role``, compiling at most once at a time."""
+    role = str(test_role or "").strip().lower()
+    version = cached_cache_version(EXAM_PAPER_CACHE_NAME, _check_seconds())
+    with _LOCK:
+        paper = _PAPERS.get(role)
+        build_lock = _BUILD_LOCKS.setdefault(role, threading.Lock())
+    if _fresh(paper, version):
+        return paper
+
+    with build_lock:
+        with _LOCK:
+            paper = _PAPERS.get(role)
+        if _fresh(paper, version):
+            return paper
+        paper = compile_paper(role, version)
+        if version is not None:
+            # 無法讀取版本（MongoDB 暫時不可用）時不快取，下一次請求重新編譯。
+            with _LOCK:
+                _PAPERS[role] = paper
+        return paper
+
+
+def invalidate_exam_papers() -> None:
+    """Call after test questions change or a test is opened or closed."""
+    with _LOCK:
+        _PAPERS.clear()
+    bump_cache_version(EXAM_PAPER_CACHE_NAME)
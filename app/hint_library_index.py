@@ -0,0 +1,285 @@
+"""In-process index of reusable Parsons hint templates.
+
+``hint_library`` is small and is only written when a teacher upserts a
+template or a structured AI hint is auto-saved, yet every hint request used
+to run up to five sorted ``find_one`` queries against it.  This module keeps
+the servable templates in dictionaries keyed exactly like those queries and
+pre-sorted by the same order (success, usage, version, updated_at, _id), so a
+lookup is a handful of dict reads.
+
+Freshness comes from the ``hint_library`` stamp in :mod:`app.cache_versions`:
+writers call :func:`invalidate_hint_library_index`, readers rebuild when the
+stamp moved.  Usage counters are buffered and written with one unordered
+``bulk_write`` of ``$inc`` updates instead of one ``update_one`` per hit.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from .cache_versions import bump_cache_version, cached_cache_version
+from .db import db
+
+
+HINT_LIBRARY_CACHE_NAME = "hint_library"
+
+# Filters every servable template satisfies; they are applied once at load
+# time instead of on every lookup.
+SERVABLE_FILTER = {
+    "is_active": True,
+    "quality_status": "passed",
+    "answer_leakage_check": "passed",
+    "language": "zh-TW",
+}
+
+_LOCK = threading.RLock()
+_STATE: Dict[str, Any] = {"index": None, "version": None, "loaded_at": 0.0}
+_PENDING_USAGE: Dict[Any, int] = {}
+_PENDING_LAST_USED: Dict[Any, datetime] = {}
+_LAST_FLUSH = {"at": time.monotonic()}
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+def index_enabled() -> bool:
+    return str(
+        os.getenv("PARSONS_HINT_LIBRARY_INDEX_ENABLED", "1")
+    ).strip().lower() not in {"0", "false", "no", "off"}
+
+
+def _sort_time(value: Any) -> float:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return 0.0
+
+
+def _int_or_zero(value: Any) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def structured_sort_key(doc: Dict[str, Any]) -> Tuple:
+    """Descending key matching the structured lookup sort in ``parsons.py``."""
+    return (
+        _int_or_zero(doc.get("success_count")),
+        _int_or_zero(doc.get("usage_count")),
+        _int_or_zero(doc.get("version")),
+        _sort_time(doc.get("updated_at")),
+        str(doc.get("_id") or ""),
+    )
+
+
+def legacy_sort_key(doc: Dict[str, Any]) -> Tuple:
+    return (
+        _int_or_zero(doc.get("version")),
+        _sort_time(doc.get("updated_at")),
+        str(doc.get("_id") or ""),
+    )
+
+
+def _base_key(doc: Dict[str, Any]) -> Tuple:
+    return (
+        doc.get("hint_level"),
+        doc.get("unit_category"),
+        doc.get("relation_type"),
+        doc.get("error_type"),
+    )
+
+
+def build_hint_library_index(docs: Iterable[Dict[str, Any]]) -> Dict[str, Dict[Tuple, List[Dict[str, Any]]]]:
+    """Bucket servable templates by every structured and legacy lookup shape."""
+    index: Dict[str, Dict[Tuple, List[Dict[str, Any]]]] = {
+        "exact_fingerprint": {},
+        "same_relation_and_control": {},
+        "same_task_family_relation": {},
+        "same_category_relation": {},
+        "legacy_concept_only": {},
+    }
+
+    def _add(bucket: str, key: Tuple, doc: Dict[str, Any]) -> None:
+        index[bucket].setdefault(key, []).append(doc)
+
+    for doc in docs:
+        if not isinstance(doc, dict):
+            continue
+        if any(doc.get(field) != value for field, value in SERVABLE_FILTER.items()):
+            continue
+        if doc.get("hint_key") is not None:
+            _add("legacy_concept_only", (doc.get("hint_level"), doc.get("hint_key")), doc)
+        if _int_or_zero(doc.get("schema_version")) < 2 or doc.get("retrieval_eligible") is not True:
+            continue
+        base = _base_key(doc)
+        concept_tag = doc.get("concept_tag")
+        if doc.get("fingerprint_key"):
+            _add("exact_fingerprint", base + (doc.get("fingerprint_key"),), doc)
+        _add(
+            "same_relation_and_control",
+            base + (doc.get("control_structure"), doc.get("scope"), concept_tag),
+            doc,
+        )
+        if doc.get("task_scope") == "task_family":
+            _add("same_task_family_relation", base + (doc.get("task_family"), concept_tag), doc)
+        _add("same_category_relation", base + (doc.get("scope"), concept_tag), doc)
+
+    for bucket, groups in index.items():
+        sort_key = legacy_sort_key if bucket == "legacy_concept_only" else structured_sort_key
+        for docs_in_group in groups.values():
+            docs_in_group.sort(key=sort_key, reverse=True)
+    return index
+
+
+def _best_of(index, bucket: str, keys: Sequence[Tuple]) -> Optional[Dict[str, Any]]:
+    heads = [group[0] for group in (index[bucket].get(key) for key in keys) if group]
+    if not heads:
+        return None
+    sort_key = legacy_sort_key if bucket == "legacy_concept_only" else structured_sort_key
+    return max(heads, key=sort_key)
+
+
+def lookup_structured(index, ctx: Dict[str, Any], aliases: Sequence[str], task_family: Optional[str]):
+    """Yield ``(match_mode, doc)`` in the same fallback order as the DB path.
+
+    Like ``find_one`` with a sort, each stage only offers its best document;
+    the caller decides whether that document is usable.
+    """
+    base = (
+        ctx.get("hint_level"),
+        ctx.get("unit_category"),
+        ctx.get("relation_type"),
+        ctx.get("error_type"),
+    )
+    concepts = list(aliases) or [ctx.get("concept_tag")]
+    stages = [
+        ("exact_fingerprint", [base + (ctx.get("fingerprint_key"),)]),
+        (
+            "same_relation_and_control",
+            [base + (ctx.get("control_structure"), ctx.get("scope"), tag) for tag in concepts],
+        ),
+    ]
+    if task_family:
+        stages.append((
+            "same_task_family_relation",
+            [base + (task_family, tag) for tag in concepts],
+        ))
+    stages.append((
+        "same_category_relation",
+        [base + (ctx.get("scope"), tag) for tag in concepts],
+    ))
+    for match_mode, keys in stages:
+        yield match_mode, _best_of(index, match_mode, keys)
+
+
+def lookup_legacy(index, hint_level: Any, hint_key: str) -> Optional[Dict[str, Any]]:
+    return _best_of(index, "legacy_concept_only", [(hint_level, hint_key)])
+
+
+def get_hint_library_index(force: bool = False):
+    """Return the current index, rebuilding it when the shared stamp moved.
+
+    Returns ``None`` when the library cannot be loaded so callers can fall
+    back to querying MongoDB directly.
+    """
+    check_seconds = _env_float("PARSONS_HINT_LIBRARY_INDEX_CHECK_SEC", 5.0)
+    max_age_seconds = _env_float("PARSONS_HINT_LIBRARY_INDEX_MAX_AGE_SEC", 300.0)
+    version = cached_cache_version(HINT_LIBRARY_CACHE_NAME, check_seconds)
+    now = time.monotonic()
+    with _LOCK:
+        current = _STATE["index"]
+        if (
+            not force
+            and current is not None
+            and version is not None
+            and version == _STATE["version"]
+            and now - _STATE["loaded_at"] < max_age_seconds
+        ):
+            return current
+        try:
+            docs = list(db.hint_library.find(SERVABLE_FILTER))
+        except PyMongoError as exc:
+            print("[hint_library] index load failed:", repr(exc))
+            return current
+        _STATE["index"] = build_hint_library_index(docs)
+        _STATE["version"] = version
+        _STATE["loaded_at"] = now
+        return _STATE["index"]
+
+
+def invalidate_hint_library_index() -> None:
+    """Drop the local index and advance the shared stamp after a library write."""
+    with _LOCK:
+        _STATE["index"] = None
+        _STATE["version"] = None
+    bump_cache_version(HINT_LIBRARY_CACHE_NAME)
+
+
+def record_hint_library_usage(doc_id: Any, used_at: datetime) -> None:
+    """Buffer one usage hit; flush when the batch is large or old enough."""
+    if doc_id is None:
+        return
+    batch_size = int(_env_float("PARSONS_HINT_LIBRARY_USAGE_BATCH", 20)) or 1
+    flush_seconds = _env_float("PARSONS_HINT_LIBRARY_USAGE_FLUSH_SEC", 10.0)
+    with _LOCK:
+        _PENDING_USAGE[doc_id] = _PENDING_USAGE.get(doc_id, 0) + 1
+        _PENDING_LAST_USED[doc_id] = used_at
+        due = (
+            sum(_PENDING_USAGE.values()) >= batch_size
+            or time.monotonic() - _LAST_FLUSH["at"] >= flush_seconds
+        )
+    if due:
+        flush_hint_library_usage()
+
+
+def flush_hint_library_usage() -> int:
+    """Write buffered usage counters with one unordered bulk ``$inc``."""
+    with _LOCK:
+        pending = dict(_PENDING_USAGE)
+        last_used = dict(_PENDING_LAST_USED)
+        _PENDING_USAGE.clear()
+        _PENDING_LAST_USED.clear()
+        _LAST_FLUSH["at"] = time.monotonic()
+    if not pending:
+        return 0
+    operations = [
+        UpdateOne(
+            {"_id": doc_id},
+            {
+                "$inc": {"usage_count": count, "match_count": count},
+                "$max": {
+                    "last_used_at": last_used[doc_id],
+                    "last_matched_at": last_used[doc_id],
+                    "updated_at": last_used[doc_id],
+                },
+            },
+        )
+        for doc_id, count in pending.items()
+    ]
+    try:
+        db.hint_library.bulk_write(operations, ordered=False)
+    except PyMongoError as exc:
+        print("[hint_library] usage flush failed:", repr(exc))
+        with _LOCK:
+            for doc_id, count in pending.items():
+                _PENDING_USAGE[doc_id] = _PENDING_USAGE.get(doc_id, 0) + count
+                _PENDING_LAST_USED.setdefault(doc_id, last_used[doc_id])
+        return 0
+    return len(operations)
+
+
+atexit.register(flush_hint_library_usage)
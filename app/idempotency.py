@@ -0,0 +1,199 @@
+"""Replay stored responses for retried student writes.
+
+A classroom Wi-Fi resend of ``/api/parsons/submit`` used to run the whole
+pipeline again: grading, a second attempt document, attempt counters and
+possibly another hint.  Views decorated with :func:`idempotent` accept an
+``Idempotency-Key`` header (or an ``idempotency_key`` body field, for
+``sendBeacon``) and keep one document per ``(student, path, key)`` in
+``idempotent_responses``:
+
+* The first request inserts an ``in_progress`` reservation (unique ``_id``),
+  runs the view and stores its status and body.  A retry with the same key
+  then costs one primary-key read and gets the stored response back with
+  ``Idempotent-Replayed: true``.
+* A retry that arrives while the first request is still running gets the
+  same 409 as ``prevent_duplicate_submission``.  A reservation older than
+  ``IDEMPOTENCY_PROGRESS_SEC`` belongs to a request that died and is taken
+  over.
+* The same key with a different body is a client bug and gets 422.
+* 5xx responses and exceptions are not stored, so those retries run again.
+
+Records expire through a TTL index on ``expires_at``
+(``IDEMPOTENCY_TTL_SEC``, default one day).  Requests without a key behave
+exactly as before.  MongoDB errors while reserving fall back to running the
+view once without replay protection.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from typing import Any, Dict, Optional
+
+from flask import Response, jsonify, make_response, request
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from .db import db
+from .leases import lease_key
+from .session_auth import current_participant_id, current_student_id, request_json_or_beacon
+
+
+IDEMPOTENCY_COLLECTION = "idempotent_responses"
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+IDEMPOTENCY_TTL_SEC = max(60, int(os.environ.get("IDEMPOTENCY_TTL_SEC", "86400")))
+IDEMPOTENCY_PROGRESS_SEC = 180
+MAX_KEY_LENGTH = 128
+# 這些欄位不屬於請求內容本身，比對重送內容時略過。
+FINGERPRINT_IGNORED_FIELDS = {"session_token", "idempotency_key"}
+
+_INDEX_READY = False
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def ensure_idempotency_indexes() -> None:
+    global _INDEX_READY
+    if _INDEX_READY:
+        return
+    try:
+        db[IDEMPOTENCY_COLLECTION].create_index("expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+        _INDEX_READY = True
+    except PyMongoError as exc:
+        print("[idempotency] index ensure failed:", repr(exc))
+
+
+def request_idempotency_key() -> str:
+    key = str(request.headers.get(IDEMPOTENCY_HEADER) or "").strip()
+    if not key and request.method == "POST":
+        key = str(request_json_or_beacon().get("idempotency_key") or "").strip()
+    return key
+
+
+def request_fingerprint() -> str:
+    data = request_json_or_beacon()
+    if data:
+        payload = json.dumps(
+            {key: value for key, value in data.items() if key not in FINGERPRINT_IGNORED_FIELDS},
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        ).encode("utf-8")
+    else:
+        payload = request.get_data(cache=True)
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _error(status: int, error: str, message: str):
+    return jsonify({"ok": False, "error": error, "message": message}), status
+
+
+def _replay(record: Dict[str, Any]) -> Response:
+    response = Response(
+        record.get("body") or "",
+        status=int(record.get("status_code") or 200),
+        mimetype=record.get("mimetype") or "application/json",
+    )
+    response.headers[REPLAYED_HEADER] = "true"
+    return response
+
+
+def _reserve(record_id: str, student_id: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+    """Reserve ``record_id``; ``None`` when this request now owns it, else the existing record."""
+    collection = db[IDEMPOTENCY_COLLECTION]
+    now = _utc_now()
+    reservation = {
+        "state": "in_progress",
+        "fingerprint": fingerprint,
+        "started_at": now,
+        "progress_deadline": now + timedelta(seconds=IDEMPOTENCY_PROGRESS_SEC),
+        "expires_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SEC),
+    }
+    try:
+        collection.insert_one({"_id": record_id, "student_id": student_id, "path": request.path, **reservation})
+        return None
+    except DuplicateKeyError:
+        pass
+    # 前一個請求中斷（行程結束）時，逾時的保留可以接手。
+    taken = collection.update_one(
+        {
+            "_id": record_id,
+            "state": "in_progress",
+            "fingerprint": fingerprint,
+            "progress_deadline": {"$lte": now},
+        },
+        {"$set": reservation},
+    )
+    if taken.modified_count == 1:
+        return None
+    return collection.find_one({"_id": record_id}) or {"state": "in_progress", "fingerprint": fingerprint}
+
+
+def _forget(record_id: str) -> None:
+    try:
+        db[IDEMPOTENCY_COLLECTION].delete_one({"_id": record_id, "state": "in_progress"})
+    except PyMongoError as exc:
+        print("[idempotency] release failed:", repr(exc))
+
+
+def _store(record_id: str, response: Response) -> None:
+    try:
+        db[IDEMPOTENCY_COLLECTION].update_one(
+            {"_id": record_id},
+            {"$set": {
+                "state": "done",
+                "status_code": response.status_code,
+                "mimetype": response.mimetype,
+                "body": response.get_data(as_text=True),
+                "completed_at": _utc_now(),
+            }},
+        )
+    except PyMongoError as exc:
+        print("[idempotency] store failed:", repr(exc))
+
+
+def idempotent(view):
+    """Replay the stored response when a request repeats its idempotency key."""
+
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        key = request_idempotency_key()
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return _error(400, "invalid_idempotency_key", f"Idempotency-Key 長度不得超過 {MAX_KEY_LENGTH} 字元。")
+
+        student_id = current_student_id() or current_participant_id()
+        record_id = lease_key("idempotency", student_id, request.path, key)
+        fingerprint = request_fingerprint()
+        try:
+            ensure_idempotency_indexes()
+            existing = _reserve(record_id, student_id, fingerprint)
+        except PyMongoError as exc:
+            print("[idempotency] reserve failed:", repr(exc))
+            return view(*args, **kwargs)
+
+        if existing is not None:
+            if existing.get("fingerprint") != fingerprint:
+                return _error(422, "idempotency_key_reused", "同一個 Idempotency-Key 不可用於不同的請求內容。")
+            if existing.get("state") == "done":
+                return _replay(existing)
+            return _error(409, "duplicate_submission", "答案正在送出，請勿重複提交。")
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            _forget(record_id)
+            raise
+        if response.status_code >= 500 or response.is_streamed:
+            _forget(record_id)
+        else:
+            _store(record_id, response)
+        return response
+
+    return wrapped
@@ -0,0 +1,85 @@
+"""Find many keywords in a text with one compiled pattern.
+
+Concept detection, subtitle selection and concept alignment score text by
+keyword containment (``keyword in text``, plain substrings, lower-cased).
+Written as ``for kw in keywords: if kw in text`` that is one scan of the
+text per keyword, repeated per subtitle segment and per concept tag.
+
+:class:`KeywordMatcher` compiles its keywords once into a single regular
+expression, ``kw_1|kw_2|...`` with the alternatives longest first.  The
+regex engine skips positions that cannot start any keyword, so one pass
+over the text replaces the per-keyword scans; what is left is a little
+Python work per hit.  Each match is the longest keyword starting at that position; the
+shorter keywords that start there are exactly its prefixes, which are
+precomputed, and the next search starts one character later so overlapping
+keywords are found too.  The result is the same set of hits as the
+substring loops, so scores do not change.
+
+Matching is case-insensitive the way the callers were: keywords and text
+are stripped / lower-cased with ``str.lower``.
+"""
+
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+def normalize_keyword(keyword) -> str:
+    return str(keyword or "").strip().lower()
+
+
+class KeywordMatcher:
+    def __init__(self, keywords: Iterable[str]):
+        unique = {normalize_keyword(keyword) for keyword in keywords or []}
+        unique.discard("")
+        self.keywords = frozenset(unique)
+        ordered = sorted(unique, key=lambda keyword: (-len(keyword), keyword))
+        # 同一位置較短的關鍵字必為最長命中的前綴。
+        self._prefixes: Dict[str, Tuple[str, ...]] = {
+            keyword: tuple(other for other in ordered if keyword.startswith(other))
+            for keyword in ordered
+        }
+        self._pattern = re.compile("|".join(re.escape(keyword) for keyword in ordered)) if ordered else None
+
+    def _matches(self, text: str):
+        search = self._pattern.search
+        position = 0
+        while True:
+            match = search(text, position)
+            if match is None:
+                return
+            yield match.start(), self._prefixes[match.group()]
+            position = match.start() + 1
+
+    def scan(self, text: str) -> List[Tuple[int, str]]:
+        """Every ``(position, keyword)`` occurrence, by position in ``text.lower()``."""
+        if self._pattern is None or not text:
+            return []
+        return [
+            (position, keyword)
+            for position, keywords in self._matches(text.lower())
+            for keyword in keywords
+        ]
+
+    def hits(self, text: str) -> Set[str]:
+        """The keywords that occur in ``text`` (``{kw for kw in keywords if kw in text}``)."""
+        if self._pattern is None or not text:
+            return set()
+        # scan() 的內層迴圈展開版：每段字幕都會呼叫，省下產生器的開銷。
+        text = text.lower()
+        search = self._pattern.search
+        prefixes = self._prefixes
+        found: Set[str] = set()
+        match = search(text)
+        while match is not None:
+            found.update(prefixes[match.group()])
+            match = search(text, match.start() + 1)
+        return found
+
+
+@lru_cache(maxsize=256)
+def keyword_matcher(keywords: Tuple[str, ...]) -> KeywordMatcher:
+    """Shared matcher for a keyword tuple built at request time."""
+    return KeywordMatcher(keywords)
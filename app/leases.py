@@ -0,0 +1,140 @@
+"""Short-lived leases shared by every worker process.
+
+Guards such as "this exact answer is already being submitted" used to live
+in a module-level set behind a ``threading.Lock``, which only protects one
+process.  With several workers (``gunicorn -w N``, ``uvicorn --workers N``
+or several containers) a retried request can land on another process, so
+the guard has to live in MongoDB:
+
+* ``request_leases`` holds one document per held lease,
+  ``{_id: key, owner, expires_at}``.  Acquiring is a single ``insert_one``;
+  the unique ``_id`` makes it atomic across processes.
+* A TTL index on ``expires_at`` removes leases whose holder crashed.  The TTL
+  monitor only runs about once a minute, so an expired lease that is still
+  present is taken over with a conditional update instead of waiting for it.
+* Releasing deletes the document only if ``owner`` still matches, so a
+  request that outlived its lease cannot release someone else's.
+
+``LEASE_BACKEND=local`` keeps the old in-process set (one process, tests).
+A Mongo failure never blocks the request: the lease is reported as acquired
+and the failure is logged, matching the guard's role as a duplicate-click
+filter rather than a correctness lock.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from .db import db
+
+
+LEASE_COLLECTION = "request_leases"
+DEFAULT_LEASE_TTL_SEC = 120
+
+_LOCAL_LOCK = threading.Lock()
+_LOCAL_LEASES: Dict[str, Tuple[str, float]] = {}
+_INDEX_READY = False
+
+
+def lease_backend() -> str:
+    backend = str(os.getenv("LEASE_BACKEND") or "mongo").strip().lower()
+    return backend if backend in {"mongo", "local"} else "mongo"
+
+
+def lease_key(*parts) -> str:
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def ensure_lease_indexes() -> None:
+    global _INDEX_READY
+    if _INDEX_READY:
+        return
+    try:
+        db[LEASE_COLLECTION].create_index("expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+        _INDEX_READY = True
+    except PyMongoError as exc:
+        print("[leases] index ensure failed:", repr(exc))
+
+
+def _acquire_local(key: str, owner: str, ttl_sec: float) -> bool:
+    now = time.monotonic()
+    with _LOCAL_LOCK:
+        held = _LOCAL_LEASES.get(key)
+        if held is not None and held[1] > now:
+            return False
+        _LOCAL_LEASES[key] = (owner, now + ttl_sec)
+        return True
+
+
+def _release_local(key: str, owner: str) -> None:
+    with _LOCAL_LOCK:
+        held = _LOCAL_LEASES.get(key)
+        if held is not None and held[0] == owner:
+            del _LOCAL_LEASES[key]
+
+
+def _acquire_mongo(key: str, owner: str, ttl_sec: float) -> bool:
+    ensure_lease_indexes()
+    now = datetime.now(timezone.utc)
+    doc = {"_id": key, "owner": owner, "acquired_at": now, "expires_at": now + timedelta(seconds=ttl_sec)}
+    collection = db[LEASE_COLLECTION]
+    try:
+        collection.insert_one(doc)
+        return True
+    except DuplicateKeyError:
+        pass
+    # TTL 監控約每分鐘才執行一次，已過期但尚未刪除的租約直接接手。
+    result = collection.update_one(
+        {"_id": key, "expires_at": {"$lte": now}},
+        {"$set": {"owner": owner, "acquired_at": now, "expires_at": doc["expires_at"]}},
+    )
+    if result.matched_count == 0:
+        # 過期租約可能剛好在兩次操作之間被 TTL 刪除；再插入一次，仍重複才是別人持有中。
+        try:
+            collection.insert_one(doc)
+            return True
+        except DuplicateKeyError:
+            return False
+    return result.modified_count == 1
+
+
+def acquire_lease(key: str, ttl_sec: float = DEFAULT_LEASE_TTL_SEC, owner: Optional[str] = None) -> Optional[str]:
+    """Take ``key`` for ``ttl_sec``; the owner token, or ``None`` if held elsewhere."""
+    owner = owner or uuid.uuid4().hex
+    if lease_backend() == "local":
+        return owner if _acquire_local(key, owner, ttl_sec) else None
+    try:
+        return owner if _acquire_mongo(key, owner, ttl_sec) else None
+    except PyMongoError as exc:
+        print("[leases] acquire failed:", repr(exc))
+        return owner
+
+
+def release_lease(key: str, owner: str) -> None:
+    if lease_backend() == "local":
+        _release_local(key, owner)
+        return
+    try:
+        db[LEASE_COLLECTION].delete_one({"_id": key, "owner": owner})
+    except PyMongoError as exc:
+        print("[leases] release failed:", repr(exc))
+
+
+@contextmanager
+def held_lease(key: str, ttl_sec: float = DEFAULT_LEASE_TTL_SEC) -> Iterator[bool]:
+    """``with held_lease(key) as acquired:``; released on exit when acquired."""
+    owner = acquire_lease(key, ttl_sec)
+    try:
+        yield owner is not None
+    finally:
+        if owner is not None:
+            release_lease(key, owner)
@@ -0,0 +1,151 @@
+"""Optional MongoDB time-series storage for the event logs.
+
+``LOG_STORAGE_MODE=timeseries`` stores ``video_rewatch_logs`` and
+``learning_logs`` as time-series collections (``timeField`` ``event_at``,
+``metaField`` ``meta``).  Documents keep their top-level fields, so every
+reader keeps working, and writers add a ``meta`` copy of the student, video
+and event type so MongoDB buckets events per student.  In this mode only a
+few compound indexes are kept instead of the ~10 single-field ones.
+
+Time-series collections need MongoDB 7.0+ here: ``learning_logs`` hint rows
+are updated in place, and the rollup job deletes archived events by ``_id``.
+They cannot carry unique indexes, so the batch telemetry endpoint only
+de-duplicates ``client_seq`` within one batch in this mode.
+
+Existing collections are converted with
+``tools/migrate_logs_to_timeseries.py``.  This module does not import
+:mod:`app.db` so maintenance scripts can share it with their own client.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+
+LOG_STORAGE_MODES = ("standard", "timeseries")
+TIME_FIELD = "event_at"
+META_FIELD = "meta"
+
+# metaField 內容：MongoDB 依這些值分 bucket。
+TIMESERIES_META_FIELDS = {
+    "video_rewatch_logs": ("student_id", "video_id", "event_type"),
+    "learning_logs": ("student_id", "event_type"),
+}
+
+# 時間序列模式下保留的索引（原本各有約 10 個單欄索引）。
+TIMESERIES_INDEXES: Dict[str, List[Tuple[list, str]]] = {
+    "video_rewatch_logs": [
+        ([("student_id", ASCENDING), ("event_at", DESCENDING)], "student_event_at_1"),
+        ([("student_id", ASCENDING), ("video_id", ASCENDING), ("event_at", DESCENDING)], "student_video_event_at_1"),
+        ([("video_id", ASCENDING), ("event_at", DESCENDING)], "video_event_at_1"),
+    ],
+    "learning_logs": [
+        ([("student_id", ASCENDING), ("event_at", DESCENDING)], "student_event_at_1"),
+        ([("event_type", ASCENDING), ("event_at", DESCENDING)], "event_type_event_at_1"),
+    ],
+}
+
+_READY_LOCK = threading.Lock()
+_READY_COLLECTIONS = set()
+
+
+def storage_mode() -> str:
+    mode = str(os.getenv("LOG_STORAGE_MODE") or "standard").strip().lower()
+    return mode if mode in LOG_STORAGE_MODES else "standard"
+
+
+def timeseries_enabled(collection_name: str) -> bool:
+    return storage_mode() == "timeseries" and collection_name in TIMESERIES_META_FIELDS
+
+
+def timeseries_options() -> Dict[str, Any]:
+    return {"timeField": TIME_FIELD, "metaField": META_FIELD, "granularity": "seconds"}
+
+
+def timeseries_ttl_seconds() -> Optional[int]:
+    """``LOG_TIMESERIES_TTL_DAYS`` lets MongoDB expire raw events itself."""
+    try:
+        days = float(os.getenv("LOG_TIMESERIES_TTL_DAYS") or 0)
+    except ValueError:
+        return None
+    return int(days * 86400) if days > 0 else None
+
+
+def _as_utc(value: Any) -> Optional[datetime]:
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def event_time(doc: Dict[str, Any]) -> datetime:
+    """Best available event time; time-series inserts require one."""
+    for field in (TIME_FIELD, "recorded_at", "start_at", "watch_end_at", "created_at"):
+        value = _as_utc(doc.get(field))
+        if value is not None:
+            return value
+    oid = doc.get("_id")
+    if isinstance(oid, ObjectId):
+        return oid.generation_time
+    return datetime.now(timezone.utc)
+
+
+def with_timeseries_fields(collection_name: str, doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Add ``event_at`` and ``meta`` as a time-series collection needs them."""
+    doc[TIME_FIELD] = event_time(doc)
+    doc[META_FIELD] = {
+        field: doc.get(field)
+        for field in TIMESERIES_META_FIELDS.get(collection_name, ())
+    }
+    return doc
+
+
+def prepare_log_document(collection_name: str, doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Writers call this before inserting; a no-op in standard mode."""
+    if timeseries_enabled(collection_name):
+        with_timeseries_fields(collection_name, doc)
+    return doc
+
+
+def is_timeseries_collection(database, collection_name: str) -> bool:
+    try:
+        infos = list(database.list_collections(filter={"name": collection_name}))
+    except PyMongoError:
+        return False
+    return bool(infos) and infos[0].get("type") == "timeseries"
+
+
+def create_timeseries_collection(database, collection_name: str) -> bool:
+    """Create ``collection_name`` as a time-series collection if it is missing."""
+    options = {"timeseries": timeseries_options()}
+    ttl = timeseries_ttl_seconds()
+    if ttl:
+        options["expireAfterSeconds"] = ttl
+    try:
+        database.create_collection(collection_name, **options)
+        return True
+    except CollectionInvalid:
+        # 已存在（一般或時間序列集合）；不在這裡轉換既有資料。
+        return False
+
+
+def ensure_log_collection(database, collection_name: str) -> None:
+    """In time-series mode create the collection and its lean indexes once."""
+    if not timeseries_enabled(collection_name):
+        return
+    with _READY_LOCK:
+        if collection_name in _READY_COLLECTIONS:
+            return
+    create_timeseries_collection(database, collection_name)
+    for keys, name in TIMESERIES_INDEXES.get(collection_name, []):
+        database[collection_name].create_index(keys, name=name)
+    with _READY_LOCK:
+        _READY_COLLECTIONS.add(collection_name)
@@ -0,0 +1,499 @@
+"""Request-level performance metrics for the backend.
+
+Everything is kept in process memory and rendered in the Prometheus text
+format by ``GET /api/admin/metrics``:
+
+* per-endpoint latency histograms, status counts and response sizes;
+* MongoDB command counts and time, from a ``pymongo.monitoring``
+  ``CommandListener`` registered on the client in :mod:`app.db`, both per
+  command name and attributed to the endpoint that issued them;
+* OpenAI call time per call kind (``observe_llm_call``);
+* saturation gauges: requests in flight and MongoDB pool connections checked
+  out (current and peak since the last ``reset_peaks``), the time spent
+  waiting for a pool connection, and the configured capacities
+  (``WAITRESS_THREADS``, ``MONGO_MAX_POOL_SIZE``) they are compared with by
+  ``tools/load_simulation.py``.
+
+When ``REQUEST_PROFILE_SLOW_MS`` is set, each request runs under cProfile (or
+pyinstrument when ``REQUEST_PROFILE_ENGINE=pyinstrument`` and it is
+installed) and the trace is written to ``REQUEST_PROFILE_DIR`` only when the
+request was slower than the threshold.  Profiling has a real cost, so it is
+off by default and meant to be switched on while chasing a slow endpoint.
+
+Counters are per process; with several worker processes each one exposes
+its own numbers.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from .query_shapes import query_shape_recorder
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+_LOCK = threading.Lock()
+_REQUEST_LOCAL = threading.local()
+
+
+def _env_enabled(name: str, default: str = "1") -> bool:
+    return str(os.getenv(name, default)).strip().lower() not in {"0", "false", "no", "off"}
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+class _Registry:
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.started_at = time.time()
+        self.request_latency: Dict[Tuple[str, str], _Histogram] = {}
+        self.request_status: Dict[Tuple[str, str, str], int] = {}
+        self.response_bytes: Dict[str, List[float]] = {}
+        self.request_mongo: Dict[str, List[float]] = {}
+        self.mongo_commands: Dict[str, List[float]] = {}
+        self.mongo_failures: Dict[str, int] = {}
+        self.llm_latency: Dict[str, _Histogram] = {}
+        self.llm_failures: Dict[str, int] = {}
+        self.profiles_captured = 0
+        self.in_flight = 0
+        self.in_flight_peak = 0
+        self.pool_checked_out = 0
+        self.pool_checked_out_peak = 0
+        self.pool_wait = _Histogram(POOL_WAIT_BUCKETS)
+        self.pool_failures: Dict[str, int] = {}
+        self.capacity: Dict[str, int] = {}
+
+
+_REGISTRY = _Registry()
+
+
+def reset_metrics() -> None:
+    with _LOCK:
+        capacity = _REGISTRY.capacity
+        _REGISTRY.reset()
+        _REGISTRY.capacity = capacity
+
+
+def reset_peaks() -> None:
+    """Start a new peak window (``GET /api/admin/metrics?reset_peaks=1``)."""
+    with _LOCK:
+        _REGISTRY.in_flight_peak = _REGISTRY.in_flight
+        _REGISTRY.pool_checked_out_peak = _REGISTRY.pool_checked_out
+
+
+def record_capacity(resource: str, value: int) -> None:
+    """Publish a configured limit, e.g. ``waitress_threads`` or ``mongo_max_pool_size``."""
+    with _LOCK:
+        _REGISTRY.capacity[resource] = int(value)
+
+
+# ---------------------------------------------------------------------------
+# Recording
+# ---------------------------------------------------------------------------
+
+def record_request(
+    endpoint: str,
+    method: str,
+    status: int,
+    seconds: float,
+    response_bytes: Optional[int],
+    mongo_commands: int = 0,
+    mongo_seconds: float = 0.0,
+) -> None:
+    with _LOCK:
+        hist = _REGISTRY.request_latency.get((endpoint, method))
+        if hist is None:
+            hist = _REGISTRY.request_latency[(endpoint, method)] = _Histogram(LATENCY_BUCKETS)
+        hist.observe(seconds)
+        key = (endpoint, method, str(status))
+        _REGISTRY.request_status[key] = _REGISTRY.request_status.get(key, 0) + 1
+        if response_bytes is not None:
+            sizes = _REGISTRY.response_bytes.setdefault(endpoint, [0.0, 0])
+            sizes[0] += response_bytes
+            sizes[1] += 1
+        mongo = _REGISTRY.request_mongo.setdefault(endpoint, [0, 0.0])
+        mongo[0] += mongo_commands
+        mongo[1] += mongo_seconds
+
+
+def record_mongo_command(command: str, seconds: float, failed: bool = False) -> None:
+    with _LOCK:
+        stats = _REGISTRY.mongo_commands.setdefault(command, [0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        if failed:
+            _REGISTRY.mongo_failures[command] = _REGISTRY.mongo_failures.get(command, 0) + 1
+    state = getattr(_REQUEST_LOCAL, "state", None)
+    if state is not None:
+        state["mongo_commands"] += 1
+        state["mongo_seconds"] += seconds
+
+
+def record_llm_call(kind: str, seconds: float, failed: bool = False) -> None:
+    with _LOCK:
+        hist = _REGISTRY.llm_latency.get(kind)
+        if hist is None:
+            hist = _REGISTRY.llm_latency[kind] = _Histogram(LLM_BUCKETS)
+        hist.observe(seconds)
+        if failed:
+            _REGISTRY.llm_failures[kind] = _REGISTRY.llm_failures.get(kind, 0) + 1
+
+
+def request_started() -> None:
+    with _LOCK:
+        _REGISTRY.in_flight += 1
+        _REGISTRY.in_flight_peak = max(_REGISTRY.in_flight_peak, _REGISTRY.in_flight)
+
+
+def request_finished() -> None:
+    with _LOCK:
+        _REGISTRY.in_flight = max(0, _REGISTRY.in_flight - 1)
+
+
+@contextmanager
+def observe_llm_call(kind: str) -> Iterator[None]:
+    """Time one OpenAI call; failures are counted and re-raised."""
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        record_llm_call(kind, time.perf_counter() - started, failed)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Count and time every command sent by the shared client.
+
+    Synchronous pymongo publishes command events on the thread that issued
+    the command, so the per-request totals can live in a thread-local.
+    """
+
+    def started(self, event) -> None:
+        pass
+
+    def succeeded(self, event) -> None:
+        record_mongo_command(event.command_name, event.duration_micros / 1_000_000)
+
+    def failed(self, event) -> None:
+        record_mongo_command(event.command_name, event.duration_micros / 1_000_000, failed=True)
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Track connections checked out of the pool and the wait to get one.
+
+    A pool at ``MONGO_MAX_POOL_SIZE`` with growing checkout waits means
+    request threads are queueing for MongoDB rather than for waitress.
+    """
+
+    def connection_checked_out(self, event) -> None:
+        with _LOCK:
+            _REGISTRY.pool_checked_out += 1
+            _REGISTRY.pool_checked_out_peak = max(_REGISTRY.pool_checked_out_peak, _REGISTRY.pool_checked_out)
+            _REGISTRY.pool_wait.observe(float(getattr(event, "duration", 0.0) or 0.0))
+
+    def connection_checked_in(self, event) -> None:
+        with _LOCK:
+            _REGISTRY.pool_checked_out = max(0, _REGISTRY.pool_checked_out - 1)
+
+    def connection_check_out_failed(self, event) -> None:
+        reason = str(getattr(event, "reason", "") or "unknown")
+        with _LOCK:
+            _REGISTRY.pool_failures[reason] = _REGISTRY.pool_failures.get(reason, 0) + 1
+            _REGISTRY.pool_wait.observe(float(getattr(event, "duration", 0.0) or 0.0))
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_created(self, event) -> None:
+        pass
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        pass
+
+    def connection_check_out_started(self, event) -> None:
+        pass
+
+
+def mongo_event_listeners() -> List[Any]:
+    """Listeners for ``MongoClient(event_listeners=...)``; empty when disabled.
+
+    ``MONGO_QUERY_SHAPES_FILE`` also adds the query-shape recorder used by
+    ``tools/index_advisor.py``.
+    """
+    listeners: List[Any] = []
+    if _env_enabled("MONGO_COMMAND_METRICS_ENABLED"):
+        listeners.append(MongoCommandMetrics())
+        listeners.append(MongoPoolMetrics())
+    recorder = query_shape_recorder()
+    if recorder is not None:
+        listeners.append(recorder)
+    return listeners
+
+
+# ---------------------------------------------------------------------------
+# Flask middleware
+# ---------------------------------------------------------------------------
+
+def _start_profiler():
+    engine = str(os.getenv("REQUEST_PROFILE_ENGINE", "cprofile")).strip().lower()
+    if engine == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            Profiler = None
+        if Profiler is not None:
+            profiler = Profiler(async_mode="disabled")
+            profiler.start()
+            return "pyinstrument", profiler
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already active on this thread.
+        return None
+    return "cprofile", profiler
+
+
+def _stop_profiler(handle) -> None:
+    if not handle:
+        return
+    engine, profiler = handle
+    try:
+        if engine == "pyinstrument":
+            profiler.stop()
+        else:
+            profiler.disable()
+    except Exception:
+        pass
+
+
+def _save_profile(handle, endpoint: str, seconds: float) -> Optional[str]:
+    engine, profiler = handle
+    directory = os.getenv("REQUEST_PROFILE_DIR") or os.path.join(os.getcwd(), "profiles")
+    safe_endpoint = re.sub(r"[^A-Za-z0-9_.-]+", "_", endpoint) or "unknown"
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    base = os.path.join(directory, f"{stamp}_{safe_endpoint}_{int(seconds * 1000)}ms")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        if engine == "pyinstrument":
+            path = base + ".html"
+            with open(path, "w", encoding="utf-8") as handle_out:
+                handle_out.write(profiler.output_html())
+        else:
+            path = base + ".prof"
+            profiler.dump_stats(path)
+    except Exception as exc:
+        print("[metrics] profile save failed:", repr(exc))
+        return None
+    with _LOCK:
+        _REGISTRY.profiles_captured += 1
+    return path
+
+
+def install_request_metrics(app) -> None:
+    """Register the timing hooks on ``app``; no-op when ``REQUEST_METRICS_ENABLED=0``."""
+    if not _env_enabled("REQUEST_METRICS_ENABLED"):
+        return
+
+    from flask import g, request
+
+    slow_ms = _env_float("REQUEST_PROFILE_SLOW_MS", 0.0)
+
+    @app.before_request
+    def start_request_metrics():
+        _REQUEST_LOCAL.state = {"mongo_commands": 0, "mongo_seconds": 0.0}
+        g.metrics_started = time.perf_counter()
+        g.metrics_in_flight = True
+        request_started()
+        g.metrics_profiler = _start_profiler() if slow_ms > 0 else None
+        return None
+
+    @app.after_request
+    def finish_request_metrics(response):
+        started = getattr(g, "metrics_started", None)
+        if started is None:
+            return response
+        seconds = time.perf_counter() - started
+        state = getattr(_REQUEST_LOCAL, "state", None) or {}
+        endpoint = request.endpoint or "unmatched"
+        profiler = getattr(g, "metrics_profiler", None)
+        g.metrics_profiler = None
+        _stop_profiler(profiler)
+        if profiler and seconds * 1000 >= slow_ms:
+            path = _save_profile(profiler, endpoint, seconds)
+            if path:
+                app.logger.warning("Slow request %.0fms %s %s profile=%s", seconds * 1000, request.method, request.path, path)
+
+        record_request(
+            endpoint,
+            request.method,
+            response.status_code,
+            seconds,
+            None if response.direct_passthrough else response.calculate_content_length(),
+            int(state.get("mongo_commands") or 0),
+            float(state.get("mongo_seconds") or 0.0),
+        )
+        return response
+
+    @app.teardown_request
+    def clear_request_metrics(exc=None):
+        _stop_profiler(getattr(g, "metrics_profiler", None))
+        if getattr(g, "metrics_in_flight", False):
+            g.metrics_in_flight = False
+            request_finished()
+        _REQUEST_LOCAL.state = None
+
+
+# ---------------------------------------------------------------------------
+# Prometheus text exposition
+# ---------------------------------------------------------------------------
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels: Any) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_number(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _histogram_lines(name: str, hist: _Histogram, **labels: Any) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(hist.buckets, hist.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(**labels, le=repr(bound))} {cumulative}")
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {hist.count}")
+    lines.append(f"{name}_sum{_labels(**labels)} {_format_number(hist.total)}")
+    lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+    return lines
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+
+    def _header(name: str, kind: str, help_text: str) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    with _LOCK:
+        _header("app_process_start_time_seconds", "gauge", "Start time of the metrics registry.")
+        lines.append(f"app_process_start_time_seconds {_format_number(_REGISTRY.started_at)}")
+
+        _header("http_request_duration_seconds", "histogram", "Request latency by Flask endpoint.")
+        for (endpoint, method), hist in sorted(_REGISTRY.request_latency.items()):
+            lines.extend(_histogram_lines("http_request_duration_seconds", hist, endpoint=endpoint, method=method))
+
+        _header("http_requests_total", "counter", "Requests by endpoint and status code.")
+        for (endpoint, method, status), count in sorted(_REGISTRY.request_status.items()):
+            lines.append(f"http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}")
+
+        _header("http_response_size_bytes", "summary", "Response body size by endpoint.")
+        for endpoint, (total, count) in sorted(_REGISTRY.response_bytes.items()):
+            lines.append(f"http_response_size_bytes_sum{_labels(endpoint=endpoint)} {_format_number(total)}")
+            lines.append(f"http_response_size_bytes_count{_labels(endpoint=endpoint)} {count}")
+
+        _header("http_request_mongo_commands_total", "counter", "MongoDB commands issued while serving each endpoint.")
+        for endpoint, (count, _) in sorted(_REGISTRY.request_mongo.items()):
+            lines.append(f"http_request_mongo_commands_total{_labels(endpoint=endpoint)} {count}")
+        _header("http_request_mongo_seconds_total", "counter", "MongoDB command time spent while serving each endpoint.")
+        for endpoint, (_, seconds) in sorted(_REGISTRY.request_mongo.items()):
+            lines.append(f"http_request_mongo_seconds_total{_labels(endpoint=endpoint)} {_format_number(seconds)}")
+
+        _header("mongo_commands_total", "counter", "MongoDB commands by command name.")
+        for command, (count, _) in sorted(_REGISTRY.mongo_commands.items()):
+            lines.append(f"mongo_commands_total{_labels(command=command)} {count}")
+        _header("mongo_command_seconds_total", "counter", "MongoDB command time by command name.")
+        for command, (_, seconds) in sorted(_REGISTRY.mongo_commands.items()):
+            lines.append(f"mongo_command_seconds_total{_labels(command=command)} {_format_number(seconds)}")
+        _header("mongo_command_failures_total", "counter", "Failed MongoDB commands by command name.")
+        for command, count in sorted(_REGISTRY.mongo_failures.items()):
+            lines.append(f"mongo_command_failures_total{_labels(command=command)} {count}")
+
+        _header("llm_call_duration_seconds", "histogram", "OpenAI call latency by call kind.")
+        for kind, hist in sorted(_REGISTRY.llm_latency.items()):
+            lines.extend(_histogram_lines("llm_call_duration_seconds", hist, kind=kind))
+        _header("llm_call_failures_total", "counter", "Failed OpenAI calls by call kind.")
+        for kind, count in sorted(_REGISTRY.llm_failures.items()):
+            lines.append(f"llm_call_failures_total{_labels(kind=kind)} {count}")
+
+        _header("http_requests_in_flight", "gauge", "Requests currently being served by this process.")
+        lines.append(f"http_requests_in_flight {_REGISTRY.in_flight}")
+        _header("http_requests_in_flight_peak", "gauge", "Most requests in flight since the last peak reset.")
+        lines.append(f"http_requests_in_flight_peak {_REGISTRY.in_flight_peak}")
+        _header("mongo_pool_checked_out", "gauge", "MongoDB pool connections currently checked out.")
+        lines.append(f"mongo_pool_checked_out {_REGISTRY.pool_checked_out}")
+        _header("mongo_pool_checked_out_peak", "gauge", "Most pool connections checked out since the last peak reset.")
+        lines.append(f"mongo_pool_checked_out_peak {_REGISTRY.pool_checked_out_peak}")
+        _header("mongo_pool_checkout_wait_seconds", "histogram", "Time spent waiting for a MongoDB pool connection.")
+        lines.extend(_histogram_lines("mongo_pool_checkout_wait_seconds", _REGISTRY.pool_wait))
+        _header("mongo_pool_checkout_failures_total", "counter", "Failed pool checkouts by reason.")
+        for reason, count in sorted(_REGISTRY.pool_failures.items()):
+            lines.append(f"mongo_pool_checkout_failures_total{_labels(reason=reason)} {count}")
+        _header("app_capacity", "gauge", "Configured limits the saturation gauges are compared with.")
+        for resource, value in sorted(_REGISTRY.capacity.items()):
+            lines.append(f"app_capacity{_labels(resource=resource)} {value}")
+
+        _header("request_profiles_captured_total", "counter", "Slow-request profiles written to disk.")
+        lines.append(f"request_profiles_captured_total {_REGISTRY.profiles_captured}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,594 @@
+"""Side-effect-free Parsons grading engine.
+
+Practice submit (``/api/parsons/submit``) and test submit
+(``/api/parsons/test/submit``) both grade through
+:func:`grade_parsons_submission`; the v2 audit helpers (per-slot block
+results, error analysis, score) live here too so the rules cannot drift
+apart again.  Nothing in this module touches MongoDB, Flask or the clock:
+it takes a parsed task (``t5doc_to_parsons_task`` output) and the submitted
+answer and returns plain dicts.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+GRADING_MODES = ("practice", "test")
+
+_DEDENT_PREFIXES = ("elif ", "else:", "except", "finally:")
+_SEMANTIC_OPERATORS = (" + ", " - ", " * ", " / ", "==", "!=", "<=", ">=", "<", ">", "+", "-", "*", "/")
+
+
+def normalize_line_for_compare(value: Any) -> str:
+    """Compare block text ignoring surrounding whitespace; tabs count as 4 spaces."""
+    return str(value or "").replace("\t", "    ").strip()
+
+
+def leading_spaces(line: Any) -> int:
+    text = str(line or "")
+    return len(text) - len(text.lstrip(" "))
+
+
+def infer_indents_from_structure(blocks: Sequence[Any]) -> List[int]:
+    """Indent 4 spaces after every ``:`` line; dedent for elif/else/except/finally."""
+    out = []
+    level = 0
+    for block in blocks or []:
+        stripped = str((block or {}).get("text") or "").strip()
+        if stripped.lower().startswith(_DEDENT_PREFIXES):
+            level = max(0, level - 1)
+        out.append(level * 4)
+        if stripped.endswith(":"):
+            level += 1
+    return out
+
+
+def expected_indentation(solution_blocks: Sequence[Any]) -> List[int]:
+    """Explicit ``indent`` or leading spaces; structural inference when all are 0."""
+    indents = []
+    for block in solution_blocks or []:
+        block = block or {}
+        if "indent" in block:
+            indents.append(int(block.get("indent", 0) or 0))
+        else:
+            indents.append(leading_spaces(block.get("text")))
+    if indents and all(value == 0 for value in indents):
+        return infer_indents_from_structure(solution_blocks)
+    return indents
+
+
+def infer_indents_from_blocks(blocks: Sequence[Any]) -> List[int]:
+    """Per-block variant used for stored correct answers (v2 audit trail)."""
+    out = []
+    level = 0
+    for block in blocks or []:
+        if not isinstance(block, dict):
+            out.append(0)
+            continue
+        if "indent" in block:
+            try:
+                out.append(int(block.get("indent") or 0))
+                continue
+            except Exception:
+                pass
+
+        raw = str(block.get("text") or "")
+        stripped = raw.strip()
+        if stripped.lower().startswith(_DEDENT_PREFIXES):
+            level = max(0, level - 1)
+        leading = leading_spaces(raw)
+        out.append(leading if leading > 0 else level * 4)
+        if stripped.endswith(":"):
+            level += 1
+    return out
+
+
+def line_kind(line: Any) -> str:
+    """Classify a code line as ``control``, ``semantic`` or ``main``."""
+    text = str(line or "").strip().lower()
+    if not text:
+        return "main"
+    if text.startswith(("if ", "elif ", "else:")):
+        return "control"
+    if any(op in text for op in _SEMANTIC_OPERATORS):
+        return "semantic"
+    if text.startswith("print(") or " return " in (" " + text + " "):
+        return "semantic"
+    return "main"
+
+
+def primary_error_type(
+    wrong_index: Optional[int],
+    indent_errors: Sequence[int],
+    control_errors: Sequence[int],
+    semantic_errors: Sequence[int],
+) -> Optional[str]:
+    """Four-level priority: indentation > control > semantic > structure."""
+    if wrong_index is None:
+        return None
+    if wrong_index in indent_errors:
+        return "indentation"
+    if wrong_index in control_errors:
+        return "condition"
+    if wrong_index in semantic_errors:
+        return "calculation"
+    return "structure"
+
+
+def grade_parsons_submission(
+    parsed_task: Dict[str, Any],
+    answer_ids: Sequence[Any],
+    answer_lines: Sequence[Any],
+    *,
+    mode: str = "practice",
+) -> Dict[str, Any]:
+    """Grade one Parsons answer slot by slot.
+
+    ``mode="practice"`` only checks indentation of answered slots and scores
+    against the single reported (first) error; ``mode="test"`` checks every
+    slot and scores against every wrong slot.
+    """
+    if mode not in GRADING_MODES:
+        raise ValueError(f"unknown grading mode: {mode}")
+    answer_ids = list(answer_ids or [])
+    answer_lines = list(answer_lines or [])
+
+    expected_ids = [str(slot.get("expected_id")) for slot in (parsed_task.get("template_slots") or [])]
+    solution_blocks = parsed_task.get("solution_blocks") or []
+    expected_indent_list = expected_indentation(solution_blocks)
+    pool_by_id = {str(block.get("id")): block for block in (parsed_task.get("pool") or [])}
+
+    aligned = list(answer_ids)
+    if len(aligned) < len(expected_ids):
+        aligned += [None] * (len(expected_ids) - len(aligned))
+
+    expected_lines = [(block.get("text") or "") for block in solution_blocks]
+    if len(expected_lines) < len(expected_ids):
+        expected_lines += [""] * (len(expected_ids) - len(expected_lines))
+
+    def _text_of(block_id: str) -> str:
+        return str(pool_by_id.get(block_id, {}).get("text", "") or "")
+
+    wrong_indices: List[int] = []
+    id_mismatch_indices: List[int] = []
+    for i, eid in enumerate(expected_ids):
+        aid = str(aligned[i]) if aligned[i] is not None else ""
+        if aid == eid:
+            continue
+        # 文字完全相同（忽略左右空白）的干擾區塊視為該格正確
+        a_text = normalize_line_for_compare(_text_of(aid))
+        if a_text and a_text == normalize_line_for_compare(_text_of(eid)):
+            continue
+        wrong_indices.append(i)
+        id_mismatch_indices.append(i)
+
+    indent_errors: List[int] = []
+    for i in range(min(len(expected_ids), len(answer_lines), len(expected_indent_list))):
+        user_line = str(answer_lines[i] or "")
+        if mode == "practice":
+            # 空白格（未拖拉）視為位置錯誤，不誤判為縮排錯誤。
+            has_answer_id = aligned[i] is not None and str(aligned[i]).strip() != ""
+            if not has_answer_id or not user_line.strip():
+                continue
+        if leading_spaces(user_line) != int(expected_indent_list[i] or 0):
+            indent_errors.append(i)
+            if i not in wrong_indices:
+                wrong_indices.append(i)
+
+    control_errors: List[int] = []
+    semantic_errors: List[int] = []
+    main_order_errors: List[int] = []
+    for i in id_mismatch_indices:
+        kind = line_kind(expected_lines[i] if i < len(expected_lines) else "")
+        if kind == "main":
+            # expected 看不出類型時，改看實際放入的區塊
+            act_id = str(aligned[i]) if aligned[i] is not None else ""
+            kind = line_kind(_text_of(act_id))
+        {"control": control_errors, "semantic": semantic_errors}.get(kind, main_order_errors).append(i)
+
+    extra_wrong = max(0, len(answer_ids) - len(expected_ids))
+    # 主錯誤格固定採「最前面出錯的格」
+    wrong_index = min(wrong_indices) if wrong_indices else None
+    reported_wrong_indices = [wrong_index] if wrong_index is not None else []
+    total_slots = max(1, len(expected_ids))
+    counted = reported_wrong_indices if mode == "practice" else wrong_indices
+    is_correct = not wrong_indices and extra_wrong == 0
+    score = (total_slots - len(counted)) / total_slots
+
+    actual_id = str(aligned[wrong_index]) if wrong_index is not None and aligned[wrong_index] is not None else ""
+    expected_id = expected_ids[wrong_index] if wrong_index is not None else ""
+
+    return {
+        "mode": mode,
+        "expected_ids": expected_ids,
+        "expected_lines": expected_lines,
+        "expected_indentation": expected_indent_list,
+        "aligned_ids": aligned,
+        "wrong_indices": wrong_indices,
+        "id_mismatch_indices": id_mismatch_indices,
+        "indent_errors": indent_errors,
+        "control_errors": control_errors,
+        "semantic_errors": semantic_errors,
+        "main_order_errors": main_order_errors,
+        "extra_wrong": extra_wrong,
+        "wrong_index": wrong_index,
+        "reported_wrong_indices": reported_wrong_indices,
+        "primary_error_type": primary_error_type(wrong_index, indent_errors, control_errors, semantic_errors),
+        "is_correct": is_correct,
+        "total_slots": total_slots,
+        "score": score,
+        "slot_label": f"第{wrong_index + 1}格" if wrong_index is not None else "",
+        "actual_id": actual_id,
+        "expected_id": expected_id,
+        "actual_text": pool_by_id.get(actual_id, {}).get("text", "") if actual_id else "",
+        "expected_text": pool_by_id.get(expected_id, {}).get("text", "") if expected_id else "",
+    }
+
+
+# ---------------------------------------------------------------------------
+# v2 audit trail helpers
+# ---------------------------------------------------------------------------
+
+def build_error_analysis(
+    *,
+    is_correct: bool,
+    submitted_order,
+    submitted_indentation,
+    correct_answer,
+    target_concept,
+    previous_error_types=None,
+) -> dict:
+    repeated_basis = "same_task_same_error_type"
+    repeated_rule_version = 1
+    concept = str(target_concept or "").strip() or "unknown"
+
+    if bool(is_correct):
+        return {
+            "error_count": 0,
+            "error_types": [],
+            "wrong_slots": [],
+            "incorrect_slots": [],
+            "sequence_slots": [],
+            "indentation_slots": [],
+            "error_details": [],
+            "error_concept": None,
+            "repeated_error": False,
+            "repeated_error_types": [],
+            "repeated_error_count": 0,
+            "repeated_error_basis": repeated_basis,
+            "repeated_error_rule_version": repeated_rule_version,
+        }
+
+    correct = correct_answer if isinstance(correct_answer, dict) else {}
+    expected_order = correct.get("order") if isinstance(correct.get("order"), list) else []
+    actual_order = submitted_order if isinstance(submitted_order, list) else []
+    expected_indents = (
+        correct.get("indentation")
+        if isinstance(correct.get("indentation"), list)
+        else []
+    )
+    actual_indentation = (
+        submitted_indentation
+        if isinstance(submitted_indentation, list)
+        else []
+    )
+
+    sequence_slots = []
+    order_error_details = []
+    if expected_order:
+        expected_position_by_block = {
+            str(block_id): index
+            for index, block_id in enumerate(expected_order)
+            if block_id is not None
+        }
+        for index in range(max(len(actual_order), len(expected_order))):
+            actual = actual_order[index] if index < len(actual_order) else None
+            expected = expected_order[index] if index < len(expected_order) else None
+            if str(actual) != str(expected):
+                sequence_slots.append(index)
+                order_error_details.append({
+                    "slot": index,
+                    "block_id": str(actual) if actual is not None else None,
+                    "error_type": "order",
+                    "expected_block_id": str(expected) if expected is not None else None,
+                    "submitted_position": index if actual is not None else None,
+                    "expected_position": expected_position_by_block.get(str(actual)) if actual is not None else None,
+                    "concept_tag": concept,
+                })
+
+    indentation_slots = []
+    indentation_error_details = []
+    if actual_indentation and expected_indents:
+        for index in range(max(len(actual_indentation), len(expected_indents))):
+            actual = actual_indentation[index] if index < len(actual_indentation) else None
+            expected = expected_indents[index] if index < len(expected_indents) else None
+            if actual != expected:
+                indentation_slots.append(index)
+                block_id = actual_order[index] if index < len(actual_order) else None
+                indentation_error_details.append({
+                    "slot": index,
+                    "block_id": str(block_id) if block_id is not None else None,
+                    "error_type": "indentation",
+                    "submitted_indent": actual,
+                    "expected_indent": expected,
+                    "concept_tag": concept,
+                })
+
+    error_types = []
+    if sequence_slots:
+        error_types.append("sequence_error")
+    if indentation_slots:
+        error_types.append("indentation_error")
+
+    # wrong_slots stores only block-order mismatches (0-based positions).
+    wrong_slots = sorted(set(sequence_slots))
+    # error_count counts distinct slots with either a sequence or indentation error.
+    incorrect_slots = sorted(set(sequence_slots + indentation_slots))
+    error_details = order_error_details + indentation_error_details
+    detail_error_types = sorted({
+        str(item.get("error_type") or "").strip()
+        for item in error_details
+        if str(item.get("error_type") or "").strip()
+    })
+    previous_types = {
+        "order" if str(item) == "sequence_error" else "indentation" if str(item) == "indentation_error" else str(item)
+        for item in (previous_error_types or [])
+        if str(item or "").strip()
+    }
+    repeated_error_types = sorted(set(detail_error_types).intersection(previous_types))
+    repeated_error_count = sum(
+        1
+        for item in error_details
+        if item.get("error_type") in repeated_error_types
+    )
+    repeated_error = bool(repeated_error_types)
+
+    return {
+        "error_count": len(incorrect_slots),
+        "error_types": error_types,
+        # wrong_slots 保留相容性：只代表順序錯誤位置。
+        "wrong_slots": wrong_slots,
+        # incorrect_slots 才是畫面紅色標記應使用的完整位置：
+        # 順序錯誤與縮排錯誤的聯集。
+        "incorrect_slots": incorrect_slots,
+        "sequence_slots": sorted(set(sequence_slots)),
+        "indentation_slots": sorted(set(indentation_slots)),
+        "error_details": error_details,
+        "error_concept": concept,
+        "repeated_error": repeated_error,
+        "repeated_error_types": repeated_error_types,
+        "repeated_error_count": repeated_error_count,
+        "repeated_error_basis": repeated_basis,
+        "repeated_error_rule_version": repeated_rule_version,
+    }
+
+
+def build_block_results(
+    *,
+    block_lookup: dict,
+    submitted_order,
+    submitted_indentation,
+    correct_answer,
+    previous_attempt=None,
+) -> Tuple[List[dict], dict]:
+    """
+    Build per-slot/per-block audit rows.
+
+    Each row preserves both submitted and expected block IDs, so the teacher
+    dashboard can determine exactly which block was corrected after an AI hint.
+    """
+    actual_order = list(submitted_order) if isinstance(submitted_order, list) else []
+    actual_indentation = (
+        list(submitted_indentation)
+        if isinstance(submitted_indentation, list)
+        else []
+    )
+    correct = correct_answer if isinstance(correct_answer, dict) else {}
+    expected_order = (
+        list(correct.get("order"))
+        if isinstance(correct.get("order"), list)
+        else []
+    )
+    expected_indents = (
+        list(correct.get("indentation"))
+        if isinstance(correct.get("indentation"), list)
+        else []
+    )
+
+    previous = previous_attempt if isinstance(previous_attempt, dict) else {}
+    previous_order = (
+        list(previous.get("submitted_order"))
+        if isinstance(previous.get("submitted_order"), list)
+        else []
+    )
+    previous_indentation = (
+        list(previous.get("submitted_indentation"))
+        if isinstance(previous.get("submitted_indentation"), list)
+        else []
+    )
+
+    total_slots = max(
+        len(expected_order),
+        len(actual_order),
+        len(expected_indents),
+        len(actual_indentation),
+    )
+
+    def _state_at(order, indentation, index):
+        submitted_id = (
+            str(order[index]).strip()
+            if index < len(order) and order[index] is not None
+            else ""
+        )
+        expected_id = (
+            str(expected_order[index]).strip()
+            if index < len(expected_order) and expected_order[index] is not None
+            else ""
+        )
+        submitted_block = block_lookup.get(submitted_id) or {}
+        expected_block = block_lookup.get(expected_id) or {}
+        submitted_text = str(submitted_block.get("text") or "")
+        expected_text = str(expected_block.get("text") or "")
+
+        block_id_match = bool(
+            submitted_id
+            and expected_id
+            and submitted_id == expected_id
+        )
+        content_equivalent = bool(
+            submitted_id
+            and expected_id
+            and normalize_line_for_compare(submitted_text)
+            and normalize_line_for_compare(submitted_text)
+            == normalize_line_for_compare(expected_text)
+        )
+        sequence_correct = bool(block_id_match or content_equivalent)
+
+        submitted_indent = (
+            indentation[index]
+            if index < len(indentation)
+            else None
+        )
+        expected_indent = (
+            expected_indents[index]
+            if index < len(expected_indents)
+            else None
+        )
+        if expected_indent is None:
+            indentation_correct = bool(submitted_id)
+        else:
+            indentation_correct = bool(
+                submitted_id
+                and submitted_indent is not None
+                and submitted_indent == expected_indent
+            )
+
+        slot_correct = bool(sequence_correct and indentation_correct)
+        return {
+            "slot_index": index,
+            "slot_label": f"第{index + 1}格",
+            "submitted_block_id": submitted_id or None,
+            "expected_block_id": expected_id or None,
+            "submitted_text": submitted_text or None,
+            "expected_text": expected_text or None,
+            "block_id_match": block_id_match,
+            "content_equivalent": content_equivalent,
+            "submitted_indentation": submitted_indent,
+            "expected_indentation": expected_indent,
+            "sequence_correct": sequence_correct,
+            "indentation_correct": indentation_correct,
+            "slot_correct": slot_correct,
+        }
+
+    current_rows = [_state_at(actual_order, actual_indentation, i) for i in range(total_slots)]
+    previous_rows = (
+        [_state_at(previous_order, previous_indentation, i) for i in range(total_slots)]
+        if previous
+        else []
+    )
+
+    corrected_block_ids = []
+    remaining_wrong_block_ids = []
+    remaining_wrong_submitted_block_ids = []
+    newly_wrong_block_ids = []
+    corrected_slot_indices = []
+    remaining_wrong_slot_indices = []
+    newly_wrong_slot_indices = []
+
+    for index, row in enumerate(current_rows):
+        previous_row = previous_rows[index] if index < len(previous_rows) else None
+        previous_slot_correct = (
+            bool(previous_row.get("slot_correct"))
+            if isinstance(previous_row, dict)
+            else None
+        )
+        current_slot_correct = bool(row.get("slot_correct"))
+
+        corrected = bool(
+            previous_slot_correct is False
+            and current_slot_correct is True
+        )
+        regressed = bool(
+            previous_slot_correct is True
+            and current_slot_correct is False
+        )
+        remained_wrong = bool(
+            previous_slot_correct is False
+            and current_slot_correct is False
+        )
+
+        if previous_slot_correct is None:
+            status_change = "first_attempt_correct" if current_slot_correct else "first_attempt_wrong"
+        elif corrected:
+            status_change = "corrected"
+        elif regressed:
+            status_change = "regressed"
+        elif remained_wrong:
+            status_change = "still_wrong"
+        else:
+            status_change = "still_correct"
+
+        row.update({
+            "previous_slot_correct": previous_slot_correct,
+            "corrected_since_previous": corrected,
+            "regressed_since_previous": regressed,
+            "remained_wrong": remained_wrong,
+            "status_change": status_change,
+        })
+
+        expected_id = row.get("expected_block_id")
+        submitted_id = row.get("submitted_block_id")
+        if corrected:
+            corrected_slot_indices.append(index)
+            if expected_id:
+                corrected_block_ids.append(expected_id)
+        if not current_slot_correct:
+            remaining_wrong_slot_indices.append(index)
+            if expected_id:
+                remaining_wrong_block_ids.append(expected_id)
+            if submitted_id:
+                remaining_wrong_submitted_block_ids.append(submitted_id)
+        if regressed:
+            newly_wrong_slot_indices.append(index)
+            if expected_id:
+                newly_wrong_block_ids.append(expected_id)
+
+    def _unique(values):
+        return list(dict.fromkeys([value for value in values if value]))
+
+    summary = {
+        "previous_attempt_id": str(previous.get("_id")) if previous.get("_id") is not None else None,
+        "previous_attempt_no": previous.get("attempt_no"),
+        "corrected_block_ids": _unique(corrected_block_ids),
+        "remaining_wrong_block_ids": _unique(remaining_wrong_block_ids),
+        "remaining_wrong_submitted_block_ids": _unique(remaining_wrong_submitted_block_ids),
+        "newly_wrong_block_ids": _unique(newly_wrong_block_ids),
+        "corrected_slot_indices": sorted(set(corrected_slot_indices)),
+        "remaining_wrong_slot_indices": sorted(set(remaining_wrong_slot_indices)),
+        "newly_wrong_slot_indices": sorted(set(newly_wrong_slot_indices)),
+        "corrected_block_count": len(set(corrected_slot_indices)),
+        "remaining_wrong_block_count": len(set(remaining_wrong_slot_indices)),
+        "newly_wrong_block_count": len(set(newly_wrong_slot_indices)),
+    }
+    return current_rows, summary
+
+
+def calculate_score(
+    *,
+    is_correct: bool,
+    error_count: int,
+    correct_answer,
+    submitted_order,
+) -> float:
+    # score is the proportion of slots without a sequence or indentation error.
+    if bool(is_correct):
+        return 1.0
+    correct = correct_answer if isinstance(correct_answer, dict) else {}
+    expected_order = correct.get("order") if isinstance(correct.get("order"), list) else []
+    actual_order = submitted_order if isinstance(submitted_order, list) else []
+    total_slots = len(expected_order) or len(actual_order)
+    if total_slots <= 0:
+        return 0.0
+    incorrect_slots = min(max(int(error_count or 0), 0), total_slots)
+    return round((total_slots - incorrect_slots) / total_slots, 6)
@@ -0,0 +1,151 @@
+"""Password verification off the request threads, with admission control.
+
+``check_password_hash`` is deliberately slow (scrypt / pbkdf2, tens of
+milliseconds of CPU) and holds the GIL while it hashes.  When a class of
+forty logs in within a few seconds, every waitress thread was hashing and
+the video logs, hint polling and submits of students already in the lesson
+waited behind them.
+
+:func:`verify_password` runs the hash in a process pool of
+``PASSWORD_VERIFY_WORKERS`` processes (default: one per core, or one per
+server process when ``WEB_CONCURRENCY`` / ``ASGI_WORKERS`` runs several, so
+the hashing processes do not multiply to cores squared; ``0`` hashes inline
+in the request thread).  At most ``LOGIN_MAX_PENDING``
+verifications per server process may be queued or running (default: two
+per pool process, and never more than half of ``WAITRESS_THREADS``, since
+a waiting login still holds its request thread); past that
+:class:`LoginBusy` is raised at once, and the login view answers 429 with a
+``retry_after_sec`` the login page waits before trying again.  A burst
+therefore costs each extra student a second of waiting instead of holding a
+request thread for the length of the queue.
+
+The pool uses the ``spawn`` start method on every platform: it is started
+inside a server process that already runs threads, where ``fork`` is not
+safe.  A spawned child imports only what the submitted callable needs
+(``werkzeug.security``) plus the main script, which it re-imports as
+``__mp_main__``; ``run.py`` and ``run_asgi.py`` skip building the app under
+that name, so a child never opens MongoDB or OpenAI clients.  Submit only
+callables from such lightweight modules to :func:`spawn_pool`.  A pool
+broken by a killed worker is replaced on the next call and the affected
+verification runs inline.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Optional, Tuple
+
+from werkzeug.security import check_password_hash
+
+from .metrics import record_capacity
+
+
+def default_pool_workers() -> int:
+    """One process per core, or one per server process in multi-process deployments."""
+    server_processes = max(
+        1,
+        int(os.environ.get("WEB_CONCURRENCY") or 1),
+        int(os.environ.get("ASGI_WORKERS") or 1),
+    )
+    return 1 if server_processes > 1 else (os.cpu_count() or 1)
+
+
+PASSWORD_VERIFY_WORKERS = max(0, int(os.environ.get("PASSWORD_VERIFY_WORKERS", str(default_pool_workers()))))
+# 等待比對結果的請求仍占用一條請求執行緒；預設最多占一半，其餘留給其他 API。
+_REQUEST_THREADS = max(4, int(os.environ.get("WAITRESS_THREADS", "8")))
+LOGIN_MAX_PENDING = max(1, int(os.environ.get(
+    "LOGIN_MAX_PENDING",
+    str(max(1, min(max(1, PASSWORD_VERIFY_WORKERS) * 2, _REQUEST_THREADS // 2))),
+)))
+# 等待超過此時間代表整台主機已忙不過來，請用戶端稍後重試。
+PASSWORD_VERIFY_TIMEOUT_SEC = 10.0
+LOGIN_RETRY_AFTER_SEC = 1
+
+
+class LoginBusy(Exception):
+    """Too many password verifications are already queued."""
+
+
+_ADMISSION = threading.BoundedSemaphore(LOGIN_MAX_PENDING)
+_POOL_LOCK = threading.Lock()
+_POOL: Optional[Tuple[int, ProcessPoolExecutor]] = None
+
+
+def spawn_pool(workers: int) -> ProcessPoolExecutor:
+    """A ``spawn`` process pool; children re-import only the callable's module and the main script."""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        # gunicorn／uvicorn worker 各自建立自己的行程池。
+        if _POOL is None or _POOL[0] != os.getpid():
+            _POOL = (
+                os.getpid(),
+                spawn_pool(PASSWORD_VERIFY_WORKERS),
+            )
+            record_capacity("password_verify_workers", PASSWORD_VERIFY_WORKERS)
+            record_capacity("login_max_pending", LOGIN_MAX_PENDING)
+        return _POOL[1]
+
+
+def _discard(executor: ProcessPoolExecutor) -> None:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None and _POOL[1] is executor:
+            _POOL = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def warm_password_pool() -> None:
+    """Start the pool processes now so the first login burst does not pay for it."""
+    if PASSWORD_VERIFY_WORKERS <= 0:
+        return
+    executor = _executor()
+    try:
+        for future in [executor.submit(os.getpid) for _ in range(PASSWORD_VERIFY_WORKERS)]:
+            future.result(timeout=60)
+    except (BrokenProcessPool, FutureTimeout, OSError) as exc:
+        print("[password_verify] warm-up failed:", repr(exc))
+        _discard(executor)
+
+
+def shutdown_password_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None and pool[0] == os.getpid():
+        pool[1].shutdown(wait=False, cancel_futures=True)
+
+
+def verify_password(stored_hash: str, password: str) -> bool:
+    """``check_password_hash`` in the pool; raises :class:`LoginBusy` when saturated."""
+    if not _ADMISSION.acquire(blocking=False):
+        raise LoginBusy()
+    try:
+        if PASSWORD_VERIFY_WORKERS <= 0:
+            return check_password_hash(stored_hash, password)
+        executor = _executor()
+        try:
+            future = executor.submit(check_password_hash, stored_hash, password)
+        except BrokenProcessPool as exc:
+            print("[password_verify] process pool failed:", repr(exc))
+            _discard(executor)
+            return check_password_hash(stored_hash, password)
+        try:
+            return future.result(timeout=PASSWORD_VERIFY_TIMEOUT_SEC)
+        except FutureTimeout as exc:
+            future.cancel()
+            raise LoginBusy() from exc
+        except BrokenProcessPool as exc:
+            print("[password_verify] process pool failed:", repr(exc))
+            _discard(executor)
+            return check_password_hash(stored_hash, password)
+    finally:
+        _ADMISSION.release()
@@ -0,0 +1,313 @@
+"""Capture the query shapes the app sends to MongoDB and derive indexes.
+
+With ``MONGO_QUERY_SHAPES_FILE`` set, :func:`app.metrics.mongo_event_listeners`
+adds a :class:`QueryShapeRecorder` to the shared client.  It reduces every
+read (``find``, ``aggregate``'s leading ``$match``/``$sort``, ``count``,
+``distinct``, ``findAndModify`` and the filters of updates and deletes) to a
+*shape*: the collection, which fields are compared by equality, ``$in``,
+range or something else, and the sort.  Values are dropped except for one
+sample command per shape, kept so ``tools/index_advisor.py`` can ``explain``
+it.  Shapes are counted and merged into the JSON file when the process
+exits, so several runs (a capture session, a test run, a day of staging
+traffic) accumulate.
+
+:func:`recommend_index` orders a shape's fields by the ESR rule (equality,
+then sort, then range; ``$in`` counts as equality unless the query also
+sorts), and :func:`redundant_indexes` flags indexes that are a plain prefix
+of another one: they cost a write on every insert but serve no query the
+longer index does not.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import json_util
+from pymongo import monitoring
+
+
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte"}
+SAMPLE_IN_LIMIT = 50
+SKIPPED_DATABASES = {"admin", "config", "local"}
+
+IndexKeys = List[Tuple[str, int]]
+
+
+def _predicate_kind(value: Any) -> str:
+    if not isinstance(value, dict) or not any(str(key).startswith("$") for key in value):
+        return "eq"
+    operators = set(value)
+    if operators == {"$eq"}:
+        return "eq"
+    if operators == {"$in"}:
+        return "in"
+    if operators and operators <= RANGE_OPERATORS:
+        return "range"
+    # $ne、$nin、$exists、$regex 等選擇性差，不放進建議索引。
+    return "other"
+
+
+def filter_shape(query: Any) -> Dict[str, str]:
+    """Map each top-level field of a filter to its predicate kind."""
+    fields: Dict[str, str] = {}
+    if not isinstance(query, dict):
+        return fields
+    for key, value in query.items():
+        if key == "$and" and isinstance(value, list):
+            for clause in value:
+                for field, kind in filter_shape(clause).items():
+                    fields.setdefault(field, kind)
+        elif str(key).startswith("$"):
+            # $or / $expr 等無法以單一索引前綴表示。
+            fields.setdefault(key, "other")
+        else:
+            fields[key] = _predicate_kind(value)
+    return fields
+
+
+def _sort_keys(sort: Any) -> IndexKeys:
+    if not isinstance(sort, dict):
+        return []
+    return [(str(field), -1 if direction == -1 else 1) for field, direction in sort.items()]
+
+
+def _first_match_and_sort(pipeline: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    match: Dict[str, Any] = {}
+    sort: Dict[str, Any] = {}
+    for position, stage in enumerate(pipeline[:2]):
+        if "$match" in stage and position == 0:
+            match = stage["$match"]
+        elif "$sort" in stage:
+            sort = stage["$sort"]
+        else:
+            break
+    return match, sort
+
+
+def _command_filter(command_name: str, command: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any], Dict[str, Any]]]:
+    collection = command.get(command_name)
+    if not isinstance(collection, str):
+        return None
+    if command_name == "find":
+        return collection, command.get("filter") or {}, command.get("sort") or {}
+    if command_name == "aggregate":
+        match, sort = _first_match_and_sort(command.get("pipeline") or [])
+        return collection, match, sort
+    if command_name in {"count", "distinct"}:
+        return collection, command.get("query") or {}, {}
+    if command_name == "findAndModify":
+        return collection, command.get("query") or {}, command.get("sort") or {}
+    if command_name == "update":
+        updates = command.get("updates") or []
+        return (collection, updates[0].get("q") or {}, {}) if updates else None
+    if command_name == "delete":
+        deletes = command.get("deletes") or []
+        return (collection, deletes[0].get("q") or {}, {}) if deletes else None
+    return None
+
+
+def query_shape(command_name: str, command: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Reduce one command to its shape; ``None`` for commands without a filter."""
+    parts = _command_filter(command_name, command)
+    if parts is None:
+        return None
+    collection, query, sort = parts
+    fields = filter_shape(query)
+    sort_keys = _sort_keys(sort)
+    if not fields and not sort_keys:
+        return None
+    return {
+        "collection": collection,
+        "command": command_name,
+        "filter": fields,
+        "sort": sort_keys,
+    }
+
+
+def shape_key(shape: Dict[str, Any]) -> str:
+    return json.dumps(
+        [shape["collection"], shape["command"], sorted(shape["filter"].items()), shape["sort"]],
+        sort_keys=True,
+    )
+
+
+def _truncate_in_lists(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {
+            key: (item[:SAMPLE_IN_LIMIT] if key in {"$in", "$nin"} and isinstance(item, list) else _truncate_in_lists(item))
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_truncate_in_lists(item) for item in value]
+    return value
+
+
+def sample_command(command_name: str, command: Dict[str, Any]) -> Dict[str, Any]:
+    """The parts of a command ``explain`` needs, without session fields."""
+    keep = {
+        "find": ("filter", "sort", "projection", "limit"),
+        "aggregate": ("pipeline", "cursor"),
+        "count": ("query",),
+        "distinct": ("key", "query"),
+        "findAndModify": ("query", "sort", "update", "remove"),
+        "update": ("updates",),
+        "delete": ("deletes",),
+    }.get(command_name, ())
+    sample = {command_name: command.get(command_name)}
+    for field in keep:
+        if field in command:
+            sample[field] = command[field]
+    if command_name == "update":
+        sample["updates"] = sample.get("updates", [])[:1]
+    if command_name == "delete":
+        sample["deletes"] = sample.get("deletes", [])[:1]
+    return _truncate_in_lists(sample)
+
+
+class QueryShapeRecorder(monitoring.CommandListener):
+    """Count query shapes per process and merge them into a JSON file."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._shapes: Dict[str, Dict[str, Any]] = {}
+
+    def started(self, event) -> None:
+        if event.database_name in SKIPPED_DATABASES:
+            return
+        try:
+            shape = query_shape(event.command_name, event.command)
+            if shape is None:
+                return
+            key = shape_key(shape)
+            with self._lock:
+                entry = self._shapes.get(key)
+                if entry is None:
+                    entry = self._shapes[key] = dict(
+                        shape,
+                        count=0,
+                        database=event.database_name,
+                        sample=sample_command(event.command_name, event.command),
+                    )
+                entry["count"] += 1
+        except Exception as exc:
+            print("[query_shapes] record failed:", repr(exc))
+
+    def succeeded(self, event) -> None:
+        pass
+
+    def failed(self, event) -> None:
+        pass
+
+    def shapes(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(entry) for entry in self._shapes.values()]
+
+    def dump(self, path: Optional[str] = None) -> None:
+        """Merge the shapes recorded since the last dump into ``path``."""
+        target = path or self.path
+        if not target:
+            return
+        with self._lock:
+            pending, self._shapes = list(self._shapes.values()), {}
+        merged = {shape_key(entry): entry for entry in load_shapes(target)}
+        for entry in pending:
+            key = shape_key(entry)
+            if key in merged:
+                merged[key]["count"] = int(merged[key].get("count") or 0) + entry["count"]
+            else:
+                merged[key] = entry
+        try:
+            with open(target, "w", encoding="utf-8") as handle:
+                handle.write(json_util.dumps(
+                    sorted(merged.values(), key=lambda item: -int(item.get("count") or 0)),
+                    indent=2,
+                ))
+        except OSError as exc:
+            print("[query_shapes] dump failed:", repr(exc))
+
+
+def load_shapes(path: str) -> List[Dict[str, Any]]:
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as handle:
+        data = json_util.loads(handle.read() or "[]")
+    shapes = []
+    for entry in data if isinstance(data, list) else []:
+        entry["sort"] = [tuple(item) for item in entry.get("sort") or []]
+        shapes.append(entry)
+    return shapes
+
+
+def query_shape_recorder() -> Optional[QueryShapeRecorder]:
+    """A recorder writing to ``MONGO_QUERY_SHAPES_FILE`` at exit, if set."""
+    path = str(os.getenv("MONGO_QUERY_SHAPES_FILE") or "").strip()
+    if not path:
+        return None
+    recorder = QueryShapeRecorder(path)
+    atexit.register(recorder.dump)
+    return recorder
+
+
+# ---------------------------------------------------------------------------
+# Index recommendations
+# ---------------------------------------------------------------------------
+
+def recommend_index(shape: Dict[str, Any]) -> Optional[IndexKeys]:
+    """ESR-ordered compound index for one shape, or ``None``."""
+    filters = shape.get("filter") or {}
+    sort_keys = [tuple(item) for item in shape.get("sort") or []]
+    sorted_query = bool(sort_keys)
+    equality = [field for field, kind in filters.items() if kind == "eq" or (kind == "in" and not sorted_query)]
+    ranges = [field for field, kind in filters.items() if kind == "range" or (kind == "in" and sorted_query)]
+
+    keys: IndexKeys = []
+    seen = set()
+    for field, direction in [(field, 1) for field in equality] + sort_keys + [(field, 1) for field in ranges]:
+        if field in seen or field.startswith("$"):
+            continue
+        seen.add(field)
+        keys.append((field, int(direction)))
+    return keys or None
+
+
+def index_name(keys: IndexKeys) -> str:
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+def index_serves(existing: IndexKeys, wanted: IndexKeys) -> bool:
+    """``existing`` already starts with every key of ``wanted``."""
+    return len(existing) >= len(wanted) and list(existing[: len(wanted)]) == list(wanted)
+
+
+def _droppable(index: Dict[str, Any]) -> bool:
+    if index.get("name") == "_id_" or index.get("unique") or index.get("partialFilterExpression"):
+        return False
+    if "expireAfterSeconds" in index or index.get("hidden"):
+        return False
+    return all(direction in (1, -1) for _field, direction in index.get("key", []))
+
+
+def redundant_indexes(indexes: Iterable[Dict[str, Any]], planned: Iterable[IndexKeys] = ()) -> List[Dict[str, Any]]:
+    """Indexes that are a strict prefix of an existing or planned index.
+
+    ``indexes`` are ``list_indexes()`` documents (``{"name", "key", ...}``).
+    Unique, partial, TTL and hidden indexes are never reported.
+    """
+    indexes = [dict(index, key=[(field, direction) for field, direction in dict(index.get("key") or {}).items()]) for index in indexes]
+    longer = [index["key"] for index in indexes] + [list(keys) for keys in planned]
+    report = []
+    for index in indexes:
+        if not _droppable(index):
+            continue
+        covering = next(
+            (keys for keys in longer if len(keys) > len(index["key"]) and index_serves(keys, index["key"])),
+            None,
+        )
+        if covering is not None:
+            report.append({"name": index["name"], "key": index["key"], "covered_by": index_name(covering)})
+    return report
@@ -11,10 +11,10 @@ from __future__ import annotations
 
 import os
 from datetime import datetime, timezone
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, Optional
 
-from pymongo import ASCENDING, ReturnDocument
-from pymongo.errors import DuplicateKeyError, PyMongoError
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
 
 from .db import db
 
@@ -171,22 +171,8 @@ def _claimed_result(slot: Dict[str, Any], assignment: Dict[str, Any], *, recover
     }
 
 
-def assign_feedback_strategy_on_import(student_id: str) -> Dict[str, Any]:
-    """Assign one A/B/C feedback strategy exactly once for an imported student.
-
-    The unique sparse slot index is the cross-process concurrency guard.  If two
-    requests for the same student race, only one can claim a slot; the loser
-    re-reads that claimed slot and returns the identical assignment.
-    """
-    sid = str(student_id or "").strip()
-    if not sid:
-        raise ValueError("student_id is required")
-
-    ensure_randomization_indexes()
-    user = db.users.find_one({"student_id": sid, "role": "student"})
-    if not user:
-        raise ValueError("student not found")
-
+def _result_without_claim(user: Dict[str, Any], sid: str) -> Optional[Dict[str, Any]]:
+    """The result for a student who must not take a new slot, else ``None``."""
     if is_test_data_user(user, sid):
         db.users.update_one(
             {"_id": user["_id"]},
@@ -228,6 +214,28 @@ def assign_feedback_strategy_on_import(student_id: str) -> Dict[str, Any]:
             "reason": "legacy_assignment",
             "feedback_strategy": locked_strategy,
         }
+    return None
+
+
+def assign_feedback_strategy_on_import(student_id: str) -> Dict[str, Any]:
+    """Assign one A/B/C feedback strategy exactly once for an imported student.
+
+    The unique sparse slot index is the cross-process concurrency guard.  If two
+    requests for the same student race, only one can claim a slot; the loser
+    re-reads that claimed slot and returns the identical assignment.
+    """
+    sid = str(student_id or "").strip()
+    if not sid:
+        raise ValueError("student_id is required")
+
+    ensure_randomization_indexes()
+    user = db.users.find_one({"student_id": sid, "role": "student"})
+    if not user:
+        raise ValueError("student not found")
+
+    result = _result_without_claim(user, sid)
+    if result is not None:
+        return result
 
     existing_slot = _slot_for_student(sid)
     if existing_slot:
@@ -278,6 +286,115 @@ def assign_feedback_strategy_on_import(student_id: str) -> Dict[str, Any]:
     return _claimed_result(slot, assignment, recovered=False)
 
 
+def assign_feedback_strategies_on_import(student_ids: Iterable[str]) -> Dict[str, Any]:
+    """Batch form of :func:`assign_feedback_strategy_on_import` for CSV imports.
+
+    Returns ``{student_id: result}`` where a result is the single-student
+    return value or the exception it would have raised.  Students are read
+    with one query, their existing claims with another, and fresh students
+    take the next available positions (in the given order) with one
+    conditional update each in a single unordered ``bulk_write``.  A claim
+    that lost a race, and every student beyond the available slots, goes
+    through the single-student function, which keeps its guarantees.
+    """
+    ids = list(dict.fromkeys(str(sid or "").strip() for sid in student_ids))
+    ids = [sid for sid in ids if sid]
+    results: Dict[str, Any] = {}
+    if not ids:
+        return results
+
+    ensure_randomization_indexes()
+    users = {
+        user["student_id"]: user
+        for user in db.users.find({"student_id": {"$in": ids}, "role": "student"})
+    }
+    pending = []
+    for sid in ids:
+        user = users.get(sid)
+        if not user:
+            results[sid] = ValueError("student not found")
+            continue
+        result = _result_without_claim(user, sid)
+        if result is not None:
+            results[sid] = result
+        else:
+            pending.append(sid)
+    if not pending:
+        return results
+
+    slots = db[SLOT_COLLECTION]
+    recovered = {
+        slot["student_id"]: slot
+        for slot in slots.find({"study_id": DEFAULT_STUDY_ID, "student_id": {"$in": pending}, "status": "claimed"})
+    }
+    fresh = [sid for sid in pending if sid not in recovered]
+
+    claimed: Dict[str, Dict[str, Any]] = {}
+    if fresh:
+        available = list(
+            slots.find({
+                "study_id": DEFAULT_STUDY_ID,
+                "sequence_version": DEFAULT_SEQUENCE_VERSION,
+                "status": "available",
+            }).sort([("position", ASCENDING)]).limit(len(fresh))
+        )
+        claimed_at = now_utc()
+        pairs = list(zip(fresh, available))
+        if pairs:
+            try:
+                slots.bulk_write(
+                    [
+                        UpdateOne(
+                            {"_id": slot["_id"], "status": "available"},
+                            {"$set": {"status": "claimed", "student_id": sid, "claimed_at": claimed_at}},
+                        )
+                        for sid, slot in pairs
+                    ],
+                    ordered=False,
+                )
+            except BulkWriteError:
+                # 同一學生被其他請求搶先認領；下方重新讀取後逐筆處理。
+                pass
+            current = {slot["_id"]: slot for slot in slots.find({"_id": {"$in": [slot["_id"] for _, slot in pairs]}})}
+            for sid, slot in pairs:
+                won = current.get(slot["_id"]) or {}
+                if won.get("status") == "claimed" and won.get("student_id") == sid:
+                    claimed[sid] = won
+
+    payloads: Dict[str, Dict[str, Any]] = {}
+    for sid, slot in {**recovered, **claimed}.items():
+        try:
+            payloads[sid] = _assignment_payload(slot)
+        except ValueError as exc:
+            # 單一名額資料損壞只影響該學生，其餘照常寫入。
+            results[sid] = exc
+    if payloads:
+        operations = [
+            UpdateOne({"student_id": sid, "role": "student"}, {"$set": payload})
+            for sid, payload in payloads.items()
+        ]
+        if db.users.bulk_write(operations, ordered=False).matched_count != len(operations):
+            for sid in list(payloads):
+                try:
+                    _persist_slot_assignment(sid, recovered.get(sid) or claimed[sid])
+                except RuntimeError as exc:
+                    results[sid] = exc
+                    payloads.pop(sid)
+    for sid, payload in payloads.items():
+        results[sid] = _claimed_result(
+            recovered.get(sid) or claimed[sid], payload, recovered=sid in recovered
+        )
+
+    for sid in fresh:
+        if sid in claimed or sid in results:
+            continue
+        try:
+            results[sid] = assign_feedback_strategy_on_import(sid)
+        except (RandomizationSlotsExhausted, ValueError, RuntimeError, PyMongoError) as exc:
+            results[sid] = exc
+    return results
+
+
 def assign_feedback_strategy_after_pretest(student_id: str) -> Dict[str, Any]:
     """Backward-compatible alias for older callers.
 
@@ -1,8 +1,21 @@
-from flask import Blueprint
+from flask import Blueprint, Response, g, jsonify, request
 from ..db import db
+from ..metrics import render_prometheus, reset_peaks
 
 admin_bp = Blueprint("admin", __name__)
 
 @admin_bp.get("/videos")
 def list_videos():
     return {"ok": True, "videos": []}
+
+
+@admin_bp.get("/metrics")
+def metrics():
+    # blueprint 已驗證 teacher/admin session；效能指標只開放給 admin。
+    if str((getattr(g, "current_user", None) or {}).get("role") or "") != "admin":
+        return jsonify({"ok": False, "error": "forbidden", "message": "您沒有權限使用此功能。"}), 403
+    body = render_prometheus()
+    # 壓測工具每個併發階段結束時帶 reset_peaks=1，下一階段重新計算峰值。
+    if request.args.get("reset_peaks") in {"1", "true"}:
+        reset_peaks()
+    return Response(body, mimetype="text/plain; version=0.0.4; charset=utf-8")
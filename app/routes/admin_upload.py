@@ -8,6 +8,9 @@ from werkzeug.utils import secure_filename
 from bson import ObjectId
 from ..db import db
 from ..unit_labels import sort_units, unit_label_map
+from ..student_progress import invalidate_student_home_catalog
+from .parsons_retrieval import precompute_subtitle_vectors
+from .parsons_service import read_subtitle_text
 
 admin_upload_bp = Blueprint("admin_upload", __name__)
 
@@ -504,6 +507,8 @@ def subtitle_save_corrected():
         upd["subtitle_blocks"] = blocks
 
     db.videos.update_one({"_id": vid}, {"$set": upd})
+    # local_dense 模式下在背景先算好字幕向量
+    precompute_subtitle_vectors(text)
 
     return jsonify({
         "ok": True,
@@ -744,6 +749,7 @@ def upload_video():
 
     r = db.videos.insert_one(doc)
     video_id = r.inserted_id
+    invalidate_student_home_catalog()
 
     # ✅ 同步寫入 subtitles collection（v1）
     db.subtitles.insert_one({
@@ -756,6 +762,8 @@ def upload_video():
         "source": "upload",
         "note": ""
     })
+    # local_dense 模式下在背景先算好字幕向量
+    precompute_subtitle_vectors(read_subtitle_text(subtitle_abs))
 
     return jsonify({
         "ok": True,
@@ -880,6 +888,7 @@ def set_video_active(video_id):
     r = db.videos.update_one({"_id": vid}, {"$set": {"active": bool(active)}})
     if r.matched_count == 0:
         return jsonify({"ok": False, "message": "找不到影片"}), 404
+    invalidate_student_home_catalog()
 
     return jsonify({"ok": True, "video_id": video_id, "active": bool(active)})
 
@@ -913,6 +922,7 @@ def soft_delete_video(video_id):
             "active": False
         }}
     )
+    invalidate_student_home_catalog()
     return jsonify({"ok": True, "video_id": video_id})
 
 
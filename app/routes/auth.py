@@ -3,10 +3,10 @@ from datetime import datetime, timezone
 
 from flask import Blueprint, g, jsonify, request
 from pymongo.errors import PyMongoError
-from werkzeug.security import check_password_hash
 
 from ..db import db
 from ..avatar_utils import resolve_avatar_src
+from ..password_verify import LOGIN_RETRY_AFTER_SEC, LoginBusy, verify_password
 from ..session_auth import require_active_session
 
 
@@ -43,7 +43,19 @@ def login():
                 "message": "帳號尚未設定密碼，請聯絡管理者。",
             }), 403
 
-        if not check_password_hash(user["password_hash"], password):
+        # 雜湊比對在獨立行程執行；同時登入過多時請前端稍候重試，不占住請求執行緒。
+        try:
+            password_ok = verify_password(stored_hash, password)
+        except LoginBusy:
+            response = jsonify({
+                "ok": False,
+                "error": "login_busy",
+                "message": "目前登入人數較多，請稍候再試。",
+                "retry_after_sec": LOGIN_RETRY_AFTER_SEC,
+            })
+            response.headers["Retry-After"] = str(LOGIN_RETRY_AFTER_SEC)
+            return response, 429
+        if not password_ok:
             return jsonify({"ok": False, "message": "帳號或密碼錯誤。"}), 401
 
         session_id = secrets.token_urlsafe(32)
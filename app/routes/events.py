@@ -3,6 +3,7 @@ from flask import Blueprint, request, jsonify
 from bson import ObjectId
 from datetime import datetime, timezone
 from app.db import db
+from app.idempotency import idempotent
 from app.session_auth import current_participant_id
 
 events_bp = Blueprint("events", __name__)
@@ -17,6 +18,7 @@ def _oid(x: str):
         return None
 
 @events_bp.post("/log")
+@idempotent
 def log_event():
     """
     JSON:
@@ -6,6 +6,8 @@ from flask import Blueprint, jsonify, request
 from pymongo import ReturnDocument
 
 from ..db import db
+from ..idempotency import idempotent
+from ..log_storage import ensure_log_collection, prepare_log_document, timeseries_enabled
 from ..session_auth import current_student_id
 
 
@@ -189,6 +191,11 @@ def ensure_learning_log_indexes():
     global _INDEXES_READY
     if _INDEXES_READY:
         return
+    if timeseries_enabled("learning_logs"):
+        # 時間序列模式改用 log_storage 的少量複合索引。
+        ensure_log_collection(db, "learning_logs")
+        _INDEXES_READY = True
+        return
     for field in (
         "student_id",
         "session_id",
@@ -621,7 +628,8 @@ def write_learning_log(payload, enforced_student_id=None):
     }
     if event_type in HINT_EVENT_TYPES:
         document.update(_hint_top_level_fields(metadata, task_id))
-    result = db.learning_logs.insert_one(document)
+    ensure_log_collection(db, "learning_logs")
+    result = db.learning_logs.insert_one(prepare_log_document("learning_logs", document))
     document["_id"] = result.inserted_id
     return document
 
@@ -733,6 +741,7 @@ def _hint_metadata_patch(metadata):
 
 
 @learning_logs_bp.post("")
+@idempotent
 def create_learning_log():
     payload = request.get_json(silent=True) or {}
     payload["student_id"] = current_student_id()
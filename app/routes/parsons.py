@@ -6,7 +6,6 @@ import json
 import math
 import random
 import statistics
-import threading
 import uuid
 from datetime import datetime, timezone, timedelta
 from functools import wraps
@@ -27,7 +26,31 @@ from ..questionnaire import (
     QUESTIONNAIRE_DATA_SOURCE,
     has_questionnaire_response,
 )
+from ..parsons_grading import (
+    build_block_results,
+    build_error_analysis as _build_attempt_v2_error_analysis,
+    calculate_score as _calculate_attempt_v2_score,
+    grade_parsons_submission,
+    infer_indents_from_blocks as _infer_attempt_v2_indents_from_blocks,
+)
 from ..randomization import is_test_data_user
+from ..idempotency import idempotent
+from ..leases import held_lease, lease_key
+from ..student_progress import (
+    invalidate_student_home_catalog,
+    record_practice_completion,
+    record_test_submission,
+)
+from ..exam_paper import ExamPaper, PaperQuestion, cached_exam_paper, invalidate_exam_papers
+from ..task_snapshots import drop_task_snapshot, load_task_snapshot, publish_task_snapshot
+from ..hint_library_index import (
+    get_hint_library_index,
+    index_enabled as hint_library_index_enabled,
+    invalidate_hint_library_index,
+    lookup_legacy as lookup_hint_library_legacy,
+    lookup_structured as lookup_hint_library_structured,
+    record_hint_library_usage,
+)
 from .learning_logs import (
     write_learning_log_safely,
     write_or_update_hint_learning_log_safely,
@@ -119,8 +142,8 @@ def enforce_parsons_session():
     return None
 
 
-_SUBMIT_GUARD_LOCK = threading.Lock()
-_SUBMIT_ACTIVE = set()
+# 送出期間可能等待 AI 提示生成（含重試），租約保留到最長的請求結束。
+SUBMIT_LEASE_TTL_SEC = 180
 
 # 會把這些資料做 SHA-256
 def _submit_request_key(data):
@@ -178,21 +201,16 @@ def _incomplete_answer_json(missing_indices, expected_count):
 def prevent_duplicate_submission(view):
     @wraps(view)
     def wrapped(*args, **kwargs):
-        key = _submit_request_key(request.get_json(silent=True) or {})
-        with _SUBMIT_GUARD_LOCK:
-            if key in _SUBMIT_ACTIVE:
+        key = lease_key("submit", *_submit_request_key(request.get_json(silent=True) or {}))
+        # 多個 worker 行程共用 MongoDB 租約，重送落在其他行程時同樣擋下。
+        with held_lease(key, SUBMIT_LEASE_TTL_SEC) as acquired:
+            if not acquired:
                 return jsonify({
                     "ok": False,
                     "error": "duplicate_submission",
                     "message": "答案正在送出，請勿重複提交。",
                 }), 409
-            _SUBMIT_ACTIVE.add(key)
-
-        try:
             return view(*args, **kwargs)
-        finally:
-            with _SUBMIT_GUARD_LOCK:
-                _SUBMIT_ACTIVE.discard(key)
 
     return wrapped
 
@@ -863,8 +881,15 @@ def _student_feedback_profile(student_id):
         }
     user = db.users.find_one(
         {"student_id": sid},
-        {"group_type": 1, "analysis_group_type": 1, "feedback_strategy": 1},
+        FEEDBACK_PROFILE_PROJECTION,
     ) or {}
+    return _feedback_profile_from_user(user)
+
+
+FEEDBACK_PROFILE_PROJECTION = {"group_type": 1, "analysis_group_type": 1, "feedback_strategy": 1}
+
+
+def _feedback_profile_from_user(user):
     strategy = _feedback_strategy_from_user(user)
     return {
         "group_type": _clean_string(user.get("group_type")),
@@ -1599,8 +1624,61 @@ def _hint_library_concept_aliases(concept_tag, unit_category=None):
 
 
 
+_HINT_LIBRARY_MATCH_SCORES = {
+    "exact_fingerprint": 1.0,
+    "same_relation_and_control": 0.95,
+    "same_task_family_relation": 0.93,
+    "same_category_relation": 0.90,
+    "legacy_concept_only": 0.50,
+}
+
+
+def _legacy_hint_library_enabled():
+    return str(
+        os.getenv("PARSONS_LEGACY_HINT_LIBRARY_ENABLED", "0")
+    ).strip().lower() in {"1", "true", "yes", "on"}
+
+
 def _find_hint_library_entry(aggregate_detail, task, level):
-    """Retrieve a passed hint using a structured error fingerprint."""
+    """Retrieve a passed hint using a structured error fingerprint.
+
+    Served from the in-process hint library index; falls back to the
+    MongoDB queries when the index is disabled or cannot be loaded.
+    """
+    ctx = _hint_library_context_from_detail(aggregate_detail, level)
+    if not ctx.get("retrieval_eligible"):
+        return None, ctx
+
+    index = get_hint_library_index() if hint_library_index_enabled() else None
+    if index is None:
+        return _find_hint_library_entry_from_db(aggregate_detail, task, level)
+
+    aliases = _hint_library_concept_aliases(
+        ctx.get("concept_tag"),
+        ctx.get("unit_category"),
+    )
+    task_family = _hint_library_task_family(task)
+    for match_mode, doc in lookup_hint_library_structured(index, ctx, aliases, task_family):
+        if doc and str(doc.get("hint_template") or "").strip():
+            return doc, {
+                **ctx,
+                "retrieval_match_mode": match_mode,
+                "retrieval_score": _HINT_LIBRARY_MATCH_SCORES[match_mode],
+            }
+
+    if _legacy_hint_library_enabled():
+        legacy = lookup_hint_library_legacy(index, ctx["hint_level"], ctx["legacy_hint_key"])
+        if legacy and str(legacy.get("hint_template") or "").strip():
+            return legacy, {
+                **ctx,
+                "retrieval_match_mode": "legacy_concept_only",
+                "retrieval_score": _HINT_LIBRARY_MATCH_SCORES["legacy_concept_only"],
+            }
+    return None, ctx
+
+
+def _find_hint_library_entry_from_db(aggregate_detail, task, level):
+    """Query ``hint_library`` directly with the structured fallback chain."""
     ensure_hint_library_indexes()
     ctx = _hint_library_context_from_detail(aggregate_detail, level)
     if not ctx.get("retrieval_eligible"):
@@ -1681,10 +1759,7 @@ def _find_hint_library_entry(aggregate_detail, task, level):
 
     # Optional compatibility fallback.  It is disabled by default because old
     # concept-only hints can mix unrelated program relations.
-    legacy_enabled = str(
-        os.getenv("PARSONS_LEGACY_HINT_LIBRARY_ENABLED", "0")
-    ).strip().lower() in {"1", "true", "yes", "on"}
-    if legacy_enabled:
+    if _legacy_hint_library_enabled():
         try:
             legacy = db.hint_library.find_one(
                 {
@@ -1715,6 +1790,10 @@ def _mark_hint_library_used(doc):
     if not isinstance(doc, dict) or doc.get("_id") is None:
         return
     now = now_utc()
+    if hint_library_index_enabled():
+        # Counters are batched into one bulk $inc; see hint_library_index.
+        record_hint_library_usage(doc["_id"], now)
+        return
     try:
         db.hint_library.update_one(
             {"_id": doc["_id"]},
@@ -2011,15 +2090,15 @@ def _auto_save_generated_hint_to_library(
         key = {"fingerprint_key": doc["fingerprint_key"], "version": doc["version"]}
         result = db.hint_library.update_one(key, {"$setOnInsert": doc}, upsert=True)
         if result.upserted_id:
+            invalidate_hint_library_index()
             saved = db.hint_library.find_one({"_id": result.upserted_id})
             fields = _hint_library_public_fields(saved, ctx) if saved else {}
             fields.update(_hint_library_status_fields(ctx, "auto_saved"))
             return fields
 
         saved = db.hint_library.find_one(key)
-        if saved:
-            _mark_hint_library_used(saved)
-            saved = db.hint_library.find_one(key)
+        # 計數可能批次寫入，不再重讀；回傳的欄位也不含計數。
+        _mark_hint_library_used(saved)
         fields = _hint_library_public_fields(saved, ctx) if saved else {}
         fields.update(_hint_library_status_fields(ctx, "already_exists"))
         return fields
@@ -2971,32 +3050,6 @@ def _submitted_indentation_by_block(submitted_order, submitted_indentation) -> d
     return normalized
 
 
-def _infer_attempt_v2_indents_from_blocks(blocks: list) -> list:
-    out = []
-    level = 0
-    for block in blocks or []:
-        if not isinstance(block, dict):
-            out.append(0)
-            continue
-        if "indent" in block:
-            try:
-                out.append(int(block.get("indent") or 0))
-                continue
-            except Exception:
-                pass
-
-        raw = str(block.get("text") or "")
-        stripped = raw.strip()
-        low = stripped.lower()
-        if low.startswith(("elif ", "else:", "except", "finally:")):
-            level = max(0, level - 1)
-        leading = len(raw) - len(raw.lstrip(" "))
-        out.append(leading if leading > 0 else level * 4)
-        if stripped.endswith(":"):
-            level += 1
-    return out
-
-
 def _correct_answer_from_task(task_doc: dict):
     if not isinstance(task_doc, dict):
         return None
@@ -3045,145 +3098,6 @@ def _correct_answer_from_task(task_doc: dict):
         return None
 
 
-def _build_attempt_v2_error_analysis(
-    *,
-    is_correct: bool,
-    submitted_order,
-    submitted_indentation,
-    correct_answer,
-    target_concept,
-    previous_error_types=None,
-) -> dict:
-    repeated_basis = "same_task_same_error_type"
-    repeated_rule_version = 1
-    concept = str(target_concept or "").strip() or "unknown"
-
-    if bool(is_correct):
-        return {
-            "error_count": 0,
-            "error_types": [],
-            "wrong_slots": [],
-            "incorrect_slots": [],
-            "sequence_slots": [],
-            "indentation_slots": [],
-            "error_details": [],
-            "error_concept": None,
-            "repeated_error": False,
-            "repeated_error_types": [],
-            "repeated_error_count": 0,
-            "repeated_error_basis": repeated_basis,
-            "repeated_error_rule_version": repeated_rule_version,
-        }
-
-    correct = correct_answer if isinstance(correct_answer, dict) else {}
-    expected_order = correct.get("order") if isinstance(correct.get("order"), list) else []
-    actual_order = submitted_order if isinstance(submitted_order, list) else []
-    expected_indentation = (
-        correct.get("indentation")
-        if isinstance(correct.get("indentation"), list)
-        else []
-    )
-    actual_indentation = (
-        submitted_indentation
-        if isinstance(submitted_indentation, list)
-        else []
-    )
-
-    sequence_slots = []
-    order_error_details = []
-    if expected_order:
-        expected_position_by_block = {
-            str(block_id): index
-            for index, block_id in enumerate(expected_order)
-            if block_id is not None
-        }
-        for index in range(max(len(actual_order), len(expected_order))):
-            actual = actual_order[index] if index < len(actual_order) else None
-            expected = expected_order[index] if index < len(expected_order) else None
-            if str(actual) != str(expected):
-                sequence_slots.append(index)
-                order_error_details.append({
-                    "slot": index,
-                    "block_id": str(actual) if actual is not None else None,
-                    "error_type": "order",
-                    "expected_block_id": str(expected) if expected is not None else None,
-                    "submitted_position": index if actual is not None else None,
-                    "expected_position": expected_position_by_block.get(str(actual)) if actual is not None else None,
-                    "concept_tag": concept,
-                })
-
-    indentation_slots = []
-    indentation_error_details = []
-    if actual_indentation and expected_indentation:
-        for index in range(max(len(actual_indentation), len(expected_indentation))):
-            actual = actual_indentation[index] if index < len(actual_indentation) else None
-            expected = expected_indentation[index] if index < len(expected_indentation) else None
-            if actual != expected:
-                indentation_slots.append(index)
-                block_id = actual_order[index] if index < len(actual_order) else None
-                indentation_error_details.append({
-                    "slot": index,
-                    "block_id": str(block_id) if block_id is not None else None,
-                    "error_type": "indentation",
-                    "submitted_indent": actual,
-                    "expected_indent": expected,
-                    "concept_tag": concept,
-                })
-
-    error_types = []
-    if sequence_slots:
-        error_types.append("sequence_error")
-    if indentation_slots:
-        error_types.append("indentation_error")
-
-    # wrong_slots stores only block-order mismatches (0-based positions).
-    wrong_slots = sorted(set(sequence_slots))
-    # error_count counts distinct slots with either a sequence or indentation error.
-    incorrect_slots = sorted(set(sequence_slots + indentation_slots))
-    error_details = order_error_details + indentation_error_details
-    detail_error_types = sorted({
-        str(item.get("error_type") or "").strip()
-        for item in error_details
-        if str(item.get("error_type") or "").strip()
-    })
-    previous_types = {
-        "order" if str(item) == "sequence_error" else "indentation" if str(item) == "indentation_error" else str(item)
-        for item in (previous_error_types or [])
-        if str(item or "").strip()
-    }
-    repeated_error_types = sorted(set(detail_error_types).intersection(previous_types))
-    repeated_error_count = sum(
-        1
-        for item in error_details
-        if item.get("error_type") in repeated_error_types
-    )
-    repeated_error = bool(repeated_error_types)
-
-    return {
-        "error_count": len(incorrect_slots),
-        "error_types": error_types,
-        # wrong_slots 保留相容性：只代表順序錯誤位置。
-        "wrong_slots": wrong_slots,
-        # incorrect_slots 才是畫面紅色標記應使用的完整位置：
-        # 順序錯誤與縮排錯誤的聯集。
-        "incorrect_slots": incorrect_slots,
-        "sequence_slots": sorted(set(sequence_slots)),
-        "indentation_slots": sorted(set(indentation_slots)),
-        "error_details": error_details,
-        "error_concept": concept,
-        "repeated_error": repeated_error,
-        "repeated_error_types": repeated_error_types,
-        "repeated_error_count": repeated_error_count,
-        "repeated_error_basis": repeated_basis,
-        "repeated_error_rule_version": repeated_rule_version,
-    }
-
-
-
-def _normalize_attempt_v2_block_text(value) -> str:
-    return str(value or "").replace("\t", "    ").strip()
-
-
 def _attempt_v2_block_lookup(task_doc: dict) -> dict:
     """Return block_id -> normalized block metadata for exact audit trails."""
     lookup = {}
@@ -3297,228 +3211,14 @@ def _build_attempt_v2_block_results(
     correct_answer,
     previous_attempt=None,
 ):
-    """
-    Build per-slot/per-block audit rows.
-
-    Each row preserves both submitted and expected block IDs, so the teacher
-    dashboard can determine exactly which block was corrected after an AI hint.
-    """
-    actual_order = list(submitted_order) if isinstance(submitted_order, list) else []
-    actual_indentation = (
-        list(submitted_indentation)
-        if isinstance(submitted_indentation, list)
-        else []
-    )
-    correct = correct_answer if isinstance(correct_answer, dict) else {}
-    expected_order = (
-        list(correct.get("order"))
-        if isinstance(correct.get("order"), list)
-        else []
-    )
-    expected_indentation = (
-        list(correct.get("indentation"))
-        if isinstance(correct.get("indentation"), list)
-        else []
-    )
-    block_lookup = _attempt_v2_block_lookup(task_doc)
-
-    previous = previous_attempt if isinstance(previous_attempt, dict) else {}
-    previous_order = (
-        list(previous.get("submitted_order"))
-        if isinstance(previous.get("submitted_order"), list)
-        else []
-    )
-    previous_indentation = (
-        list(previous.get("submitted_indentation"))
-        if isinstance(previous.get("submitted_indentation"), list)
-        else []
-    )
-
-    total_slots = max(
-        len(expected_order),
-        len(actual_order),
-        len(expected_indentation),
-        len(actual_indentation),
-    )
-
-    def _state_at(order, indentation, index):
-        submitted_id = (
-            str(order[index]).strip()
-            if index < len(order) and order[index] is not None
-            else ""
-        )
-        expected_id = (
-            str(expected_order[index]).strip()
-            if index < len(expected_order) and expected_order[index] is not None
-            else ""
-        )
-        submitted_block = block_lookup.get(submitted_id) or {}
-        expected_block = block_lookup.get(expected_id) or {}
-        submitted_text = str(submitted_block.get("text") or "")
-        expected_text = str(expected_block.get("text") or "")
-
-        block_id_match = bool(
-            submitted_id
-            and expected_id
-            and submitted_id == expected_id
-        )
-        content_equivalent = bool(
-            submitted_id
-            and expected_id
-            and _normalize_attempt_v2_block_text(submitted_text)
-            and _normalize_attempt_v2_block_text(submitted_text)
-            == _normalize_attempt_v2_block_text(expected_text)
-        )
-        sequence_correct = bool(block_id_match or content_equivalent)
-
-        submitted_indent = (
-            indentation[index]
-            if index < len(indentation)
-            else None
-        )
-        expected_indent = (
-            expected_indentation[index]
-            if index < len(expected_indentation)
-            else None
-        )
-        if expected_indent is None:
-            indentation_correct = bool(submitted_id)
-        else:
-            indentation_correct = bool(
-                submitted_id
-                and submitted_indent is not None
-                and submitted_indent == expected_indent
-            )
-
-        slot_correct = bool(sequence_correct and indentation_correct)
-        return {
-            "slot_index": index,
-            "slot_label": f"第{index + 1}格",
-            "submitted_block_id": submitted_id or None,
-            "expected_block_id": expected_id or None,
-            "submitted_text": submitted_text or None,
-            "expected_text": expected_text or None,
-            "block_id_match": block_id_match,
-            "content_equivalent": content_equivalent,
-            "submitted_indentation": submitted_indent,
-            "expected_indentation": expected_indent,
-            "sequence_correct": sequence_correct,
-            "indentation_correct": indentation_correct,
-            "slot_correct": slot_correct,
-        }
-
-    current_rows = [_state_at(actual_order, actual_indentation, i) for i in range(total_slots)]
-    previous_rows = (
-        [_state_at(previous_order, previous_indentation, i) for i in range(total_slots)]
-        if previous
-        else []
+    return build_block_results(
+        block_lookup=_attempt_v2_block_lookup(task_doc),
+        submitted_order=submitted_order,
+        submitted_indentation=submitted_indentation,
+        correct_answer=correct_answer,
+        previous_attempt=previous_attempt,
     )
 
-    corrected_block_ids = []
-    remaining_wrong_block_ids = []
-    remaining_wrong_submitted_block_ids = []
-    newly_wrong_block_ids = []
-    corrected_slot_indices = []
-    remaining_wrong_slot_indices = []
-    newly_wrong_slot_indices = []
-
-    for index, row in enumerate(current_rows):
-        previous_row = previous_rows[index] if index < len(previous_rows) else None
-        previous_slot_correct = (
-            bool(previous_row.get("slot_correct"))
-            if isinstance(previous_row, dict)
-            else None
-        )
-        current_slot_correct = bool(row.get("slot_correct"))
-
-        corrected = bool(
-            previous_slot_correct is False
-            and current_slot_correct is True
-        )
-        regressed = bool(
-            previous_slot_correct is True
-            and current_slot_correct is False
-        )
-        remained_wrong = bool(
-            previous_slot_correct is False
-            and current_slot_correct is False
-        )
-
-        if previous_slot_correct is None:
-            status_change = "first_attempt_correct" if current_slot_correct else "first_attempt_wrong"
-        elif corrected:
-            status_change = "corrected"
-        elif regressed:
-            status_change = "regressed"
-        elif remained_wrong:
-            status_change = "still_wrong"
-        else:
-            status_change = "still_correct"
-
-        row.update({
-            "previous_slot_correct": previous_slot_correct,
-            "corrected_since_previous": corrected,
-            "regressed_since_previous": regressed,
-            "remained_wrong": remained_wrong,
-            "status_change": status_change,
-        })
-
-        expected_id = row.get("expected_block_id")
-        submitted_id = row.get("submitted_block_id")
-        if corrected:
-            corrected_slot_indices.append(index)
-            if expected_id:
-                corrected_block_ids.append(expected_id)
-        if not current_slot_correct:
-            remaining_wrong_slot_indices.append(index)
-            if expected_id:
-                remaining_wrong_block_ids.append(expected_id)
-            if submitted_id:
-                remaining_wrong_submitted_block_ids.append(submitted_id)
-        if regressed:
-            newly_wrong_slot_indices.append(index)
-            if expected_id:
-                newly_wrong_block_ids.append(expected_id)
-
-    def _unique(values):
-        return list(dict.fromkeys([value for value in values if value]))
-
-    summary = {
-        "previous_attempt_id": str(previous.get("_id")) if previous.get("_id") is not None else None,
-        "previous_attempt_no": previous.get("attempt_no"),
-        "corrected_block_ids": _unique(corrected_block_ids),
-        "remaining_wrong_block_ids": _unique(remaining_wrong_block_ids),
-        "remaining_wrong_submitted_block_ids": _unique(remaining_wrong_submitted_block_ids),
-        "newly_wrong_block_ids": _unique(newly_wrong_block_ids),
-        "corrected_slot_indices": sorted(set(corrected_slot_indices)),
-        "remaining_wrong_slot_indices": sorted(set(remaining_wrong_slot_indices)),
-        "newly_wrong_slot_indices": sorted(set(newly_wrong_slot_indices)),
-        "corrected_block_count": len(set(corrected_slot_indices)),
-        "remaining_wrong_block_count": len(set(remaining_wrong_slot_indices)),
-        "newly_wrong_block_count": len(set(newly_wrong_slot_indices)),
-    }
-    return current_rows, summary
-
-
-def _calculate_attempt_v2_score(
-    *,
-    is_correct: bool,
-    error_count: int,
-    correct_answer,
-    submitted_order,
-) -> float:
-    # score is the proportion of slots without a sequence or indentation error.
-    if bool(is_correct):
-        return 1.0
-    correct = correct_answer if isinstance(correct_answer, dict) else {}
-    expected_order = correct.get("order") if isinstance(correct.get("order"), list) else []
-    actual_order = submitted_order if isinstance(submitted_order, list) else []
-    total_slots = len(expected_order) or len(actual_order)
-    if total_slots <= 0:
-        return 0.0
-    incorrect_slots = min(max(int(error_count or 0), 0), total_slots)
-    return round((total_slots - incorrect_slots) / total_slots, 6)
-
 
 def _previous_attempt_v2_error_types(
     student_id: str,
@@ -4079,10 +3779,11 @@ def _canonical_block_meaning_zh(block: dict) -> str:
     return ""
 
 
-def t5doc_to_parsons_task(doc: dict) -> dict:
+def t5doc_to_parsons_task(doc: dict, *, shuffle_pool: bool = True) -> dict:
     """
     將 parsons_tasks / parsons_test_tasks 來源任務（doc）轉成前端 Parsons.vue 期待的格式。
     - 支援 template_slots 可能是 dict list 或 str list（舊資料/手動匯入）。
+    - shuffle_pool=False 時保留原始順序，由呼叫端在每次回應前自行亂序（快取的考卷）。
     """
     question_text = doc.get("question_text") or doc.get("question") or ""
     solution_blocks = doc.get("solution_blocks") or []
@@ -4197,7 +3898,7 @@ def t5doc_to_parsons_task(doc: dict) -> dict:
         pool = _norm_blocks(pool)
 
     # 學生端片段池需要亂序，避免不同題型或不同資料來源暴露原始順序。
-    if isinstance(pool, list) and len(pool) > 1:
+    if shuffle_pool and isinstance(pool, list) and len(pool) > 1:
         pool = list(pool)
         random.shuffle(pool)
 
@@ -4336,6 +4037,7 @@ def save_fixed_task():
                 or (existing_id.generation_time if isinstance(existing_id, ObjectId) else now)
             )
         db.parsons_tasks.update_one({"_id": existing["_id"]}, {"$set": doc_set})
+        drop_task_snapshot(existing["_id"])
         task_id = str(existing["_id"])
     else:
         doc_set["task_code"] = incoming_task_code or "FIXED-01"
@@ -4361,7 +4063,10 @@ def get_fixed_task():
             ({"$or": [{"video_id": vid_oid}, {"video_id_str": video_id}]} if vid_oid else {"video_id_str": video_id}),
         ]
     }
-    task = db.parsons_tasks.find_one(q)
+    task = db.parsons_tasks.find_one(
+        q,
+        {"question_text": 1, "solution_blocks.text": 1, "distractor_blocks.text": 1, "enabled": 1, "status": 1},
+    )
     if not task:
         return jsonify({"ok": True, "found": False})
 
@@ -4400,7 +4105,9 @@ def get_task():
     else:
         q["video_id"] = video_id
 
-    task = db.parsons_tasks.find_one(q, sort=[("created_at", -1)])
+    # 只從 parsons_tasks 決定哪一題已發布，題目內容讀精簡快照。
+    published = db.parsons_tasks.find_one(q, {"_id": 1}, sort=[("created_at", -1)])
+    task = load_task_snapshot(published["_id"]) if published else None
     if not task:
         return jsonify({"ok": True, "noTask": True, "message": "此影片尚未發布題目"})
 
@@ -4503,7 +4210,7 @@ def publish_task():
     except Exception:
         return jsonify({"ok": False, "message": "invalid task_id"}), 400
 
-    task = db.parsons_tasks.find_one({"_id": oid})
+    task = db.parsons_tasks.find_one({"_id": oid}, {"video_id": 1, "level": 1})
     if not task:
         return jsonify({"ok": False, "message": "task not found"}), 404
 
@@ -4529,6 +4236,7 @@ def publish_task():
             "published_at": now_utc(),
         }},
     )
+    publish_task_snapshot(oid)
     return jsonify({
         "ok": True,
         "matched": result.matched_count,
@@ -4812,44 +4520,6 @@ def _find_pretest_choice_question_by_ref(task_ref: str):
     return db.questions.find_one(question_query)
 
 
-def _find_pretest_choice_question_by_index(index: int):
-    current_index = max(1, int(index or 1))
-    query = _active_test_question_query(_choice_test_question_types())
-    total = db.pre_parsons_questions.count_documents(query)
-    if total > 0:
-        if current_index > total:
-            current_index = total
-        docs = list(
-            db.pre_parsons_questions
-            .find(query)
-            .sort(_test_question_sort_key())
-            .skip(current_index - 1)
-            .limit(1)
-        )
-        return (docs[0] if docs else None), total, current_index
-
-    question_query = {
-        "$and": [
-            {"type": {"$in": ["mcq", "choice", "multiple_choice", "single_choice"]}},
-            {"active": {"$ne": False}},
-            {"is_active": {"$ne": False}},
-        ]
-    }
-    total = db.questions.count_documents(question_query)
-    if total <= 0:
-        return None, 0, current_index
-    if current_index > total:
-        current_index = total
-    docs = list(
-        db.questions
-        .find(question_query)
-        .sort(_test_question_sort_key())
-        .skip(current_index - 1)
-        .limit(1)
-    )
-    return (docs[0] if docs else None), total, current_index
-
-
 def _find_test_question_by_ref(test_role: str, task_ref: str):
     collection_name = _test_question_collection_name(test_role)
     ref = str(task_ref or "").strip()
@@ -4869,34 +4539,6 @@ def _find_test_question_by_ref(test_role: str, task_ref: str):
     return db[collection_name].find_one({"$and": [query, {"$or": candidates}]})
 
 
-def _find_test_question_by_index(test_role: str, index: int):
-    collection_name = _test_question_collection_name(test_role)
-    if not collection_name:
-        return None, 0, 1
-
-    if str(test_role or "").strip().lower() == "pre":
-        choice_doc, choice_total, choice_index = _find_pretest_choice_question_by_index(index)
-        if choice_doc:
-            return choice_doc, choice_total, choice_index
-
-    current_index = max(1, int(index or 1))
-    query = _active_test_question_query()
-    total = db[collection_name].count_documents(query)
-    if total <= 0:
-        return None, 0, current_index
-
-    if current_index > total:
-        current_index = total
-    docs = list(
-        db[collection_name]
-        .find(query)
-        .sort(_test_question_sort_key())
-        .skip(current_index - 1)
-        .limit(1)
-    )
-    return (docs[0] if docs else None), total, current_index
-
-
 def _active_test_question_docs(test_role: str) -> list:
     """Return the exact active source list used by the formal test endpoint."""
     role = str(test_role or "").strip().lower()
@@ -4935,12 +4577,7 @@ def _active_test_question_docs(test_role: str) -> list:
 
 
 def _expected_test_task_ids(test_role: str) -> list:
-    ids = []
-    for question_doc in _active_test_question_docs(test_role):
-        task_id = _test_question_task_id(question_doc)
-        if task_id and task_id not in ids:
-            ids.append(task_id)
-    return ids
+    return _exam_paper(test_role).expected_task_ids
 
 
 def _numeric_score(value, default=0.0):
@@ -4954,7 +4591,8 @@ def _numeric_score(value, default=0.0):
 
 
 def _pretest_completion_snapshot(student_id: str, test_cycle_id: str) -> dict:
-    expected_task_ids = _expected_test_task_ids("pre")
+    paper = _exam_paper("pre")
+    expected_task_ids = paper.expected_task_ids
     expected_ids = set(expected_task_ids)
     attempts = list(db.parsons_test_attempts.find(
         {
@@ -4987,7 +4625,10 @@ def _pretest_completion_snapshot(student_id: str, test_cycle_id: str) -> dict:
         score += _numeric_score(attempt.get("score"), 0.0)
         attempt_max = _numeric_score(attempt.get("max_score"), 0.0)
         if attempt_max <= 0:
-            attempt_max = 4.0 if attempt.get("question_type") == "choice" else 1.0
+            attempt_max = paper.max_score(
+                task_id,
+                float(_CHOICE_TEST_MAX_SCORE) if attempt.get("question_type") == "choice" else 1.0,
+            )
         max_score += attempt_max
     percentage = round((score / max_score) * 100, 4) if max_score > 0 else 0.0
     return {
@@ -5112,7 +4753,7 @@ def _parsons_question_to_task_doc(question_doc: dict) -> dict:
     }
 
 
-def _build_test_question_response(question_doc: dict, total: int, current_index: int, test_role: str = ""):
+def _build_test_question_response(question_doc: dict, total: int, current_index: int, test_role: str = "", parsed: dict = None):
     if _is_choice_test_question(question_doc):
         task_id = _test_question_task_id(question_doc)
         return {
@@ -5128,8 +4769,8 @@ def _build_test_question_response(question_doc: dict, total: int, current_index:
             "data_source": _choice_test_data_source(test_role),
         }
 
-    task_doc = _parsons_question_to_task_doc(question_doc)
-    parsed = t5doc_to_parsons_task(task_doc)
+    if parsed is None:
+        parsed = t5doc_to_parsons_task(_parsons_question_to_task_doc(question_doc))
     task_id = _test_question_task_id(question_doc)
     return {
         "ok": True,
@@ -5144,6 +4785,66 @@ def _build_test_question_response(question_doc: dict, total: int, current_index:
         "data_source": "pre_post_parsons_questions",
     }
 
+def _test_question_refs(question_doc: dict, task_id: str) -> list:
+    # 與 _find_test_question_by_ref 接受的參照相同：question_id / task_id / test_task_id / _id。
+    refs = [task_id]
+    for key in ("question_id", "task_id", "test_task_id", "_id"):
+        value = question_doc.get(key)
+        if value is not None and str(value).strip():
+            refs.append(str(value).strip())
+    return refs
+
+
+def _compile_exam_paper(test_role: str, version) -> ExamPaper:
+    """Build the ordered, converted paper served by /test/task and graded by /test/submit."""
+    question_docs = _active_test_question_docs(test_role)
+    total = len(question_docs)
+    questions = []
+    refs = {}
+    for position, question_doc in enumerate(question_docs, start=1):
+        task_id = _test_question_task_id(question_doc)
+        if _is_choice_test_question(question_doc):
+            question = PaperQuestion(
+                index=position,
+                task_id=task_id,
+                question_type="choice",
+                source_doc=question_doc,
+                task_doc=question_doc,
+                parsed={},
+                payload=_build_test_question_response(question_doc, total, position, test_role),
+                expected_ids=(_choice_answer_key(question_doc),),
+                max_score=float(_CHOICE_TEST_MAX_SCORE),
+            )
+        else:
+            task_doc = _parsons_question_to_task_doc(question_doc)
+            # 考卷會跨請求快取：片段池不在此亂序，改由 get_test_task 每次回應時亂序。
+            parsed = t5doc_to_parsons_task(task_doc, shuffle_pool=False)
+            question = PaperQuestion(
+                index=position,
+                task_id=task_id,
+                question_type="parsons",
+                source_doc=question_doc,
+                task_doc=task_doc,
+                parsed=parsed,
+                payload=_build_test_question_response(question_doc, total, position, test_role, parsed=parsed),
+                expected_ids=tuple(str(slot.get("expected_id")) for slot in (parsed.get("template_slots") or [])),
+                max_score=1.0,
+            )
+        questions.append(question)
+        for ref in _test_question_refs(question_doc, task_id):
+            refs.setdefault(ref, question)
+    return ExamPaper(
+        test_role=test_role,
+        version=version,
+        questions=tuple(questions),
+        refs=refs,
+    )
+
+
+def _exam_paper(test_role: str) -> ExamPaper:
+    return cached_exam_paper(test_role, _compile_exam_paper)
+
+
 # 紀錄前後測結果
 @parsons_bp.get("/test/task")
 def get_test_task():
@@ -5178,9 +4879,13 @@ def get_test_task():
     except Exception:
         requested_index = 1
 
-    question_doc, total, current_index = _find_test_question_by_index(test_role, requested_index)
-    if question_doc:
-        payload = _build_test_question_response(question_doc, total, current_index, test_role)
+    question, _current_index = _exam_paper(test_role).question_at(requested_index)
+    if question is not None:
+        payload = dict(question.payload)
+        if isinstance(payload.get("pool"), list):
+            # 複製後再亂序：不改動快取考卷中的片段池，每位學生各自取得新順序。
+            payload["pool"] = list(payload["pool"])
+            random.shuffle(payload["pool"])
         payload["test_cycle_id"] = test_cycle_id
         return jsonify(payload)
 
@@ -5191,10 +4896,7 @@ def get_test_task():
     # 取得原始題目
     raw_source = tt.get("task_id") or tt.get("source_task_id")
     source_task_id = str(raw_source).strip() if raw_source else ""
-    try:
-        task_doc = db.parsons_tasks.find_one({"_id": ObjectId(source_task_id)})
-    except:
-        task_doc = None
+    task_doc = load_task_snapshot(source_task_id)
 
     if not task_doc:
         return jsonify({"ok": False, "message": "source task not found"}), 404
@@ -5314,6 +5016,7 @@ def _submit_choice_test_answer(
     try:
         ins = db.parsons_test_attempts.insert_one(attempt_doc)
         attempt_id = str(ins.inserted_id)
+        record_test_submission(student_id, test_cycle_id, test_role, task_identity)
     except DuplicateKeyError:
         existing_attempt = db.parsons_test_attempts.find_one(
             {
@@ -5373,6 +5076,7 @@ def _submit_choice_test_answer(
 
 # 提交前後測答案
 @parsons_bp.post("/test/submit")
+@idempotent
 @prevent_duplicate_submission
 def submit_test_answer():
     '''
@@ -5421,11 +5125,16 @@ def submit_test_answer():
 
     # 取得題目
     task_identity = request_task_id
-    try:
-        task = db.parsons_tasks.find_one({"_id": ObjectId(request_task_id)})
-    except Exception:
-        task = None
+    parsed = None
+    task = load_task_snapshot(request_task_id)
+    if not task:
+        paper_question = _exam_paper(test_role).find(request_task_id)
+        if paper_question is not None:
+            task = paper_question.task_doc
+            task_identity = paper_question.task_id
+            parsed = paper_question.parsed or None
     if not task:
+        # 不在目前試卷中的舊題目參照仍照原本方式查詢。
         question_doc = _find_test_question_by_ref(test_role, request_task_id)
         if question_doc:
             task = question_doc if _is_choice_test_question(question_doc) else _parsons_question_to_task_doc(question_doc)
@@ -5465,93 +5174,23 @@ def submit_test_answer():
             payload_duration_seconds=payload_duration_seconds,
         )
 
-    parsed = t5doc_to_parsons_task(task)
+    if parsed is None:
+        parsed = t5doc_to_parsons_task(task)
     expected_ids = [str(s.get("expected_id")) for s in (parsed.get("template_slots") or [])]
     missing_answer_indices = _incomplete_answer_indices(answer_ids, expected_ids)
     if missing_answer_indices:
         return _incomplete_answer_json(missing_answer_indices, len(expected_ids))
 
-    def _infer_indents_from_structure(blocks: list) -> list:
-        out = []
-        level = 0
-        for b in blocks or []:
-            raw = str((b or {}).get("text") or "")
-            s = raw.strip()
-            low = s.lower()
-            if low.startswith(("elif ", "else:", "except", "finally:")):
-                level = max(0, level - 1)
-            out.append(level * 4)
-            if s.endswith(":"):
-                level += 1
-        return out
-
-    expected_blocks = parsed.get("solution_blocks") or []
-    expected_indent_list = []
-    for b in expected_blocks:
-        b = b or {}
-        raw_text = str(b.get("text") or "")
-        if "indent" in b:
-            expected_indent_list.append(int(b.get("indent", 0) or 0))
-        else:
-            expected_indent_list.append(len(raw_text) - len(raw_text.lstrip(" ")))
-    if expected_indent_list and all(x == 0 for x in expected_indent_list):
-        expected_indent_list = _infer_indents_from_structure(expected_blocks)
-
-    aligned = list(answer_ids)
-    if len(aligned) < len(expected_ids):
-        aligned = aligned + [None] * (len(expected_ids) - len(aligned))
-
-    # [新增] 允許「文字相同但 block_id 不同」視為同一行（避免干擾題與解答文字相同導致誤判）
-    def _norm_line_for_compare(s: str) -> str:
-        try:
-            s = (s or "").replace("	", "    ")
-            # 比對時忽略左右空白（縮排由另外的 indentation 機制處理）
-            return s.strip()
-        except Exception:
-            return (s or "").strip()
-
-    pool_by_id_for_compare = {str(b.get("id")): b for b in (parsed.get("pool") or [])}
-    expected_lines = [(b.get("text") or "") for b in expected_blocks]
-    if len(expected_lines) < len(expected_ids):
-        expected_lines += [""] * (len(expected_ids) - len(expected_lines))
-
-    wrong_indices = []
-    id_mismatch_indices = []
-    for i in range(len(expected_ids)):
-        aid = str(aligned[i]) if aligned[i] is not None else ""
-        eid = str(expected_ids[i])
-
-        if aid == eid:
-            continue
-
-        a_text = str(pool_by_id_for_compare.get(aid, {}).get("text", "") or "")
-        e_text = str(pool_by_id_for_compare.get(eid, {}).get("text", "") or "")
-
-        # 若文字完全相同（忽略左右空白），視為該格正確
-        if _norm_line_for_compare(a_text) and _norm_line_for_compare(a_text) == _norm_line_for_compare(e_text):
-            continue
-
-        wrong_indices.append(i)
-        id_mismatch_indices.append(i)
-
-    # 縮排檢查：有 answer_lines 時一併判定。
-    indent_errors = []
-    for i in range(min(len(expected_ids), len(answer_lines), len(expected_indent_list))):
-        expected_indent = int(expected_indent_list[i] or 0)
-
-        user_line = str(answer_lines[i] or "")
-        user_indent = len(user_line) - len(user_line.lstrip(" "))
-
-        if user_indent != expected_indent:
-            indent_errors.append(i)
-            if i not in wrong_indices:
-                wrong_indices.append(i)
-
-    extra_wrong = max(0, len(answer_ids) - len(expected_ids))
-    is_correct = (len(wrong_indices) == 0 and extra_wrong == 0)
-
-    total_slots = max(1, len(expected_ids))
-    score = (total_slots - len(wrong_indices)) / total_slots
+    grading = grade_parsons_submission(parsed, answer_ids, answer_lines, mode="test")
+    expected_lines = grading["expected_lines"]
+    expected_indent_list = grading["expected_indentation"]
+    wrong_indices = grading["wrong_indices"]
+    id_mismatch_indices = grading["id_mismatch_indices"]
+    indent_errors = grading["indent_errors"]
+    extra_wrong = grading["extra_wrong"]
+    is_correct = grading["is_correct"]
+    total_slots = grading["total_slots"]
+    score = grading["score"]
     submitted_order = list(answer_ids) if isinstance(answer_ids, list) else []
     submitted_indentation = _submitted_indentation_from_lines(answer_lines)
     submitted_indentation_by_block = _submitted_indentation_by_block(
@@ -5662,6 +5301,7 @@ def submit_test_answer():
     try:
         ins = db.parsons_test_attempts.insert_one(attempt_doc)
         attempt_id = str(ins.inserted_id)
+        record_test_submission(student_id, test_cycle_id, test_role, task_identity)
     except DuplicateKeyError:
         existing_attempt = db.parsons_test_attempts.find_one(
             {
@@ -5784,6 +5424,8 @@ def toggle_test_cycle():
             {"$set": update},
             upsert=True
         )
+        invalidate_student_home_catalog()
+        invalidate_exam_papers()
 
         # 回傳最新狀態
         new_doc = db.test_control.find_one({"_id": f"post_open:{test_cycle_id}"}) or {}
@@ -6017,6 +5659,7 @@ def _derive_slot_concept_map(task_doc: dict) -> dict:
 答對 → 不顯示錯誤提示
 '''
 @parsons_bp.post("/submit")
+@idempotent
 @prevent_duplicate_submission
 def submit_answer():
     data = request.get_json(silent=True) or {}
@@ -6031,15 +5674,15 @@ def submit_answer():
     if not task_id:
         return jsonify({"ok": False, "message": "missing task_id"}), 400
 
-    try:
-        task = db.parsons_tasks.find_one({"_id": ObjectId(task_id)})
-    except Exception:
+    if not ObjectId.is_valid(task_id):
         return jsonify({"ok": False, "message": "invalid task_id"}), 400
+    task = load_task_snapshot(task_id)
     if not task:
         return jsonify({"ok": False, "message": "task not found"}), 404
 
     if not student_id:
         return jsonify({"ok": False, "message": "missing student_id"}), 400
+    feedback_profile = _student_feedback_profile(student_id)
 
     parsed = t5doc_to_parsons_task(task)
 
@@ -6063,182 +5706,32 @@ def submit_answer():
     print("answer_lines =", answer_lines)
     print("=========================================\n")
 
-    # 先初始化（最終正確性以後段「模板槽位比對 + 縮排比對」為準）
-    wrong_indices = []
-    indent_errors = []
-    is_correct = False
-
-    # [新增] V1.3：Submit 端 fallback 解析 SRT（把 [行-行] 轉成秒數）
-
-
-
-
-
-
-
-
-
-
-
-    # [新增] V1.4：用「template_slots 的順序」做一格一格比對，避免 idx 錯位（第3格變第4格）
-    parsed = t5doc_to_parsons_task(task)
-    expected_ids = [str(s.get("expected_id")) for s in (parsed.get("template_slots") or [])]
-
-    def _infer_indents_from_structure(blocks: list) -> list:
-        out = []
-        level = 0
-        for b in blocks or []:
-            raw = str((b or {}).get("text") or "")
-            s = raw.strip()
-            low = s.lower()
-            if low.startswith(("elif ", "else:", "except", "finally:")):
-                level = max(0, level - 1)
-            out.append(level * 4)
-            if s.endswith(":"):
-                level += 1
-        return out
-
     expected_blocks_all = parsed.get("solution_blocks") or []
-    expected_indent_list = []
-    for b in expected_blocks_all:
-        b = b or {}
-        raw_text = str(b.get("text") or "")
-        if "indent" in b:
-            expected_indent_list.append(int(b.get("indent", 0) or 0))
-        else:
-            expected_indent_list.append(len(raw_text) - len(raw_text.lstrip(" ")))
-    if expected_indent_list and all(x == 0 for x in expected_indent_list):
-        expected_indent_list = _infer_indents_from_structure(expected_blocks_all)
 
     # [保留] 仍保留 answer_core_ids 欄位（不改 DB schema）
     answer_core = [bid for bid in answer_ids if str(bid).startswith("b")]
 
-    # [新增] 對齊長度：不足補 None；多出的視為錯（但不會影響 wrong_indices 的 index 對齊）
-    aligned = list(answer_ids)
-    if len(aligned) < len(expected_ids):
-        aligned = aligned + [None] * (len(expected_ids) - len(aligned))
-
-    # [新增] 允許「文字相同但 block_id 不同」視為同一行（避免干擾題與解答文字相同導致誤判）
-    def _norm_line_for_compare(s: str) -> str:
-        try:
-            s = (s or "").replace("	", "    ")
-            # 比對時忽略左右空白（縮排由另外的 indentation 機制處理）
-            return s.strip()
-        except Exception:
-            return (s or "").strip()
-
-    pool_by_id_for_compare = {str(b.get("id")): b for b in (parsed.get("pool") or [])}
-
-    expected_lines = [(b.get("text") or "") for b in expected_blocks_all]
-    if len(expected_lines) < len(expected_ids):
-        expected_lines += [""] * (len(expected_ids) - len(expected_lines))
-
-    wrong_indices = []
-    id_mismatch_indices = []
-    for i in range(len(expected_ids)):
-        aid = str(aligned[i]) if aligned[i] is not None else ""
-        eid = str(expected_ids[i])
-
-        if aid == eid:
-            continue
-
-        a_text = str(pool_by_id_for_compare.get(aid, {}).get("text", "") or "")
-        e_text = str(pool_by_id_for_compare.get(eid, {}).get("text", "") or "")
-
-        # 若文字完全相同（忽略左右空白），視為該格正確
-        if _norm_line_for_compare(a_text) and _norm_line_for_compare(a_text) == _norm_line_for_compare(e_text):
-            continue
-
-        wrong_indices.append(i)
-        id_mismatch_indices.append(i)
-
-    # [修正] 縮排檢查僅針對「該格有實際作答」的情況。
-    # 空白格（未拖拉）應視為未完成/位置錯誤，不應誤判為縮排錯誤。
-    for i in range(min(len(expected_ids), len(answer_lines), len(expected_indent_list))):
-        has_answer_id = (i < len(aligned) and aligned[i] is not None and str(aligned[i]).strip() != "")
-        user_line = str(answer_lines[i] or "")
-        if (not has_answer_id) or (not user_line.strip()):
-            continue
-
-        expected_indent = int(expected_indent_list[i] or 0)
-        user_indent = len(user_line) - len(user_line.lstrip(" "))
-        if user_indent != expected_indent:
-            indent_errors.append(i)
-            if i not in wrong_indices:
-                wrong_indices.append(i)
-
-    # 額外多填的答案也算錯（不新增不存在的格 index，只影響 is_correct / score）
-    extra_wrong = max(0, len(answer_ids) - len(expected_ids))
-
-    def _line_kind(s: str) -> str:
-        t = str(s or "").strip().lower()
-        if not t:
-            return "main"
-        if t.startswith(("if ", "elif ", "else:")):
-            return "control"
-        if any(op in t for op in [" + ", " - ", " * ", " / ", "==", "!=", "<=", ">=", "<", ">", "+", "-", "*", "/"]):
-            return "semantic"
-        if t.startswith("print(") or " return " in (" " + t + " "):
-            return "semantic"
-        return "main"
-
-    # 四層優先：indentation > control > semantic > main
-    control_errors = []
-    semantic_errors = []
-    main_order_errors = []
-    for i in id_mismatch_indices:
-        exp_line = str(expected_lines[i] or "") if i < len(expected_lines) else ""
-        act_id = str(aligned[i]) if i < len(aligned) and aligned[i] is not None else ""
-        act_line = str(pool_by_id_for_compare.get(act_id, {}).get("text", "") or "")
-        k = _line_kind(exp_line)
-        if k == "control":
-            control_errors.append(i)
-        elif k == "semantic":
-            semantic_errors.append(i)
-        else:
-            # 若 expected 看不出來，actual 是控制/語意也要納入
-            k2 = _line_kind(act_line)
-            if k2 == "control":
-                control_errors.append(i)
-            elif k2 == "semantic":
-                semantic_errors.append(i)
-            else:
-                main_order_errors.append(i)
-
-    # 主錯誤格固定採「最前面出錯的格」，避免第1格錯卻回饋第2格。
-    wrong_index = min(wrong_indices) if wrong_indices else None
-
-    if wrong_index is None:
-        primary_error_type = None
-    elif wrong_index in indent_errors:
-        primary_error_type = "indentation"
-    elif wrong_index in control_errors:
-        primary_error_type = "condition"
-    elif wrong_index in semantic_errors:
-        primary_error_type = "calculation"
-    elif wrong_index in main_order_errors:
-        primary_error_type = "structure"
-    else:
-        primary_error_type = "structure"
-
-    # 關鍵規則：只回報第一個主錯誤，忽略後續衍生錯誤。
-    reported_wrong_indices = [wrong_index] if wrong_index is not None else []
-    is_correct = (len(reported_wrong_indices) == 0 and extra_wrong == 0)
-
-    # [新增] 分數：以格數正確率計算
-    total_slots = max(1, len(expected_ids))
-    score = (total_slots - len(reported_wrong_indices)) / total_slots
-
-    # [新增] 產生回饋需要的欄位（slot_label / actual_text / expected_text）
-    slot_label = f"第{(wrong_index + 1)}格" if wrong_index is not None else ""
+    # 逐格比對、縮排檢查與主錯誤格判定都在 parsons_grading（與前後測共用）。
+    # 練習模式只回報第一個主錯誤，忽略後續衍生錯誤；分數也只扣這一格。
+    grading = grade_parsons_submission(parsed, answer_ids, answer_lines, mode="practice")
+    expected_lines = grading["expected_lines"]
+    expected_indent_list = grading["expected_indentation"]
+    wrong_indices = grading["wrong_indices"]
+    indent_errors = grading["indent_errors"]
+    wrong_index = grading["wrong_index"]
+    reported_wrong_indices = grading["reported_wrong_indices"]
+    primary_error_type = grading["primary_error_type"]
+    is_correct = grading["is_correct"]
+    score = grading["score"]
+
+    # 產生回饋需要的欄位（slot_label / actual_text / expected_text）
+    slot_label = grading["slot_label"]
+    actual_id = grading["actual_id"]
+    expected_id = grading["expected_id"]
+    actual_text = grading["actual_text"]
+    expected_text = grading["expected_text"]
     pool_by_id = {str(b.get("id")): b for b in (parsed.get("pool") or [])}
 
-    actual_id = str(aligned[wrong_index]) if (wrong_index is not None and aligned[wrong_index] is not None) else ""
-    expected_id = str(expected_ids[wrong_index]) if wrong_index is not None else ""
-
-    actual_text = pool_by_id.get(actual_id, {}).get("text", "") if actual_id else ""
-    expected_text = pool_by_id.get(expected_id, {}).get("text", "") if expected_id else ""
-
     try:
         print("DEBUG_WRONG_SLOT =", {
             "wrong_index": wrong_index,
@@ -6382,6 +5875,8 @@ def submit_answer():
         except Exception as rollback_error:
             print("[parsons submit] v2 rollback after legacy write failure failed:", repr(rollback_error))
         return jsonify({"ok": False, "message": "parsons_attempts legacy write failed", "detail": str(e)}), 500
+    if attempt_doc.get("is_correct") is True:
+        record_practice_completion(student_id, attempt_doc.get("video_id"))
 
     write_learning_log_safely({
         "session_id": data.get("session_id"),
@@ -7642,6 +7137,27 @@ def _prepare_ai_hint_record(att, task, *, requested_hint_no=1, force=False, coun
     payload["generated"] = bool(generated)
     return record, payload
 
+def _hint_state_quick_payload(feedback_profile, ai_state):
+    """hint_state 的常見情況：非 B 組或已有 AI 提示；其餘回傳 None，需查作答紀錄。"""
+    if feedback_profile.get("feedback_strategy") != "B":
+        return {
+            "ok": True,
+            "feedback_mode": feedback_profile.get("feedback_mode"),
+            "hint_record": None,
+            "hint_state": None,
+            "completed_previous_session": False,
+        }
+    if ai_state:
+        return {
+            "ok": True,
+            "feedback_mode": "structured_ai_once",
+            "hint_record": None,
+            "hint_state": _ai_hint_state_public(ai_state),
+            "completed_previous_session": False,
+        }
+    return None
+
+
 # 重新整理或重新進入題目時，還原已產生的單一聚焦提示與 metadata
 @parsons_bp.route("/hint_state", methods=["GET", "OPTIONS"])
 def get_parsons_hint_state():
@@ -7655,24 +7171,10 @@ def get_parsons_hint_state():
         return jsonify({"ok": False, "message": "missing task_id"}), 400
 
     feedback_profile = _student_feedback_profile(student_id)
-    if feedback_profile.get("feedback_strategy") != "B":
-        return jsonify({
-            "ok": True,
-            "feedback_mode": feedback_profile.get("feedback_mode"),
-            "hint_record": None,
-            "hint_state": None,
-            "completed_previous_session": False,
-        })
-
-    ai_state = _get_ai_hint_state(student_id, task_id)
-    if ai_state:
-        return jsonify({
-            "ok": True,
-            "feedback_mode": "structured_ai_once",
-            "hint_record": None,
-            "hint_state": _ai_hint_state_public(ai_state),
-            "completed_previous_session": False,
-        })
+    ai_state = _get_ai_hint_state(student_id, task_id) if feedback_profile.get("feedback_strategy") == "B" else None
+    quick = _hint_state_quick_payload(feedback_profile, ai_state)
+    if quick is not None:
+        return jsonify(quick)
 
     latest = _latest_attempt_v2_doc(student_id, task_id, "practice", None)
     if latest:
@@ -7747,6 +7249,7 @@ def upsert_hint_library_entry():
             "message": "hint_library write failed",
             "detail": str(exc),
         }), 500
+    invalidate_hint_library_index()
 
     return jsonify({
         "ok": True,
@@ -7796,10 +7299,7 @@ def generate_parsons_hint():
     task_id_for_record = str(att.get("task_id") or "").strip()
     if not task_id_for_record:
         return jsonify({"ok": False, "message": "attempt missing task_id"}), 400
-    try:
-        task_for_record = db.parsons_tasks.find_one({"_id": ObjectId(task_id_for_record)})
-    except Exception:
-        task_for_record = None
+    task_for_record = load_task_snapshot(task_id_for_record)
     if not task_for_record:
         return jsonify({"ok": False, "message": "task not found"}), 404
 
@@ -10,6 +10,8 @@ import time
 from typing import Any, Dict, Optional, Tuple, List
 from dotenv import load_dotenv
 
+from ..metrics import observe_llm_call
+
 # ✅ 修正：load_dotenv() 必須在所有 os.getenv() 之前執行
 load_dotenv()
 
@@ -96,7 +98,8 @@ def _responses_create_with_retry(client: "OpenAI", **kwargs):
 
     for i in range(attempts):
         try:
-            return client.responses.create(**kwargs)
+            with observe_llm_call("responses"):
+                return client.responses.create(**kwargs)
         except Exception as e:
             last_err = e
             name = e.__class__.__name__.lower()
@@ -42,14 +42,27 @@ LLM 不穩定點（需求保留）：
 
 import os
 import re
+import threading
 _re = re
 import json
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Optional, List
 
 from flask import jsonify
 from bson import ObjectId
 
+from ..concept_align_store import (
+    AlignKey,
+    content_hash,
+    find_covering_result,
+    fingerprint,
+    load_result,
+    save_result,
+    stored_recommendations,
+)
 from ..db import db
+from ..keyword_matcher import KeywordMatcher, normalize_keyword
+from ..task_snapshots import drop_task_snapshot
 from . import parsons_ai
 from .parsons_service import (
     now_utc,
@@ -66,6 +79,14 @@ from .parsons_retrieval import build_subtitle_index
 # ─────────────────────────────────────────────
 # 模型設定
 
+# 章節 rerank 同時送出的 LLM 呼叫數（全行程共用），以及一次對齊等待 rerank 的總時間。
+CONCEPT_RERANK_WORKERS = max(1, int(os.getenv("CONCEPT_RERANK_WORKERS", "4")))
+CONCEPT_RERANK_DEADLINE_SEC = max(1.0, float(os.getenv("CONCEPT_RERANK_DEADLINE_SEC", "25")))
+
+_RERANK_POOL_LOCK = threading.Lock()
+_RERANK_POOL: Optional[tuple] = None
+
+
 def _model_for_concept_align() -> str:
     """概念對齊使用的 LLM 模型。"""
     return (
@@ -118,6 +139,21 @@ _LEGACY_SURFACE_TAG_ALIASES = {
 }
 
 
+# alias 表各編成一個比對器：名稱只掃一次，再依表格順序找第一個命中的 canonical。
+_CONCEPT_ALIAS_MATCHER = KeywordMatcher(a for aliases in _LEGACY_CONCEPT_TAG_ALIASES.values() for a in aliases)
+_SURFACE_ALIAS_MATCHER = KeywordMatcher(a for aliases in _LEGACY_SURFACE_TAG_ALIASES.values() for a in aliases)
+
+
+def _first_alias_hit(raw: str, aliases_by_canonical: dict, matcher: KeywordMatcher) -> str:
+    hits = matcher.hits(raw)
+    for canonical, aliases in aliases_by_canonical.items():
+        if raw == canonical:
+            return canonical
+        if any(normalize_keyword(alias) in hits for alias in aliases):
+            return canonical
+    return ""
+
+
 def concept_tag_to_label(tag: str) -> str:
     tag_key = str(tag or "").strip().lower()
     if not tag_key:
@@ -130,15 +166,7 @@ def normalize_surface_tag(surface: str) -> str:
     if not raw:
         return ""
 
-    for canonical, aliases in _LEGACY_SURFACE_TAG_ALIASES.items():
-        if raw == canonical:
-            return canonical
-        for alias in aliases:
-            alias_low = str(alias or "").strip().lower()
-            if alias_low and (alias_low == raw or alias_low in raw):
-                return canonical
-
-    return raw
+    return _first_alias_hit(raw, _LEGACY_SURFACE_TAG_ALIASES, _SURFACE_ALIAS_MATCHER) or raw
 
 
 def _legacy_surface_from_concept_tag(tag: str) -> str:
@@ -182,27 +210,38 @@ def infer_surface_tag_from_text(text: str) -> str:
     return ""
 
 
+# infer_concept_tag_from_text 依序檢查的線索詞。
+_CONCEPT_HINT_TERMS = {
+    "star_formula_2i_minus_1": ["2i-1", "2*i-1", "星號", "star", "奇數列"],
+    "space_formula_n_minus_i": ["n-i", "n - i", "空白", "space", "spacing"],
+    "nested_loop_structure": ["nested", "巢狀", "雙層", "多層", "兩層迴圈"],
+    "loop_reverse_range": ["reverse", "倒著", "反向", "遞減", "由大到小"],
+    "if_branch_order": ["elif", "else if", "分支順序", "分支排列", "排序"],
+    "edge_case_condition": ["edge", "邊界", "特殊", "例外", "空值", "沒有", "最後一筆", "0", "1"],
+}
+_CONCEPT_HINT_MATCHER = KeywordMatcher(term for terms in _CONCEPT_HINT_TERMS.values() for term in terms)
+
+
 def infer_concept_tag_from_text(text: str) -> str:
     q = str(text or "").strip().lower()
     if not q:
         return "python_syntax"
 
     surface = infer_surface_tag_from_text(q)
+    hits = _CONCEPT_HINT_MATCHER.hits(q)
 
-    if any(term in q for term in ["2i-1", "2*i-1", "星號", "star", "奇數列"]):
-        return "star_formula_2i_minus_1"
-    if any(term in q for term in ["n-i", "n - i", "空白", "space", "spacing"]):
-        return "space_formula_n_minus_i"
-    if any(term in q for term in ["nested", "巢狀", "雙層", "多層", "兩層迴圈"]):
-        return "nested_loop_structure"
-    if any(term in q for term in ["reverse", "倒著", "反向", "遞減", "由大到小"]):
-        return "loop_reverse_range"
+    def has_hint(tag):
+        return any(term in hits for term in _CONCEPT_HINT_TERMS[tag])
+
+    for tag in ("star_formula_2i_minus_1", "space_formula_n_minus_i", "nested_loop_structure", "loop_reverse_range"):
+        if has_hint(tag):
+            return tag
     if surface == "for":
         return "loop_count_control"
     if surface == "if":
-        if any(term in q for term in ["elif", "else if", "分支順序", "分支排列", "排序"]):
+        if has_hint("if_branch_order"):
             return "if_branch_order"
-        if any(term in q for term in ["edge", "邊界", "特殊", "例外", "空值", "沒有", "最後一筆", "0", "1"]):
+        if has_hint("edge_case_condition"):
             return "edge_case_condition"
         return "if_condition_logic"
     if surface == "input":
@@ -211,9 +250,6 @@ def infer_concept_tag_from_text(text: str) -> str:
         return "print_separator"
     if surface in {"def", "return", "call", "operator"}:
         return "python_syntax"
-
-    if any(term in q for term in ["input", "print", "if", "for", "while", "def", "return"]):
-        return "python_syntax"
     return "python_syntax"
 
 
@@ -237,13 +273,9 @@ def normalize_concept_name(concept: str) -> str:
         return ""
 
     low = raw.lower()
-    for canonical, aliases in _LEGACY_CONCEPT_TAG_ALIASES.items():
-        if low == canonical:
-            return canonical
-        for alias in aliases:
-            alias_low = str(alias or "").strip().lower()
-            if alias_low and (alias_low == low or alias_low in low):
-                return canonical
+    canonical = _first_alias_hit(low, _LEGACY_CONCEPT_TAG_ALIASES, _CONCEPT_ALIAS_MATCHER)
+    if canonical:
+        return canonical
 
     if low in _CONCEPT_TAG_LABELS:
         return low
@@ -462,6 +494,18 @@ def _chapter_label_needs_rename(concept_tag: str, concept_label: str) -> bool:
     return False
 
 
+# _build_ai_chapter_suggestion_candidates 針對個別 concept_tag 額外加分的字詞。
+_SUGGESTION_SIGNAL_TERMS = (
+    "input(", "int(input", "轉整數", "型別轉換",
+    "sep=", "print(", "空格", "分隔",
+    "for", "range(",
+    "判斷", "條件",
+    "elif", "else",
+    "最後", "特殊", "邊界", "沒有", "例外",
+    "def", "return",
+)
+
+
 def _build_ai_chapter_suggestion_candidates(draft_chapters: list[dict], subtitle_segments: list[dict]) -> tuple[list[dict], list[dict]]:
     normalized_drafts = validate_chapters(draft_chapters)
     normalized_subtitles = _normalize_subtitle_segments_for_suggestions(subtitle_segments)
@@ -482,62 +526,71 @@ def _build_ai_chapter_suggestion_candidates(draft_chapters: list[dict], subtitle
                     "_concept_tag": tag,
                 })
 
+    # 每個 concept_tag 的詞表只整理一次；每段字幕用一個比對器掃一次。
+    tag_terms = []
+    for concept_tag in sorted(_CONCEPT_TAG_LABELS.keys()):
+        if concept_tag in existing_tags:
+            continue
+        context = get_context_rules_for_concept_tag(concept_tag) or {}
+        tag_terms.append((
+            concept_tag,
+            [(str(term).strip(), normalize_keyword(term)) for term in get_query_terms_for_concept_tag(concept_tag) or []],
+            [(str(term).strip(), normalize_keyword(term)) for term in context.get("positive") or []],
+        ))
+    matcher = KeywordMatcher(
+        [term_low for _, terms, positive in tag_terms for _, term_low in terms + positive]
+        + list(_SUGGESTION_SIGNAL_TERMS)
+    )
+
     tag_scores = {}
     for seg in normalized_subtitles:
         text = str(seg.get("text") or "").strip()
         if not text:
             continue
         low = text.lower()
-        for concept_tag in sorted(_CONCEPT_TAG_LABELS.keys()):
-            if concept_tag in existing_tags:
-                continue
-            terms = list(get_query_terms_for_concept_tag(concept_tag) or [])
-            context = get_context_rules_for_concept_tag(concept_tag) or {}
-            positive_terms = list(context.get("positive") or [])
-
+        found = matcher.hits(low)
+        for concept_tag, terms, positive_terms in tag_terms:
             hits = []
             score = 0.0
-            for term in terms:
-                term_low = str(term or "").strip().lower()
-                if term_low and term_low in low:
-                    hits.append(str(term).strip())
+            for term, term_low in terms:
+                if term_low and term_low in found:
+                    hits.append(term)
                     score += 1.0
 
-            for term in positive_terms:
-                term_low = str(term or "").strip().lower()
-                if term_low and term_low in low:
-                    hits.append(str(term).strip())
+            for term, term_low in positive_terms:
+                if term_low and term_low in found:
+                    hits.append(term)
                     score += 1.2
 
             if concept_tag == "input_int_cast":
-                if "input(" in low or "int(input" in low:
+                if "input(" in found or "int(input" in found:
                     score += 2.8
                     hits.append("input(")
-                if "轉整數" in text or "型別轉換" in text:
+                if "轉整數" in found or "型別轉換" in found:
                     score += 1.5
             elif concept_tag == "print_separator":
-                if "sep=" in low or "print(" in low:
+                if "sep=" in found or "print(" in found:
                     score += 2.4
                     hits.append("print/separator")
-                if "空格" in text or "分隔" in text:
+                if "空格" in found or "分隔" in found:
                     score += 1.4
             elif concept_tag == "loop_count_control":
-                if "for" in low or "range(" in low:
+                if "for" in found or "range(" in found:
                     score += 2.0
                     hits.append("for/range")
             elif concept_tag == "if_condition_logic":
-                if re.search(r"\bif\b", low) or "判斷" in text or "條件" in text:
+                if re.search(r"\bif\b", low) or "判斷" in found or "條件" in found:
                     score += 2.0
                     hits.append("if/條件")
             elif concept_tag == "if_branch_order":
-                if "elif" in low or "else" in low:
+                if "elif" in found or "else" in found:
                     score += 2.0
                     hits.append("elif/else")
             elif concept_tag == "edge_case_condition":
-                if any(term in text for term in ["最後", "特殊", "邊界", "沒有", "例外"]):
+                if any(term in found for term in ["最後", "特殊", "邊界", "沒有", "例外"]):
                     score += 1.8
             elif concept_tag == "python_syntax":
-                if "def" in low or "return" in low:
+                if "def" in found or "return" in found:
                     score += 1.6
 
             if score <= 0:
@@ -678,15 +731,46 @@ def _build_chapter_candidate_pool(chapter: dict, subtitle_segments: list[dict],
     return pool, label
 
 
-def _build_chapter_ai_recommendations(draft_chapters: list[dict], subtitle_segments: list[dict]) -> list[dict]:
-    recommendations = []
+def _build_chapter_ai_recommendations(draft_chapters: list[dict], subtitle_segments: list[dict], cached: Optional[dict] = None) -> list[dict]:
+    return [
+        entry["recommendation"]
+        for entry in _chapter_recommendation_entries(draft_chapters, subtitle_segments, cached)
+    ]
+
+
+def _chapter_recommendation_entries(draft_chapters: list[dict], subtitle_segments: list[dict], cached: Optional[dict] = None) -> list[dict]:
+    """每個章節的推薦與其輸入指紋；``cached`` 中指紋相同的章節沿用舊結果，不再呼叫 rerank。
+
+    需要 rerank 的章節一起送進 ``_RERANK_POOL``，共用一個 ``CONCEPT_RERANK_DEADLINE_SEC``
+    期限；結果仍依章節順序組回。期限內沒回來的章節才改用依時間最近的 rule fallback。
+    """
     normalized_drafts = validate_chapters(draft_chapters or [])
     segs = [seg for seg in (subtitle_segments or []) if isinstance(seg, dict)]
+    model_key = _model_for_concept_align() if ai_enabled() else "rule"
 
+    plans = []
     for idx, chapter in enumerate(normalized_drafts, start=1):
         candidate_pool, concept_label = _build_chapter_candidate_pool(chapter, segs)
-        if not candidate_pool:
-            recommendations.append({
+        chapter_fingerprint = fingerprint(
+            chapter.get("concept_tag") or chapter.get("concept"),
+            chapter.get("concept_label"),
+            chapter.get("wrong_type"),
+            concept_label,
+            candidate_pool,
+            model_key,
+        )
+        plan = {
+            "idx": idx,
+            "chapter": chapter,
+            "candidate_pool": candidate_pool,
+            "concept_label": concept_label,
+            "fingerprint": chapter_fingerprint,
+        }
+        if cached and chapter_fingerprint in cached:
+            # 前面的章節被裁掉時序號會變，cell_id 以這次的位置為準。
+            plan["recommendation"] = {**cached[chapter_fingerprint], "cell_id": chapter.get("cell_id") or idx}
+        elif not candidate_pool:
+            plan["recommendation"] = {
                 "cell_id": chapter.get("cell_id") or idx,
                 "concept_tag": chapter.get("concept_tag") or chapter.get("concept") or "",
                 "concept_label": concept_label,
@@ -698,51 +782,104 @@ def _build_chapter_ai_recommendations(draft_chapters: list[dict], subtitle_segme
                 "chapter_note": "目前候選片段不足，請調整教學區間後再判斷。",
                 "confidence": None,
                 "candidates": [],
-            })
-            continue
+            }
+        plans.append(plan)
 
-        subtitle_window = "\n".join(
-            f"[{item['start']:.2f}-{item['end']:.2f}] {item['text']}" for item in candidate_pool[:8]
-        )
-        reranked = rerank_chapter_candidates_with_ai(
-            concept_tag=chapter.get("concept_tag") or chapter.get("concept") or "",
-            wrong_type=chapter.get("wrong_type") or chapter.get("concept_tag") or "",
-            query_text=str(chapter.get("concept_label") or concept_label or "").strip(),
-            candidates=candidate_pool,
-            subtitle_window=subtitle_window,
-            chapter_name_candidates=[str(chapter.get("concept_label") or concept_label or "").strip(), concept_label],
-        )
+    pending = [plan for plan in plans if "recommendation" not in plan]
+    reranked_by_idx, timed_out = _rerank_chapters_concurrently(pending)
+
+    entries = []
+    for plan in plans:
+        if "recommendation" in plan:
+            entries.append({"fingerprint": plan["fingerprint"], "recommendation": plan["recommendation"]})
+            continue
+        idx = plan["idx"]
+        chapter = plan["chapter"]
+        candidate_pool = plan["candidate_pool"]
+        concept_label = plan["concept_label"]
+        reranked = reranked_by_idx.get(idx) or {}
 
         if not reranked:
             # [修正] AI 停用或回傳空時，用 rule-based fallback，並標示來源讓前端顯示
             best_candidate = candidate_pool[0]
             _ai_was_disabled = not ai_enabled()
+            if idx in timed_out:
+                chapter_note = f"（AI 逾時）依時間最近原則，選取候選 #{best_candidate.get('candidate_id') or idx}。建議老師手動確認。"
+            elif _ai_was_disabled:
+                chapter_note = f"（AI 未啟動）依時間最近原則，自動選取候選 #{best_candidate.get('candidate_id') or idx}。建議老師確認內容是否符合「{concept_label or chapter.get('concept_tag') or '目前概念'}」教學重點。"
+            else:
+                chapter_note = f"（AI 判斷失敗）依時間最近原則，選取候選 #{best_candidate.get('candidate_id') or idx}。建議老師手動確認。"
             reranked = {
                 "best_candidate_id": str(best_candidate.get("candidate_id") or best_candidate.get("id") or idx),
                 "alternative_candidate_ids": [str(item.get("candidate_id") or item.get("id") or i + 1) for i, item in enumerate(candidate_pool[1:3])],
                 "chapter_title": concept_label,
                 "chapter_title_candidates": [concept_label] if concept_label else [],
-                "chapter_note": (
-                    f"（AI 未啟動）依時間最近原則，自動選取候選 #{best_candidate.get('candidate_id') or idx}。建議老師確認內容是否符合「{concept_label or chapter.get('concept_tag') or '目前概念'}」教學重點。"
-                    if _ai_was_disabled else
-                    f"（AI 判斷失敗）依時間最近原則，選取候選 #{best_candidate.get('candidate_id') or idx}。建議老師手動確認。"
-                ),
+                "chapter_note": chapter_note,
                 "confidence": None,
                 "rerank_source": "rule_fallback",
             }
+            if idx in timed_out:
+                reranked["rerank_timed_out"] = True
         else:
             reranked.setdefault("rerank_source", "ai")
 
-        recommendations.append({
+        entries.append({"fingerprint": plan["fingerprint"], "recommendation": {
             "cell_id": chapter.get("cell_id") or idx,
             "concept_tag": chapter.get("concept_tag") or chapter.get("concept") or "",
             "concept_label": concept_label,
             **reranked,
             "candidate_id": reranked.get("best_candidate_id"),
             "candidates": candidate_pool,
-        })
+        }})
+
+    return entries
+
+
+def _rerank_pool() -> ThreadPoolExecutor:
+    global _RERANK_POOL
+    with _RERANK_POOL_LOCK:
+        if _RERANK_POOL is None or _RERANK_POOL[0] != os.getpid():
+            _RERANK_POOL = (
+                os.getpid(),
+                ThreadPoolExecutor(max_workers=CONCEPT_RERANK_WORKERS, thread_name_prefix="concept-rerank"),
+            )
+        return _RERANK_POOL[1]
+
+
+def _rerank_chapter_plan(plan: dict) -> dict:
+    chapter = plan["chapter"]
+    candidate_pool = plan["candidate_pool"]
+    concept_label = plan["concept_label"]
+    subtitle_window = "\n".join(
+        f"[{item['start']:.2f}-{item['end']:.2f}] {item['text']}" for item in candidate_pool[:8]
+    )
+    return rerank_chapter_candidates_with_ai(
+        concept_tag=chapter.get("concept_tag") or chapter.get("concept") or "",
+        wrong_type=chapter.get("wrong_type") or chapter.get("concept_tag") or "",
+        query_text=str(chapter.get("concept_label") or concept_label or "").strip(),
+        candidates=candidate_pool,
+        subtitle_window=subtitle_window,
+        chapter_name_candidates=[str(chapter.get("concept_label") or concept_label or "").strip(), concept_label],
+    )
+
 
-    return recommendations
+def _rerank_chapters_concurrently(plans: list[dict]) -> tuple[dict, set]:
+    """``({idx: reranked}, {逾時的 idx})``；AI 關閉時不佔用執行緒。"""
+    if not plans or not ai_enabled():
+        return {}, set()
+    futures = {_rerank_pool().submit(_rerank_chapter_plan, plan): plan["idx"] for plan in plans}
+    done, not_done = wait(futures, timeout=CONCEPT_RERANK_DEADLINE_SEC)
+    results = {}
+    for future in done:
+        try:
+            results[futures[future]] = future.result()
+        except Exception as exc:
+            print("[parsons_concept_align] chapter rerank failed:", repr(exc))
+            results[futures[future]] = {}
+    # 已在執行的呼叫無法中斷，結果直接丟棄；還在排隊的取消掉。
+    for future in not_done:
+        future.cancel()
+    return results, {futures[future] for future in not_done}
 
 
 def generate_ai_chapter_suggestions(draft_chapters, subtitle_segments) -> dict:
@@ -870,7 +1007,44 @@ def generate_ai_chapter_suggestions(draft_chapters, subtitle_segments) -> dict:
 # Step 1：字幕 → 概念章節清單
 # ─────────────────────────────────────────────
 
-def extract_concept_chapters(subtitle_compact: str, strict_ai_only: bool = False, code_start_ts=None, teaching_range_end=None) -> list[dict]:
+def _clamp_chapters_to_range(chapters: list[dict], range_start: float = None, range_end: float = None) -> list[dict]:
+    """
+    強制將章節時間 clamp 在 [range_start, range_end] 以內。
+    - 整個章節在邊界以外的 → 直接刪除
+    - 跨越邊界的章節 → 截斷
+    不修改 concept_tag / concept_label 等語意欄位。
+    """
+    if range_start is None and range_end is None:
+        return list(chapters or [])
+
+    clamped = []
+    for ch in validate_chapters(chapters or []):
+        s = float(ch.get("start") or 0.0)
+        e = float(ch.get("end") or 0.0)
+
+        # 範圍外整句丟棄
+        if range_start is not None and e <= range_start:
+            continue
+        if range_end is not None and s >= range_end:
+            continue
+
+        item = dict(ch)
+        # 截斷起點
+        if range_start is not None and s < range_start:
+            item["start"] = round(range_start, 2)
+        # 截斷終點
+        if range_end is not None and e > range_end:
+            item["end"] = round(range_end, 2)
+
+        # 確保截斷後還是有效區間
+        if float(item.get("end", 0.0)) <= float(item.get("start", 0.0)):
+            continue
+
+        clamped.append(item)
+    return validate_chapters(clamped)
+
+
+def extract_concept_chapters(subtitle_compact: str, strict_ai_only: bool = False, code_start_ts=None, teaching_range_end=None, guards_only: bool = False) -> list[dict]:
     """
     輸入精簡字幕文字（compact 格式或純文字），
     先切出與程式相關的字幕區段，再將區段分類成固定 6 大概念。
@@ -884,6 +1058,8 @@ def extract_concept_chapters(subtitle_compact: str, strict_ai_only: bool = False
 
     teaching_range_end：老師設定的教學結束時間（秒），章節不可超過此值。
     若 AI 失敗，回傳空 list。
+    guards_only：只做切分前的檢查（區間至少 15 秒、rule-based 切得出章節），
+    通過時回傳 rule-based 章節，不呼叫 AI；沿用已存結果前用來確認新區間仍可切分。
     """
     if not subtitle_compact or not subtitle_compact.strip():
         return []
@@ -1055,42 +1231,6 @@ def extract_concept_chapters(subtitle_compact: str, strict_ai_only: bool = False
             cleaned.append(ch)
         return validate_chapters(cleaned)
 
-    def _clamp_chapters_to_range(chapters: list[dict], range_start: float = None, range_end: float = None) -> list[dict]:
-        """
-        強制將章節時間 clamp 在 [range_start, range_end] 以內。
-        - 整個章節在邊界以外的 → 直接刪除
-        - 跨越邊界的章節 → 截斷
-        不修改 concept_tag / concept_label 等語意欄位。
-        """
-        if range_start is None and range_end is None:
-            return list(chapters or [])
-
-        clamped = []
-        for ch in validate_chapters(chapters or []):
-            s = float(ch.get("start") or 0.0)
-            e = float(ch.get("end") or 0.0)
-
-            # 範圍外整句丟棄
-            if range_start is not None and e <= range_start:
-                continue
-            if range_end is not None and s >= range_end:
-                continue
-
-            item = dict(ch)
-            # 截斷起點
-            if range_start is not None and s < range_start:
-                item["start"] = round(range_start, 2)
-            # 截斷終點
-            if range_end is not None and e > range_end:
-                item["end"] = round(range_end, 2)
-
-            # 確保截斷後還是有效區間
-            if float(item.get("end", 0.0)) <= float(item.get("start", 0.0)):
-                continue
-
-            clamped.append(item)
-        return validate_chapters(clamped)
-
     # [修正1] 先解析教學區間邊界，再對字幕做 hard cut
     manual_start_ts = None
     if code_start_ts is not None and str(code_start_ts).strip() != "":
@@ -1128,8 +1268,8 @@ def extract_concept_chapters(subtitle_compact: str, strict_ai_only: bool = False
 
     # [修正3] 沒有程式語意就不切：先在裁切後字幕上做 rule-based segmentation
     rule_based_chapters = _build_rule_based_chapters(analysis_compact)
-    if not rule_based_chapters:
-        return []
+    if not rule_based_chapters or guards_only:
+        return rule_based_chapters
 
     fallback_segments = [] if strict_ai_only else [{"start": ch["start"], "end": ch["end"], "evidence": ch["concept"]} for ch in rule_based_chapters]
 
@@ -1937,7 +2077,8 @@ def _build_subtitle_index_from_text(subtitle_text: str) -> dict:
         return {}
 
     try:
-        return build_subtitle_index(segs)
+        # 這裡只用 segments 對齊字幕邊界；固定 local，不觸發 dense 編碼或寫向量檔。
+        return build_subtitle_index(segs, mode="local")
     except Exception:
         return {}
 
@@ -2791,27 +2932,95 @@ def align_task_by_concept(data: dict):
         solution_blocks = task.get("solution_blocks") or []
 
         # ── 5. 生成 draft ─────────────────────────
-        effective_subtitle_index = build_subtitle_index(effective_segments) if effective_segments else subtitle_index
+        effective_subtitle_index = build_subtitle_index(effective_segments, mode="local") if effective_segments else subtitle_index
         effective_compact = compact_segments_for_prompt(effective_segments, max_chars=8000) if effective_segments else subtitle_compact
 
         validated_teacher_chapters = validate_chapters(task.get("teacher_concept_chapters") or [])
         teacher_version_key = str(task.get("teacher_concept_version_key") or "").strip().lower()
 
         draft_code_start_ts = teaching_range_start if teacher_range_only else (teaching_range_start or code_start_ts)
-        draft_raw = extract_concept_chapters(
-            effective_compact,
-            strict_ai_only=False,
-            code_start_ts=draft_code_start_ts,
-            teaching_range_end=teaching_range_end,
+
+        # 同一份題目、字幕、教學區間、模式與模型算過的結果直接沿用；
+        # 只改教學區間時，把涵蓋新區間的舊章節裁到新區間再貼齊字幕，不重叫 LLM。
+        align_key = AlignKey.build(
+            task_id=real_task_id,
+            content_hash=content_hash(solution_blocks, subtitle_raw),
+            version_key=current_version_key,
+            mode="teacher_range_only" if teacher_range_only else (raw_mode or "legacy"),
+            model=_model_for_concept_align() if ai_enabled() else "rule",
+            range_start=draft_code_start_ts,
+            range_end=teaching_range_end,
         )
-        draft_source = str((draft_raw[0] or {}).get("draft_source") or "rule").strip().lower() if draft_raw else "rule"
+        stored_result = None if force_rebuild else load_result(align_key)
+        covering_result = None
+        if stored_result:
+            align_cache = "hit"
+            draft_raw = stored_result.get("draft_raw") or []
+            draft_source = stored_result.get("draft_source") or "rule"
+        else:
+            covering_result = None if force_rebuild else find_covering_result(align_key)
+            if covering_result and not extract_concept_chapters(
+                effective_compact,
+                code_start_ts=draft_code_start_ts,
+                teaching_range_end=teaching_range_end,
+                guards_only=True,
+            ):
+                # 新區間過短或沒有程式語意時，重新抽取本來就會回空；改走 miss，結果與未存時一致。
+                covering_result = None
+            if covering_result:
+                align_cache = "reclamped"
+                draft_source = covering_result.get("draft_source") or "rule"
+                draft_raw = [
+                    {**ch, "draft_source": draft_source}
+                    for ch in _clamp_chapters_to_range(
+                        covering_result.get("draft_raw") or [], draft_code_start_ts, teaching_range_end
+                    )
+                ]
+            else:
+                align_cache = "miss"
+                draft_raw = extract_concept_chapters(
+                    effective_compact,
+                    strict_ai_only=False,
+                    code_start_ts=draft_code_start_ts,
+                    teaching_range_end=teaching_range_end,
+                )
+                draft_source = str((draft_raw[0] or {}).get("draft_source") or "rule").strip().lower() if draft_raw else "rule"
+        recommendation_cache = stored_recommendations(stored_result or covering_result)
+        stored_fingerprints = set(recommendation_cache)
+
+        def _recommendations_for(chapters_for_recommendation):
+            entries = _chapter_recommendation_entries(chapters_for_recommendation, effective_segments, recommendation_cache)
+            for entry in entries:
+                # AI 失敗時的 rule fallback 不存，下次仍會重試。
+                if ai_enabled() and entry["recommendation"].get("rerank_source") == "rule_fallback":
+                    continue
+                recommendation_cache.setdefault(entry["fingerprint"], entry["recommendation"])
+            return [entry["recommendation"] for entry in entries]
+
+        def _save_align_result():
+            if stored_result and set(recommendation_cache) <= stored_fingerprints:
+                return
+            save_result(align_key, {
+                "draft_raw": draft_raw,
+                "draft_source": draft_source,
+                "ai_suggestions": ai_suggestions,
+                "recommendations": [
+                    {"fingerprint": key, "recommendation": value}
+                    for key, value in recommendation_cache.items()
+                ],
+                "derived_from": (covering_result or {}).get("_id"),
+            })
+
         draft_chapters = validate_chapters(draft_raw)
         draft_chapters = _snap_chapters_to_subtitle_bounds(draft_chapters, effective_subtitle_index)
         draft_block_chapter_map = map_blocks_to_chapters(solution_blocks, draft_chapters) if solution_blocks else {}
         draft_block_chapter_code_map = _build_block_chapter_code_map(solution_blocks, draft_chapters, draft_block_chapter_map)
         draft_chapter_code_map = _build_chapter_code_map(draft_block_chapter_code_map, draft_chapters)
-        ai_suggestions = generate_ai_chapter_suggestions(draft_chapters, effective_segments)
-        chapter_recommendations = _build_chapter_ai_recommendations(draft_chapters, effective_segments)
+        if stored_result and isinstance(stored_result.get("ai_suggestions"), dict):
+            ai_suggestions = stored_result["ai_suggestions"]
+        else:
+            ai_suggestions = generate_ai_chapter_suggestions(draft_chapters, effective_segments)
+        chapter_recommendations = _recommendations_for(draft_chapters)
 
         # ── 6. 若只要 draft，先回 draft ─────────────
         if force_rebuild or not validated_teacher_chapters or teacher_version_key != current_version_key:
@@ -2827,6 +3036,8 @@ def align_task_by_concept(data: dict):
                     }
                 }
             )
+            drop_task_snapshot(real_task_id)
+            _save_align_result()
 
             return jsonify({
                 "ok": True,
@@ -2835,6 +3046,7 @@ def align_task_by_concept(data: dict):
                 "subtitle_version_key": current_version_key,
                 "draft_source": draft_source,
                 "forced_rebuild": bool(force_rebuild),
+                "align_cache": align_cache,
                 "mode": "teacher_range_only" if teacher_range_only else (raw_mode or "legacy"),
                 "teaching_range_mode": "teacher_range_only" if teacher_range_only else (raw_mode or "legacy"),
                 "code_start_ts": code_start_ts,
@@ -2917,6 +3129,7 @@ def align_task_by_concept(data: dict):
                     }
                 }
             )
+            drop_task_snapshot(real_task_id)
             return jsonify({
                 "ok": False,
                 "message": "正式章節已存在，但目前沒有任何 block 能以 rule-first 對應成功；未寫入正式答案。",
@@ -2931,6 +3144,7 @@ def align_task_by_concept(data: dict):
             status = "partial_rule_match_needs_teacher_review"
 
         concept_segment_map = build_concept_segment_map(block_chapter_map, chapters)
+        formal_recommendations = _recommendations_for(chapters)
 
         ai_segment_map = {}
         for slot_str, ch_data in block_chapter_map.items():
@@ -2971,12 +3185,14 @@ def align_task_by_concept(data: dict):
             "concept_align_unmapped_slots": unmapped_slots,
             "concept_align_version_key": current_version_key,
             "concept_chapters_formal": chapters,
-            "chapter_recommendations": _build_chapter_ai_recommendations(chapters, effective_segments),
+            "chapter_recommendations": formal_recommendations,
         }
         if subtitle_range:
             update["subtitle_range"] = subtitle_range
+        _save_align_result()
 
         db.parsons_tasks.update_one({"_id": task["_id"]}, {"$set": update})
+        drop_task_snapshot(task["_id"])
 
         msg = f"概念章節對齊完成，共 {len(chapters)} 個章節，{len(ai_segment_map)} 個 slot 成功對齊。"
         if unmapped_slots:
@@ -3024,7 +3240,8 @@ def align_task_by_concept(data: dict):
             "code_summary_range_source": "teacher_range_only" if teacher_range_only else ("teaching_range" if effective_segments else "teaching_range_empty"),
             "code_start_warning": teaching_range_notice,
             "ai_suggestions": ai_suggestions,
-            "chapter_recommendations": _build_chapter_ai_recommendations(chapters, effective_segments),
+            "chapter_recommendations": formal_recommendations,
+            "align_cache": align_cache,
             "warnings": [teaching_range_notice["code"]] if teaching_range_notice else [],
         }), 200
 
@@ -5,7 +5,9 @@ from __future__ import annotations
 
 import hashlib
 import re
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Set
+
+from ..keyword_matcher import KeywordMatcher, normalize_keyword
 
 
 # =========================================================
@@ -227,6 +229,20 @@ CONCEPT_KEYWORDS: Dict[str, List[str]] = {
     "function_calculation": ["計算", "面積", "平均", "折扣"],
 }
 
+# 每個類別的細部概念關鍵字編成一個比對器，每段文本只掃一次。
+_TRACK_CONCEPT_MATCHERS: Dict[str, KeywordMatcher] = {
+    track: KeywordMatcher(k for concept in concepts for k in CONCEPT_KEYWORDS.get(concept) or [])
+    for track, concepts in TRACK_CONCEPTS.items()
+}
+
+# 沒有課程單元時，依序用這些關鍵字推測概念類別。
+_TRACK_KEYWORDS = (
+    ("while", ["while", "直到", "停止", "quit"]),
+    ("for", ["for", "range", "迴圈", "重複"]),
+    ("condition", ["if", "elif", "else", "條件", "判斷"]),
+)
+_TRACK_MATCHER = KeywordMatcher(k for _, keys in _TRACK_KEYWORDS for k in keys)
+
 # 文本標準化，用於關鍵字比對，避免因為大小寫或前後空白導致漏掉關鍵字。
 def _norm_text(s: str) -> str:
     return (s or "").strip().lower()
@@ -254,34 +270,25 @@ def _infer_track(unit: str, subtitle_text: str, teacher_description: str = "", v
     if "-LIST" in u or u.startswith("U6"):
         return "list"
 
-    if any(k in all_text for k in ["while", "直到", "停止", "quit"]):
-        return "while"
-    if any(k in all_text for k in ["for", "range", "迴圈", "重複"]):
-        return "for"
-    if any(k in all_text for k in ["if", "elif", "else", "條件", "判斷"]):
-        return "condition"
+    found = _TRACK_MATCHER.hits(all_text)
+    for track, keys in _TRACK_KEYWORDS:
+        if any(k in found for k in keys):
+            return track
     return "io"
 
 
-def _score_concept(concept: str, subtitle_text: str, teacher_description: str, video_title: str) -> int:
-    keys = CONCEPT_KEYWORDS.get(concept) or []
-    if not keys:
-        return 0
-
+def _score_concept(concept: str, subtitle_hits: Set[str], teacher_hits: Set[str], title_hits: Set[str]) -> int:
+    """以字幕、老師描述、影片標題各自的關鍵字命中集合計分。"""
     score = 0
-    sub = _norm_text(subtitle_text)
-    tea = _norm_text(teacher_description)
-    title = _norm_text(video_title)
-
-    for k in keys:
-        kk = _norm_text(k)
+    for k in CONCEPT_KEYWORDS.get(concept) or []:
+        kk = normalize_keyword(k)
         if not kk:
             continue
-        if kk in sub:
+        if kk in subtitle_hits:
             score += 2
-        if kk in tea:
+        if kk in teacher_hits:
             score += 3
-        if kk in title:
+        if kk in title_hits:
             score += 1
     return score
 
@@ -293,7 +300,13 @@ def detect_concept(unit: str, subtitle_text: str, teacher_description: str = "",
     track = _infer_track(unit, subtitle_text, teacher_description, video_title)
     candidates = TRACK_CONCEPTS.get(track) or ["generic"]
 
-    scored = [(c, _score_concept(c, subtitle_text, teacher_description, video_title)) for c in candidates]
+    matcher = _TRACK_CONCEPT_MATCHERS.get(track) or KeywordMatcher([])
+    hits = (
+        matcher.hits(subtitle_text or ""),
+        matcher.hits(teacher_description or ""),
+        matcher.hits(video_title or ""),
+    )
+    scored = [(c, _score_concept(c, *hits)) for c in candidates]
     scored.sort(key=lambda x: x[1], reverse=True)
     top_score = scored[0][1] if scored else 0
     if top_score <= 0:
@@ -1,14 +1,38 @@
+import heapq
 import math
 import os
 import re
+from collections import Counter
 from typing import Any, Dict, List, Optional, Tuple
 
+from .. import dense_vectors
+from ..metrics import observe_llm_call
+
 _OPENAI_CLIENT = None
 
+# local_dense：本機 CPU 模型＋磁碟上的 float16 向量（見 app/dense_vectors.py）。
+# bm25：同樣的斷詞，預先建好 postings；hybrid：bm25 與 dense 模式以 RRF 融合。
+RETRIEVAL_MODES = {"local", "openai", "local_dense", "bm25", "hybrid"}
+DENSE_MODES = {"openai", "local_dense"}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# RRF 的平滑常數，以及每個排名各取前幾名參與融合。
+RRF_K = 60
+RRF_DEPTH = 20
+# 合併複習視窗：片段之間的空隙不超過此秒數才視為時間上連續，且視窗總長不超過上限。
+WINDOW_MAX_GAP_SEC = max(0.0, float(os.getenv("PARSONS_WINDOW_MAX_GAP_SEC", "2.0")))
+WINDOW_MAX_SPAN_SEC = max(1.0, float(os.getenv("PARSONS_WINDOW_MAX_SPAN_SEC", "60")))
+
 
 def get_retrieval_mode() -> str:
     mode = str(os.getenv("PARSONS_RETRIEVAL_MODE") or "local").strip().lower()
-    return mode if mode in {"local", "openai"} else "local"
+    return mode if mode in RETRIEVAL_MODES else "local"
+
+
+def get_hybrid_dense_mode() -> str:
+    mode = str(os.getenv("PARSONS_RETRIEVAL_HYBRID_DENSE") or "local_dense").strip().lower()
+    return mode if mode in DENSE_MODES | {"none"} else "local_dense"
 
 
 def get_openai_embedding_model() -> str:
@@ -16,13 +40,14 @@ def get_openai_embedding_model() -> str:
 
 
 def _get_openai_client():
+    # 以 pid 區分：fork 出來的 worker 不可沿用父行程的連線池。
     global _OPENAI_CLIENT
-    if _OPENAI_CLIENT is not None:
-        return _OPENAI_CLIENT
+    if _OPENAI_CLIENT is not None and _OPENAI_CLIENT[0] == os.getpid():
+        return _OPENAI_CLIENT[1]
     from openai import OpenAI  # lazy import
 
-    _OPENAI_CLIENT = OpenAI()
-    return _OPENAI_CLIENT
+    _OPENAI_CLIENT = (os.getpid(), OpenAI())
+    return _OPENAI_CLIENT[1]
 
 
 def _tokenize(text: str) -> List[str]:
@@ -77,6 +102,72 @@ def _vectorize(tokens: List[str], idf: Dict[str, float]) -> Dict[str, float]:
     return v
 
 
+def _build_bm25(docs_tokens: List[List[str]]) -> Dict[str, Any]:
+    """Postings and document lengths for BM25.
+
+    ``bm25_postings[term]`` is a flat ``[doc, tf, doc, tf, ...]`` list so the
+    index stays compact when it is stored in ``subtitle_ir_cache``.
+    """
+    n = len(docs_tokens)
+    doc_len = [len(toks) for toks in docs_tokens]
+    postings: Dict[str, List[int]] = {}
+    for i, toks in enumerate(docs_tokens):
+        for t, f in Counter(toks).items():
+            postings.setdefault(t, []).extend((i, f))
+    idf = {}
+    for t, p in postings.items():
+        df = len(p) // 2
+        idf[t] = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+    return {
+        "bm25_postings": postings,
+        "bm25_idf": idf,
+        "doc_len": doc_len,
+        "avg_doc_len": (sum(doc_len) / float(n)) if n else 0.0,
+    }
+
+
+def _bm25_scores(query: str, subtitle_index: Dict[str, Any]) -> List[Tuple[int, float]]:
+    """BM25 of the segments sharing a term with ``query``, scaled into 0..1.
+
+    The scale is the score a segment would get with every query term at an
+    unbounded frequency, so scores stay comparable across queries.
+    """
+    postings = subtitle_index.get("bm25_postings") or {}
+    idf = subtitle_index.get("bm25_idf") or {}
+    doc_len = subtitle_index.get("doc_len") or []
+    avgdl = float(subtitle_index.get("avg_doc_len") or 0.0) or 1.0
+    q_tf = Counter(t for t in _tokenize(query) if t in postings)
+    if not q_tf:
+        return []
+
+    k1, b = BM25_K1, BM25_B
+    acc: Dict[int, float] = {}
+    upper = 0.0
+    for term, qf in q_tf.items():
+        w = qf * idf.get(term, 0.0)
+        if w <= 0:
+            continue
+        upper += w * (k1 + 1.0)
+        p = postings[term]
+        for j in range(0, len(p), 2):
+            i = p[j]
+            f = p[j + 1]
+            acc[i] = acc.get(i, 0.0) + w * f * (k1 + 1.0) / (f + k1 * (1.0 - b + b * doc_len[i] / avgdl))
+    if upper <= 0:
+        return []
+    return [(i, min(1.0, s / upper)) for i, s in acc.items()]
+
+
+def _rrf(rankings: List[List[int]]) -> List[Tuple[int, float]]:
+    """Reciprocal-rank fusion; 1.0 means first in every ranking."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, i in enumerate(ranking, start=1):
+            fused[i] = fused.get(i, 0.0) + 1.0 / (RRF_K + rank)
+    best = len(rankings) / float(RRF_K + 1)
+    return [(i, s / best) for i, s in fused.items()]
+
+
 def _cosine_sparse(a: Dict[str, float], b: Dict[str, float]) -> float:
     if not a or not b:
         return 0.0
@@ -114,7 +205,8 @@ def _cosine_dense(a: List[float], b: List[float]) -> float:
 
 def _embed_text_openai(text: str, model: str) -> List[float]:
     client = _get_openai_client()
-    resp = client.embeddings.create(model=model, input=str(text or ""))
+    with observe_llm_call("embeddings"):
+        resp = client.embeddings.create(model=model, input=str(text or ""))
     emb = resp.data[0].embedding if resp and resp.data else []
     return [float(x) for x in (emb or [])]
 
@@ -125,7 +217,7 @@ def build_subtitle_index(
     embed_model: Optional[str] = None,
 ) -> Dict[str, Any]:
     selected_mode = (mode or get_retrieval_mode()).strip().lower()
-    if selected_mode not in {"local", "openai"}:
+    if selected_mode not in RETRIEVAL_MODES:
         selected_mode = "local"
     selected_model = (embed_model or get_openai_embedding_model()).strip()
 
@@ -157,10 +249,38 @@ def build_subtitle_index(
             # graceful fallback keeps system running even if OpenAI is unavailable.
             selected_mode = "local"
 
+    if selected_mode == "local_dense" and dense_vectors.available():
+        local_model = dense_vectors.local_model_name()
+        try:
+            # 向量存在磁碟上，索引本身只記 key，存進 subtitle_ir_cache 也很小。
+            key = dense_vectors.ensure_vectors([s["text"] for s in safe_segs], local_model)
+            return {
+                "mode": "local_dense",
+                "embed_model": local_model,
+                "segments": safe_segs,
+                "vector_key": key,
+            }
+        except Exception as exc:
+            print("[parsons_retrieval] local dense index failed:", repr(exc))
+
     docs_tokens: List[List[str]] = []
     for s in safe_segs:
         docs_tokens.append(_tokenize(str(s.get("text") or "")))
 
+    if selected_mode in {"bm25", "hybrid"}:
+        index = {"mode": selected_mode, "embed_model": "", "segments": safe_segs, **_build_bm25(docs_tokens)}
+        if selected_mode == "hybrid":
+            dense_mode = get_hybrid_dense_mode()
+            dense = build_subtitle_index(safe_segs, mode=dense_mode, embed_model=embed_model) if dense_mode != "none" else {}
+            # dense 模式不可用（退回 local）時只用 bm25。
+            if dense.get("mode") == dense_mode:
+                dense.pop("segments", None)
+                index["dense"] = dense
+                index["embed_model"] = str(dense.get("embed_model") or "")
+            else:
+                index["dense"] = None
+        return index
+
     idf = _build_idf(docs_tokens)
     vectors = [_vectorize(toks, idf) for toks in docs_tokens]
 
@@ -187,6 +307,88 @@ def retrieve_best_segment(query: str, subtitle_index: Dict[str, Any]) -> Tuple[O
     }, float(first.get("score", 0.0))
 
 
+def _top_k_rows(segs: List[Dict[str, Any]], scored: List[Tuple[int, float]], k: int) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    for i, score in heapq.nlargest(k, scored, key=lambda x: x[1]):
+        seg = segs[i]
+        out.append({
+            "id": seg.get("id"),
+            "start": float(seg.get("start", 0.0)),
+            "end": float(seg.get("end", 0.0)),
+            "text": str(seg.get("text") or ""),
+            "index": int(i),
+            "score": float(score),
+        })
+    return out
+
+
+def _dense_top_k(queries: List[str], subtitle_index: Dict[str, Any], k: int) -> List[List[Dict[str, Any]]]:
+    """local_dense: encode every query at once and score them with one matrix product."""
+    segs = subtitle_index.get("segments") or []
+    key = str(subtitle_index.get("vector_key") or "")
+    if not key or not dense_vectors.available():
+        return [[] for _ in queries]
+    try:
+        scores = dense_vectors.score(
+            key,
+            queries,
+            str(subtitle_index.get("embed_model") or dense_vectors.local_model_name()),
+            texts=[str(s.get("text") or "") for s in segs],
+        )
+    except Exception as exc:
+        print("[parsons_retrieval] local dense query failed:", repr(exc))
+        return [[] for _ in queries]
+    if scores is None or scores.shape[1] != len(segs):
+        return [[] for _ in queries]
+
+    import numpy as np
+
+    out = []
+    take = min(k, len(segs))
+    for row in np.clip(scores, 0.0, 1.0):
+        # 只排序前 k 名，不排整支影片的字幕。
+        best = np.argpartition(-row, take - 1)[:take] if take < len(segs) else np.arange(len(segs))
+        out.append(_top_k_rows(segs, [(int(i), float(row[i])) for i in best], k))
+    return out
+
+
+def _hybrid_top_k(queries: List[str], subtitle_index: Dict[str, Any], k: int) -> List[List[Dict[str, Any]]]:
+    """hybrid: BM25 and the dense sub-index fused with RRF."""
+    segs = subtitle_index.get("segments") or []
+    depth = max(k, RRF_DEPTH)
+    dense = subtitle_index.get("dense")
+    if isinstance(dense, dict) and dense.get("mode") in DENSE_MODES:
+        dense_index = {**dense, "segments": segs}
+        dense_hits = retrieve_top_k_segments_batch(queries, dense_index, k=depth)
+    else:
+        dense_hits = [[] for _ in queries]
+
+    out = []
+    for query, dense_rows in zip(queries, dense_hits):
+        bm25 = _bm25_scores(query, subtitle_index)
+        if not dense_rows:
+            out.append(_top_k_rows(segs, bm25, k))
+            continue
+        rankings = [[row["index"] for row in dense_rows]]
+        if bm25:
+            rankings.append([i for i, _ in heapq.nlargest(depth, bm25, key=lambda x: x[1])])
+        out.append(_top_k_rows(segs, _rrf(rankings), k))
+    return out
+
+
+def retrieve_top_k_segments_batch(
+    queries: List[str], subtitle_index: Dict[str, Any], k: int = 3
+) -> List[List[Dict[str, Any]]]:
+    """``retrieve_top_k_segments`` for several queries against one subtitle."""
+    queries = [str(q or "") for q in queries or []]
+    mode = str((subtitle_index or {}).get("mode") or "local").strip().lower()
+    if mode == "local_dense" and queries and (subtitle_index or {}).get("segments"):
+        return _dense_top_k(queries, subtitle_index, max(1, int(k or 1)))
+    if mode == "hybrid" and queries and (subtitle_index or {}).get("segments"):
+        return _hybrid_top_k(queries, subtitle_index, max(1, int(k or 1)))
+    return [retrieve_top_k_segments(q, subtitle_index, k=k) for q in queries]
+
+
 def retrieve_top_k_segments(query: str, subtitle_index: Dict[str, Any], k: int = 3) -> List[Dict[str, Any]]:
     segs = (subtitle_index or {}).get("segments") or []
     mode = str((subtitle_index or {}).get("mode") or "local").strip().lower()
@@ -195,6 +397,13 @@ def retrieve_top_k_segments(query: str, subtitle_index: Dict[str, Any], k: int =
     if not segs:
         return []
 
+    if mode == "local_dense":
+        return _dense_top_k([str(query or "")], subtitle_index, k)[0]
+    if mode == "hybrid":
+        return _hybrid_top_k([str(query or "")], subtitle_index, k)[0]
+    if mode == "bm25":
+        return _top_k_rows(segs, _bm25_scores(query, subtitle_index), k)
+
     scored: List[Tuple[int, float]] = []
 
     if mode == "openai":
@@ -225,31 +434,53 @@ def retrieve_top_k_segments(query: str, subtitle_index: Dict[str, Any], k: int =
             s = _cosine_sparse(q_vec, sv)
             scored.append((i, float(max(0.0, min(1.0, s)))))
 
-    scored.sort(key=lambda x: x[1], reverse=True)
-    out: List[Dict[str, Any]] = []
-    for i, score in scored[:k]:
-        seg = segs[i]
-        out.append({
-            "id": seg.get("id"),
-            "start": float(seg.get("start", 0.0)),
-            "end": float(seg.get("end", 0.0)),
-            "text": str(seg.get("text") or ""),
-            "index": int(i),
-            "score": float(score),
-        })
-    return out
+    return _top_k_rows(segs, scored, k)
+
 
+def merge_top_k_window(
+    top_k: List[Dict[str, Any]],
+    max_gap_sec: Optional[float] = None,
+    max_span_sec: Optional[float] = None,
+) -> Tuple[Optional[Dict[str, Any]], float]:
+    """Merge top-k hits into one review window using timeline continuity.
 
-def merge_top_k_window(top_k: List[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], float]:
-    """Merge top-k hits into one review window using timeline continuity."""
+    The best hit anchors the window.  Other hits join only while they are
+    within ``max_gap_sec`` of the window and the window stays within
+    ``max_span_sec``, so a hit from another part of the lecture no longer
+    stretches the window across everything in between.  The score combines
+    the joined hits as a noisy-or: more agreeing neighbours, more confidence.
+    """
     if not top_k:
         return None, 0.0
-
-    ordered = sorted(top_k, key=lambda x: float(x.get("start", 0.0)))
-    start = float(ordered[0].get("start", 0.0))
-    end = float(ordered[-1].get("end", 0.0))
+    gap = WINDOW_MAX_GAP_SEC if max_gap_sec is None else float(max_gap_sec)
+    span = WINDOW_MAX_SPAN_SEC if max_span_sec is None else float(max_span_sec)
+
+    anchor = max(top_k, key=lambda x: float(x.get("score", 0.0)))
+    start = float(anchor.get("start", 0.0))
+    end = float(anchor.get("end", 0.0))
+    joined = [anchor]
+    # 分數高的鄰近片段優先併入，視窗長度上限先留給較有把握的片段。
+    rest = sorted((x for x in top_k if x is not anchor), key=lambda x: -float(x.get("score", 0.0)))
+    grown = True
+    while grown and rest:
+        grown = False
+        for x in list(rest):
+            xs, xe = float(x.get("start", 0.0)), float(x.get("end", 0.0))
+            if xs - end > gap or start - xe > gap:
+                continue
+            if max(end, xe) - min(start, xs) > span:
+                continue
+            start, end = min(start, xs), max(end, xe)
+            joined.append(x)
+            rest.remove(x)
+            grown = True
+
+    ordered = sorted(joined, key=lambda x: float(x.get("start", 0.0)))
     text = "\n".join([str(x.get("text") or "").strip() for x in ordered if str(x.get("text") or "").strip()])
-    score = sum(float(x.get("score", 0.0)) for x in ordered) / float(len(ordered))
+    miss = 1.0
+    for x in joined:
+        miss *= 1.0 - max(0.0, min(1.0, float(x.get("score", 0.0))))
+    score = 1.0 - miss
 
     return {
         "start": start,
@@ -257,3 +488,21 @@ def merge_top_k_window(top_k: List[Dict[str, Any]]) -> Tuple[Optional[Dict[str,
         "text": text,
         "index": int(ordered[0].get("index", 0)),
     }, float(score)
+
+
+def precompute_subtitle_vectors(subtitle_text: str):
+    """Embed a newly saved subtitle in the background when ``local_dense`` is on.
+
+    Returns the background future, or ``None`` when there is nothing to do.
+    """
+    if get_retrieval_mode() != "local_dense" or not dense_vectors.available():
+        return None
+    raw = str(subtitle_text or "").strip()
+    if "-->" not in raw:
+        return None
+    from .parsons_service import parse_srt_segments
+
+    segs = parse_srt_segments(raw)
+    if not segs:
+        return None
+    return dense_vectors.submit_background(build_subtitle_index, segs, mode="local_dense")
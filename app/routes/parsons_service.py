@@ -11,6 +11,7 @@ from typing import Any, Dict, Tuple, Optional
 from bson import ObjectId
 
 from ..db import db
+from ..keyword_matcher import keyword_matcher, normalize_keyword
 from . import parsons_ai
 from .parsons_concept_engine import build_generation_plan, build_template_solution, CONCEPT_KEYWORDS
 
@@ -1644,28 +1645,26 @@ def _selector_unit_keywords(
     return out
 
 
+_SELECTOR_SYNTAX_TOKENS = ("input", "print", "if", "for", "while", "def", "return", "quit", "range")
+# 題目可出性加權：定義句、規則句、示例句通常比閒聊更穩定。
+_SELECTOR_SENTENCE_TOKENS = ("例如", "比如", "像是", "必須", "需要", "注意", "通常", "代表", "意思是")
+
+
 def _score_subtitle_segment_for_selector(text: str, keywords: list) -> int:
     t = (text or "").lower()
     if not t:
         return 0
 
+    terms = tuple(normalize_keyword(kw) for kw in (keywords or []))
+    # 同一次挑選的每段字幕用同一組關鍵字，比對器只編一次。
+    hits = keyword_matcher(terms + _SELECTOR_SYNTAX_TOKENS + _SELECTOR_SENTENCE_TOKENS).hits(t)
+
     score = 0
-    for kw in (keywords or []):
-        k = str(kw or "").strip().lower()
-        if not k:
-            continue
-        if k in t:
+    for k in terms:
+        if k and k in hits:
             score += 3 if len(k) >= 2 else 1
-
-    for token in ["input", "print", "if", "for", "while", "def", "return", "quit", "range"]:
-        if token in t:
-            score += 1
-
-    # 題目可出性加權：定義句、規則句、示例句通常比閒聊更穩定。
-    sentence_type_bonus = ["例如", "比如", "像是", "必須", "需要", "注意", "通常", "代表", "意思是"]
-    for token in sentence_type_bonus:
-        if token in t:
-            score += 1
+    score += sum(1 for token in _SELECTOR_SYNTAX_TOKENS if token in hits)
+    score += sum(1 for token in _SELECTOR_SENTENCE_TOKENS if token in hits)
     return score
 
 
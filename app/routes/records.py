@@ -1,4 +1,4 @@
-from flask import Blueprint, current_app, request, jsonify, Response
+from flask import Blueprint, g, request, jsonify, Response
 from app.db import db
 from app.questionnaire import (
     QUESTIONNAIRE_COLLECTION,
@@ -10,16 +10,14 @@ from app.questionnaire import (
     get_questionnaire_response,
     present_questionnaire_answers,
 )
-from app.randomization import (
-    RandomizationSlotsExhausted,
-    assign_feedback_strategy_on_import,
-)
+from app.user_import import ImportRow, import_job_status, run_user_import, start_import_job
 from datetime import datetime, timedelta, timezone
 
 records_bp = Blueprint("records", __name__)
 _TEST_STUDENT_ID = "11461127"
 _TAIPEI_TZ = timezone(timedelta(hours=8))
 _DEFAULT_TEST_CYCLE_ID = "2026_07_batch_01"
+STUDENTS_CSV_JOB_KIND = "records_students_csv"
 
 
 def _format_taipei_datetime(value):
@@ -75,13 +73,125 @@ def students():
     return jsonify({"ok": True, "students": students, "total": total})
 
 
+def _student_import_fields(row, existing, now):
+    """$set fields for one CSV row of /students/import_csv."""
+    data = row.data
+    # A CSV group_type never decides the research condition.  Existing
+    # locked/manual assignments are retained on re-import; all other
+    # formal students are assigned by the server after the import.
+    existing_locked = bool((existing or {}).get("assignment_locked") is True)
+    existing_assigned = bool(
+        existing
+        and existing.get("assignment_status") == "assigned"
+        and str(existing.get("group_type") or "").strip()
+    )
+    group_type = existing.get("group_type") if existing_locked or existing_assigned else None
+
+    if data["test_cycle_id"]:
+        test_cycle_id = data["test_cycle_id"]
+    elif existing:
+        test_cycle_id = str(existing.get("test_cycle_id") or "").strip()
+    else:
+        test_cycle_id = ""
+
+    if row.student_id == _TEST_STUDENT_ID:
+        is_test_data = True
+    elif data["is_test_data"] is not None:
+        is_test_data = data["is_test_data"]
+    elif existing and isinstance(existing.get("is_test_data"), bool):
+        is_test_data = existing.get("is_test_data")
+    else:
+        is_test_data = False
+
+    doc = {
+        "student_id": row.student_id,
+        "name": data["name"],
+        "class_name": data["class_name"],
+        "role": "student",
+        "group_type": group_type,
+        "is_test_data": is_test_data,
+        "updated_at": now,
+    }
+    if not existing:
+        doc["created_at"] = now
+    if not existing_locked and not existing_assigned:
+        doc.update({
+            "assignment_status": "excluded_test_data" if is_test_data else "pending_randomization",
+            "assignment_method": None,
+            "assignment_locked": False,
+        })
+    if test_cycle_id:
+        doc["test_cycle_id"] = test_cycle_id
+    return doc
+
+
+def _student_import_password(row, existing):
+    # 已有密碼雜湊的帳號不重設密碼。
+    if existing and existing.get("password_hash"):
+        return None
+    return row.data["password"]
+
+
+def _run_student_csv_import(rows, progress):
+    results = run_user_import(
+        rows,
+        _student_import_fields,
+        _student_import_password,
+        hash_method="scrypt",
+        lookup_filter={"role": "student"},
+        randomize=lambda row, fields: not fields["is_test_data"],
+        progress=progress,
+    )
+    assignment_summary = {
+        "assigned": 0,
+        "already_assigned": 0,
+        "excluded_test_data": 0,
+        "control": 0,
+        "experimental_1": 0,
+        "experimental_2": 0,
+        "failed": [],
+    }
+    upserts = 0
+    for result in results:
+        if result["action"] not in {"inserted", "updated"}:
+            continue
+        upserts += 1
+        assignment = result.get("assignment")
+        if result.get("assignment_error"):
+            failure = {"student_id": result["student_id"], "reason": result["assignment_error"]}
+            if result["assignment_error"] != "randomization_slots_exhausted":
+                failure["detail"] = result.get("assignment_detail")
+            assignment_summary["failed"].append(failure)
+        elif assignment is None:
+            assignment_summary["excluded_test_data"] += 1
+        elif assignment.get("assigned") and not assignment.get("recovered"):
+            assignment_summary["assigned"] += 1
+            assigned_group_type = str(assignment.get("group_type") or "").strip().lower()
+            if assigned_group_type in {"control", "experimental_1", "experimental_2"}:
+                assignment_summary[assigned_group_type] += 1
+        else:
+            assignment_summary["already_assigned"] += 1
+
+    message = "學生已匯入，並已依全研究共用序列完成自動分派。"
+    if assignment_summary["failed"]:
+        message = "學生已匯入，但研究分派名額不足；請先新增 slots 後重新匯入同一份 CSV。"
+    return {
+        "ok": not bool(assignment_summary["failed"]),
+        "upserts": upserts,
+        "assignment": assignment_summary,
+        "rows": results,
+        "message": message,
+    }
+
+
 @records_bp.post("/students/import_csv")
 def import_students_csv():
     """
-    匯入 students CSV
+    匯入 students CSV（背景工作）
     欄位（最少）：student_id,name,class_name
     password 可選
     - 若 CSV 沒 password 且「預設密碼」也沒填：用 student_id 當密碼（避免空密碼）
+    - 回傳 202 與 job_id，以 GET /students/import_jobs/<job_id> 查詢進度與逐列結果
     """
     import io
     import csv
@@ -105,131 +215,44 @@ def import_students_csv():
     if not required.issubset(set([h.strip() for h in (reader.fieldnames or [])])):
         return jsonify({"ok": False, "message": "CSV 欄位需包含 student_id,name,class_name（password 可選）"}), 400
 
-    upserts = 0
-    assignment_summary = {
-        "assigned": 0,
-        "already_assigned": 0,
-        "excluded_test_data": 0,
-        "control": 0,
-        "experimental_1": 0,
-        "experimental_2": 0,
-        "failed": [],
-    }
-    for row in reader:
+    rows = []
+    for row_number, row in enumerate(reader, start=2):
         sid = (row.get("student_id") or "").strip()
-        name = (row.get("name") or "").strip()
-        class_name = (row.get("class_name") or "").strip()
-
         if not sid:
             continue
-
-        pw = (row.get("password") or "").strip()  # [修改]
-        if not pw:
-            pw = default_password or sid  # [新增] CSV 無 password 且未填預設密碼時 → 用 student_id 當密碼
-
-        existing = db.users.find_one({"student_id": sid, "role": "student"})
-        # A CSV group_type never decides the research condition.  Existing
-        # locked/manual assignments are retained on re-import; all other
-        # formal students are assigned by the server immediately below.
-        existing_locked = bool((existing or {}).get("assignment_locked") is True)
-        existing_assigned = bool(
-            existing
-            and existing.get("assignment_status") == "assigned"
-            and str(existing.get("group_type") or "").strip()
-        )
-        if existing_locked or existing_assigned:
-            group_type = existing.get("group_type")
-        else:
-            group_type = None
-
-        imported_test_cycle_id = str(row.get("test_cycle_id") or "").strip()
-        if imported_test_cycle_id:
-            test_cycle_id = imported_test_cycle_id
-        elif existing:
-            test_cycle_id = str(existing.get("test_cycle_id") or "").strip()
-        else:
-            test_cycle_id = ""
-
-        csv_is_test_data = _parse_optional_bool(row.get("is_test_data"))
-        if sid == _TEST_STUDENT_ID:
-            is_test_data = True
-        elif csv_is_test_data is not None:
-            is_test_data = csv_is_test_data
-        elif existing and isinstance(existing.get("is_test_data"), bool):
-            is_test_data = existing.get("is_test_data")
-        else:
-            is_test_data = False
-
-        doc = {
-            "student_id": sid,
-            "name": name,
-            "class_name": class_name,
-            "role": "student",
-            "password": pw,
-            "group_type": group_type,
-            "is_test_data": is_test_data,
-        }
-        if not existing:
-            doc.update({
-                "assignment_status": "excluded_test_data" if is_test_data else "pending_randomization",
-                "assignment_method": None,
-                "assignment_locked": False,
-            })
-        elif not existing_locked and not existing_assigned:
-            doc.update({
-                "assignment_status": "excluded_test_data" if is_test_data else "pending_randomization",
-                "assignment_method": None,
-                "assignment_locked": False,
-            })
-        if test_cycle_id:
-            doc["test_cycle_id"] = test_cycle_id
-
-        db.users.update_one(
-            {"student_id": sid, "role": "student"},
-            {"$set": doc},
-            upsert=True
-        )
-        upserts += 1
-
-        if is_test_data:
-            assignment_summary["excluded_test_data"] += 1
-            continue
-
-        try:
-            assignment = assign_feedback_strategy_on_import(sid)
-            if assignment.get("assigned") and not assignment.get("recovered"):
-                assignment_summary["assigned"] += 1
-                assigned_group_type = str(assignment.get("group_type") or "").strip().lower()
-                if assigned_group_type in {"control", "experimental_1", "experimental_2"}:
-                    assignment_summary[assigned_group_type] += 1
-            else:
-                assignment_summary["already_assigned"] += 1
-        except RandomizationSlotsExhausted:
-            assignment_summary["failed"].append({
-                "student_id": sid,
-                "reason": "randomization_slots_exhausted",
-            })
-        except Exception as exc:
-            current_app.logger.exception(
-                "Automatic randomization failed during student import: %s",
-                sid,
-            )
-            assignment_summary["failed"].append({
-                "student_id": sid,
-                "reason": "randomization_assignment_failed",
-                "detail": str(exc),
-            })
-
-    message = "學生已匯入，並已依全研究共用序列完成自動分派。"
-    if assignment_summary["failed"]:
-        message = "學生已匯入，但研究分派名額不足；請先新增 slots 後重新匯入同一份 CSV。"
-    response = {
-        "ok": not bool(assignment_summary["failed"]),
-        "upserts": upserts,
-        "assignment": assignment_summary,
-        "message": message,
-    }
-    return jsonify(response), (409 if assignment_summary["failed"] else 200)
+        rows.append(ImportRow(row_number, sid, {
+            "name": (row.get("name") or "").strip(),
+            "class_name": (row.get("class_name") or "").strip(),
+            # CSV 無 password 且未填預設密碼時 → 用 student_id 當密碼
+            "password": (row.get("password") or "").strip() or default_password or sid,
+            "test_cycle_id": str(row.get("test_cycle_id") or "").strip(),
+            "is_test_data": _parse_optional_bool(row.get("is_test_data")),
+        }))
+
+    job_id = start_import_job(
+        STUDENTS_CSV_JOB_KIND,
+        str((getattr(g, "current_user", None) or {}).get("student_id") or ""),
+        len(rows),
+        lambda progress: _run_student_csv_import(rows, progress),
+    )
+    return jsonify({
+        "ok": True,
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/records/students/import_jobs/{job_id}",
+    }), 202
+
+
+@records_bp.get("/students/import_jobs/<job_id>")
+def import_students_csv_job(job_id):
+    job = import_job_status(
+        job_id,
+        STUDENTS_CSV_JOB_KIND,
+        str((getattr(g, "current_user", None) or {}).get("student_id") or ""),
+    )
+    if job is None:
+        return jsonify({"ok": False, "error": "job_not_found", "message": "找不到此匯入工作。"}), 404
+    return jsonify({"ok": True, **job})
 
 
 @records_bp.get("/students/export_csv")
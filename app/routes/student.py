@@ -1,10 +1,12 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime, timezone
 from ..db import db
-from ..unit_labels import sort_units, unit_label_map, unit_label
+from ..log_storage import ensure_log_collection, prepare_log_document
+from ..unit_labels import unit_label
 from ..avatar_utils import resolve_avatar_src
 from ..session_auth import current_participant_id, current_student_id
 from .learning_logs import write_learning_log_safely
+from ..student_progress import units_progress_payload
 from ..questionnaire import (
     QUESTIONNAIRE_COLLECTION,
     QUESTIONNAIRE_DATA_SOURCE,
@@ -270,6 +272,8 @@ def units_progress():
     1) 依老師端上傳 videos 的 unit 分組，計算每個 unit 的作答進度（%）
     2) 後測開關狀態與已作答數（統一讀 test_control）
 
+    進度來自 student_progress（作答時維護），影片目錄與後測狀態為行程內快取。
+
     Query:
       - student_id (或 participant_id)
       - test_cycle_id (預設 default)
@@ -279,106 +283,10 @@ def units_progress():
         if not student_id:
             return jsonify({"ok": False, "error": "missing student_id"}), 400
 
-        test_cycle_id = _student_test_cycle_id(student_id)
-
-        # 1) 取得影片（老師端上傳）=> 用 unit 分組
-        videos = list(
-            db.videos.find(
-                {"deleted": {"$ne": True}, "is_deleted": {"$ne": True}},
-                {"_id": 1, "unit": 1, "title": 1, "is_active": 1, "active": 1},
-            )
-        )
-        # 只計算「啟用」的影片；若你的 schema 不叫 is_active，這段也不會炸（預設 True）
-        videos = [v for v in videos if v.get("is_active", v.get("active", True))]
-
-        # unit -> [video_id]
-        unit_videos: dict = {}
-        for v in videos:
-            u = (v.get("unit") or "").strip()
-            if not u:
-                continue
-            vid = str(v.get("_id"))
-            unit_videos.setdefault(u, []).append(vid)
-        labels = unit_label_map(unit_videos.keys())
-
-        # 2) 取得學生作答紀錄（parsons_attempts）
-        #    以「某影片至少有一次正確作答」視為該影片完成
-        correct_video_ids = set(
-            db.parsons_attempts.distinct(
-                "video_id",
-                {
-                    "student_id": student_id,
-                    "is_correct": True,
-                    "video_id": {"$ne": None},
-                },
-            )
-        )
-        correct_video_ids = {str(x) for x in correct_video_ids if x is not None}
-
-        units_out = []
-        for unit in sort_units(unit_videos.keys(), labels):
-            vids = unit_videos.get(unit) or []
-            total = len(vids)
-            done = sum(1 for vid in vids if vid in correct_video_ids)
-            progress = 0
-            if total > 0:
-                progress = round((done / total) * 100)
-            units_out.append(
-                {
-                    "unit": unit,
-                    "unit_label": labels.get(unit) or unit,
-                    "total_videos": total,
-                    "done_videos": done,
-                    "progress": progress,
-                }
-            )
-
-        # 3) 後測狀態（統一讀 test_control）
-        ctrl = db.test_control.find_one({"_id": f"post_open:{test_cycle_id}"}) or {}
-        if not ctrl and test_cycle_id == "2026_07_batch_01":
-            ctrl = db.test_control.find_one({"_id": "post_open:default"}) or {}
-        post_open = bool(ctrl.get("post_open", False))
-
-        # 後測總題數：parsons_test_tasks
-        post_total = db.parsons_test_tasks.count_documents(
-            {
-                "test_cycle_id": test_cycle_id,
-                "test_role": "post",
-                "deleted": {"$ne": True},
-            }
-        )
-        if post_total == 0 and test_cycle_id == "2026_07_batch_01":
-            post_total = db.parsons_test_tasks.count_documents(
-                {
-                    "test_cycle_id": "default",
-                    "test_role": "post",
-                    "deleted": {"$ne": True},
-                }
-            )
-        # 後測已作答題數：parsons_test_attempts（同 test_cycle_id + post）
-        post_done = len(
-            db.parsons_test_attempts.distinct(
-                "task_id",
-                {
-                    "student_id": student_id,
-                    "test_cycle_id": test_cycle_id,
-                    "test_role": "post",
-                },
-            )
-        )
-
-        return jsonify(
-            {
-                "ok": True,
-                "units": units_out,
-                "posttest": {
-                    "test_cycle_id": test_cycle_id,
-                    "post_open": post_open,
-                    "done": int(post_done),
-                    "total": int(post_total),
-                },
-            }
-        )
+        # 學生進度（student_progress）與影片目錄快取一次讀取；
+        # 詳見 app/student_progress.py。
+        payload = units_progress_payload(student_id)
+        return jsonify({"ok": True, **payload})
 
     except Exception as e:
         print("units_progress error:", e)
@@ -441,7 +349,8 @@ def learning_start():
     if not participant_id or not unit:
         return jsonify({"ok": False, "message": "缺少 participant_id 或 unit"}), 400
 
-    r = db.learning_logs.insert_one({
+    ensure_log_collection(db, "learning_logs")
+    r = db.learning_logs.insert_one(prepare_log_document("learning_logs", {
         "participant_id": participant_id,
         "unit": unit,
         "start_at": now_utc(),
@@ -449,7 +358,7 @@ def learning_start():
         "duration_sec": None,
         "regen_clicks": 0,
         "understood": None
-    })
+    }))
 
     return jsonify({"ok": True, "log_id": str(r.inserted_id)})
 
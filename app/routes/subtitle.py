@@ -5,6 +5,7 @@ from bson import ObjectId
 
 from ..db import db
 from .admin_upload import validate_subtitle_text_by_ext    # 重用驗證器（若循環 import，改成複製一份到此檔）
+from .parsons_retrieval import precompute_subtitle_vectors
 
 subtitle_bp = Blueprint("subtitle", __name__)
 
@@ -183,6 +184,8 @@ def save():
     if set_current:
         upd.update({"subtitle_current_version": next_ver, "subtitle_path": rel, "subtitle_blocks": blocks})
     db.videos.update_one({"_id": vid}, {"$set": upd})
+    # local_dense 模式下在背景先算好字幕向量
+    precompute_subtitle_vectors(text)
 
     return jsonify({"ok": True, "new_version": next_ver, "path": rel, "blocks": blocks, "set_current": set_current})
 
@@ -286,6 +289,8 @@ def upload_subtitle():
         "subtitle_uploaded": True,
         "subtitle_updated_at": now_utc()
     }})
+    # local_dense 模式下在背景先算好字幕向量
+    precompute_subtitle_vectors(raw)
 
     return jsonify({
         "ok": True,
@@ -7,6 +7,13 @@ from flask import Blueprint, jsonify, request
 
 from app.db import db
 from app.unit_labels import normalize_unit_key, unit_sort_key as shared_unit_sort_key
+from app.video_log_rollup import (
+    DAILY_SUMMARY_EVENT_TYPE,
+    VIDEO_REWATCH_DAILY_COLLECTION,
+    is_auto_end_pause_event,
+    summary_completed_weight,
+    summary_record_weight,
+)
 
 
 teacher_analysis_bp = Blueprint("teacher_analysis", __name__)
@@ -2258,19 +2265,59 @@ def _video_playback_rate_parts(log):
 
 
 def _is_auto_end_pause_log(log):
-    if str(log.get("event_type") or "") != "video_pause":
-        return False
-    if log.get("reached_end") is True or log.get("completed_fully") is True:
-        return True
+    return is_auto_end_pause_event(log)
+
+
+def _video_daily_summary_row(summary, profiles):
+    sid = str(summary.get("student_id") or "").strip()
+    profile = profiles.get(sid) or {}
+    event_count = int(summary.get("event_count") or 0)
+    seek_count = int(summary.get("seek_count") or 0)
+    total_seek_distance = _safe_float(summary.get("total_seek_distance"))
+    completed_event_count = int(summary.get("completed_event_count") or 0)
+    return _json_safe({
+        "log_id": "daily:{student_id}:{video_id}:{day}".format(
+            student_id=sid,
+            video_id=summary.get("video_id") or "",
+            day=summary.get("day") or "",
+        ),
+        "student_id": sid,
+        "student_name": profile.get("name"),
+        "class_name": profile.get("class_name") or summary.get("class_name"),
+        "group_type": profile.get("group_type") or summary.get("group_type"),
+        "is_test_data": profile.get("is_test_data") is True or summary.get("is_test_data") is True,
+        "event_type": DAILY_SUMMARY_EVENT_TYPE,
+        "is_daily_summary": True,
+        "day": summary.get("day"),
+        "event_count": event_count,
+        "event_type_counts": summary.get("event_type_counts") or {},
+        "completed_event_count": completed_event_count,
+        "watch_session_count": summary.get("watch_session_count"),
+        "video_id": summary.get("video_id"),
+        "video_title": summary.get("video_title"),
+        "unit_id": summary.get("unit_id"),
+        "watch_seconds": _safe_float(summary.get("watch_seconds_total")),
+        "watch_seconds_for_total": _safe_float(summary.get("watch_seconds_total")) or 0,
+        "current_time_sec": _safe_float(summary.get("max_current_time_sec")),
+        "video_duration_sec": _safe_float(summary.get("video_duration_sec")),
+        "reached_end": completed_event_count > 0,
+        "completed_fully": False,
+        "watch_start_at": summary.get("first_event_at"),
+        "watch_end_at": summary.get("last_event_at"),
+        "seek_count": seek_count,
+        "backward_seek_count": summary.get("backward_seek_count"),
+        "total_seek_distance": total_seek_distance,
+        "avg_seek_distance": round(total_seek_distance / seek_count, 3) if seek_count and total_seek_distance is not None else None,
+        "event_at": summary.get("last_event_at"),
+    })
 
-    current_time = _safe_float(log.get("current_time_sec"))
-    duration = _safe_float(log.get("video_duration_sec"))
-    return (
-        current_time is not None
-        and duration is not None
-        and duration > 0
-        and current_time >= duration - 0.5
-    )
+
+def _read_video_daily_summaries(student_ids, profiles, limit):
+    # 超過保留期限的原始事件已由 tools/rollup_video_rewatch_logs.py 彙整成每日摘要。
+    summaries = db[VIDEO_REWATCH_DAILY_COLLECTION].find(
+        {"student_id": {"$in": sorted(student_ids)}}
+    ).sort([("student_id", 1), ("last_event_at", -1)]).limit(limit)
+    return [_video_daily_summary_row(summary, profiles) for summary in summaries]
 
 
 def _read_video_rewatch_logs(class_name, group_filter, student_id=None, limit=1000):
@@ -2384,6 +2431,14 @@ def _read_video_rewatch_logs(class_name, group_filter, student_id=None, limit=10
             "source": log.get("source"),
             "event_at": event_at,
         }))
+
+    summary_rows = _read_video_daily_summaries(student_ids, profiles, limit)
+    if summary_rows:
+        # 每日摘要都比仍保留的原始事件舊，接在各學生的原始紀錄之後。
+        by_student = defaultdict(list)
+        for row in rows + summary_rows:
+            by_student[row.get("student_id")].append(row)
+        rows = [row for sid in sorted(by_student) for row in by_student[sid]][:limit]
     return rows, profiles
 
 
@@ -2404,11 +2459,9 @@ def _video_rewatch_summary(records, profiles):
             _safe_float(record.get("watch_seconds_for_total")) or 0
             for record in student_records
         )
-        completed_count = sum(
-            1
-            for record in student_records
-            if record.get("reached_end") is True or record.get("completed_fully") is True
-        )
+        # 每日摘要列代表多筆原始事件，依 event_count 加權。
+        record_count = sum(summary_record_weight(record) for record in student_records)
+        completed_count = sum(summary_completed_weight(record) for record in student_records)
         latest = max(
             (_sort_datetime(record.get("event_at")) for record in student_records),
             default=_utc_min(),
@@ -2419,10 +2472,10 @@ def _video_rewatch_summary(records, profiles):
             "class_name": profile.get("class_name"),
             "group_type": profile.get("group_type"),
             "is_test_data": profile.get("is_test_data") is True,
-            "record_count": len(student_records),
+            "record_count": record_count,
             "video_count": len(videos),
             "total_watch_seconds": round(total_watch_seconds, 3),
-            "avg_watch_seconds": round(total_watch_seconds / len(student_records), 3) if student_records else 0,
+            "avg_watch_seconds": round(total_watch_seconds / record_count, 3) if record_count else 0,
             "completed_count": completed_count,
             "latest_event_at": latest if latest != _utc_min() else None,
         }))
@@ -2606,7 +2659,7 @@ def video_rewatch_analysis():
         },
         "summary": {
             "student_count": len(summary),
-            "record_count": len(records),
+            "record_count": sum(row["record_count"] for row in summary),
             "total_watch_seconds": round(
                 sum(_safe_float(row.get("total_watch_seconds")) or 0 for row in summary),
                 3,
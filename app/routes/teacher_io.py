@@ -8,14 +8,10 @@ from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 from uuid import uuid4
 
-from flask import Blueprint, Response, current_app, jsonify, request
-from werkzeug.security import generate_password_hash
+from flask import Blueprint, Response, g, jsonify, request
 
 from app.db import db
-from app.randomization import (
-    RandomizationSlotsExhausted,
-    assign_feedback_strategy_on_import,
-)
+from app.user_import import ImportRow, import_job_status, run_user_import, start_import_job
 from app.routes.teacher_analysis import (
     TEST_STUDENT_ID,
     VALID_TEST_ROLES,
@@ -40,6 +36,7 @@ VALID_GROUP_TYPES = {"control", "experimental_1", "experimental_2"}
 VALID_USER_ROLES = {"student", "teacher", "admin"}
 ASSIGNMENT_METHOD_MATCHED_PAIRS = "matched_pairs"
 MAX_USER_CSV_BYTES = 2 * 1024 * 1024
+USERS_CSV_JOB_KIND = "teacher_users_csv"
 SENSITIVE_CSV_FIELDS = frozenset({
     "password",
     "password_hash",
@@ -961,42 +958,13 @@ def create_assignment_batch():
         **preview,
     }), 201
 
-@teacher_io_bp.post("/import/users-csv")
-def import_users_csv():
-    if "file" not in request.files:
-        return jsonify({"ok": False, "message": "missing file"}), 400
-
-    upload = request.files["file"]
-    filename = str(upload.filename or "").strip()
-    if not filename.lower().endswith(".csv"):
-        return jsonify({"ok": False, "message": "csv_file_required"}), 400
-    raw = upload.stream.read(MAX_USER_CSV_BYTES + 1)
-    if len(raw) > MAX_USER_CSV_BYTES:
-        return jsonify({"ok": False, "message": "csv_file_too_large"}), 413
-    text = raw.decode("utf-8-sig", errors="replace")
-    reader = csv.DictReader(io.StringIO(text))
-    headers = {str(name or "").strip() for name in (reader.fieldnames or [])}
-    if "student_id" not in headers:
-        return jsonify({"ok": False, "message": "missing student_id header"}), 400
-
-    inserted_count = 0
-    updated_count = 0
-    skipped_count = 0
+def _parse_user_import_rows(reader):
+    """Validate the CSV rows; ``(ImportRow list, invalid_rows)``."""
+    rows = []
     invalid_rows = []
-    assignment_summary = {
-        "assigned": 0,
-        "already_assigned": 0,
-        "excluded_test_data": 0,
-        "control": 0,
-        "experimental_1": 0,
-        "experimental_2": 0,
-        "failed": [],
-    }
-
     for row_number, row in enumerate(reader, start=2):
         student_id = _optional_string(row.get("student_id"))
         if not student_id:
-            skipped_count += 1
             invalid_rows.append({
                 "row": row_number,
                 "student_id": "",
@@ -1008,7 +976,6 @@ def import_users_csv():
         if group_type:
             group_type = group_type.lower()
         if group_type and group_type not in VALID_GROUP_TYPES:
-            skipped_count += 1
             invalid_rows.append({
                 "row": row_number,
                 "student_id": student_id,
@@ -1018,7 +985,6 @@ def import_users_csv():
 
         is_test_data = _parse_bool(row.get("is_test_data"), default=False)
         if is_test_data is None:
-            skipped_count += 1
             invalid_rows.append({
                 "row": row_number,
                 "student_id": student_id,
@@ -1030,7 +996,6 @@ def import_users_csv():
 
         role = (_optional_string(row.get("role")) or "student").lower()
         if role not in VALID_USER_ROLES:
-            skipped_count += 1
             invalid_rows.append({
                 "row": row_number,
                 "student_id": student_id,
@@ -1041,101 +1006,162 @@ def import_users_csv():
         sexj_raw = _optional_string(row.get("sexj"))
         sexj = _normalize_sexj(sexj_raw)
         if sexj_raw and not sexj:
-            skipped_count += 1
             invalid_rows.append({
                 "row": row_number,
                 "student_id": student_id,
                 "reason": "invalid_sexj",
             })
             continue
-        try:
-            existing = db.users.find_one({"student_id": student_id})
-            now = datetime.now(timezone.utc)
-            assignment_fields = _resolve_import_assignment(existing, role, group_type)
-            if role == "student" and is_test_data and not (existing or {}).get("assignment_locked"):
-                assignment_fields.update({
-                    "group_type": None,
-                    "assignment_status": "excluded_test_data",
-                    "assignment_method": None,
-                    "assignment_locked": False,
-                })
-            update_doc = {
-                "student_id": student_id,
-                "name": _optional_string(row.get("name")),
-                "class_name": _optional_string(row.get("class_name")),
-                "role": role,
-                "is_test_data": bool(is_test_data),
-                "sexj": sexj,
-                "updated_at": now,
-                **assignment_fields,
-            }
-
-            if existing:
-                if not existing.get("password_hash"):
-                    update_doc["password_hash"] = generate_password_hash(student_id)
-                if "created_at" not in existing:
-                    update_doc["created_at"] = now
-                if "last_login_at" not in existing:
-                    update_doc["last_login_at"] = None
-                db.users.update_one({"_id": existing["_id"]}, {"$set": update_doc})
-                updated_count += 1
-            else:
-                update_doc["password_hash"] = generate_password_hash(student_id)
-                update_doc["created_at"] = now
-                update_doc["last_login_at"] = None
-                db.users.insert_one(update_doc)
-                inserted_count += 1
-
-            if role == "student" and not is_test_data:
-                try:
-                    assignment = assign_feedback_strategy_on_import(student_id)
-                    if assignment.get("assigned") and not assignment.get("recovered"):
-                        assignment_summary["assigned"] += 1
-                        assigned_group_type = _optional_string(assignment.get("group_type"))
-                        if assigned_group_type in {"control", "experimental_1", "experimental_2"}:
-                            assignment_summary[assigned_group_type] += 1
-                    else:
-                        assignment_summary["already_assigned"] += 1
-                except RandomizationSlotsExhausted:
-                    assignment_summary["failed"].append({
-                        "row": row_number,
-                        "student_id": student_id,
-                        "reason": "randomization_slots_exhausted",
-                    })
-                except Exception as exc:
-                    current_app.logger.exception(
-                        "Automatic randomization failed during user import: %s",
-                        student_id,
-                    )
-                    assignment_summary["failed"].append({
-                        "row": row_number,
-                        "student_id": student_id,
-                        "reason": "randomization_assignment_failed",
-                        "detail": str(exc),
-                    })
-            elif role == "student":
-                assignment_summary["excluded_test_data"] += 1
-        except Exception:
-            skipped_count += 1
-            invalid_rows.append({
-                "row": row_number,
-                "student_id": student_id,
-                "reason": "row_write_failed",
+
+        rows.append(ImportRow(row_number, student_id, {
+            "name": _optional_string(row.get("name")),
+            "class_name": _optional_string(row.get("class_name")),
+            "role": role,
+            "group_type": group_type,
+            "is_test_data": bool(is_test_data),
+            "sexj": sexj,
+        }))
+    return rows, invalid_rows
+
+
+def _user_import_fields(row, existing, now):
+    data = row.data
+    assignment_fields = _resolve_import_assignment(existing, data["role"], data["group_type"])
+    if data["role"] == "student" and data["is_test_data"] and not (existing or {}).get("assignment_locked"):
+        assignment_fields.update({
+            "group_type": None,
+            "assignment_status": "excluded_test_data",
+            "assignment_method": None,
+            "assignment_locked": False,
+        })
+    fields = {
+        "student_id": row.student_id,
+        "name": data["name"],
+        "class_name": data["class_name"],
+        "role": data["role"],
+        "is_test_data": data["is_test_data"],
+        "sexj": data["sexj"],
+        "updated_at": now,
+        **assignment_fields,
+    }
+    if not existing or "created_at" not in existing:
+        fields["created_at"] = now
+    if not existing or "last_login_at" not in existing:
+        fields["last_login_at"] = None
+    return fields
+
+
+def _user_import_password(row, existing):
+    # 新帳號與尚無密碼的帳號，預設密碼為學號。
+    if existing and existing.get("password_hash"):
+        return None
+    return row.student_id
+
+
+def _run_users_csv_import(rows, invalid_rows, progress):
+    results = run_user_import(
+        rows,
+        _user_import_fields,
+        _user_import_password,
+        randomize=lambda row, fields: fields["role"] == "student" and not fields["is_test_data"],
+        progress=progress,
+    )
+
+    assignment_summary = {
+        "assigned": 0,
+        "already_assigned": 0,
+        "excluded_test_data": 0,
+        "control": 0,
+        "experimental_1": 0,
+        "experimental_2": 0,
+        "failed": [],
+    }
+    data_by_row = {row.row: row.data for row in rows}
+    failed_rows = []
+    for result in results:
+        if result["action"] in {"failed", "skipped"}:
+            failed_rows.append({key: result[key] for key in ("row", "student_id", "reason")})
+            continue
+        data = data_by_row[result["row"]]
+        if data["role"] == "student" and data["is_test_data"]:
+            assignment_summary["excluded_test_data"] += 1
+        assignment = result.get("assignment")
+        if result.get("assignment_error"):
+            assignment_summary["failed"].append({
+                "row": result["row"],
+                "student_id": result["student_id"],
+                "reason": result["assignment_error"],
+                **({"detail": result["assignment_detail"]} if result["assignment_error"] != "randomization_slots_exhausted" else {}),
             })
+        elif assignment is not None:
+            if assignment.get("assigned") and not assignment.get("recovered"):
+                assignment_summary["assigned"] += 1
+                assigned_group_type = _optional_string(assignment.get("group_type"))
+                if assigned_group_type in {"control", "experimental_1", "experimental_2"}:
+                    assignment_summary[assigned_group_type] += 1
+            else:
+                assignment_summary["already_assigned"] += 1
 
     message = "學生已匯入，並已依全研究共用序列完成自動分派。"
     if assignment_summary["failed"]:
         message = "學生已匯入，但研究分派名額不足；請先新增 slots 後重新匯入同一份 CSV。"
-    response = {
+    all_invalid = sorted(invalid_rows + failed_rows, key=lambda item: item["row"])
+    return {
         "ok": not bool(assignment_summary["failed"]),
-        "inserted_count": inserted_count,
-        "updated_count": updated_count,
-        "skipped_count": skipped_count,
-        "invalid_rows": invalid_rows,
+        "inserted_count": sum(1 for result in results if result["action"] == "inserted"),
+        "updated_count": sum(1 for result in results if result["action"] == "updated"),
+        "skipped_count": len(all_invalid),
+        "invalid_rows": all_invalid,
         "assignment": assignment_summary,
+        "rows": results,
         "message": message,
     }
-    return jsonify(response), (409 if assignment_summary["failed"] else 200)
+
+
+# 大量匯入改為背景工作：上傳後立即回傳 job_id，前端輪詢 /import/jobs/<job_id>。
+@teacher_io_bp.post("/import/users-csv")
+def import_users_csv():
+    if "file" not in request.files:
+        return jsonify({"ok": False, "message": "missing file"}), 400
+
+    upload = request.files["file"]
+    filename = str(upload.filename or "").strip()
+    if not filename.lower().endswith(".csv"):
+        return jsonify({"ok": False, "message": "csv_file_required"}), 400
+    raw = upload.stream.read(MAX_USER_CSV_BYTES + 1)
+    if len(raw) > MAX_USER_CSV_BYTES:
+        return jsonify({"ok": False, "message": "csv_file_too_large"}), 413
+    text = raw.decode("utf-8-sig", errors="replace")
+    reader = csv.DictReader(io.StringIO(text))
+    headers = {str(name or "").strip() for name in (reader.fieldnames or [])}
+    if "student_id" not in headers:
+        return jsonify({"ok": False, "message": "missing student_id header"}), 400
+
+    rows, invalid_rows = _parse_user_import_rows(reader)
+    job_id = start_import_job(
+        USERS_CSV_JOB_KIND,
+        str((getattr(g, "current_user", None) or {}).get("student_id") or ""),
+        len(rows) + len(invalid_rows),
+        lambda progress: _run_users_csv_import(rows, invalid_rows, progress),
+    )
+    return jsonify({
+        "ok": True,
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/teacher/import/jobs/{job_id}",
+    }), 202
+
+
+@teacher_io_bp.get("/import/jobs/<job_id>")
+def import_users_csv_job(job_id):
+    job = import_job_status(
+        job_id,
+        USERS_CSV_JOB_KIND,
+        str((getattr(g, "current_user", None) or {}).get("student_id") or ""),
+    )
+    if job is None:
+        return jsonify({"ok": False, "error": "job_not_found", "message": "找不到此匯入工作。"}), 404
+    return jsonify({"ok": True, **job})
 
 
 @teacher_io_bp.get("/export/student-summary.csv")
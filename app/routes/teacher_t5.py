@@ -5,6 +5,9 @@ import re  # [新增] 用於 version 遞增解析
 from bson import ObjectId
 from ..db import db
 from ..unit_labels import sort_units, unit_label_map, save_unit_label
+from ..student_progress import invalidate_student_home_catalog
+from ..exam_paper import invalidate_exam_papers
+from ..task_snapshots import drop_task_snapshot, publish_task_snapshot
 
 teacher_t5_bp = Blueprint("teacher_t5", __name__)
 
@@ -54,27 +57,6 @@ def _doc_created_iso(doc):
     return _safe_iso(doc.get("created_at") or doc.get("created_at_utc") or doc.get("_id"))
 
 
-def _doc_created_sort_value(doc):
-    if not isinstance(doc, dict):
-        return datetime.min.replace(tzinfo=timezone.utc)
-    raw = doc.get("created_at") or doc.get("created_at_utc")
-    if isinstance(raw, datetime):
-        return raw
-    if isinstance(raw, str):
-        text = raw.strip()
-        if text:
-            try:
-                if text.endswith(("Z", "z")):
-                    text = text[:-1] + "+00:00"
-                return datetime.fromisoformat(text)
-            except Exception:
-                pass
-    oid = doc.get("_id")
-    if isinstance(oid, ObjectId):
-        return oid.generation_time
-    return datetime.min.replace(tzinfo=timezone.utc)
-
-
 def _task_source_type(doc):
     if not isinstance(doc, dict):
         return "ai"
@@ -109,10 +91,6 @@ def _backfill_created_at_if_missing(doc):
         pass
 
 
-def _fixed_task_code(index):
-    return f"FIXED-{max(1, int(index or 1)):02d}"
-
-
 def _backfill_task_code_if_missing(doc, task_code):
     if not isinstance(doc, dict):
         return ""
@@ -308,6 +286,7 @@ def update_unit_label():
         return jsonify({"ok": False, "error": "missing label"}), 400
     try:
         saved = save_unit_label(unit_id, label, updated_by="teacher_t5")
+        invalidate_student_home_catalog()
         return jsonify({"ok": True, **saved})
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
@@ -354,6 +333,8 @@ def _set_test_control(test_cycle_id, test_role, is_open):
     else:
         update["close_at"] = now
     db.test_control.update_one({"_id": doc_id}, {"$set": update}, upsert=True)
+    invalidate_student_home_catalog()
+    invalidate_exam_papers()
     return db.test_control.find_one({"_id": doc_id}) or {}
 
 
@@ -459,11 +440,144 @@ def video_info():
 # D. questions list (TeacherT5AgentLog.vue 需要)
 # GET /questions?video_id=...&status=all&sort=newest
 # =========================
+_TRUE_LIKE = [True, 1, "1", "true", "True", "TRUE"]
+
+_STATUS_ZH_MAP = {
+    "draft": "草稿",
+    "pending": "待審核",
+    "approved": "已審核",
+    "published": "已發布",
+    "rejected": "已退回",
+}
+
+
+def _lowered_text_expr(field):
+    return {"$toLower": {"$trim": {"input": {"$toString": {"$ifNull": [field, ""]}}}}}
+
+
+def _to_oid_expr(field):
+    return {"$convert": {"input": field, "to": "objectId", "onError": None, "onNull": None}}
+
+
+def _question_list_pipeline(match, status, sort_dir, skip, limit):
+    """One aggregation for the teacher question list.
+
+    Soft-deleted videos are filtered with a ``$lookup`` instead of one
+    ``videos.find_one`` per task, the review status filter runs in MongoDB,
+    and only list columns are returned.  The sort uses the stored
+    ``created_at`` right after the first ``$match`` so the
+    ``(video_id, created_at)`` indexes can serve it; the later stages keep
+    that order.  Missing ``created_at`` / ``task_code`` values are
+    backfilled once by ``scripts/backfill_parsons_task_list_fields.py``,
+    not on every GET.
+    """
+    raw_status = {
+        "$let": {
+            "vars": {
+                "status": _lowered_text_expr("$status"),
+                "review": _lowered_text_expr("$review_status"),
+            },
+            "in": {
+                "$cond": [
+                    {"$ne": ["$$status", ""]},
+                    "$$status",
+                    {
+                        "$cond": [
+                            {"$ne": ["$$review", ""]},
+                            "$$review",
+                            {
+                                "$cond": [
+                                    {"$toBool": {"$ifNull": ["$enabled", False]}},
+                                    "published",
+                                    "pending",
+                                ]
+                            },
+                        ]
+                    },
+                ]
+            },
+        }
+    }
+    pipeline = [
+        {"$match": match},
+        # 緊接在 $match 後、以儲存的 created_at 排序，才能走 video/created_at 索引。
+        {"$sort": {"created_at": sort_dir, "_id": sort_dir}},
+        {
+            "$addFields": {
+                "_video_oid": {"$ifNull": [_to_oid_expr("$video_id"), _to_oid_expr("$video_id_str")]},
+                "_raw_status": raw_status,
+            }
+        },
+        {
+            "$lookup": {
+                "from": "videos",
+                "localField": "_video_oid",
+                "foreignField": "_id",
+                "as": "_video",
+            }
+        },
+        {
+            "$match": {
+                "_video.deleted": {"$nin": _TRUE_LIKE},
+                "_video.is_deleted": {"$nin": _TRUE_LIKE},
+            }
+        },
+    ]
+    if status != "all":
+        pipeline.append({"$match": {"_raw_status": status}})
+
+    page_stages = []
+    if skip:
+        page_stages.append({"$skip": skip})
+    if limit:
+        page_stages.append({"$limit": limit})
+    page_stages.append({
+        "$project": {
+            "_raw_status": 1,
+            "status": 1,
+            "review_status": 1,
+            "enabled": 1,
+            "source_type": 1,
+            "gen_source": 1,
+            "ai_generated": 1,
+            "task_code": 1,
+            "version": 1,
+            "title": 1,
+            "video_title": 1,
+            "created_at": 1,
+            "created_at_utc": 1,
+            "segment_label": 1,
+            "parent_version": 1,
+            "parent_task_id": 1,
+            "has_note": {
+                "$gt": [{"$strLenCP": {"$trim": {"input": {"$toString": {"$ifNull": ["$review_note", ""]}}}}}, 0]
+            },
+        }
+    })
+    pipeline.append({
+        "$facet": {
+            "items": page_stages,
+            "total": [{"$count": "count"}],
+        }
+    })
+    return pipeline
+
+
+def _positive_int_arg(name):
+    try:
+        return max(0, int(request.args.get(name, 0) or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
 @teacher_t5_bp.get("/questions")
 def questions():
     video_id = (request.args.get("video_id", "") or "").strip()
     status = (request.args.get("status", "all") or "all").strip().lower()
     sort = (request.args.get("sort", "newest") or "newest").strip().lower()
+    # 分頁為選用參數；未帶 page_size 時回傳全部題目（相容舊前端）。
+    page_size = min(_positive_int_arg("page_size"), 500)
+    page = max(1, _positive_int_arg("page") or 1)
 
     vid = _oid(video_id)
     if not video_id:
@@ -475,92 +589,36 @@ def questions():
     else:
         q = {"$or": [{"video_id": video_id}, {"video_id_str": video_id}]}
 
-    # 軟刪除影片不應再出現在老師端題目列表（相容 deleted / is_deleted）。
-    if vid:
-        vdoc = db.videos.find_one({"_id": vid}, {"deleted": 1, "is_deleted": 1}) or {}
-        if vdoc and (vdoc.get("deleted") is True or vdoc.get("is_deleted") is True):
-            return jsonify({"ok": True, "items": []})
-
     # 排序
     sort_dir = -1 if sort == "newest" else 1
+    skip = (page - 1) * page_size if page_size else 0
 
-    items = []
-    _video_deleted_cache = {}
-
-    def _task_video_is_deleted(task_doc: dict) -> bool:
-        raw_vid = task_doc.get("video_id")
-        vid_oid = raw_vid if isinstance(raw_vid, ObjectId) else _oid(str(raw_vid or ""))
-        if not vid_oid:
-            vid_oid = _oid(str(task_doc.get("video_id_str") or ""))
-        if not vid_oid:
-            return False
-
-        key = str(vid_oid)
-        if key in _video_deleted_cache:
-            return _video_deleted_cache[key]
-
-        vdoc = db.videos.find_one({"_id": vid_oid}, {"deleted": 1, "is_deleted": 1}) or {}
-        is_del = bool(vdoc and (vdoc.get("deleted") is True or vdoc.get("is_deleted") is True))
-        _video_deleted_cache[key] = is_del
-        return is_del
-
-    task_docs = list(db.parsons_tasks.find(q))
-    for t in task_docs:
-        _backfill_created_at_if_missing(t)
-
-    fixed_docs = [
-        t for t in task_docs
-        if _task_source_type(t) == "fixed" and not _task_video_is_deleted(t)
-    ]
-    fixed_docs.sort(key=lambda doc: (_doc_created_sort_value(doc), str(doc.get("_id") or "")))
-    for idx, fixed_doc in enumerate(fixed_docs, start=1):
-        _backfill_task_code_if_missing(fixed_doc, _fixed_task_code(idx))
-
-    task_docs.sort(
-        key=lambda doc: (_doc_created_sort_value(doc), str(doc.get("_id") or "")),
-        reverse=(sort_dir == -1),
+    facet = next(
+        db.parsons_tasks.aggregate(_question_list_pipeline(q, status, sort_dir, skip, page_size)),
+        {},
     )
+    total = int(((facet.get("total") or [{}])[0]).get("count") or 0)
 
-    for t in task_docs:
-        if _task_video_is_deleted(t):
-            continue
-
+    items = []
+    for t in facet.get("items") or []:
         enabled = bool(t.get("enabled", False))
 
         # ===== 統一來源 =====
         source_type = _task_source_type(t)
 
         # ===== 統一狀態 =====
-        raw_status = (
-            (t.get("status") or "").strip().lower()
-            or (t.get("review_status") or "").strip().lower()
-        )
-
         # 固定題常見 draft / approved；AI 題常見 pending / published / rejected
-        if not raw_status:
-            raw_status = "published" if enabled else "pending"
-
-        # 前端狀態過濾（統一用 status 比）
-        # all / pending / published / rejected / approved / draft
-        if status != "all" and raw_status != status:
-            continue
+        raw_status = t.get("_raw_status") or ("published" if enabled else "pending")
 
         # ===== 題目代號 =====
         # 固定題優先 task_code，AI 題優先 version
         if source_type == "fixed":
-            version = _backfill_task_code_if_missing(t, "FIXED-01")
+            version = str(t.get("task_code") or "").strip() or "FIXED-01"
         else:
             version = (t.get("version") or t.get("task_code") or "v1").strip()
 
         # ===== 顯示用中文狀態 =====
-        status_zh_map = {
-            "draft": "草稿",
-            "pending": "待審核",
-            "approved": "已審核",
-            "published": "已發布",
-            "rejected": "已退回",
-        }
-        status_zh = status_zh_map.get(raw_status, raw_status or "待審核")
+        status_zh = _STATUS_ZH_MAP.get(raw_status, raw_status or "待審核")
 
         items.append({
             "task_id": str(t["_id"]),
@@ -573,7 +631,7 @@ def questions():
             "student_visible": enabled,
             "created_at": _doc_created_iso(t),
             "segment_label": t.get("segment_label", "—"),
-            "has_note": bool((t.get("review_note") or "").strip()),
+            "has_note": bool(t.get("has_note")),
             "gen_source": source_type,                 # 前端目前用 q.gen_source 判斷 fixed / ai
             "source_type": source_type,                # [新增] 給新表格欄位直接用
             "review_status": (t.get("review_status") or "").strip().lower(),
@@ -581,7 +639,13 @@ def questions():
             "parent_task_id": str(t.get("parent_task_id")) if t.get("parent_task_id") else "",
         })
 
-    return jsonify({"ok": True, "items": items})
+    return jsonify({
+        "ok": True,
+        "items": items,
+        "total": total,
+        "page": page if page_size else 1,
+        "page_size": page_size or total,
+    })
 
 
 # =========================
@@ -868,6 +932,7 @@ def review_save():
         update_doc["hide_semantic_zh"] = bool(hide_semantic_zh)
 
     db.parsons_tasks.update_one({"_id": tid}, {"$set": update_doc})
+    drop_task_snapshot(tid)
     return jsonify({"ok": True})
 
 
@@ -888,6 +953,7 @@ def publish():
     }})
     if r.matched_count == 0:
         return jsonify({"ok": False, "error": "task not found"}), 404
+    publish_task_snapshot(tid)
     return jsonify({"ok": True})
 
 
@@ -5,10 +5,18 @@ from math import isfinite
 
 from bson import ObjectId
 from flask import Blueprint, g, jsonify, request
-from pymongo.errors import PyMongoError
+from pymongo.errors import BulkWriteError, PyMongoError
 
 from ..db import db
-from ..session_auth import current_student_id
+from ..idempotency import idempotent
+from ..log_storage import ensure_log_collection, prepare_log_document, timeseries_enabled
+from ..session_auth import current_student_id, request_json_or_beacon
+from ..video_playback_state import (
+    apply_playback_event,
+    apply_playback_events,
+    is_completed,
+    read_playback_state,
+)
 
 
 video_rewatch_logs_bp = Blueprint("video_rewatch_logs", __name__)
@@ -19,6 +27,9 @@ TIMEZONE_NAME = "Asia/Taipei"
 TAIPEI_TZ = timezone(timedelta(hours=8))
 
 # video_progress 保留以相容舊版前端；新版前端已改為事件式紀錄，不會固定送出。
+MAX_BATCH_EVENTS = 200
+DUPLICATE_KEY_ERROR = 11000
+
 ALLOWED_EVENT_TYPES = {
     "video_click",
     "video_play",
@@ -67,6 +78,16 @@ def _optional_float(value):
     return round(number, 3)
 
 
+def _optional_seq(value):
+    if value is None or value == "" or isinstance(value, bool):
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number >= 0 else None
+
+
 def _parse_datetime(value):
     if isinstance(value, datetime):
         if value.tzinfo is None:
@@ -87,7 +108,11 @@ def _parse_datetime(value):
     return parsed.astimezone(timezone.utc)
 
 
-def _video_lookup(video_id):
+VIDEO_LOOKUP_PROJECTION = {"unit": 1, "title": 1, "filename": 1, "path": 1}
+USER_PROFILE_PROJECTION = {"class_name": 1, "group_type": 1, "is_test_data": 1, "role": 1}
+
+
+def _video_lookup_filter(video_id):
     video_id_text = _optional_string(video_id)
     if not video_id_text:
         return None
@@ -102,10 +127,14 @@ def _video_lookup(video_id):
         oid = ObjectId(video_id_text)
         query.extend([{"_id": oid}, {"video_id": oid}])
 
-    return db.videos.find_one(
-        {"$or": query},
-        {"unit": 1, "title": 1, "filename": 1, "path": 1},
-    )
+    return {"$or": query}
+
+
+def _video_lookup(video_id):
+    query = _video_lookup_filter(video_id)
+    if query is None:
+        return None
+    return db.videos.find_one(query, VIDEO_LOOKUP_PROJECTION)
 
 
 def _ensure_indexes():
@@ -115,6 +144,12 @@ def _ensure_indexes():
         return
 
     try:
+        if timeseries_enabled("video_rewatch_logs"):
+            # 時間序列集合只保留少量複合索引，也不支援 unique（client_seq 只在批次內去重）。
+            ensure_log_collection(db, "video_rewatch_logs")
+            _INDEX_READY = True
+            return
+
         db.video_rewatch_logs.create_index(
             [("student_id", 1), ("event_at", -1)],
             name="student_event_at_1",
@@ -146,42 +181,44 @@ def _ensure_indexes():
             name="student_video_event_at_1",
         )
 
+        # 批次上傳的重送去重：同一 watch_session 的 client_seq 只收一次。
+        db.video_rewatch_logs.create_index(
+            [("student_id", 1), ("watch_session_id", 1), ("client_seq", 1)],
+            name="uniq_student_session_client_seq",
+            unique=True,
+            partialFilterExpression={
+                "watch_session_id": {"$type": "string"},
+                "client_seq": {"$type": "number"},
+            },
+        )
+
         _INDEX_READY = True
     except PyMongoError:
         # 索引建立失敗不應阻止學習行為紀錄。
         return
 
 
-@video_rewatch_logs_bp.post("")
-def create_video_rewatch_log():
-    student_id = current_student_id()
-    if not student_id:
-        return jsonify({"ok": False, "message": "missing student session"}), 401
+def _current_user_profile(student_id):
+    return getattr(g, "current_user", None) or db.users.find_one(
+        {"student_id": student_id},
+        USER_PROFILE_PROJECTION,
+    ) or {}
 
-    data = request.get_json(silent=True) or {}
+
+def _build_log_doc(data, student_id, user, video, now):
+    """Validate one event payload; return ``(doc, None)`` or ``(None, (payload, status))``."""
     event_type = str(data.get("event_type") or "").strip()
     if event_type not in ALLOWED_EVENT_TYPES:
-        return jsonify({
+        return None, ({
             "ok": False,
             "error": "invalid_event_type",
             "message": "video_rewatch_logs event_type is not allowed",
-        }), 400
+        }, 400)
 
     video_id = _optional_string(data.get("video_id"))
     if not video_id:
-        return jsonify({"ok": False, "message": "missing video_id"}), 400
-
-    user = getattr(g, "current_user", None) or db.users.find_one(
-        {"student_id": student_id},
-        {"class_name": 1, "group_type": 1, "is_test_data": 1, "role": 1},
-    ) or {}
-
-    try:
-        video = _video_lookup(video_id) or {}
-    except PyMongoError:
-        video = {}
+        return None, ({"ok": False, "message": "missing video_id"}, 400)
 
-    now = _utc_now()
     event_at = _parse_datetime(data.get("event_at")) or now
     watch_seconds = _optional_float(data.get("watch_seconds"))
     watch_delta_sec = _optional_float(data.get("watch_delta_sec"))
@@ -211,11 +248,11 @@ def create_video_rewatch_log():
             or playback_rate_from <= 0
             or playback_rate_to <= 0
         ):
-            return jsonify({
+            return None, ({
                 "ok": False,
                 "error": "invalid_playback_rate_data",
                 "message": "video_rate_change 必須包含有效的播放倍速 from 與 to",
-            }), 400
+            }, 400)
 
         # ratechange 發生後的 current 應等於 to；由後端統一校正。
         playback_rate_current = playback_rate_to
@@ -242,11 +279,11 @@ def create_video_rewatch_log():
         seek_to_sec = _optional_float(data.get("seek_to_sec"))
 
         if seek_from_sec is None or seek_to_sec is None:
-            return jsonify({
+            return None, ({
                 "ok": False,
                 "error": "invalid_seek_data",
                 "message": "video_seek 必須包含有效的 seek_from_sec 與 seek_to_sec",
-            }), 400
+            }, 400)
 
         # 不採信前端傳入的差值，由後端依兩個位置重新計算。
         seek_delta_sec = round(seek_to_sec - seek_from_sec, 3)
@@ -275,6 +312,8 @@ def create_video_rewatch_log():
         "event_type": event_type,
         "video_id": video_id,
         "watch_session_id": _optional_string(data.get("watch_session_id")),
+        # 批次上傳時由前端依 watch_session 遞增，用來去除重送的重複事件。
+        "client_seq": _optional_seq(data.get("client_seq")),
         "video_title": (
             _optional_string(data.get("video_title"))
             or video.get("title")
@@ -319,6 +358,28 @@ def create_video_rewatch_log():
         "updated_at_utc": now,
         "updated_at_taiwan": _taiwan_time_string(now),
     }
+    return prepare_log_document("video_rewatch_logs", doc), None
+
+
+@video_rewatch_logs_bp.post("")
+@idempotent
+def create_video_rewatch_log():
+    student_id = current_student_id()
+    if not student_id:
+        return jsonify({"ok": False, "message": "missing student session"}), 401
+
+    data = request.get_json(silent=True) or {}
+    event_type = str(data.get("event_type") or "").strip()
+    video_id = _optional_string(data.get("video_id"))
+    user = _current_user_profile(student_id)
+    try:
+        video = _video_lookup(video_id) or {}
+    except PyMongoError:
+        video = {}
+
+    doc, error = _build_log_doc(data, student_id, user, video, _utc_now())
+    if error is not None:
+        return jsonify(error[0]), error[1]
 
     try:
         _ensure_indexes()
@@ -330,6 +391,9 @@ def create_video_rewatch_log():
             "message": "影片觀看紀錄寫入失敗，請稍後再試。",
         }), 503
 
+    # 續播位置改由 video_playback_state 維護，回看片段的事件不會更新。
+    apply_playback_event(doc)
+
     return jsonify({
         "ok": True,
         "log_id": str(result.inserted_id),
@@ -340,6 +404,136 @@ def create_video_rewatch_log():
     })
 
 
+def _batch_events_error(data):
+    """``(payload, status)`` when the batch body is unusable, else ``None``."""
+    events = data.get("events")
+    if not isinstance(events, list) or not events:
+        return {"ok": False, "error": "missing_events", "message": "events must be a non-empty list"}, 400
+    if len(events) > MAX_BATCH_EVENTS:
+        return {
+            "ok": False,
+            "error": "too_many_events",
+            "message": f"at most {MAX_BATCH_EVENTS} events per batch",
+        }, 400
+    return None
+
+
+def _batch_video_ids(events):
+    ids = []
+    for event in events:
+        video_id = _optional_string(event.get("video_id")) if isinstance(event, dict) else None
+        if video_id and video_id not in ids:
+            ids.append(video_id)
+    return ids
+
+
+def _build_batch_docs(events, student_id, user, videos, now):
+    """Validate a batch; return ``(docs, rejected, duplicates)``.
+
+    ``videos`` maps each id from :func:`_batch_video_ids` to its document.
+    """
+    docs = []
+    rejected = []
+    seen_keys = set()
+    duplicates = 0
+    for index, event in enumerate(events):
+        if not isinstance(event, dict):
+            rejected.append({"index": index, "error": "invalid_event"})
+            continue
+        video_id = _optional_string(event.get("video_id"))
+        doc, error = _build_log_doc(event, student_id, user, videos.get(video_id) or {}, now)
+        if error is not None:
+            rejected.append({"index": index, "error": error[0].get("error") or error[0].get("message")})
+            continue
+        if doc["client_seq"] is not None and doc["watch_session_id"]:
+            key = (doc["watch_session_id"], doc["client_seq"])
+            if key in seen_keys:
+                duplicates += 1
+                continue
+            seen_keys.add(key)
+        docs.append(doc)
+    return docs, rejected, duplicates
+
+
+def _inserted_after_bulk_error(docs, exc):
+    """``(inserted, duplicates)`` when every write error is a duplicate ``client_seq``, else ``None``."""
+    write_errors = exc.details.get("writeErrors") or []
+    if any(item.get("code") != DUPLICATE_KEY_ERROR for item in write_errors):
+        return None
+    failed = {item.get("index") for item in write_errors}
+    return [doc for position, doc in enumerate(docs) if position not in failed], len(failed)
+
+
+BATCH_WRITE_FAILED = {
+    "ok": False,
+    "error": "video_rewatch_log_write_failed",
+    "message": "影片觀看紀錄寫入失敗，請稍後再試。",
+}
+
+
+def _batch_payload(student_id, user, docs, inserted, duplicates, rejected):
+    return {
+        "ok": True,
+        "student_id": student_id,
+        "group_type": user.get("group_type") or None,
+        "inserted": len(inserted),
+        "duplicates": duplicates,
+        "rejected": rejected,
+        "max_client_seq": max((doc["client_seq"] for doc in docs if doc["client_seq"] is not None), default=None),
+    }
+
+
+@video_rewatch_logs_bp.post("/batch")
+@idempotent
+def create_video_rewatch_log_batch():
+    """一次寫入多筆播放事件。
+
+    body: ``{"events": [...]}``，每筆格式與單筆 API 相同，另帶 ``client_seq``。
+    使用者與影片資料每批只查一次，事件以一次 ``insert_many`` 寫入；
+    ``(student_id, watch_session_id, client_seq)`` 重複的事件視為重送並略過。
+    頁面關閉時前端以 ``navigator.sendBeacon`` 送出 text/plain 內容，
+    登入 token 放在 body 的 ``session_token``（beacon 無法帶 header）。
+    非同步模式（app/asgi.py）以相同的輔助函式處理這個 endpoint。
+    """
+    student_id = current_student_id()
+    if not student_id:
+        return jsonify({"ok": False, "message": "missing student session"}), 401
+
+    data = request_json_or_beacon()
+    error = _batch_events_error(data)
+    if error is not None:
+        return jsonify(error[0]), error[1]
+    events = data["events"]
+
+    user = _current_user_profile(student_id)
+    videos = {}
+    for video_id in _batch_video_ids(events):
+        try:
+            videos[video_id] = _video_lookup(video_id) or {}
+        except PyMongoError:
+            videos[video_id] = {}
+    docs, rejected, duplicates = _build_batch_docs(events, student_id, user, videos, _utc_now())
+
+    inserted = []
+    if docs:
+        try:
+            _ensure_indexes()
+            db.video_rewatch_logs.insert_many(docs, ordered=False)
+            inserted = docs
+        except BulkWriteError as exc:
+            recovered = _inserted_after_bulk_error(docs, exc)
+            if recovered is None:
+                return jsonify(BATCH_WRITE_FAILED), 503
+            inserted, skipped = recovered
+            duplicates += skipped
+        except PyMongoError:
+            return jsonify(BATCH_WRITE_FAILED), 503
+
+    apply_playback_events(inserted)
+
+    return jsonify(_batch_payload(student_id, user, docs, inserted, duplicates, rejected))
+
+
 @video_rewatch_logs_bp.get("/resume")
 def get_video_resume_position():
     """讀取目前學生對指定影片最後一次有效的完整影片觀看位置。"""
@@ -352,36 +546,7 @@ def get_video_resume_position():
         return jsonify({"ok": False, "message": "missing video_id"}), 400
 
     try:
-        _ensure_indexes()
-        latest = db.video_rewatch_logs.find_one(
-            {
-                "student_id": student_id,
-                "video_id": video_id,
-                # 回看錯誤片段的紀錄不可覆蓋完整教學影片的續播位置。
-                # MongoDB 的 null 條件同時會匹配欄位不存在的舊資料。
-                "segment_start_sec": None,
-                # 排除剛點選影片所產生的 current_time_sec=0 紀錄。
-                "event_type": {
-                    "$in": [
-                        "video_progress",
-                        "video_pause",
-                        "video_seek",
-                        "video_rate_change",
-                        "video_leave",
-                        "video_ended",
-                    ]
-                },
-                "current_time_sec": {"$gt": 0},
-            },
-            {
-                "event_type": 1,
-                "current_time_sec": 1,
-                "video_duration_sec": 1,
-                "reached_end": 1,
-                "event_at": 1,
-            },
-            sort=[("event_at", -1)],
-        )
+        state = read_playback_state(student_id, video_id)
     except PyMongoError:
         return jsonify({
             "ok": False,
@@ -389,32 +554,32 @@ def get_video_resume_position():
             "message": "影片續播位置讀取失敗，請稍後再試。",
         }), 503
 
-    if not latest:
-        return jsonify({
+    return jsonify(_resume_payload(video_id, state))
+
+
+def _resume_payload(video_id, state):
+    if not state or not state.get("last_event_type"):
+        return {
             "ok": True,
             "video_id": video_id,
             "resume_sec": 0,
             "completed": False,
-        })
-
-    current_time = _optional_float(latest.get("current_time_sec")) or 0
-    duration = _optional_float(latest.get("video_duration_sec"))
-    completed = bool(
-        latest.get("event_type") == "video_ended"
-        or latest.get("reached_end") is True
-        or (
-            duration is not None
-            and duration > 0
-            and current_time >= duration - 3
-        )
+        }
+
+    current_time = _optional_float(state.get("resume_sec")) or 0
+    completed = bool(state.get("completed")) or is_completed(
+        state.get("last_event_type"),
+        state.get("reached_end"),
+        current_time,
+        _optional_float(state.get("video_duration_sec")),
     )
 
-    event_at = latest.get("event_at")
-    return jsonify({
+    event_at = state.get("last_event_at")
+    return {
         "ok": True,
         "video_id": video_id,
         "resume_sec": 0 if completed else current_time,
         "completed": completed,
-        "last_event_type": latest.get("event_type"),
+        "last_event_type": state.get("last_event_type"),
         "last_event_at": event_at.isoformat() if isinstance(event_at, datetime) else None,
-    })
+    }
@@ -37,6 +37,12 @@ def main():
 
     # 寫入 MongoDB
     r = db.questions.insert_many(docs)
+    # 讓執行中的服務重新編譯前後測試卷（app/exam_paper.py）。
+    db.cache_versions.update_one(
+        {"_id": "exam_paper"},
+        {"$inc": {"version": 1}, "$currentDate": {"updated_at": True}},
+        upsert=True,
+    )
     print(f"✅ 匯入完成：{len(r.inserted_ids)} 題 -> {DB_NAME}.questions")
 
 if __name__ == "__main__":
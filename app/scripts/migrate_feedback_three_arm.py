@@ -14,6 +14,8 @@ from pathlib import Path
 from dotenv import load_dotenv
 from pymongo import MongoClient
 
+from app.bulk_migration import Migration, add_migration_arguments, run_migration
+
 
 LEGACY_POLICY = "feedback_v1_two_arm"
 CURRENT_POLICY = "feedback_v2_three_arm"
@@ -37,66 +39,61 @@ def migrated_group(group_type):
     return GROUP_MAP.get(str(group_type or "").strip().lower())
 
 
-def migrate_users(database, apply):
-    scanned = changed = 0
-    for user in database.users.find({"group_type": {"$in": list(GROUP_MAP)}}):
-        scanned += 1
-        canonical = migrated_group(user.get("group_type"))
-        if not canonical:
-            continue
-        changed += 1
-        if apply:
-            database.users.update_one(
-                {"_id": user["_id"]},
-                {"$set": {
-                    "legacy_group_type": user.get("group_type"),
-                    "group_type": canonical,
-                    "analysis_group_type": canonical,
-                    "feedback_strategy": "B" if canonical == "experimental_1" else "C",
-                    "updated_at": now_utc(),
-                }},
-            )
-    return scanned, changed
-
-
-def migrate_history(collection, apply):
-    scanned = changed = 0
-    for doc in collection.find({"group_type": {"$in": list(GROUP_MAP)}}):
-        scanned += 1
-        canonical = migrated_group(doc.get("group_type"))
-        needs_update = (
-            doc.get("analysis_group_type") != canonical
-            or not doc.get("feedback_policy_version")
-        )
-        if not needs_update:
-            continue
-        changed += 1
-        if apply:
-            collection.update_one(
-                {"_id": doc["_id"]},
-                {"$set": {
-                    "analysis_group_type": canonical,
-                    "feedback_policy_version": doc.get("feedback_policy_version") or LEGACY_POLICY,
-                    "group_mapping_version": CURRENT_POLICY,
-                    "group_mapping_migrated_at": now_utc(),
-                }},
-            )
-    return scanned, changed
+def user_update(user, counters):
+    canonical = migrated_group(user.get("group_type"))
+    if not canonical:
+        return None
+    return {"$set": {
+        "legacy_group_type": user.get("group_type"),
+        "group_type": canonical,
+        "analysis_group_type": canonical,
+        "feedback_strategy": "B" if canonical == "experimental_1" else "C",
+        "updated_at": now_utc(),
+    }}
+
+
+def history_update(doc, counters):
+    canonical = migrated_group(doc.get("group_type"))
+    needs_update = (
+        doc.get("analysis_group_type") != canonical
+        or not doc.get("feedback_policy_version")
+    )
+    if not needs_update:
+        return None
+    return {"$set": {
+        "analysis_group_type": canonical,
+        "feedback_policy_version": doc.get("feedback_policy_version") or LEGACY_POLICY,
+        "group_mapping_version": CURRENT_POLICY,
+        "group_mapping_migrated_at": now_utc(),
+    }}
 
 
 def main():
     parser = argparse.ArgumentParser(description="Preview or apply feedback-study group migration")
     parser.add_argument("--apply", action="store_true", help="Write the migration after a dry run")
+    add_migration_arguments(parser)
     args = parser.parse_args()
     client = MongoClient(os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017"))
     database = client[os.environ.get("MONGO_DATABASE", "thesis_system")]
     mode = "applied" if args.apply else "dry-run"
-
-    scanned, changed = migrate_users(database, args.apply)
-    print(f"{mode}: users scanned={scanned} changed={changed}")
-    for name in HISTORICAL_COLLECTIONS:
-        scanned, changed = migrate_history(database[name], args.apply)
-        print(f"{mode}: {name} scanned={scanned} changed={changed}")
+    query = {"group_type": {"$in": list(GROUP_MAP)}}
+
+    migrations = [Migration("feedback_three_arm:users", "users", user_update, query)]
+    migrations.extend(
+        Migration(f"feedback_three_arm:{name}", name, history_update, query)
+        for name in HISTORICAL_COLLECTIONS
+    )
+    for migration in migrations:
+        report = run_migration(
+            database,
+            migration,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            dry_run=not args.apply,
+            restart=args.restart,
+        )
+        print(f"{mode}: {migration.collection} scanned={report.scanned} changed={report.changed} "
+              f"({report.docs_per_sec:.0f} docs/s)")
 
 
 if __name__ == "__main__":
@@ -11,10 +11,14 @@ from datetime import datetime, timezone
 
 from pymongo import MongoClient
 
+from app.bulk_migration import Migration, add_migration_arguments, run_migration
+
 
 CHOICE_TYPES = ["choice", "choices", "mcq", "multiple_choice", "single_choice"]
 CHOICE_TEST_MAX_SCORE = 4
 CHOICE_TEST_MIN_SCORE = 0
+# 與 app/exam_paper.py 的 EXAM_PAPER_CACHE_NAME 相同；改題後讓執行中的服務重新編譯試卷。
+EXAM_PAPER_CACHE_NAME = "exam_paper"
 ATTEMPT_LEGACY_FIELDS = {
     "answer": "",
     "answer_text": "",
@@ -163,10 +167,8 @@ def build_attempt_update(doc):
     }
 
 
-def migrate_collection(collection, query, build_update, unset_fields, canonical_aliases, apply):
-    scanned = changed = conflicts = 0
-    for doc in collection.find(query):
-        scanned += 1
+def migrate_collection(db, collection_name, query, build_update, unset_fields, canonical_aliases, apply, args):
+    def transform(doc, counters):
         update_fields = build_update(doc)
 
         def values_match(key, current, proposed):
@@ -193,9 +195,9 @@ def migrate_collection(collection, query, build_update, unset_fields, canonical_
             and not values_match(key, doc.get(key), update_fields[key])
         ]
         if conflicting_fields:
-            conflicts += 1
-            print(f"Conflict: {collection.name}/{doc.get('_id')} fields={','.join(conflicting_fields)}")
-            continue
+            counters["conflicts"] += 1
+            print(f"Conflict: {collection_name}/{doc.get('_id')} fields={','.join(conflicting_fields)}")
+            return None
         alias_conflicts = []
         for canonical, aliases in canonical_aliases.items():
             proposed = update_fields.get(canonical)
@@ -203,29 +205,37 @@ def migrate_collection(collection, query, build_update, unset_fields, canonical_
                 if alias in doc and doc.get(alias) not in (None, "") and not values_match(canonical, doc.get(alias), proposed):
                     alias_conflicts.append(f"{canonical}:{alias}")
         if alias_conflicts:
-            conflicts += 1
-            print(f"Conflict: {collection.name}/{doc.get('_id')} fields={','.join(alias_conflicts)}")
-            continue
+            counters["conflicts"] += 1
+            print(f"Conflict: {collection_name}/{doc.get('_id')} fields={','.join(alias_conflicts)}")
+            return None
         needs_set = any(
             not values_match(key, doc.get(key), value)
             for key, value in update_fields.items()
         )
         fields_to_unset = {key: value for key, value in unset_fields.items() if key in doc}
         if not needs_set and not fields_to_unset:
-            continue
-        changed += 1
-        if apply:
-            update_fields["updated_at"] = datetime.now(timezone.utc)
-            update = {"$set": update_fields}
-            if fields_to_unset:
-                update["$unset"] = fields_to_unset
-            collection.update_one({"_id": doc["_id"]}, update)
-    return scanned, changed, conflicts
+            return None
+        update_fields["updated_at"] = datetime.now(timezone.utc)
+        update = {"$set": update_fields}
+        if fields_to_unset:
+            update["$unset"] = fields_to_unset
+        return update
+
+    report = run_migration(
+        db,
+        Migration(f"pretest_choice_fields:{collection_name}", collection_name, transform, query),
+        batch_size=args.batch_size,
+        workers=args.workers,
+        dry_run=not apply,
+        restart=args.restart,
+    )
+    return report.scanned, report.changed, report.counters.get("conflicts", 0)
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--apply", action="store_true", help="Write the normalized records to MongoDB.")
+    add_migration_arguments(parser)
     args = parser.parse_args()
 
     client = MongoClient(os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017"))
@@ -249,22 +259,32 @@ def main():
         question_results.append((
             collection_name,
             migrate_collection(
-                db[collection_name],
+                db,
+                collection_name,
                 question_query,
                 build_question_update,
                 QUESTION_LEGACY_FIELDS,
                 QUESTION_CANONICAL_ALIASES,
                 args.apply,
+                args,
             ),
         ))
     attempt_result = migrate_collection(
-        db.parsons_test_attempts,
+        db,
+        "parsons_test_attempts",
         attempt_query,
         build_attempt_update,
         ATTEMPT_LEGACY_FIELDS,
         ATTEMPT_CANONICAL_ALIASES,
         args.apply,
+        args,
     )
+    if args.apply:
+        db.cache_versions.update_one(
+            {"_id": EXAM_PAPER_CACHE_NAME},
+            {"$inc": {"version": 1}, "$currentDate": {"updated_at": True}},
+            upsert=True,
+        )
     mode = "applied" if args.apply else "preview"
     for collection_name, result in question_results:
         print(f"{mode}: {collection_name} scanned={result[0]} changed={result[1]} conflicts={result[2]}")
@@ -1,4 +1,5 @@
 # 預防同個帳號在不同裝置同時登入，造成 session 被覆蓋的問題。 資安防護
+import json
 from datetime import datetime, timezone
 from functools import wraps
 
@@ -19,14 +20,35 @@ def _utc_now():
     return datetime.now(timezone.utc)
 
 
+# navigator.sendBeacon 無法設定 header，這些 endpoint 允許把 token 放在 body。
+BEACON_TOKEN_ENDPOINTS = {
+    "video_rewatch_logs.create_video_rewatch_log_batch",
+}
+
+
+def request_json_or_beacon():
+    """JSON body, also accepting the text/plain body sendBeacon produces."""
+    if request.is_json:
+        data = request.get_json(silent=True)
+    else:
+        try:
+            data = json.loads(request.get_data(cache=True, as_text=True) or "null")
+        except ValueError:
+            data = None
+    return data if isinstance(data, dict) else {}
+
+
 def _bearer_token():
     authorization = str(request.headers.get("Authorization") or "").strip()
     if authorization.lower().startswith("bearer "):
         return authorization[7:].strip()
-    return str(request.headers.get("X-User-Token") or "").strip()
+    token = str(request.headers.get("X-User-Token") or "").strip()
+    if not token and request.method == "POST" and request.endpoint in BEACON_TOKEN_ENDPOINTS:
+        token = str(request_json_or_beacon().get("session_token") or "").strip()
+    return token
 
 
-def _role_set(roles):
+def role_set(roles):
     if roles is None:
         return None
     if isinstance(roles, str):
@@ -42,16 +64,39 @@ def current_participant_id():
     return str((getattr(g, "current_user", None) or {}).get("_id") or "").strip()
 
 
+AUTH_UNAVAILABLE_PAYLOAD = {
+    "ok": False,
+    "error": "authentication_service_unavailable",
+    "message": "登入驗證服務暫時無法使用，請稍後再試。",
+}
+
+FORBIDDEN_PAYLOAD = {
+    "ok": False,
+    "error": "forbidden",
+    "message": "您沒有權限使用此功能。",
+}
+
+STUDENT_IDENTITY_MISMATCH_PAYLOAD = {
+    "ok": False,
+    "error": "student_identity_mismatch",
+    "message": "不得存取其他學生的資料。",
+}
+
+
 def _student_identity_matches(user):
+    sources = [request.args, request.form]
+    if request.is_json:
+        sources.append(request.get_json(silent=True) or {})
+    return identity_claims_match(user, sources)
+
+
+def identity_claims_match(user, sources):
+    """Any ``student_id`` / ``participant_id`` claimed in ``sources`` belongs to ``user``."""
     student_id = str(user.get("student_id") or "").strip()
     user_id = str(user.get("_id") or "").strip()
     if not student_id:
         return False
 
-    sources = [request.args, request.form]
-    if request.is_json:
-        sources.append(request.get_json(silent=True) or {})
-
     for source in sources:
         claimed_student_id = str(source.get("student_id") or "").strip()
         if claimed_student_id and claimed_student_id != student_id:
@@ -76,30 +121,18 @@ def active_session_guard(roles=None):
         user = db.users.find_one({"active_session_id": token})
     except PyMongoError:
         current_app.logger.exception("Active session lookup failed")
-        return jsonify({
-            "ok": False,
-            "error": "authentication_service_unavailable",
-            "message": "登入驗證服務暫時無法使用，請稍後再試。",
-        }), 503
+        return jsonify(AUTH_UNAVAILABLE_PAYLOAD), 503
 
     if not user:
         return jsonify(SESSION_EXPIRED_PAYLOAD), 401
 
-    allowed_roles = _role_set(roles)
+    allowed_roles = role_set(roles)
     role = str(user.get("role") or "student")
     if allowed_roles is not None and role not in allowed_roles:
-        return jsonify({
-            "ok": False,
-            "error": "forbidden",
-            "message": "您沒有權限使用此功能。",
-        }), 403
+        return jsonify(FORBIDDEN_PAYLOAD), 403
 
     if role == "student" and not _student_identity_matches(user):
-        return jsonify({
-            "ok": False,
-            "error": "student_identity_mismatch",
-            "message": "不得存取其他學生的資料。",
-        }), 403
+        return jsonify(STUDENT_IDENTITY_MISMATCH_PAYLOAD), 403
 
     g.current_user = user
     g.active_session_id = token
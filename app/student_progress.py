@@ -0,0 +1,253 @@
+"""Denormalized student home-page progress.
+
+The student home page used to rebuild its numbers on every load from the
+video catalog, ``parsons_attempts``, ``test_control``, ``parsons_test_tasks``
+and ``parsons_test_attempts``.  Instead:
+
+* ``student_progress`` keeps one document per student (``_id`` is the
+  student id) with the completed practice video ids and the posttest tasks
+  already answered.  Submissions maintain it with ``$addToSet``; a document
+  without ``seeded`` is rebuilt once from the attempt collections.
+* The catalog of active videos per unit, their labels and the per-cycle
+  posttest status are shared by every student and cached in process behind
+  the ``student_home_catalog`` stamp, which video activate/delete/upload,
+  unit label edits and posttest toggles bump.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from .cache_versions import bump_cache_version, cached_cache_version
+from .db import db
+from .unit_labels import sort_units, unit_label_map
+
+
+STUDENT_PROGRESS_COLLECTION = "student_progress"
+STUDENT_HOME_CATALOG_CACHE_NAME = "student_home_catalog"
+DEFAULT_TEST_CYCLE_ID = "2026_07_batch_01"
+
+_CATALOG_LOCK = threading.Lock()
+_CATALOG_STATE: Dict[str, Any] = {"version": None, "units": None, "posttest": {}}
+
+
+def now_utc() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _catalog_check_seconds() -> float:
+    try:
+        return max(0.0, float(os.getenv("STUDENT_HOME_CATALOG_CHECK_SEC", "5")))
+    except ValueError:
+        return 5.0
+
+
+def _post_done_key(test_cycle_id: str, task_id: Any) -> str:
+    return f"{test_cycle_id}|{task_id}"
+
+
+# ---------------------------------------------------------------------------
+# Write side
+# ---------------------------------------------------------------------------
+
+def record_practice_completion(student_id: str, video_id: Any) -> None:
+    """Mark a practice video as completed after a correct submission."""
+    sid = str(student_id or "").strip()
+    vid = str(video_id or "").strip()
+    if not sid or not vid:
+        return
+    try:
+        db[STUDENT_PROGRESS_COLLECTION].update_one(
+            {"_id": sid},
+            {
+                "$addToSet": {"completed_video_ids": vid},
+                "$set": {"updated_at": now_utc()},
+            },
+            upsert=True,
+        )
+    except PyMongoError as exc:
+        print("[student_progress] practice update failed:", repr(exc))
+
+
+def record_test_submission(student_id: str, test_cycle_id: str, test_role: str, task_id: Any) -> None:
+    """Count one answered posttest task; pretest submissions are not shown."""
+    sid = str(student_id or "").strip()
+    if not sid or str(test_role or "").strip() != "post" or task_id in (None, ""):
+        return
+    try:
+        db[STUDENT_PROGRESS_COLLECTION].update_one(
+            {"_id": sid},
+            {
+                "$addToSet": {"post_done_keys": _post_done_key(test_cycle_id, task_id)},
+                "$set": {"updated_at": now_utc()},
+            },
+            upsert=True,
+        )
+    except PyMongoError as exc:
+        print("[student_progress] test update failed:", repr(exc))
+
+
+def rebuild_student_progress(student_id: str) -> Dict[str, Any]:
+    """Seed a student's document from the attempt collections (run once)."""
+    sid = str(student_id or "").strip()
+    completed = [
+        str(item)
+        for item in db.parsons_attempts.distinct(
+            "video_id",
+            {"student_id": sid, "is_correct": True, "video_id": {"$ne": None}},
+        )
+        if item is not None
+    ]
+    post_done = [
+        _post_done_key(row["_id"].get("test_cycle_id") or "", row["_id"].get("task_id"))
+        for row in db.parsons_test_attempts.aggregate([
+            {"$match": {"student_id": sid, "test_role": "post"}},
+            {"$group": {"_id": {"test_cycle_id": "$test_cycle_id", "task_id": "$task_id"}}},
+        ])
+    ]
+    # $addToSet keeps submissions that raced with the rebuild.
+    return db[STUDENT_PROGRESS_COLLECTION].find_one_and_update(
+        {"_id": sid},
+        {
+            "$addToSet": {
+                "completed_video_ids": {"$each": completed},
+                "post_done_keys": {"$each": post_done},
+            },
+            "$set": {"seeded": True, "updated_at": now_utc()},
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    ) or {}
+
+
+# ---------------------------------------------------------------------------
+# Read side
+# ---------------------------------------------------------------------------
+
+def load_student_home(student_id: str) -> Tuple[str, Dict[str, Any]]:
+    """Return ``(test_cycle_id, progress_doc)`` with one indexed round trip."""
+    sid = str(student_id or "").strip()
+    rows = list(db.users.aggregate([
+        {"$match": {"student_id": sid}},
+        {"$limit": 1},
+        {"$project": {"_id": 0, "student_id": 1, "test_cycle_id": 1}},
+        {
+            "$lookup": {
+                "from": STUDENT_PROGRESS_COLLECTION,
+                "localField": "student_id",
+                "foreignField": "_id",
+                "as": "progress",
+            }
+        },
+    ]))
+    if not rows:
+        # Same fallback as the legacy lookup: an unknown user has no cycle.
+        progress = db[STUDENT_PROGRESS_COLLECTION].find_one({"_id": sid}) or {}
+        test_cycle_id = ""
+    else:
+        row = rows[0]
+        progress = (row.get("progress") or [{}])[0]
+        test_cycle_id = str(row.get("test_cycle_id") or "").strip() or DEFAULT_TEST_CYCLE_ID
+    if not progress.get("seeded"):
+        progress = rebuild_student_progress(sid)
+    return test_cycle_id, progress
+
+
+def _load_units() -> List[Dict[str, Any]]:
+    videos = db.videos.find(
+        {"deleted": {"$ne": True}, "is_deleted": {"$ne": True}},
+        {"_id": 1, "unit": 1, "is_active": 1, "active": 1},
+    )
+    unit_videos: Dict[str, List[str]] = {}
+    for video in videos:
+        # 只計算「啟用」的影片；若 schema 不叫 is_active，預設 True
+        if not video.get("is_active", video.get("active", True)):
+            continue
+        unit = (video.get("unit") or "").strip()
+        if unit:
+            unit_videos.setdefault(unit, []).append(str(video.get("_id")))
+    labels = unit_label_map(unit_videos.keys())
+    return [
+        {
+            "unit": unit,
+            "unit_label": labels.get(unit) or unit,
+            "video_ids": frozenset(unit_videos.get(unit) or []),
+        }
+        for unit in sort_units(unit_videos.keys(), labels)
+    ]
+
+
+def _load_posttest(test_cycle_id: str) -> Dict[str, Any]:
+    ctrl = db.test_control.find_one({"_id": f"post_open:{test_cycle_id}"}) or {}
+    if not ctrl and test_cycle_id == DEFAULT_TEST_CYCLE_ID:
+        ctrl = db.test_control.find_one({"_id": "post_open:default"}) or {}
+    total = db.parsons_test_tasks.count_documents(
+        {"test_cycle_id": test_cycle_id, "test_role": "post", "deleted": {"$ne": True}}
+    )
+    if total == 0 and test_cycle_id == DEFAULT_TEST_CYCLE_ID:
+        total = db.parsons_test_tasks.count_documents(
+            {"test_cycle_id": "default", "test_role": "post", "deleted": {"$ne": True}}
+        )
+    return {"post_open": bool(ctrl.get("post_open", False)), "total": int(total)}
+
+
+def student_home_catalog(test_cycle_id: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Return the cached ``(units, posttest)`` catalog for one test cycle."""
+    version = cached_cache_version(STUDENT_HOME_CATALOG_CACHE_NAME, _catalog_check_seconds())
+    with _CATALOG_LOCK:
+        if version is None or version != _CATALOG_STATE["version"]:
+            _CATALOG_STATE.update(version=version, units=None, posttest={})
+        units = _CATALOG_STATE["units"]
+        posttest = _CATALOG_STATE["posttest"].get(test_cycle_id)
+    if units is None:
+        units = _load_units()
+    if posttest is None:
+        posttest = _load_posttest(test_cycle_id)
+    with _CATALOG_LOCK:
+        if _CATALOG_STATE["version"] == version and version is not None:
+            _CATALOG_STATE["units"] = units
+            _CATALOG_STATE["posttest"][test_cycle_id] = posttest
+    return units, posttest
+
+
+def invalidate_student_home_catalog() -> None:
+    """Call after videos, unit labels or posttest switches change."""
+    with _CATALOG_LOCK:
+        _CATALOG_STATE.update(version=None, units=None, posttest={})
+    bump_cache_version(STUDENT_HOME_CATALOG_CACHE_NAME)
+
+
+def units_progress_payload(student_id: str) -> Dict[str, Any]:
+    test_cycle_id, progress = load_student_home(student_id)
+    units, posttest = student_home_catalog(test_cycle_id)
+
+    completed = set(progress.get("completed_video_ids") or [])
+    units_out = []
+    for unit in units:
+        total = len(unit["video_ids"])
+        done = len(unit["video_ids"] & completed)
+        units_out.append({
+            "unit": unit["unit"],
+            "unit_label": unit["unit_label"],
+            "total_videos": total,
+            "done_videos": done,
+            "progress": round((done / total) * 100) if total else 0,
+        })
+
+    prefix = f"{test_cycle_id}|"
+    post_done = sum(1 for key in (progress.get("post_done_keys") or []) if str(key).startswith(prefix))
+    return {
+        "units": units_out,
+        "posttest": {
+            "test_cycle_id": test_cycle_id,
+            "post_open": posttest["post_open"],
+            "done": int(post_done),
+            "total": int(posttest["total"]),
+        },
+    }
@@ -0,0 +1,159 @@
+"""Lean, student-facing snapshots of ``parsons_tasks`` documents.
+
+A generated task document keeps everything the generator produced: the
+prompt source with its subtitle preview, the subtitle text it used, the
+compact AI segments, selector / policy metadata, rule checks, the debug
+dump and the environment.  Loading a task for a student, grading a
+submission or building a hint used to read the whole document, so every
+request decoded and transferred that baggage to use a few fields.
+
+``parsons_task_snapshots`` keeps one document per task (``_id`` is the task
+``_id``) holding only :data:`SNAPSHOT_FIELDS`: the question, blocks, slots,
+pool, slot hints, concept map and chapter map, and the labels the grading and
+hint code reads.  Publishing a task writes its snapshot; student paths read
+it with :func:`load_task_snapshot`, which builds a missing snapshot from the
+task with the same projection, so tasks published before snapshots existed
+(and test source tasks that were never published) work unchanged.
+
+Visibility (``enabled`` / ``status`` / ``review_status``) is not copied:
+which task is live is still decided by querying ``parsons_tasks``, so
+publishing a sibling or unpublishing never leaves a stale flag behind.
+Teacher writes that change the content call :func:`drop_task_snapshot`; a
+snapshot older than ``TASK_SNAPSHOT_MAX_AGE_SEC`` is rebuilt as well, which
+bounds how long a task edited directly in MongoDB stays stale.  Teacher
+tools keep reading the full document from ``parsons_tasks``.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import PyMongoError
+
+from .db import db
+
+
+TASK_SNAPSHOT_COLLECTION = "parsons_task_snapshots"
+
+SNAPSHOT_FIELDS = (
+    # 題目內容
+    "question_text",
+    "question",
+    "title",
+    "task_title",
+    "solution_blocks",
+    "distractor_blocks",
+    "pool",
+    "template_slots",
+    "ai_slot_hints",
+    "slot_hints",
+    "hide_semantic_zh",
+    "ai_feedback",
+    # 概念對應（slot → concept、章節）
+    "slot_concept_map",
+    "ai_slot_hints_concept",
+    "concept",
+    "concept_tag",
+    "tags",
+    "target_concept",
+    "task_family",
+    "family",
+    "control_structure",
+    "course_category",
+    "relation_category",
+    "unit_category",
+    "concept_chapters_formal",
+    "teacher_concept_chapters",
+    "teacher_concept_version_key",
+    "concept_align_status",
+    # 影片與難度
+    "video_id",
+    "video_id_str",
+    "video_title",
+    "unit",
+    "unit_type",
+    "level",
+    "version",
+)
+
+TASK_SNAPSHOT_PROJECTION = {field: 1 for field in SNAPSHOT_FIELDS}
+
+
+def _max_age_seconds() -> float:
+    try:
+        return max(0.0, float(os.getenv("TASK_SNAPSHOT_MAX_AGE_SEC", "3600")))
+    except ValueError:
+        return 3600.0
+
+
+def _task_oid(task_id: Any) -> Optional[ObjectId]:
+    if isinstance(task_id, ObjectId):
+        return task_id
+    try:
+        return ObjectId(str(task_id or "").strip())
+    except (InvalidId, TypeError):
+        return None
+
+
+def _store(task: Dict[str, Any]) -> Dict[str, Any]:
+    snapshot = {field: task[field] for field in SNAPSHOT_FIELDS if field in task}
+    snapshot["_id"] = task["_id"]
+    try:
+        db[TASK_SNAPSHOT_COLLECTION].replace_one(
+            {"_id": task["_id"]},
+            {**snapshot, "snapshot_at": time.time()},
+            upsert=True,
+        )
+    except PyMongoError as exc:
+        # 快照只是讀取捷徑；寫不進去時仍回傳這次讀到的內容。
+        print("[task_snapshots] store failed:", repr(exc))
+    return snapshot
+
+
+def publish_task_snapshot(task_id: Any) -> Optional[Dict[str, Any]]:
+    """(Re)write the snapshot of ``task_id`` from ``parsons_tasks``."""
+    oid = _task_oid(task_id)
+    if oid is None:
+        return None
+    task = db.parsons_tasks.find_one({"_id": oid}, TASK_SNAPSHOT_PROJECTION)
+    if not task:
+        drop_task_snapshot(oid)
+        return None
+    return _store(task)
+
+
+def load_task_snapshot(task_id: Any) -> Optional[Dict[str, Any]]:
+    """The student-facing fields of ``task_id``; ``None`` when the task does not exist."""
+    oid = _task_oid(task_id)
+    if oid is None:
+        return None
+    try:
+        snapshot = db[TASK_SNAPSHOT_COLLECTION].find_one({"_id": oid})
+    except PyMongoError as exc:
+        print("[task_snapshots] load failed:", repr(exc))
+        snapshot = None
+    if snapshot:
+        snapshot_at = snapshot.pop("snapshot_at", None)
+        max_age = _max_age_seconds()
+        if not max_age or time.time() - float(snapshot_at or 0) < max_age:
+            return snapshot
+    return publish_task_snapshot(oid)
+
+
+def drop_task_snapshot(task_id: Any) -> None:
+    """Forget the snapshot after a teacher edit; the next read rebuilds it."""
+    drop_task_snapshots([task_id])
+
+
+def drop_task_snapshots(task_ids: Iterable[Any]) -> None:
+    oids = [oid for oid in (_task_oid(task_id) for task_id in task_ids) if oid is not None]
+    if not oids:
+        return
+    try:
+        db[TASK_SNAPSHOT_COLLECTION].delete_many({"_id": {"$in": oids}})
+    except PyMongoError as exc:
+        print("[task_snapshots] drop failed:", repr(exc))
@@ -0,0 +1,316 @@
+"""Bulk user CSV import, run as a background job.
+
+Importing a cohort used to cost, per CSV row, a ``users.find_one``, an
+``update_one`` or ``insert_one``, a randomization slot claim and a password
+hash (scrypt: tens of milliseconds of CPU under the GIL), all inside the
+upload request.  Six hundred students took minutes and the proxy gave up
+on the request first.
+
+:func:`run_user_import` does the same work in bulk:
+
+1. one ``$in`` query per ``LOOKUP_CHUNK_SIZE`` student ids for the users
+   that already exist;
+2. the passwords that need hashing are hashed in a process pool of
+   ``IMPORT_HASH_WORKERS`` processes (each with its own salt), started with
+   :func:`app.password_verify.spawn_pool` so the children load only
+   ``werkzeug.security``;
+3. inserts and updates go out as unordered ``bulk_write`` batches of
+   ``WRITE_CHUNK_SIZE``; a failed operation marks only its own row;
+4. students that should be randomized claim their slots together through
+   :func:`app.randomization.assign_feedback_strategies_on_import`.
+
+The caller validates the CSV and decides, per row, which fields to set and
+which password (if any) to hash; the pipeline returns one result per row.
+
+:func:`start_import_job` runs such a pipeline in a worker thread of the
+process that received the upload and keeps the job in ``user_import_jobs``,
+so any server process can answer the status poll.  Only the user who
+started a job may poll it.  A running job whose heartbeat stops for
+``JOB_STALE_SEC`` (the process was restarted) is reported as ``stale``;
+importing the same CSV again is safe.  A queued job has no heartbeat yet
+(it waits behind the import in progress) and is never stale.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from itertools import repeat
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from werkzeug.security import generate_password_hash
+
+from .db import db
+from .password_verify import default_pool_workers, spawn_pool
+from .randomization import RandomizationSlotsExhausted, assign_feedback_strategies_on_import
+
+
+USER_IMPORT_JOBS = "user_import_jobs"
+LOOKUP_CHUNK_SIZE = 1000
+WRITE_CHUNK_SIZE = 500
+IMPORT_HASH_WORKERS = max(0, int(os.environ.get("IMPORT_HASH_WORKERS", str(default_pool_workers()))))
+# 少量帳號直接在背景執行緒雜湊，省下啟動行程池的時間。
+HASH_POOL_MIN_PASSWORDS = 16
+JOB_STALE_SEC = 300
+JOB_TTL_DAYS = 7
+
+Progress = Callable[[str, int, int], None]
+
+_INDEX_READY = False
+_EXECUTOR_LOCK = threading.Lock()
+_EXECUTOR: Optional[Tuple[int, ThreadPoolExecutor]] = None
+
+
+@dataclass
+class ImportRow:
+    """One validated CSV row; ``data`` holds the parsed values for the caller's callbacks."""
+
+    row: int
+    student_id: str
+    data: Dict[str, Any]
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _no_progress(stage: str, done: int, total: int) -> None:
+    return None
+
+
+def _chunks(items: List[Any], size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# ---------------------------------------------------------------------------
+# Pipeline
+# ---------------------------------------------------------------------------
+
+def existing_users(student_ids: List[str], lookup_filter: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+    users: Dict[str, Dict[str, Any]] = {}
+    for chunk in _chunks(list(dict.fromkeys(student_ids)), LOOKUP_CHUNK_SIZE):
+        for user in db.users.find({**(lookup_filter or {}), "student_id": {"$in": chunk}}):
+            users[user["student_id"]] = user
+    return users
+
+
+def hash_passwords(passwords: List[str], method: Optional[str] = None, progress: Progress = _no_progress) -> List[str]:
+    """``generate_password_hash`` for every password, in a process pool when worthwhile."""
+    method_args = () if method is None else (method,)
+    total = len(passwords)
+    if IMPORT_HASH_WORKERS <= 0 or total < HASH_POOL_MIN_PASSWORDS:
+        hashes = []
+        for password in passwords:
+            hashes.append(generate_password_hash(password, *method_args))
+            if len(hashes) % 100 == 0:
+                progress("hashing", len(hashes), total)
+        return hashes
+
+    hashes = []
+    workers = min(IMPORT_HASH_WORKERS, total)
+    # 由已有執行緒的伺服器行程啟動，不能用 fork；子行程只載入 werkzeug.security。
+    with spawn_pool(workers) as executor:
+        arguments = [passwords] + [repeat(value) for value in method_args]
+        for password_hash in executor.map(generate_password_hash, *arguments, chunksize=max(1, total // (workers * 4))):
+            hashes.append(password_hash)
+            if len(hashes) % 100 == 0:
+                progress("hashing", len(hashes), total)
+    return hashes
+
+
+def _write_chunk(operations: List[Any]) -> Dict[int, str]:
+    """Unordered ``bulk_write``; ``{operation index: reason}`` for the failed ones."""
+    try:
+        db.users.bulk_write(operations, ordered=False)
+    except BulkWriteError as exc:
+        failed = {}
+        for error in exc.details.get("writeErrors") or []:
+            failed[int(error["index"])] = "duplicate_student_id" if error.get("code") == 11000 else "row_write_failed"
+        return failed
+    except PyMongoError as exc:
+        print("[user_import] bulk write failed:", repr(exc))
+        return {index: "row_write_failed" for index in range(len(operations))}
+    return {}
+
+
+def _assignment_error(exc: Exception) -> str:
+    if isinstance(exc, RandomizationSlotsExhausted):
+        return "randomization_slots_exhausted"
+    return "randomization_assignment_failed"
+
+
+def run_user_import(
+    rows: List[ImportRow],
+    fields_for: Callable[[ImportRow, Optional[Dict[str, Any]], datetime], Dict[str, Any]],
+    password_for: Callable[[ImportRow, Optional[Dict[str, Any]]], Optional[str]],
+    *,
+    hash_method: Optional[str] = None,
+    lookup_filter: Optional[Dict[str, Any]] = None,
+    randomize: Optional[Callable[[ImportRow, Dict[str, Any]], bool]] = None,
+    progress: Progress = _no_progress,
+) -> List[Dict[str, Any]]:
+    """Insert or update ``rows``; one result per row, in row order.
+
+    ``fields_for(row, existing, now)`` returns the fields to ``$set`` (the
+    whole document for a new user); ``password_for(row, existing)`` returns
+    the password to hash, or ``None`` to keep the stored one.  Existing users
+    are matched on ``student_id`` plus ``lookup_filter``.  When
+    ``randomize(row, fields)`` is true the written student claims a
+    randomization slot.  A student id repeated in the file is written once
+    with its last row; the earlier rows are reported as skipped.
+    """
+    last_row = {row.student_id: row.row for row in rows}
+    results = {
+        row.row: {"row": row.row, "student_id": row.student_id, "action": "skipped", "reason": "duplicate_student_id_in_file"}
+        for row in rows
+        if last_row[row.student_id] != row.row
+    }
+    rows = [row for row in rows if last_row[row.student_id] == row.row]
+
+    progress("lookup", 0, len(rows))
+    existing = existing_users([row.student_id for row in rows], lookup_filter)
+    now = _utc_now()
+    planned = []
+    for row in rows:
+        current = existing.get(row.student_id)
+        planned.append((row, current, fields_for(row, current, now), password_for(row, current)))
+
+    to_hash = [index for index, (_row, _current, _fields, password) in enumerate(planned) if password is not None]
+    progress("hashing", 0, len(to_hash))
+    hashes = hash_passwords([planned[index][3] for index in to_hash], hash_method, progress)
+    for index, password_hash in zip(to_hash, hashes):
+        planned[index][2]["password_hash"] = password_hash
+
+    written = 0
+    for chunk in _chunks(planned, WRITE_CHUNK_SIZE):
+        operations = [
+            UpdateOne({"_id": current["_id"]}, {"$set": fields}) if current else InsertOne(dict(fields))
+            for _row, current, fields, _password in chunk
+        ]
+        failed = _write_chunk(operations)
+        for index, (row, current, _fields, _password) in enumerate(chunk):
+            result = {"row": row.row, "student_id": row.student_id}
+            if index in failed:
+                result.update(action="failed", reason=failed[index])
+            else:
+                result["action"] = "updated" if current else "inserted"
+            results[row.row] = result
+        written += len(chunk)
+        progress("writing", written, len(planned))
+
+    if randomize is not None:
+        candidates = [
+            row.student_id
+            for row, _current, fields, _password in planned
+            if results[row.row]["action"] != "failed" and randomize(row, fields)
+        ]
+        progress("assigning", 0, len(candidates))
+        try:
+            assignments = assign_feedback_strategies_on_import(candidates)
+        except (PyMongoError, RuntimeError, ValueError) as exc:
+            print("[user_import] randomization failed:", repr(exc))
+            assignments = {sid: exc for sid in candidates}
+        by_student = {result["student_id"]: result for result in results.values() if result["action"] != "skipped"}
+        for sid, assignment in assignments.items():
+            if isinstance(assignment, Exception):
+                by_student[sid]["assignment_error"] = _assignment_error(assignment)
+                by_student[sid]["assignment_detail"] = str(assignment)
+            else:
+                by_student[sid]["assignment"] = assignment
+        progress("assigning", len(candidates), len(candidates))
+
+    return [results[number] for number in sorted(results)]
+
+
+# ---------------------------------------------------------------------------
+# Background jobs
+# ---------------------------------------------------------------------------
+
+def ensure_import_job_indexes() -> None:
+    global _INDEX_READY
+    if _INDEX_READY:
+        return
+    try:
+        db[USER_IMPORT_JOBS].create_index("expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+        _INDEX_READY = True
+    except PyMongoError as exc:
+        print("[user_import] index ensure failed:", repr(exc))
+
+
+def _job_executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None or _EXECUTOR[0] != os.getpid():
+            # 一次只跑一個匯入，避免兩份 CSV 同時搶研究分派名額與 CPU。
+            _EXECUTOR = (os.getpid(), ThreadPoolExecutor(max_workers=1, thread_name_prefix="user-import"))
+        return _EXECUTOR[1]
+
+
+def _update_job(job_id: str, fields: Dict[str, Any]) -> None:
+    try:
+        db[USER_IMPORT_JOBS].update_one({"_id": job_id}, {"$set": {**fields, "heartbeat_at": _utc_now()}})
+    except PyMongoError as exc:
+        print("[user_import] job update failed:", repr(exc))
+
+
+def _run_job(job_id: str, work: Callable[[Progress], Dict[str, Any]]) -> None:
+    def progress(stage: str, done: int, total: int) -> None:
+        _update_job(job_id, {"progress": {"stage": stage, "done": done, "total": total}})
+
+    _update_job(job_id, {"status": "running", "started_at": _utc_now()})
+    try:
+        result = work(progress)
+    except Exception as exc:
+        print("[user_import] job failed:", repr(exc))
+        _update_job(job_id, {"status": "failed", "error": repr(exc), "finished_at": _utc_now()})
+        return
+    _update_job(job_id, {"status": "done", "result": result, "finished_at": _utc_now()})
+
+
+def start_import_job(kind: str, created_by: str, total_rows: int, work: Callable[[Progress], Dict[str, Any]]) -> str:
+    """Queue ``work(progress)``; its return value becomes the job's ``result``."""
+    ensure_import_job_indexes()
+    job_id = uuid4().hex
+    now = _utc_now()
+    db[USER_IMPORT_JOBS].insert_one({
+        "_id": job_id,
+        "kind": kind,
+        "status": "queued",
+        "created_by": created_by,
+        "created_at": now,
+        "heartbeat_at": now,
+        "progress": {"stage": "queued", "done": 0, "total": total_rows},
+        "expires_at": now + timedelta(days=JOB_TTL_DAYS),
+    })
+    _job_executor().submit(_run_job, job_id, work)
+    return job_id
+
+
+def import_job_status(job_id: str, kind: str, created_by: str) -> Optional[Dict[str, Any]]:
+    """The job's status for its creator; ``None`` for an unknown job or another user's."""
+    job = db[USER_IMPORT_JOBS].find_one({"_id": str(job_id or ""), "kind": kind})
+    # 結果含學號與錯誤原因，只讓發起匯入的人查詢。
+    if not job or str(job.get("created_by") or "") != str(created_by or ""):
+        return None
+    heartbeat = job.get("heartbeat_at")
+    if heartbeat is not None and heartbeat.tzinfo is None:
+        heartbeat = heartbeat.replace(tzinfo=timezone.utc)
+    status = job.get("status")
+    if status == "running" and heartbeat is not None and _utc_now() - heartbeat > timedelta(seconds=JOB_STALE_SEC):
+        status = "stale"
+    return {
+        "job_id": job["_id"],
+        "status": status,
+        "progress": job.get("progress") or {},
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "created_at": job.get("created_at"),
+        "finished_at": job.get("finished_at"),
+    }
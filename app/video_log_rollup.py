@@ -0,0 +1,200 @@
+"""Per-student, per-video, per-day rollups of ``video_rewatch_logs``.
+
+Raw playback events older than the retention window are moved to an archive
+collection by ``tools/rollup_video_rewatch_logs.py`` and summarized here into
+``video_rewatch_daily``, one document per student, video and Taipei calendar
+day.  ``teacher_analysis._read_video_rewatch_logs`` returns those summaries
+next to the raw rows (``event_type == "daily_summary"``) so the teacher
+totals still cover archived days; resume positions live in
+``video_playback_state`` and do not depend on the raw log.
+
+This module is pure: the tool reads events and writes the returned
+documents itself.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from math import isfinite
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+VIDEO_REWATCH_DAILY_COLLECTION = "video_rewatch_daily"
+VIDEO_REWATCH_ARCHIVE_COLLECTION = "video_rewatch_logs_archive"
+DAILY_SUMMARY_EVENT_TYPE = "daily_summary"
+ROLLUP_SCHEMA_VERSION = 1
+
+TAIPEI_TZ = timezone(timedelta(hours=8))
+
+
+def _safe_float(value: Any) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if isfinite(number) else None
+
+
+def _as_utc(value: Any) -> Optional[datetime]:
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def is_auto_end_pause_event(log: Dict[str, Any]) -> bool:
+    """Players emit a pause right after ``ended``; it is not a student action."""
+    if str(log.get("event_type") or "") != "video_pause":
+        return False
+    if log.get("reached_end") is True or log.get("completed_fully") is True:
+        return True
+
+    current_time = _safe_float(log.get("current_time_sec"))
+    duration = _safe_float(log.get("video_duration_sec"))
+    return (
+        current_time is not None
+        and duration is not None
+        and duration > 0
+        and current_time >= duration - 0.5
+    )
+
+
+def watch_seconds_for_total(log: Dict[str, Any]) -> float:
+    delta = _safe_float(log.get("watch_delta_sec"))
+    if delta is not None:
+        return delta
+    seconds = _safe_float(log.get("watch_seconds"))
+    return seconds if seconds is not None else 0
+
+
+def event_time(log: Dict[str, Any]) -> Optional[datetime]:
+    for field in ("event_at", "recorded_at", "created_at"):
+        value = _as_utc(log.get(field))
+        if value is not None:
+            return value
+    return None
+
+
+def taipei_day(value: datetime) -> str:
+    return _as_utc(value).astimezone(TAIPEI_TZ).strftime("%Y-%m-%d")
+
+
+def taipei_day_bounds(day: str) -> Tuple[datetime, datetime]:
+    """UTC ``[start, end)`` of one Taipei calendar day."""
+    start = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=TAIPEI_TZ)
+    return start.astimezone(timezone.utc), (start + timedelta(days=1)).astimezone(timezone.utc)
+
+
+def summary_key(student_id: str, video_id: str, day: str) -> Dict[str, str]:
+    return {"student_id": student_id, "video_id": video_id, "day": day}
+
+
+def summarize_video_events(
+    events: Iterable[Dict[str, Any]],
+    rolled_up_at: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    """Fold raw events into ``video_rewatch_daily`` documents.
+
+    Auto-generated end-of-video pauses are skipped exactly as the teacher
+    view skips them, so the counts match what the raw rows would have shown.
+    Recomputing a day from the same events yields the same documents, which
+    makes replace-upserts idempotent.
+    """
+    rolled_up_at = rolled_up_at or datetime.now(timezone.utc)
+    groups: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+    for log in events:
+        if is_auto_end_pause_event(log):
+            continue
+        at = event_time(log)
+        student_id = str(log.get("student_id") or "").strip()
+        if at is None or not student_id:
+            continue
+        video_id = str(log.get("video_id") or "").strip()
+        day = taipei_day(at)
+        summary = groups.get((student_id, video_id, day))
+        if summary is None:
+            summary = groups[(student_id, video_id, day)] = {
+                "_id": summary_key(student_id, video_id, day),
+                "schema_version": ROLLUP_SCHEMA_VERSION,
+                "student_id": student_id,
+                "video_id": video_id or None,
+                "day": day,
+                "class_name": None,
+                "group_type": None,
+                "is_test_data": False,
+                "video_title": None,
+                "unit_id": None,
+                "event_count": 0,
+                "event_type_counts": {},
+                "watch_seconds_total": 0.0,
+                "completed_event_count": 0,
+                "seek_count": 0,
+                "backward_seek_count": 0,
+                "total_seek_distance": 0.0,
+                "max_current_time_sec": None,
+                "video_duration_sec": None,
+                "first_event_at": at,
+                "last_event_at": at,
+                "_sessions": set(),
+            }
+        event_type = str(log.get("event_type") or "review_watch")
+        summary["event_count"] += 1
+        summary["event_type_counts"][event_type] = summary["event_type_counts"].get(event_type, 0) + 1
+        summary["watch_seconds_total"] += watch_seconds_for_total(log)
+        if log.get("reached_end") is True or log.get("completed_fully") is True:
+            summary["completed_event_count"] += 1
+        if event_type == "video_seek":
+            summary["seek_count"] += 1
+            summary["total_seek_distance"] += abs(_safe_float(log.get("seek_delta_sec")) or 0)
+            if log.get("is_backward_seek") is True:
+                summary["backward_seek_count"] += 1
+        if log.get("watch_session_id"):
+            summary["_sessions"].add(str(log["watch_session_id"]))
+        if log.get("is_test_data") is True:
+            summary["is_test_data"] = True
+
+        current_time = _safe_float(log.get("current_time_sec"))
+        if current_time is not None:
+            previous = summary["max_current_time_sec"]
+            summary["max_current_time_sec"] = current_time if previous is None else max(previous, current_time)
+        if at <= summary["first_event_at"]:
+            summary["first_event_at"] = at
+        if at >= summary["last_event_at"]:
+            # 班級、組別等描述欄位以當天最後一筆事件為準。
+            summary["last_event_at"] = at
+            for field in ("class_name", "group_type", "video_title"):
+                summary[field] = log.get(field) or summary[field]
+            summary["unit_id"] = log.get("unit_id") or log.get("unit") or summary["unit_id"]
+            duration = _safe_float(log.get("video_duration_sec"))
+            if duration is not None:
+                summary["video_duration_sec"] = duration
+
+    results = []
+    for summary in groups.values():
+        sessions = summary.pop("_sessions")
+        summary["watch_session_count"] = len(sessions)
+        summary["watch_seconds_total"] = round(summary["watch_seconds_total"], 3)
+        summary["total_seek_distance"] = round(summary["total_seek_distance"], 3)
+        summary["rolled_up_at"] = rolled_up_at
+        results.append(summary)
+    return results
+
+
+def summary_record_weight(record: Dict[str, Any]) -> int:
+    """How many raw events a teacher-view row stands for."""
+    if record.get("is_daily_summary") is True:
+        try:
+            return max(0, int(record.get("event_count") or 0))
+        except (TypeError, ValueError):
+            return 0
+    return 1
+
+
+def summary_completed_weight(record: Dict[str, Any]) -> int:
+    if record.get("is_daily_summary") is True:
+        try:
+            return max(0, int(record.get("completed_event_count") or 0))
+        except (TypeError, ValueError):
+            return 0
+    return 1 if record.get("reached_end") is True or record.get("completed_fully") is True else 0
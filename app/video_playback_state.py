@@ -0,0 +1,220 @@
+"""Latest full-video playback state per (student, video).
+
+``video_rewatch_logs`` is an append-only event history.  Resuming a video
+used to search that history for the newest qualifying event on every video
+open; ``video_playback_state`` keeps the answer instead, one document per
+student and video with ``_id = {"student_id": ..., "video_id": ...}``:
+
+* ``resume_sec`` / ``last_event_type`` / ``last_event_at`` / ``reached_end`` /
+  ``completed`` from the newest resume-qualifying event;
+* ``video_duration_sec`` (latest reported), ``first_completed_at``,
+  ``watch_seconds_total`` (sum of ``watch_delta_sec``) and ``event_count``.
+
+Only full-video events update it: replaying a wrong segment (``start_sec``
+set) must not move the resume position.  Each event is applied with one
+pipeline upsert that ignores events older than the stored one, so retried or
+batched events may arrive out of order.  Because resume no longer depends on
+the log, old log documents can be archived without losing positions.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import PyMongoError
+
+from .db import db
+
+
+VIDEO_PLAYBACK_STATE_COLLECTION = "video_playback_state"
+
+# 排除剛點選影片所產生的 current_time_sec=0 紀錄（video_click / video_play）。
+RESUME_EVENT_TYPES = (
+    "video_progress",
+    "video_pause",
+    "video_seek",
+    "video_rate_change",
+    "video_leave",
+    "video_ended",
+)
+
+# 距離片尾 3 秒內視為看完。
+COMPLETION_TOLERANCE_SEC = 3
+
+
+def playback_state_key(student_id: str, video_id: str) -> Dict[str, str]:
+    return {"student_id": str(student_id), "video_id": str(video_id)}
+
+
+def is_completed(event_type: Any, reached_end: Any, current_time_sec: Optional[float], duration_sec: Optional[float]) -> bool:
+    current_time = current_time_sec or 0
+    return bool(
+        event_type == "video_ended"
+        or reached_end is True
+        or (
+            duration_sec is not None
+            and duration_sec > 0
+            and current_time >= duration_sec - COMPLETION_TOLERANCE_SEC
+        )
+    )
+
+
+def _literal(value: Any) -> Dict[str, Any]:
+    # 使用者輸入的字串可能以 "$" 開頭，在 pipeline 內必須當成常數。
+    return {"$literal": value}
+
+
+def playback_state_update(log_doc: Dict[str, Any]) -> Optional[list]:
+    """Return the pipeline update for one ``video_rewatch_logs`` document.
+
+    ``None`` means the event does not touch the full-video state.
+    """
+    if log_doc.get("segment_start_sec") is not None:
+        return None
+    event_at = log_doc.get("event_at")
+    if not isinstance(event_at, datetime):
+        return None
+
+    event_type = log_doc.get("event_type")
+    current_time = log_doc.get("current_time_sec")
+    duration = log_doc.get("video_duration_sec")
+    reached_end = bool(log_doc.get("reached_end") is True)
+    moves_position = event_type in RESUME_EVENT_TYPES and (current_time or 0) > 0
+    completed = is_completed(event_type, reached_end, current_time, duration)
+    now = log_doc.get("updated_at") or event_at
+
+    def _when_fresh(value: Any, field: str) -> Dict[str, Any]:
+        return {"$cond": ["$_fresh", _literal(value), f"${field}"]}
+
+    fields: Dict[str, Any] = {
+        "student_id": _literal(log_doc.get("student_id")),
+        "video_id": _literal(log_doc.get("video_id")),
+        "watch_seconds_total": {
+            "$add": [{"$ifNull": ["$watch_seconds_total", 0]}, float(log_doc.get("watch_delta_sec") or 0)]
+        },
+        "event_count": {"$add": [{"$ifNull": ["$event_count", 0]}, 1]},
+        "created_at": {"$ifNull": ["$created_at", _literal(now)]},
+        "updated_at": _literal(now),
+    }
+    if duration is not None:
+        fields["video_duration_sec"] = _literal(duration)
+    if moves_position:
+        fields.update({
+            "resume_sec": _when_fresh(current_time, "resume_sec"),
+            "last_event_type": _when_fresh(event_type, "last_event_type"),
+            "last_event_at": _when_fresh(event_at, "last_event_at"),
+            "reached_end": _when_fresh(reached_end, "reached_end"),
+            "completed": _when_fresh(completed, "completed"),
+        })
+        if completed:
+            fields["first_completed_at"] = {"$min": [{"$ifNull": ["$first_completed_at", _literal(event_at)]}, _literal(event_at)]}
+
+    # BSON 排序中 null 小於任何日期，沒有 last_event_at 的文件一律視為較舊。
+    fresh = {"$lte": [{"$ifNull": ["$last_event_at", None]}, _literal(event_at)]}
+    return [
+        {"$set": {"_fresh": fresh}},
+        {"$set": fields},
+        {"$project": {"_fresh": 0}},
+    ]
+
+
+def apply_playback_event(log_doc: Dict[str, Any]) -> None:
+    """Fold one logged event into ``video_playback_state``; never raises."""
+    update = playback_state_update(log_doc)
+    if update is None:
+        return
+    student_id = str(log_doc.get("student_id") or "").strip()
+    video_id = str(log_doc.get("video_id") or "").strip()
+    if not student_id or not video_id:
+        return
+    try:
+        db[VIDEO_PLAYBACK_STATE_COLLECTION].update_one(
+            {"_id": playback_state_key(student_id, video_id)},
+            update,
+            upsert=True,
+        )
+    except PyMongoError as exc:
+        print("[video_playback_state] update failed:", repr(exc))
+
+
+def playback_state_operations(log_docs: Iterable[Dict[str, Any]]) -> List[UpdateOne]:
+    """The upserts that fold ``log_docs`` into ``video_playback_state``."""
+    operations = []
+    for log_doc in log_docs:
+        update = playback_state_update(log_doc)
+        student_id = str(log_doc.get("student_id") or "").strip()
+        video_id = str(log_doc.get("video_id") or "").strip()
+        if update is None or not student_id or not video_id:
+            continue
+        operations.append(UpdateOne({"_id": playback_state_key(student_id, video_id)}, update, upsert=True))
+    return operations
+
+
+def apply_playback_events(log_docs: Iterable[Dict[str, Any]]) -> None:
+    """Fold a batch of events with one unordered ``bulk_write``; never raises.
+
+    Order does not matter: position fields only move forward in
+    ``event_at`` and the counters are sums.
+    """
+    operations = playback_state_operations(log_docs)
+    if not operations:
+        return
+    try:
+        db[VIDEO_PLAYBACK_STATE_COLLECTION].bulk_write(operations, ordered=False)
+    except PyMongoError as exc:
+        print("[video_playback_state] batch update failed:", repr(exc))
+
+
+def _latest_resume_event_from_log(student_id: str, video_id: str) -> Optional[Dict[str, Any]]:
+    return db.video_rewatch_logs.find_one(
+        {
+            "student_id": student_id,
+            "video_id": video_id,
+            # MongoDB 的 null 條件同時會匹配欄位不存在的舊資料。
+            "segment_start_sec": None,
+            "event_type": {"$in": list(RESUME_EVENT_TYPES)},
+            "current_time_sec": {"$gt": 0},
+        },
+        {
+            "student_id": 1,
+            "video_id": 1,
+            "event_type": 1,
+            "current_time_sec": 1,
+            "video_duration_sec": 1,
+            "reached_end": 1,
+            "event_at": 1,
+        },
+        sort=[("event_at", -1)],
+    )
+
+
+def is_settled_state(state: Optional[Dict[str, Any]]) -> bool:
+    """The stored state can be returned without consulting the event log."""
+    return state is not None and bool(state.get("last_event_type") or state.get("legacy_checked"))
+
+
+def read_playback_state(student_id: str, video_id: str) -> Optional[Dict[str, Any]]:
+    """Primary-key read of the resume state.
+
+    Students whose position only exists in events logged before this
+    collection existed are seeded once from the newest qualifying log event;
+    ``legacy_checked`` records that the log was already consulted.
+    """
+    key = playback_state_key(student_id, video_id)
+    collection = db[VIDEO_PLAYBACK_STATE_COLLECTION]
+    state = collection.find_one({"_id": key})
+    if is_settled_state(state):
+        return state
+
+    latest = _latest_resume_event_from_log(student_id, video_id)
+    if latest:
+        # 舊資料沒有逐筆 watch_delta_sec 的累計，只補續播位置。
+        apply_playback_event(dict(latest, watch_delta_sec=0))
+    return collection.find_one_and_update(
+        {"_id": key},
+        {"$set": {"legacy_checked": True}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
@@ -12,6 +12,15 @@ const AUTH_STORAGE_KEYS = [
   "user",
 ];
 
+// Student writes the backend replays by Idempotency-Key (app/idempotency.py).
+const IDEMPOTENT_API_PATHS = new Set([
+  "/api/parsons/submit",
+  "/api/parsons/test/submit",
+  "/api/learning_logs",
+  "/api/events/log",
+]);
+const IDEMPOTENT_RETRY_DELAYS_MS = [500, 1500];
+
 let handlingExpiredSession = false;
 let fetchInstalled = false;
 const axiosClients = new WeakSet();
@@ -69,6 +78,27 @@ function isBackendAxiosRequest(config) {
 }
 
 
+function idempotentApiPath(input, init) {
+  const method = String(init.method || input?.method || "GET").toUpperCase();
+  if (method !== "POST" || typeof init.body !== "string") return null;
+  const raw = typeof input === "string" ? input : input?.url;
+  try {
+    const { pathname } = new URL(raw, window.location.origin);
+    return IDEMPOTENT_API_PATHS.has(pathname) ? pathname : null;
+  } catch (_) {
+    return null;
+  }
+}
+
+
+function newIdempotencyKey() {
+  try {
+    if (globalThis.crypto?.randomUUID) return globalThis.crypto.randomUUID();
+  } catch (_) {}
+  return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+}
+
+
 export function handleSessionExpired(payload) {
   if (payload?.error !== "session_expired_due_to_new_login") return false;
   clearAuthState();
@@ -101,7 +131,25 @@ export function installFetchSessionHandling() {
       requestInit.headers = headers;
     }
 
-    const response = await originalFetch(input, requestInit);
+    let response;
+    if (isApiRequest(input) && idempotentApiPath(input, requestInit)) {
+      // One key per logical submission: a resend after a dropped connection
+      // gets the stored response instead of grading the answer twice.
+      if (!requestInit.headers.has("Idempotency-Key")) {
+        requestInit.headers.set("Idempotency-Key", newIdempotencyKey());
+      }
+      for (let attempt = 0; ; attempt += 1) {
+        try {
+          response = await originalFetch(input, requestInit);
+          break;
+        } catch (err) {
+          if (attempt >= IDEMPOTENT_RETRY_DELAYS_MS.length) throw err;
+          await new Promise((resolve) => setTimeout(resolve, IDEMPOTENT_RETRY_DELAYS_MS[attempt]));
+        }
+      }
+    } else {
+      response = await originalFetch(input, requestInit);
+    }
     if (response.status === 401 && isApiRequest(input)) {
       const payload = await response.clone().json().catch(() => null);
       handleSessionExpired(payload);
@@ -0,0 +1,56 @@
+# 多行程部署（Linux／容器）：gunicorn -c gunicorn.conf.py run:app
+# Windows 無法使用 gunicorn，請改用 ASGI_WORKERS=N python run_asgi.py（見 docs/DEPLOYMENT.md）。
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+load_dotenv()
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '5000')}"
+
+# 每個 worker 一個 CPU 核心；I/O 等待由 worker 內的執行緒承擔。
+workers = max(1, int(os.environ.get("WEB_CONCURRENCY") or multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = max(4, int(os.environ.get("WAITRESS_THREADS", "8")))
+# 讓 app/password_verify.py 知道有幾個 worker：多 worker 時每個 worker 預設只開一個雜湊行程，
+# 避免雜湊行程總數變成核心數的平方。
+os.environ.setdefault("WEB_CONCURRENCY", str(workers))
+
+# AI 提示生成含重試可能超過一分鐘。
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "180"))
+graceful_timeout = 30
+max_requests = 2000
+max_requests_jitter = 200
+
+# MongoClient 與 OpenAI client 在匯入 app 時建立，必須在 fork 之後才建立，
+# 因此不預先載入 app；master 行程也不得匯入 app 套件。
+preload_app = False
+
+
+def on_starting(server):
+    """在 fork 前以獨立連線建立租約與冪等回應集合的 TTL 索引，避免每個 worker 同時建立。"""
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    client = MongoClient(
+        os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017"),
+        serverSelectionTimeoutMS=5000,
+    )
+    try:
+        db = client[os.environ.get("MONGO_DATABASE", "thesis_system")]
+        for name in ("request_leases", "idempotent_responses"):
+            db[name].create_index("expires_at", name="expires_at_ttl", expireAfterSeconds=0)
+    except PyMongoError as exc:
+        server.log.warning("TTL index ensure failed: %r", exc)
+    finally:
+        client.close()
+
+
+def post_fork(server, worker):
+    from app.metrics import record_capacity
+    from app.password_verify import warm_password_pool
+
+    record_capacity("gunicorn_threads", threads)
+    record_capacity("gunicorn_workers", workers)
+    # 每個 worker 各自的密碼比對行程池（多 worker 時預設各一個行程）。
+    warm_password_pool()
@@ -1,8 +1,13 @@
 import os
 from dotenv import load_dotenv
 load_dotenv()
-from app import create_app
-app = create_app()
+# 密碼比對行程池以 spawn 啟動，子行程會以 __mp_main__ 重新匯入本檔；
+# 子行程只做雜湊，不需要建立 app（以及 MongoDB／OpenAI client）。
+if __name__ != "__mp_main__":
+    from app import create_app
+    from app.metrics import record_capacity
+    from app.password_verify import warm_password_pool
+    app = create_app()
 if __name__ == "__main__":
     try:
         from waitress import serve
@@ -14,6 +19,8 @@ if __name__ == "__main__":
     host = os.environ.get("HOST", "0.0.0.0")
     port = int(os.environ.get("PORT", "5000"))
     threads = max(4, int(os.environ.get("WAITRESS_THREADS", "8")))
+    record_capacity("waitress_threads", threads)
+    warm_password_pool()
     print(f"Starting backend on http://{host}:{port}", flush=True)
 
     serve(
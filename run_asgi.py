@@ -0,0 +1,30 @@
+import os
+from dotenv import load_dotenv
+load_dotenv()
+# 密碼比對行程池以 spawn 啟動，子行程會以 __mp_main__ 重新匯入本檔，不需要建立 app。
+if __name__ != "__mp_main__":
+    from app.asgi import create_asgi_app
+    app = create_asgi_app()
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError as exc:
+        raise SystemExit(
+            "Uvicorn is required for the async mode. Run: pip install uvicorn"
+        ) from exc
+
+    host = os.environ.get("HOST", "0.0.0.0")
+    port = int(os.environ.get("PORT", "5000"))
+    workers = max(1, int(os.environ.get("ASGI_WORKERS", "1")))
+    print(f"Starting async backend on http://{host}:{port} with {workers} worker(s)", flush=True)
+
+    # 多個 worker 時 uvicorn 以 spawn 啟動子行程，各自重新匯入 run_asgi:app。
+    uvicorn.run(
+        "run_asgi:app" if workers > 1 else app,
+        host=host,
+        port=port,
+        workers=workers,
+        # 預設上限 1000 個同時連線；長時間等待 LLM 的請求也算在內。
+        limit_concurrency=int(os.environ.get("ASGI_MAX_CONNECTIONS", "1000")),
+        log_level=os.environ.get("LOG_LEVEL", "info").lower(),
+    )
@@ -0,0 +1,161 @@
+"""One-time backfill of the fields the teacher question list sorts and shows.
+
+Older ``parsons_tasks`` documents may lack ``created_at`` (manual imports)
+or, for fixed tasks, ``task_code``.  The list endpoint used to repair them
+with one ``update_one`` per task on every GET; it is now read-only, so run
+this once after deploying:
+
+    python scripts/backfill_parsons_task_list_fields.py [--dry-run]
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import ConnectionFailure, PyMongoError, ServerSelectionTimeoutError
+
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+load_dotenv(PROJECT_ROOT / ".env")
+
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017")
+MONGO_DATABASE = os.environ.get("MONGO_DATABASE", "thesis_system")
+
+BATCH_SIZE = 500
+
+
+def _is_blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _source_type(doc):
+    return (
+        (doc.get("source_type") or "").strip().lower()
+        or (doc.get("gen_source") or "").strip().lower()
+        or ("ai" if bool(doc.get("ai_generated")) else "fixed")
+    )
+
+
+def _created_sort_value(doc):
+    raw = doc.get("created_at") or doc.get("created_at_utc")
+    if isinstance(raw, datetime):
+        return raw if raw.tzinfo else raw.replace(tzinfo=timezone.utc)
+    if isinstance(raw, str) and raw.strip():
+        text = raw.strip()
+        if text.endswith(("Z", "z")):
+            text = text[:-1] + "+00:00"
+        try:
+            parsed = datetime.fromisoformat(text)
+            return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+    oid = doc.get("_id")
+    if isinstance(oid, ObjectId):
+        return oid.generation_time
+    return datetime.min.replace(tzinfo=timezone.utc)
+
+
+def _video_key(doc):
+    return str(doc.get("video_id") or doc.get("video_id_str") or "")
+
+
+def _plan_updates(docs):
+    """Return ``(operations, stats)`` matching the old list-time backfill."""
+    stats = {"created_at": 0, "task_code": 0}
+    updates = {}
+
+    for doc in docs:
+        if _is_blank(doc.get("created_at")) and isinstance(doc.get("_id"), ObjectId):
+            created_at = doc.get("created_at_utc") or doc["_id"].generation_time
+            doc["created_at"] = created_at
+            updates.setdefault(doc["_id"], {})["created_at"] = created_at
+            stats["created_at"] += 1
+
+    fixed_by_video = {}
+    for doc in docs:
+        if _source_type(doc) == "fixed":
+            fixed_by_video.setdefault(_video_key(doc), []).append(doc)
+
+    for fixed_docs in fixed_by_video.values():
+        fixed_docs.sort(key=lambda doc: (_created_sort_value(doc), str(doc.get("_id") or "")))
+        for position, doc in enumerate(fixed_docs, start=1):
+            if _is_blank(doc.get("task_code")) and isinstance(doc.get("_id"), ObjectId):
+                updates.setdefault(doc["_id"], {})["task_code"] = f"FIXED-{position:02d}"
+                stats["task_code"] += 1
+
+    operations = [
+        UpdateOne({"_id": oid}, {"$set": fields})
+        for oid, fields in updates.items()
+    ]
+    return operations, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="print the counts without writing")
+    args = parser.parse_args()
+
+    client = MongoClient(
+        MONGO_URI,
+        serverSelectionTimeoutMS=5000,
+        connectTimeoutMS=5000,
+    )
+    try:
+        client.admin.command("ping")
+        db = client[MONGO_DATABASE]
+        print(f"Connected to MongoDB database: {MONGO_DATABASE}")
+
+        docs = list(
+            db.parsons_tasks.find(
+                {},
+                {
+                    "_id": 1,
+                    "video_id": 1,
+                    "video_id_str": 1,
+                    "created_at": 1,
+                    "created_at_utc": 1,
+                    "task_code": 1,
+                    "source_type": 1,
+                    "gen_source": 1,
+                    "ai_generated": 1,
+                },
+            )
+        )
+        operations, stats = _plan_updates(docs)
+        print(f"parsons_tasks scanned: {len(docs)}")
+        print(f"  created_at to backfill: {stats['created_at']}")
+        print(f"  fixed task_code to backfill: {stats['task_code']}")
+
+        if args.dry_run:
+            print("\nDry run: no documents were modified.")
+            return 0
+
+        modified = 0
+        for start in range(0, len(operations), BATCH_SIZE):
+            result = db.parsons_tasks.bulk_write(
+                operations[start:start + BATCH_SIZE],
+                ordered=False,
+            )
+            modified += result.modified_count
+        print(f"\nDone. modified documents: {modified}")
+        return 0
+    except (ServerSelectionTimeoutError, ConnectionFailure):
+        print(
+            "MongoDB connection failed. Please confirm MongoDB is running on "
+            "127.0.0.1:27017."
+        )
+        return 1
+    except PyMongoError as exc:
+        print(f"MongoDB update failed: {exc}")
+        return 1
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
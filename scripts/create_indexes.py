@@ -15,6 +15,9 @@ from pymongo.errors import (
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 load_dotenv(PROJECT_ROOT / ".env")
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.log_storage import is_timeseries_collection  # noqa: E402
 
 MONGO_URI = os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017")
 MONGO_DATABASE = os.environ.get("MONGO_DATABASE", "thesis_system")
@@ -187,6 +190,32 @@ INDEX_SPECS = {
             "name": "class_group_event_at_1",
         },
     ],
+    "request_leases": [
+        {"keys": [("expires_at", ASCENDING)], "name": "expires_at_ttl", "expireAfterSeconds": 0},
+    ],
+    "idempotent_responses": [
+        {"keys": [("expires_at", ASCENDING)], "name": "expires_at_ttl", "expireAfterSeconds": 0},
+    ],
+    "user_import_jobs": [
+        {"keys": [("expires_at", ASCENDING)], "name": "expires_at_ttl", "expireAfterSeconds": 0},
+    ],
+    "concept_align_results": [
+        {"keys": [("expires_at", ASCENDING)], "name": "expires_at_ttl", "expireAfterSeconds": 0},
+        {
+            "keys": [("task_id", ASCENDING), ("content_hash", ASCENDING), ("version_key", ASCENDING)],
+            "name": "task_content_version_1",
+        },
+    ],
+    "parsons_tasks": [
+        {
+            "keys": [("video_id", ASCENDING), ("created_at", DESCENDING)],
+            "name": "video_created_at_-1",
+        },
+        {
+            "keys": [("video_id_str", ASCENDING), ("created_at", DESCENDING)],
+            "name": "video_id_str_created_at_-1",
+        },
+    ],
 }
 
 
@@ -206,6 +235,8 @@ def _find_compatible_index(collection, spec):
             continue
         if index.get("partialFilterExpression") != spec.get("partialFilterExpression"):
             continue
+        if index.get("expireAfterSeconds") != spec.get("expireAfterSeconds"):
+            continue
         return index.get("name")
     return None
 
@@ -295,6 +326,8 @@ def _create_collection_indexes(db, collection_name, specs):
             options["sparse"] = True
         if spec.get("partialFilterExpression"):
             options["partialFilterExpression"] = spec["partialFilterExpression"]
+        if "expireAfterSeconds" in spec:
+            options["expireAfterSeconds"] = spec["expireAfterSeconds"]
         try:
             created_name = collection.create_index(spec["keys"], **options)
             print(f"[created] {collection_name}.{created_name}")
@@ -339,6 +372,10 @@ def main():
 
         failures = []
         for collection_name, specs in INDEX_SPECS.items():
+            if is_timeseries_collection(db, collection_name):
+                # LOG_STORAGE_MODE=timeseries 的索引由 app/log_storage.py 管理。
+                print(f"\n[skip] {collection_name} is a time-series collection")
+                continue
             print(f"\nCreating/checking {collection_name} indexes...")
             failures.extend(
                 f"{collection_name}.{name}"
@@ -1,3 +1,4 @@
+import argparse
 import os
 import sys
 from datetime import datetime, timezone
@@ -10,6 +11,9 @@ from pymongo.errors import ConnectionFailure, PyMongoError, ServerSelectionTimeo
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 load_dotenv(PROJECT_ROOT / ".env")
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.bulk_migration import Migration, add_migration_arguments, run_migration  # noqa: E402
 
 MONGO_URI = os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017")
 MONGO_DATABASE = os.environ.get("MONGO_DATABASE", "thesis_system")
@@ -82,44 +86,26 @@ def _coerce_to_date(value, fallback):
     return fallback, "generated_fallback"
 
 
-def _normalize_collection(db, collection_name):
-    collection = db[collection_name]
-    docs = list(
-        collection.find(
-            MISSING_OR_STRING_DATE_QUERY,
-            {"_id": 1, "created_at": 1, "updated_at": 1},
-        )
-    )
-
-    stats = {
-        "matched": len(docs),
-        "modified": 0,
-        "converted_string": 0,
-        "generated_missing": 0,
-        "generated_fallback": 0,
-        "already_date": 0,
-    }
-
-    for doc in docs:
-        now = _utc_now()
-        update_fields = {}
-        for field in DATE_FIELDS:
-            value = doc.get(field)
-            date_value, reason = _coerce_to_date(value, now)
-            stats[reason] += 1
-            if not isinstance(value, datetime):
-                update_fields[field] = date_value
-
-        if not update_fields:
-            continue
-
-        result = collection.update_one({"_id": doc["_id"]}, {"$set": update_fields})
-        stats["modified"] += result.modified_count
-
-    return stats
+def _normalize_dates(doc, counters):
+    now = _utc_now()
+    update_fields = {}
+    for field in DATE_FIELDS:
+        value = doc.get(field)
+        date_value, reason = _coerce_to_date(value, now)
+        counters[reason] += 1
+        if not isinstance(value, datetime):
+            update_fields[field] = date_value
+    if not update_fields:
+        return None
+    return {"$set": update_fields}
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Store parsons question created_at / updated_at as Date values.")
+    parser.add_argument("--dry-run", action="store_true", help="Preview changes without writing to MongoDB.")
+    add_migration_arguments(parser)
+    args = parser.parse_args()
+
     client = MongoClient(
         MONGO_URI,
         serverSelectionTimeoutMS=5000,
@@ -132,15 +118,33 @@ def main():
         print(f"Connected to MongoDB database: {MONGO_DATABASE}")
 
         for collection_name in COLLECTIONS:
-            stats = _normalize_collection(db, collection_name)
+            migration = Migration(
+                f"normalize_parsons_question_dates:{collection_name}",
+                collection_name,
+                _normalize_dates,
+                MISSING_OR_STRING_DATE_QUERY,
+                {"_id": 1, "created_at": 1, "updated_at": 1},
+            )
+            report = run_migration(
+                db,
+                migration,
+                batch_size=args.batch_size,
+                workers=args.workers,
+                dry_run=args.dry_run,
+                restart=args.restart,
+            )
             print(f"\n{collection_name}")
-            print(f"  matched documents: {stats['matched']}")
-            print(f"  modified documents: {stats['modified']}")
-            print(f"  converted string date fields: {stats['converted_string']}")
-            print(f"  generated missing date fields: {stats['generated_missing']}")
-            print(f"  generated fallback date fields: {stats['generated_fallback']}")
-
-        print("\nDone. created_at and updated_at are stored as MongoDB Date values.")
+            print(f"  matched documents: {report.scanned}")
+            print(f"  modified documents: {report.modified}")
+            print(f"  converted string date fields: {report.counters.get('converted_string', 0)}")
+            print(f"  generated missing date fields: {report.counters.get('generated_missing', 0)}")
+            print(f"  generated fallback date fields: {report.counters.get('generated_fallback', 0)}")
+            print(f"  throughput: {report.docs_per_sec:.0f} docs/s")
+
+        if args.dry_run:
+            print("\ndry-run only; no documents were changed.")
+        else:
+            print("\nDone. created_at and updated_at are stored as MongoDB Date values.")
         return 0
     except (ServerSelectionTimeoutError, ConnectionFailure):
         print(
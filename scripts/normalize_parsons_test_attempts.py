@@ -14,6 +14,9 @@ from pymongo.errors import PyMongoError, ServerSelectionTimeoutError
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 load_dotenv(PROJECT_ROOT / ".env")
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.bulk_migration import Migration, add_migration_arguments, run_migration  # noqa: E402
 
 MONGO_URI = os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017")
 MONGO_DATABASE = os.environ.get("MONGO_DATABASE", "thesis_system")
@@ -311,6 +314,7 @@ def main():
         description="Normalize parsons_test_attempts to use task_id and full answer fields."
     )
     parser.add_argument("--dry-run", action="store_true", help="Preview changes without writing to MongoDB.")
+    add_migration_arguments(parser)
     args = parser.parse_args()
 
     client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
@@ -332,33 +336,32 @@ def main():
             {"incorrect_slots": {"$exists": False}},
         ]
     }
-
-    matched = 0
-    updated = 0
-    missing_question = 0
+    # 題目數量少，同一題只查一次。
+    questions = {}
+
+    def transform(attempt, counters):
+        task_id = canonical_task_id(attempt)
+        key = (normalize_id(attempt.get("test_role")).lower(), task_id)
+        if key not in questions:
+            questions[key] = find_question(db, attempt.get("test_role"), task_id)
+        if not questions[key]:
+            counters["missing_question_context"] += 1
+        return build_update(attempt, build_question_context(questions[key] or {}))
 
     try:
-        cursor = db.parsons_test_attempts.find(query)
-        for attempt in cursor:
-            matched += 1
-            task_id = canonical_task_id(attempt)
-            question = find_question(db, attempt.get("test_role"), task_id)
-            if not question:
-                missing_question += 1
-            context = build_question_context(question or {})
-            update_doc = build_update(attempt, context)
-            if args.dry_run:
-                print(f"[dry-run] would update _id={attempt.get('_id')} task_id={task_id}")
-                continue
-            result = db.parsons_test_attempts.update_one({"_id": attempt["_id"]}, update_doc)
-            updated += result.modified_count
+        report = run_migration(
+            db,
+            Migration("normalize_parsons_test_attempts", "parsons_test_attempts", transform, query),
+            batch_size=args.batch_size,
+            workers=args.workers,
+            dry_run=args.dry_run,
+            restart=args.restart,
+        )
     except PyMongoError as exc:
         print(f"MongoDB update failed: {exc}")
         return 1
 
-    print(f"matched: {matched}")
-    print(f"updated: {updated if not args.dry_run else 0}")
-    print(f"missing_question_context: {missing_question}")
+    print(report.summary())
     if args.dry_run:
         print("dry-run only; no documents were changed.")
     return 0
@@ -0,0 +1,118 @@
+import asyncio
+
+import httpx
+from flask import Flask, Response, request
+
+from app import asgi
+
+
+def _flask_app():
+    app = Flask(__name__)
+
+    @app.post("/echo")
+    def echo():
+        return {"length": len(request.get_data()), "type": request.content_type}
+
+    @app.get("/stream")
+    def stream():
+        return Response((f"line {index}\n" for index in range(3)), mimetype="text/plain")
+
+    return app
+
+
+def _request(app, method, url, **kwargs):
+    async def _send():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, url, **kwargs)
+
+    return asyncio.run(_send())
+
+
+def test_bridge_passes_bodies_and_streams_responses():
+    app = asgi.create_asgi_app(_flask_app())
+    posted = _request(app, "POST", "/echo", content=b"x" * 5000, headers={"Content-Type": "text/plain"})
+    assert posted.json() == {"length": 5000, "type": "text/plain"}
+    streamed = _request(app, "GET", "/stream")
+    assert streamed.text == "line 0\nline 1\nline 2\n"
+
+
+def test_native_route_rejects_missing_session_with_cors_headers():
+    app = asgi.create_asgi_app(_flask_app())
+    origin = sorted(app.origins)[0]
+    response = _request(app, "POST", "/api/video_rewatch_logs/batch", json={"events": []}, headers={"Origin": origin})
+    assert response.status_code == 401
+    assert response.json()["error"] == "session_expired_due_to_new_login"
+    assert response.headers["access-control-allow-origin"] == origin
+
+
+def test_uploads_support_ranges_and_conditional_requests(tmp_path, monkeypatch):
+    (tmp_path / "clip.mp4").write_bytes(bytes(range(256)) * 4)
+    monkeypatch.setattr(asgi, "UPLOAD_ROUTES", (("/uploads/", "serve_uploads", str(tmp_path)),))
+    app = asgi.create_asgi_app(_flask_app())
+
+    partial = _request(app, "GET", "/uploads/clip.mp4", headers={"Range": "bytes=10-19"})
+    assert partial.status_code == 206
+    assert partial.content == bytes(range(10, 20))
+    assert partial.headers["content-range"] == "bytes 10-19/1024"
+
+    full = _request(app, "GET", "/uploads/clip.mp4")
+    assert len(full.content) == 1024
+    cached = _request(app, "GET", "/uploads/clip.mp4", headers={"If-None-Match": full.headers["etag"]})
+    assert cached.status_code == 304
+    assert _request(app, "GET", "/uploads/..%2Fsecret.txt").status_code == 404
+    assert _request(app, "GET", "/uploads/clip.mp4", headers={"Range": "bytes=5000-"}).status_code == 416
+
+
+def test_parse_byte_range():
+    assert asgi.parse_byte_range("bytes=0-", 100) == (0, 99)
+    assert asgi.parse_byte_range("bytes=-10", 100) == (90, 99)
+    assert asgi.parse_byte_range("bytes=50-500", 100) == (50, 99)
+    assert asgi.parse_byte_range("bytes=0-1,5-6", 100) is None
+
+
+def test_oversized_native_body_is_413_and_delegated_requests_are_counted_once(monkeypatch):
+    events = []
+    flask_app = _flask_app()
+    flask_app.before_request(lambda: events.append("flask") and None)
+    monkeypatch.setattr(asgi, "request_started", lambda: events.append("started"))
+    monkeypatch.setattr(asgi, "request_finished", lambda: events.append("finished"))
+    monkeypatch.setattr(asgi, "NATIVE_BODY_LIMIT", 100)
+    app = asgi.create_asgi_app(flask_app)
+
+    too_large = _request(app, "POST", "/api/video_rewatch_logs/batch", content=b'{"session_token": "' + b"x" * 200 + b'"}')
+    assert too_large.status_code == 413
+    assert too_large.json()["error"] == "request_too_large"
+    assert events == ["started", "finished"]
+
+    async def delegate(request, sender):
+        await request.body()
+        return asgi.DELEGATE
+
+    events.clear()
+    app.native_routes[("POST", "/echo")] = ("echo", delegate)
+    assert _request(app, "POST", "/echo", content=b"abc").json()["length"] == 3
+    # Flask 端的 install_request_metrics 自己計數；ASGI 端在轉交前就結束計數。
+    assert events == ["started", "finished", "flask"]
+
+
+def test_hint_state_answers_503_when_the_state_lookup_fails(monkeypatch):
+    from pymongo.errors import PyMongoError
+
+    class _States:
+        async def find_one(self, query):
+            raise PyMongoError("down")
+
+    class _AsyncDB:
+        parsons_ai_hint_state = _States()
+
+    async def active_user(self, request, roles, beacon=False):
+        return {"student_id": "s1", "role": "student", "feedback_strategy": "B"}, None
+
+    monkeypatch.setattr(asgi.AsyncServingApp, "adb", property(lambda self: _AsyncDB()))
+    monkeypatch.setattr(asgi.AsyncServingApp, "active_user", active_user)
+    app = asgi.create_asgi_app(_flask_app())
+
+    response = _request(app, "GET", "/api/parsons/hint_state?task_id=t1")
+    assert response.status_code == 503
+    assert response.json()["ok"] is False
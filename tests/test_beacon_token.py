@@ -0,0 +1,40 @@
+import json
+
+from flask import Flask
+
+from app import session_auth
+
+
+def _app():
+    app = Flask(__name__)
+
+    @app.post("/batch", endpoint="video_rewatch_logs.create_video_rewatch_log_batch")
+    def batch():
+        return {"token": session_auth._bearer_token(), "events": session_auth.request_json_or_beacon().get("events")}
+
+    @app.post("/other")
+    def other():
+        return {"token": session_auth._bearer_token()}
+
+    return app
+
+
+def test_beacon_body_token_is_accepted_only_on_beacon_endpoints():
+    client = _app().test_client()
+    body = json.dumps({"events": [{"event_type": "video_leave"}], "session_token": "tok"})
+
+    beacon = client.post("/batch", data=body, content_type="text/plain;charset=UTF-8").get_json()
+    assert beacon == {"token": "tok", "events": [{"event_type": "video_leave"}]}
+
+    other = client.post("/other", data=body, content_type="text/plain;charset=UTF-8").get_json()
+    assert other == {"token": ""}
+
+
+def test_authorization_header_still_wins():
+    client = _app().test_client()
+    response = client.post(
+        "/batch",
+        json={"events": [], "session_token": "body"},
+        headers={"Authorization": "Bearer header"},
+    )
+    assert response.get_json()["token"] == "header"
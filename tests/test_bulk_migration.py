@@ -0,0 +1,159 @@
+import pytest
+
+from app import bulk_migration
+from app.bulk_migration import Migration, run_migration
+
+
+class _Result:
+    def __init__(self, modified_count=0):
+        self.modified_count = modified_count
+
+
+def _matches(doc, query):
+    for field, expected in query.items():
+        if field == "$and":
+            if not all(_matches(doc, part) for part in expected):
+                return False
+        elif isinstance(expected, dict):
+            value = doc.get(field)
+            if "$gt" in expected and not value > expected["$gt"]:
+                return False
+            if "$gte" in expected and not value >= expected["$gte"]:
+                return False
+            if "$lt" in expected and not value < expected["$lt"]:
+                return False
+            if "$exists" in expected and (field in doc) != expected["$exists"]:
+                return False
+        elif doc.get(field) != expected:
+            return False
+    return True
+
+
+class _Cursor(list):
+    def sort(self, keys):
+        field, direction = keys[0]
+        return _Cursor(sorted(self, key=lambda doc: doc[field], reverse=direction < 0))
+
+    def skip(self, count):
+        return _Cursor(self[count:])
+
+    def limit(self, count):
+        return _Cursor(self[:count])
+
+
+class _Collection:
+    """find / bulk_write / the checkpoint operations with MongoDB's semantics."""
+
+    def __init__(self, name, docs=()):
+        self.name = name
+        self.docs = {doc["_id"]: dict(doc) for doc in docs}
+        self.bulk_writes = 0
+
+    def find(self, query, projection=None):
+        return _Cursor(dict(doc) for doc in self.docs.values() if _matches(doc, query))
+
+    def find_one(self, query):
+        doc = self.docs.get(query["_id"])
+        return dict(doc) if doc else None
+
+    def count_documents(self, query):
+        return len(self.find(query))
+
+    def bulk_write(self, operations, ordered=True):
+        self.bulk_writes += 1
+        for operation in operations:
+            doc = self.docs[operation._filter["_id"]]
+            doc.update(operation._doc.get("$set") or {})
+            for field in operation._doc.get("$unset") or {}:
+                doc.pop(field, None)
+        return _Result(len(operations))
+
+    def replace_one(self, query, doc, upsert=False):
+        self.docs[query["_id"]] = dict(doc)
+
+    def update_one(self, query, update):
+        doc = self.docs[query["_id"]]
+        for path, value in update["$set"].items():
+            if path.startswith("partitions."):
+                doc["partitions"][int(path.split(".")[1])] = dict(value)
+            else:
+                doc[path] = value
+
+
+class _DB(dict):
+    def __missing__(self, name):
+        self[name] = _Collection(name)
+        return self[name]
+
+
+def _db(count):
+    return _DB(attempts=_Collection("attempts", [
+        {"_id": index, "status": "old", **({"legacy": True} if index % 2 == 0 else {})} for index in range(count)
+    ]))
+
+
+def _normalize(doc, counters):
+    if doc["_id"] % 5 == 0:
+        counters["skipped"] += 1
+        return None
+    return {"$set": {"status": "new"}, "$unset": {"legacy": ""}}
+
+
+def test_partitions_batches_and_dry_run_diff(monkeypatch):
+    db = _db(40)
+    migration = Migration("normalize", "attempts", _normalize, {"status": "old"})
+
+    preview = run_migration(db, migration, batch_size=5, workers=3, dry_run=True, log=lambda line: None)
+    assert preview.partitions == 3
+    assert (preview.scanned, preview.changed, preview.modified) == (40, 32, 0)
+    assert preview.counters == {"skipped": 8}
+    assert preview.fields == {"set:status": 32, "unset:legacy": 16}
+    assert db["attempts"].bulk_writes == 0
+    assert bulk_migration.MIGRATION_PROGRESS_COLLECTION not in db
+
+    report = run_migration(db, migration, batch_size=5, workers=3, log=lambda line: None)
+    assert (report.scanned, report.changed, report.modified) == (40, 32, 32)
+    assert db["attempts"].bulk_writes == 9
+    assert sum(doc["status"] == "new" for doc in db["attempts"].docs.values()) == 32
+    assert db[bulk_migration.MIGRATION_PROGRESS_COLLECTION].docs["normalize"]["status"] == "done"
+
+    # 沒有變化的更新不寫入。
+    again = run_migration(db, migration, batch_size=5, workers=3, log=lambda line: None)
+    assert (again.scanned, again.changed) == (8, 0)
+
+
+def test_interrupted_run_resumes_from_the_checkpoint():
+    db = _db(30)
+    seen = []
+    fail_at = {17}
+
+    def transform(doc, counters):
+        if doc["_id"] in fail_at:
+            fail_at.clear()
+            raise RuntimeError("connection lost")
+        seen.append(doc["_id"])
+        counters["normalized"] += 1
+        return {"$set": {"status": "new"}}
+
+    migration = Migration("resumable", "attempts", transform)
+    with pytest.raises(RuntimeError):
+        run_migration(db, migration, batch_size=4, workers=2, log=lambda line: None)
+    checkpoint = db[bulk_migration.MIGRATION_PROGRESS_COLLECTION].docs["resumable"]
+    assert checkpoint["status"] == "running"
+
+    report = run_migration(db, migration, batch_size=4, workers=2, log=lambda line: None)
+    assert report.resumed
+    assert report.scanned == 30
+    assert all(doc["status"] == "new" for doc in db["attempts"].docs.values())
+    # 只有中斷時那一批會重讀。
+    assert len(seen) - len(set(seen)) <= 4
+    assert report.counters["normalized"] == 30
+
+
+def test_numeric_ids_partition_across_int_and_float_but_not_strings():
+    db = _DB(attempts=_Collection("attempts", [{"_id": value, "status": "old"} for value in (1, 2.5, 4, 7.0, 9)]))
+    report = run_migration(db, Migration("mixed", "attempts", _normalize), batch_size=2, workers=2, log=lambda line: None)
+    assert report.partitions == 2 and report.scanned == 5
+
+    assert bulk_migration._bson_type_class(True) != bulk_migration._bson_type_class(1)
+    assert bulk_migration._bson_type_class("s1") != bulk_migration._bson_type_class(1.5)
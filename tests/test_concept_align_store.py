@@ -0,0 +1,157 @@
+from app import concept_align_store
+from app.concept_align_store import AlignKey
+
+
+class _DB(dict):
+    def __getattr__(self, name):
+        return self[name]
+
+
+class _Cursor(list):
+    def sort(self, keys):
+        field, direction = keys[0]
+        return _Cursor(sorted(self, key=lambda doc: doc[field], reverse=direction < 0))
+
+    def limit(self, count):
+        return _Cursor(self[:count])
+
+
+class _Collection:
+    def __init__(self):
+        self.docs = {}
+
+    def create_index(self, *args, **kwargs):
+        return kwargs.get("name")
+
+    def find_one(self, query):
+        return self.docs.get(query["_id"])
+
+    def find(self, query):
+        return _Cursor(doc for doc in self.docs.values() if all(doc.get(key) == value for key, value in query.items()))
+
+    def replace_one(self, query, doc, upsert=False):
+        self.docs[query["_id"]] = dict(doc)
+
+
+def _key(start, end, **overrides):
+    fields = dict(task_id="t1", content_hash="c1", version_key="v1", mode="teacher_range_only", model="m")
+    fields.update(overrides)
+    return AlignKey.build(range_start=start, range_end=end, **fields)
+
+
+def test_exact_key_and_narrowest_covering_range(monkeypatch):
+    collection = _Collection()
+    monkeypatch.setattr(concept_align_store, "db", _DB({concept_align_store.ALIGN_RESULT_COLLECTION: collection}))
+
+    concept_align_store.save_result(_key(0, 120), {"draft_raw": ["wide"]})
+    concept_align_store.save_result(_key(10, 100), {"draft_raw": ["narrow"]})
+    concept_align_store.save_result(_key(None, None), {"draft_raw": ["whole"]})
+    concept_align_store.save_result(_key(20, 90, model="other"), {"draft_raw": ["other model"]})
+
+    assert concept_align_store.load_result(_key(0, 120.001))["draft_raw"] == ["wide"]
+    assert concept_align_store.load_result(_key(0, 121)) is None
+
+    assert concept_align_store.find_covering_result(_key(20, 90))["draft_raw"] == ["narrow"]
+    assert concept_align_store.find_covering_result(_key(5, 90))["draft_raw"] == ["wide"]
+    assert concept_align_store.find_covering_result(_key(5, 130))["draft_raw"] == ["whole"]
+    # 開放端點只會被開放端點涵蓋；內容不同的題目不共用結果。
+    assert concept_align_store.find_covering_result(_key(None, 90))["draft_raw"] == ["whole"]
+    assert concept_align_store.find_covering_result(_key(20, 90, content_hash="c2")) is None
+
+
+def _srt(lines):
+    def stamp(seconds):
+        return f"00:{seconds // 60:02d}:{seconds % 60:02d},000"
+
+    return "\n\n".join(
+        f"{index}\n{stamp(index * 10 - 10)} --> {stamp(index * 10)}\n{text}"
+        for index, text in enumerate(lines, start=1)
+    )
+
+
+class _Tasks:
+    def __init__(self, task):
+        self.task = task
+
+    def find_one(self, query):
+        return dict(self.task) if query.get("_id") == self.task["_id"] else None
+
+    def update_one(self, query, update):
+        self.task.update(update.get("$set") or {})
+
+
+def test_align_route_hits_reclamps_and_misses(monkeypatch):
+    from bson import ObjectId
+    from flask import Flask
+
+    from app.routes import parsons_concept_align as align
+
+    task = {"_id": ObjectId(), "solution_blocks": [{"text": "n = int(input())"}, {"text": "print(n)"}]}
+    results = _Collection()
+    monkeypatch.setenv("AI_ENABLED", "1")
+    monkeypatch.setattr(align, "db", _DB(parsons_tasks=_Tasks(task)))
+    monkeypatch.setattr(concept_align_store, "db", _DB({concept_align_store.ALIGN_RESULT_COLLECTION: results}))
+    monkeypatch.setattr(align, "drop_task_snapshot", lambda task_id: None)
+    monkeypatch.setattr(align, "_get_subtitle_for_task", lambda task: _srt([
+        "先用 input 讀取輸入", "input 讀進來要用 int 轉整數", "接著 for 迴圈 重複", "for i in range 計數",
+        "if 條件判斷", "if 判斷成立", "最後 print 印出", "print 輸出結果", "結束", "下課",
+    ]))
+    monkeypatch.setattr(align, "generate_ai_chapter_suggestions", lambda chapters, segments: {"rename_suggestions": [], "missing_concepts": []})
+
+    real_extract = align.extract_concept_chapters
+    extracted = []
+
+    def extract(compact, **kwargs):
+        # 只替換 AI 抽取；區間長度與 rule-based 檢查照常執行。
+        guards = real_extract(compact, **{**kwargs, "guards_only": True})
+        if kwargs.get("guards_only") or not guards:
+            return guards
+        extracted.append((kwargs["code_start_ts"], kwargs["teaching_range_end"]))
+        chapters = [
+            {"concept": "input_int_cast", "start": 0.0, "end": 30.0},
+            {"concept": "loop_count_control", "start": 30.0, "end": 60.0},
+            {"concept": "print_separator", "start": 60.0, "end": 100.0},
+        ]
+        clamped = align._clamp_chapters_to_range(chapters, kwargs["code_start_ts"], kwargs["teaching_range_end"])
+        return [{**chapter, "draft_source": "ai"} for chapter in clamped]
+
+    reranked = []
+
+    def rerank(*, concept_tag, candidates, **kwargs):
+        reranked.append(concept_tag)
+        # print_separator 的 AI 判斷失敗 → rule_fallback，不應被存下。
+        if concept_tag == "print_separator":
+            return {}
+        return {"best_candidate_id": candidates[0]["candidate_id"], "chapter_title": concept_tag}
+
+    monkeypatch.setattr(align, "extract_concept_chapters", extract)
+    monkeypatch.setattr(align, "rerank_chapter_candidates_with_ai", rerank)
+
+    def call(start, end):
+        body = {"task_id": str(task["_id"]), "mode": "teacher_range_only", "teaching_range_start": start, "teaching_range_end": end}
+        with Flask(__name__).app_context():
+            response, status = align.align_task_by_concept(body)
+        assert status == 200
+        return response.get_json()
+
+    first = call(0, 100)
+    assert first["align_cache"] == "miss" and extracted == [(0.0, 100.0)]
+    assert sorted(reranked) == ["input_int_cast", "loop_count_control", "print_separator"]
+    stored = next(iter(results.docs.values()))
+    assert len(stored["recommendations"]) == 2
+    assert "rule_fallback" not in {item["recommendation"].get("rerank_source") for item in stored["recommendations"]}
+
+    reranked.clear()
+    again = call(0, 100)
+    assert again["align_cache"] == "hit" and len(extracted) == 1
+    assert again["concept_chapters_draft"] == first["concept_chapters_draft"]
+    assert reranked == ["print_separator"]
+
+    narrower = call(20, 80)
+    assert narrower["align_cache"] == "reclamped" and len(extracted) == 1
+    assert [(ch["start"], ch["end"]) for ch in narrower["concept_chapters_draft"]] == [(20.0, 30.0), (30.0, 60.0), (60.0, 80.0)]
+
+    # 新區間不足 15 秒：與重新抽取一樣回空，不沿用舊章節。
+    short = call(30, 40)
+    assert short["align_cache"] == "miss" and short["concept_chapters_draft"] == []
+    assert len(extracted) == 1
@@ -0,0 +1,37 @@
+import threading
+import time
+
+from app.routes import parsons_concept_align as align
+
+
+def test_chapter_reranks_run_concurrently_and_only_late_chapters_fall_back(monkeypatch):
+    monkeypatch.setenv("AI_ENABLED", "1")
+    monkeypatch.setattr(align, "CONCEPT_RERANK_DEADLINE_SEC", 0.5)
+    release = threading.Event()
+    running = []
+
+    def rerank(*, concept_tag, candidates, **kwargs):
+        running.append(concept_tag)
+        if concept_tag == "print_separator":
+            release.wait(5)
+        else:
+            time.sleep(0.05)
+        return {"best_candidate_id": candidates[-1]["candidate_id"], "chapter_title": concept_tag}
+
+    monkeypatch.setattr(align, "rerank_chapter_candidates_with_ai", rerank)
+    segments = [{"id": index, "start": index * 10, "end": index * 10 + 10, "text": f"seg {index}"} for index in range(6)]
+    tags = ["loop_count_control", "print_separator", "if_condition_logic", "input_int_cast"]
+    chapters = [{"concept_tag": tag, "start": index * 10, "end": index * 10 + 10} for index, tag in enumerate(tags)]
+
+    started = time.perf_counter()
+    entries = align._chapter_recommendation_entries(chapters, segments)
+    elapsed = time.perf_counter() - started
+    release.set()
+
+    recommendations = [entry["recommendation"] for entry in entries]
+    assert elapsed < 1.0
+    assert [item["concept_tag"] for item in recommendations] == tags
+    assert [item["rerank_source"] for item in recommendations] == ["ai", "rule_fallback", "ai", "ai"]
+    assert recommendations[1]["rerank_timed_out"] is True
+    assert recommendations[1]["best_candidate_id"] == recommendations[1]["candidates"][0]["candidate_id"]
+    assert recommendations[0]["chapter_title"] == "loop_count_control"
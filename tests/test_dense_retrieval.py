@@ -0,0 +1,82 @@
+import hashlib
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app import dense_vectors
+from app.routes import parsons_retrieval as retrieval
+
+
+def _fake_encode(calls):
+    def encode(texts, model, *, query=False):
+        calls.append((len(texts), query))
+        rows = np.zeros((len(texts), 16), dtype=np.float32)
+        for row, text in zip(rows, texts):
+            for token in retrieval._tokenize(text):
+                row[int(hashlib.md5(token.encode("utf-8")).hexdigest(), 16) % 16] += 1.0
+        norms = np.linalg.norm(rows, axis=1, keepdims=True)
+        return rows / np.where(norms > 0, norms, 1.0)
+
+    return encode
+
+
+def test_local_dense_index_stores_float16_vectors_and_scores_queries_in_one_batch(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setenv("PARSONS_VECTOR_DIR", str(tmp_path))
+    monkeypatch.setattr(dense_vectors, "available", lambda: True)
+    monkeypatch.setattr(dense_vectors, "encode", _fake_encode(calls))
+    segs = [
+        {"id": 1, "start": 0.0, "end": 10.0, "text": "print 輸出文字"},
+        {"id": 2, "start": 10.0, "end": 20.0, "text": "input 讀取輸入"},
+        {"id": 3, "start": 20.0, "end": 30.0, "text": "if 條件判斷"},
+    ]
+
+    index = retrieval.build_subtitle_index(segs, mode="local_dense")
+    assert index["mode"] == "local_dense"
+    assert "embeddings" not in index and "vectors" not in index
+    stored = dense_vectors.open_vectors(index["vector_key"])
+    assert stored.dtype == np.float16 and stored.shape == (3, 16)
+    assert calls == [(3, False)]
+
+    # 同一份字幕不會再編碼一次。
+    assert retrieval.build_subtitle_index(segs, mode="local_dense")["vector_key"] == index["vector_key"]
+    assert calls == [(3, False)]
+
+    hits = retrieval.retrieve_top_k_segments_batch(["讀取輸入 input", "條件判斷 if"], index, k=2)
+    assert calls[-1] == (2, True)
+    assert [rows[0]["id"] for rows in hits] == [2, 3]
+    assert all(len(rows) == 2 for rows in hits)
+    assert retrieval.retrieve_best_segment("print 輸出", index)[0]["id"] == 1
+
+    # 向量檔遺失（例如換機器）時查詢會重建。
+    dense_vectors._OPEN.clear()
+    for path in tmp_path.iterdir():
+        path.unlink()
+    assert retrieval.retrieve_top_k_segments("if 條件", index, k=1)[0]["id"] == 3
+
+    monkeypatch.setattr(dense_vectors, "available", lambda: False)
+    assert retrieval.build_subtitle_index(segs, mode="local_dense")["mode"] == "local"
+
+
+def test_prune_drops_stale_then_least_recently_used_vector_files(tmp_path, monkeypatch):
+    import os
+
+    monkeypatch.setenv("PARSONS_VECTOR_DIR", str(tmp_path))
+    monkeypatch.setattr(dense_vectors, "VECTOR_DIR_MAX_BYTES", 0)
+    monkeypatch.setattr(dense_vectors, "VECTOR_MAX_AGE_SEC", 0)
+    matrix = np.ones((4, 8), dtype=np.float32)
+    for key, used_at in (("old", 1_000.0), ("mid", 50_000.0), ("new", 90_000.0)):
+        dense_vectors.write_vectors(key, matrix, "m")
+        os.utime(tmp_path / f"{key}.json", (used_at, used_at))
+    size = sum(os.path.getsize(path) for path in dense_vectors._paths("new"))
+
+    monkeypatch.setattr(dense_vectors, "VECTOR_MAX_AGE_SEC", 50_000.0)
+    assert dense_vectors.prune_vectors(now=100_000.0) == 1
+    assert not (tmp_path / "old.json").exists() and not (tmp_path / "old.f16").exists()
+
+    # 超過大小上限時先刪最久未開啟的；剛寫入的檔案不會被刪。
+    monkeypatch.setattr(dense_vectors, "VECTOR_MAX_AGE_SEC", 0)
+    monkeypatch.setattr(dense_vectors, "VECTOR_DIR_MAX_BYTES", size * 2)
+    dense_vectors.write_vectors("fresh", matrix, "m")
+    assert sorted(path.name for path in tmp_path.glob("*.json")) == ["fresh.json", "new.json"]
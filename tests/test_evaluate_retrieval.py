@@ -0,0 +1,57 @@
+from tools import evaluate_retrieval as ev
+
+
+SRT = """1
+00:00:00,000 --> 00:00:10,000
+今天介紹 print 輸出文字
+
+2
+00:00:10,000 --> 00:00:20,000
+用 input 讀取使用者輸入
+
+3
+00:00:20,000 --> 00:00:30,000
+if 條件判斷成立時執行
+"""
+
+
+def _task(task_id, **extra):
+    return {
+        "_id": task_id,
+        "subtitle_text_used": SRT,
+        "solution_blocks": [
+            {"text": "name = input()", "semantic_zh": "讀取輸入"},
+            {"text": "if name:", "semantic_zh": "條件判斷"},
+        ],
+        "ai_segment_map": {"0": {"start": 10.0, "end": 20.0}, "1": {"start": 0.0, "end": 10.0}},
+        **extra,
+    }
+
+
+def test_runner_scores_strategies_and_reuses_cached_predictions(tmp_path, monkeypatch):
+    cache = str(tmp_path / "cache.json")
+    tasks = [_task("t1"), _task("t2"), {"_id": "t3", "solution_blocks": [{"text": "x"}]}]
+    labels = {("t1", 0): (10.0, 20.0), ("t1", 1): (20.0, 30.0)}
+    strategies = ["tfidf", "stored_map"]
+
+    first = ev.evaluate(tasks, strategies, labels=labels, cache_path=cache)
+    assert (first["computed"], first["reused"], first["skipped_tasks"]) == (4, 0, 1)
+    summary = {row["strategy"]: row for row in first["summary"]}
+    assert summary["tfidf"]["precision_at_1"] == 1.0
+    assert summary["tfidf"]["map_overlap"] == 0.5
+    assert summary["stored_map"]["precision_at_1"] == 0.5
+    assert summary["stored_map"]["monotonicity"] == 0.0
+
+    again = ev.evaluate(tasks, strategies, labels=labels, cache_path=cache)
+    assert (again["computed"], again["reused"]) == (0, 4)
+    assert again["summary"][0]["precision_at_1"] == 1.0
+
+    # 只有改版的策略重算；其他策略沿用快取。
+    monkeypatch.setattr(ev.STRATEGIES["tfidf"], "version", "2")
+    bumped = ev.evaluate(tasks, strategies, labels=labels, cache_path=cache)
+    assert (bumped["computed"], bumped["reused"]) == (2, 2)
+    assert {row["strategy"] for row in bumped["rows"] if not row["cached"]} == {"tfidf"}
+
+    pooled = ev.evaluate([_task("t4"), _task("t5", subtitle_text_used=SRT.replace("今天", "現在"))], strategies, workers=2)
+    assert pooled["computed"] == 4
+    assert not any(row["error"] for row in pooled["rows"])
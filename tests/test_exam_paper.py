@@ -0,0 +1,110 @@
+import threading
+
+import app.exam_paper as exam_paper
+from app.exam_paper import ExamPaper, PaperQuestion
+
+
+def _question(index, task_id):
+    return PaperQuestion(
+        index=index,
+        task_id=task_id,
+        question_type="choice",
+        source_doc={"question_id": task_id},
+        task_doc={"question_id": task_id},
+        parsed={},
+        payload={"task_id": task_id, "current_index": index},
+        expected_ids=("A",),
+        max_score=4.0,
+    )
+
+
+def _paper(version, *task_ids):
+    questions = tuple(_question(index, task_id) for index, task_id in enumerate(task_ids, start=1))
+    return ExamPaper(
+        test_role="pre",
+        version=version,
+        questions=questions,
+        refs={question.task_id: question for question in questions},
+    )
+
+
+def test_index_is_clamped_like_the_former_skip_limit_query():
+    paper = _paper(1, "q1", "q2")
+    assert paper.question_at(0)[0].task_id == "q1"
+    assert paper.question_at("x")[1] == 1
+    assert paper.question_at(9) == (paper.questions[1], 2)
+    assert paper.max_score("q2") == 4.0
+    assert paper.max_score("missing", 1.0) == 1.0
+    assert _paper(1).question_at(3) == (None, 3)
+
+
+def test_concurrent_requests_compile_the_paper_once(monkeypatch):
+    monkeypatch.setattr(exam_paper, "cached_cache_version", lambda name, max_age: 7)
+    monkeypatch.setattr(exam_paper, "_PAPERS", {})
+    calls = []
+    gate = threading.Event()
+
+    def compile_paper(role, version):
+        calls.append(role)
+        gate.wait(1)
+        return _paper(version, "q1")
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(exam_paper.cached_exam_paper("pre", compile_paper)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    gate.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["pre"]
+    assert len({id(paper) for paper in results}) == 1
+
+    # 版本戳記改變後重新編譯。
+    monkeypatch.setattr(exam_paper, "cached_cache_version", lambda name, max_age: 8)
+    assert exam_paper.cached_exam_paper("pre", compile_paper).version == 8
+    assert calls == ["pre", "pre"]
+
+
+def test_cached_paper_pool_is_reshuffled_per_request(monkeypatch):
+    import random
+
+    from flask import Flask
+
+    from app.routes import parsons
+
+    question_doc = {
+        "question_id": "pq1",
+        "question_type": "parsons",
+        "blocks": [{"block_id": f"b{i}", "code": f"x{i} = {i}"} for i in range(1, 9)],
+        "solution": [f"b{i}" for i in range(1, 9)],
+    }
+    compiled = []
+
+    def active_docs(role):
+        compiled.append(role)
+        return [question_doc]
+
+    monkeypatch.setattr(exam_paper, "cached_cache_version", lambda name, max_age: 1)
+    monkeypatch.setattr(exam_paper, "_PAPERS", {})
+    monkeypatch.setattr(parsons, "_active_test_question_docs", active_docs)
+    monkeypatch.setattr(parsons, "current_student_id", lambda: "s1")
+    monkeypatch.setattr(parsons, "get_student_test_cycle_id", lambda student_id: "c1")
+    monkeypatch.setattr(parsons, "is_posttest_open", lambda test_cycle_id: True)
+    random.seed(3)
+
+    orders = []
+    app = Flask(__name__)
+    for _ in range(5):
+        with app.test_request_context("/test/task?test_role=post"):
+            body = parsons.get_test_task().get_json()
+        orders.append(tuple(block["id"] for block in body["pool"]))
+
+    assert compiled == ["post"]
+    assert len(set(orders)) > 1
+    # 快取的考卷保留原始順序，不被每次回應的亂序改動。
+    cached = exam_paper.cached_exam_paper("post", parsons._compile_exam_paper)
+    assert [block["id"] for block in cached.questions[0].payload["pool"]] == [f"b{i}" for i in range(1, 9)]
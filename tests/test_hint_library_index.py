@@ -0,0 +1,77 @@
+from datetime import datetime
+
+from app.hint_library_index import (
+    build_hint_library_index,
+    lookup_legacy,
+    lookup_structured,
+)
+
+
+def _template(**overrides):
+    doc = {
+        "_id": overrides.pop("_id", "h1"),
+        "schema_version": 2,
+        "retrieval_eligible": True,
+        "is_active": True,
+        "quality_status": "passed",
+        "answer_leakage_check": "passed",
+        "language": "zh-TW",
+        "hint_level": 1,
+        "unit_category": "count_controlled_loop",
+        "relation_type": "loop_body",
+        "error_type": "order",
+        "control_structure": "for",
+        "scope": "narrow",
+        "concept_tag": "for_loop",
+        "fingerprint_key": "fp-1",
+        "hint_key": "fp-1",
+        "hint_template": "想想迴圈內要重複做的事。",
+        "success_count": 0,
+        "usage_count": 0,
+        "version": 1,
+        "updated_at": datetime(2026, 1, 1),
+    }
+    doc.update(overrides)
+    return doc
+
+
+_CTX = {
+    "hint_level": 1,
+    "unit_category": "count_controlled_loop",
+    "relation_type": "loop_body",
+    "error_type": "order",
+    "control_structure": "for",
+    "scope": "narrow",
+    "concept_tag": "for_loop",
+    "fingerprint_key": "fp-1",
+}
+
+
+def test_exact_fingerprint_is_tried_first_and_best_sorted_doc_wins():
+    index = build_hint_library_index([
+        _template(_id="low", success_count=1),
+        _template(_id="high", success_count=5),
+    ])
+    match_mode, doc = next(lookup_structured(index, _CTX, ["for_loop"], None))
+    assert match_mode == "exact_fingerprint"
+    assert doc["_id"] == "high"
+
+
+def test_alias_fallback_picks_best_across_alias_buckets():
+    index = build_hint_library_index([
+        _template(_id="a", fingerprint_key="other", concept_tag="for_loop", usage_count=1),
+        _template(_id="b", fingerprint_key="other", concept_tag="loop_count_control", usage_count=9),
+    ])
+    stages = dict(lookup_structured(index, _CTX, ["for_loop", "loop_count_control"], None))
+    assert stages["exact_fingerprint"] is None
+    assert stages["same_relation_and_control"]["_id"] == "b"
+
+
+def test_unservable_templates_are_not_indexed():
+    index = build_hint_library_index([
+        _template(_id="inactive", is_active=False),
+        _template(_id="leaky", answer_leakage_check="failed"),
+        _template(_id="legacy", schema_version=1, retrieval_eligible=False, hint_key="for_loop|order|level_1"),
+    ])
+    assert all(doc is None for _, doc in lookup_structured(index, _CTX, ["for_loop"], "fam"))
+    assert lookup_legacy(index, 1, "for_loop|order|level_1")["_id"] == "legacy"
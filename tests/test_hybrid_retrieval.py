@@ -0,0 +1,73 @@
+from app.routes import parsons_retrieval as retrieval
+
+
+SEGS = [
+    {"id": 1, "start": 0.0, "end": 5.0, "text": "先用 input 讀取輸入"},
+    {"id": 2, "start": 5.0, "end": 10.0, "text": "input 讀進來的是字串 要用 int 轉成數字"},
+    {"id": 3, "start": 10.0, "end": 15.0, "text": "接著用 for 迴圈 重複計算總和"},
+    {"id": 4, "start": 15.0, "end": 20.0, "text": "最後 print 印出 total"},
+]
+
+
+def test_bm25_scores_only_matching_segments_within_unit_range():
+    index = retrieval.build_subtitle_index(SEGS, mode="bm25")
+    assert index["doc_len"] == [len(retrieval._tokenize(s["text"])) for s in SEGS]
+    assert index["bm25_postings"]["input"] == [0, 1, 1, 1]
+
+    hits = retrieval.retrieve_top_k_segments("int 轉成數字", index, k=3)
+    assert [hit["id"] for hit in hits] == [2]
+    assert 0.0 < hits[0]["score"] <= 1.0
+    assert [hit["id"] for hit in retrieval.retrieve_top_k_segments("input 讀取", index, k=3)] == [1, 2]
+    assert retrieval.retrieve_top_k_segments("while", index, k=3) == []
+
+
+def test_hybrid_fuses_bm25_and_dense_rankings(monkeypatch):
+    # dense 端刻意偏好第 4 段：融合後 bm25 與 dense 都排前面的片段勝出。
+    def embed(text, model):
+        return [1.0, 0.0] if ("total" in text or "印出" in text) else [0.6, 0.8]
+
+    monkeypatch.setenv("PARSONS_RETRIEVAL_HYBRID_DENSE", "openai")
+    monkeypatch.setattr(retrieval, "_embed_text_openai", embed)
+    index = retrieval.build_subtitle_index(SEGS, mode="hybrid")
+    assert index["dense"]["mode"] == "openai" and "segments" not in index["dense"]
+
+    hits = retrieval.retrieve_top_k_segments("print total 印出", index, k=2)
+    assert hits[0]["id"] == 4 and hits[0]["score"] == 1.0
+    batch = retrieval.retrieve_top_k_segments_batch(["print total 印出", "int 數字"], index, k=1)
+    assert [rows[0]["id"] for rows in batch] == [4, 2]
+
+    def unavailable(text, model):
+        raise RuntimeError("offline")
+
+    monkeypatch.setattr(retrieval, "_embed_text_openai", unavailable)
+    bm25_only = retrieval.build_subtitle_index(SEGS, mode="hybrid")
+    assert bm25_only["dense"] is None
+    assert retrieval.retrieve_best_segment("int 數字", bm25_only)[0]["id"] == 2
+
+
+def test_window_merge_keeps_time_continuity():
+    hits = [
+        {"start": 10.0, "end": 15.0, "text": "b", "index": 2, "score": 0.8},
+        {"start": 15.5, "end": 20.0, "text": "c", "index": 3, "score": 0.5},
+        {"start": 120.0, "end": 125.0, "text": "far", "index": 30, "score": 0.7},
+        {"start": 4.0, "end": 9.0, "text": "a", "index": 1, "score": 0.5},
+    ]
+    window, score = retrieval.merge_top_k_window(hits)
+    assert (window["start"], window["end"], window["index"]) == (4.0, 20.0, 1)
+    assert window["text"] == "a\nb\nc"
+    assert abs(score - (1 - 0.2 * 0.5 * 0.5)) < 1e-9
+
+    narrow, _ = retrieval.merge_top_k_window(hits, max_gap_sec=0.0)
+    assert (narrow["start"], narrow["end"]) == (10.0, 15.0)
+    capped, _ = retrieval.merge_top_k_window(hits, max_span_sec=11.0)
+    assert (capped["start"], capped["end"]) == (10.0, 20.0)
+    assert retrieval.merge_top_k_window([]) == (None, 0.0)
+
+
+def test_concept_alignment_snapping_ignores_the_dense_retrieval_modes(monkeypatch):
+    from app.routes import parsons_concept_align
+
+    monkeypatch.setenv("PARSONS_RETRIEVAL_MODE", "hybrid")
+    index = parsons_concept_align._build_subtitle_index_from_text("1\n00:00:00,000 --> 00:00:05,000\nprint 輸出\n")
+    assert index["mode"] == "local"
+    assert [seg["text"] for seg in index["segments"]] == ["print 輸出"]
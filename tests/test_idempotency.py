@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask, g, request
+from pymongo.errors import DuplicateKeyError
+
+from app import idempotency
+
+
+class _Result:
+    def __init__(self, modified_count):
+        self.modified_count = modified_count
+
+
+class _ResponseCollection:
+    """The operations app.idempotency uses, with MongoDB's semantics."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def insert_one(self, doc):
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError("duplicate")
+        self.docs[doc["_id"]] = dict(doc)
+
+    def update_one(self, query, update):
+        doc = self.docs.get(query["_id"])
+        if doc is None:
+            return _Result(0)
+        for field, expected in query.items():
+            if isinstance(expected, dict):
+                if doc.get(field) > expected["$lte"]:
+                    return _Result(0)
+            elif doc.get(field) != expected:
+                return _Result(0)
+        doc.update(update["$set"])
+        return _Result(1)
+
+    def find_one(self, query):
+        return self.docs.get(query["_id"])
+
+    def delete_one(self, query):
+        doc = self.docs.get(query["_id"])
+        if doc is not None and doc["state"] == query["state"]:
+            del self.docs[query["_id"]]
+
+
+def _app(monkeypatch):
+    collection = _ResponseCollection()
+    monkeypatch.setattr(idempotency, "db", {idempotency.IDEMPOTENCY_COLLECTION: collection})
+    monkeypatch.setattr(idempotency, "_INDEX_READY", True)
+    app = Flask(__name__)
+    calls = []
+
+    @app.before_request
+    def _user():
+        g.current_user = {"_id": "p1", "student_id": "s1"}
+
+    @app.post("/submit")
+    @idempotency.idempotent
+    def submit():
+        calls.append(request.get_json(silent=True))
+        if (request.get_json(silent=True) or {}).get("fail"):
+            return {"ok": False}, 503
+        return {"ok": True, "attempt": len(calls)}, 201
+
+    return app.test_client(), calls, collection
+
+
+def test_retry_with_same_key_replays_the_stored_response(monkeypatch):
+    client, calls, _ = _app(monkeypatch)
+    headers = {"Idempotency-Key": "k1"}
+
+    first = client.post("/submit", json={"answer": [1, 2]}, headers=headers)
+    retry = client.post("/submit", json={"answer": [1, 2]}, headers=headers)
+    assert first.status_code == retry.status_code == 201
+    assert retry.get_json() == first.get_json() == {"ok": True, "attempt": 1}
+    assert retry.headers[idempotency.REPLAYED_HEADER] == "true"
+    assert len(calls) == 1
+
+    reused = client.post("/submit", json={"answer": [2, 1]}, headers=headers)
+    assert reused.status_code == 422
+    assert reused.get_json()["error"] == "idempotency_key_reused"
+
+    # 沒有 key 的請求照舊執行；beacon 可把 key 放在 body。
+    client.post("/submit", json={"answer": [1, 2]})
+    client.post("/submit", json={"answer": [3], "idempotency_key": "k2"})
+    replayed = client.post("/submit", json={"answer": [3], "idempotency_key": "k2", "session_token": "t"})
+    assert replayed.headers[idempotency.REPLAYED_HEADER] == "true"
+    assert len(calls) == 3
+
+
+def test_in_progress_and_failed_requests(monkeypatch):
+    client, calls, collection = _app(monkeypatch)
+    headers = {"Idempotency-Key": "k1"}
+
+    failed = client.post("/submit", json={"fail": True}, headers=headers)
+    assert failed.status_code == 503
+    assert collection.docs == {}
+    client.post("/submit", json={"fail": True}, headers=headers)
+    assert len(calls) == 2
+
+    record_id = idempotency.lease_key("idempotency", "s1", "/submit", "k2")
+    now = datetime.now(timezone.utc)
+    collection.docs[record_id] = {
+        "_id": record_id,
+        "state": "in_progress",
+        "fingerprint": idempotency.hashlib.sha256(b'{"answer": 1}').hexdigest(),
+        "progress_deadline": now + timedelta(seconds=60),
+    }
+    busy = client.post("/submit", json={"answer": 1}, headers={"Idempotency-Key": "k2"})
+    assert busy.status_code == 409
+    assert len(calls) == 2
+
+    # 前一個請求中斷留下的逾時保留可被接手。
+    collection.docs[record_id]["progress_deadline"] = now - timedelta(seconds=1)
+    taken = client.post("/submit", json={"answer": 1}, headers={"Idempotency-Key": "k2"})
+    assert taken.status_code == 201
+    assert collection.docs[record_id]["state"] == "done"
+    assert len(calls) == 3
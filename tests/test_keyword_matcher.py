@@ -0,0 +1,129 @@
+import random
+
+import pytest
+
+from app.keyword_matcher import KeywordMatcher
+from app.routes import parsons_concept_align as align
+from app.routes import parsons_concept_engine as engine
+from app.routes import parsons_service as service
+
+
+def test_hits_match_substring_containment_including_overlaps():
+    keywords = ["否則", "否則就", "則就", "n-i", "n - i", "If", " print ", "2*i-1", "*", ""]
+    matcher = KeywordMatcher(keywords)
+    normalized = {keyword.strip().lower() for keyword in keywords if keyword.strip()}
+
+    assert matcher.hits("否則就印出 N-I") == {"否則", "否則就", "則就", "n-i"}
+    assert matcher.scan("if 2*i-1") == [(0, "if"), (3, "2*i-1"), (4, "*")]
+    assert KeywordMatcher([]).hits("anything") == set()
+
+    alphabet = ["否", "則", "就", "n", "-", " ", "i", "f", "2", "*", "1", "p", "rint"]
+    rnd = random.Random(7)
+    for _ in range(500):
+        text = "".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 20)))
+        assert matcher.hits(text) == {keyword for keyword in normalized if keyword in text.lower()}
+
+
+# 以下表格的期望值是改用 KeywordMatcher 之前的子字串迴圈算出來的輸出。
+
+
+@pytest.mark.parametrize("unit, subtitle, teacher, title, expected", [
+    ("U1-IO", "while 直到", "", "", "io"),
+    ("", "用 while 直到輸入 quit 停止", "", "", "while"),
+    ("", "For i in RANGE(5) 重複", "", "", "for"),
+    ("", "如果 elif 否則 else", "", "", "condition"),
+    ("", "印出結果", "請輸入名字", "基本輸入輸出", "io"),
+    ("U4-NESTED", "", "", "", "for"),
+    ("U5", "", "", "", "while"),
+    ("", "", "", "If 判斷成績", "condition"),
+    ("U3-FOR", "while", "", "", "for"),
+])
+def test_infer_track_keeps_its_outputs(unit, subtitle, teacher, title, expected):
+    assert engine._infer_track(unit, subtitle, teacher, title) == expected
+
+
+@pytest.mark.parametrize("unit, subtitle, teacher, title, expected", [
+    ("U1-IO", "用 input 讀兩個數字 再 print 總和", "兩次輸入後計算", "加總", "io_basic"),
+    ("U2-IF", "if 分數 >= 60 及格 else 不及格", "成績判斷", "", "if_basic"),
+    ("", "for i in range(10, 0, -1) 倒數", "遞減", "", "range_desc"),
+    ("", "while 直到 輸入 0 累加總和", "", "while 累加", "while_sum"),
+    ("U6-LIST", "串列 append 加總", "", "", "list_sum"),
+    ("U7-FUNCTION", "def area(w, h): return w * h 計算面積", "", "", "function_calculation"),
+    ("", "", "", "", "io_basic"),
+    ("U3", "PRINT 星號 圖形", "", "", "range_pattern"),
+])
+def test_detect_concept_keeps_its_outputs(unit, subtitle, teacher, title, expected):
+    assert engine.detect_concept(unit, subtitle, teacher, title) == expected
+
+
+@pytest.mark.parametrize("concept, subtitle, teacher, title, expected", [
+    ("io_basic", "INPUT 之後 print 輸出", "輸入", "顯示", 10),
+    ("range_sum", "for 累加 總和", "sum", "", 7),
+    ("if_else", "else 否則", "", "if else", 5),
+    ("while_input", "", "", "", 0),
+    ("function_return", "return 回傳值", "回傳", "return", 8),
+])
+def test_score_concept_on_hit_sets_matches_the_text_scores(concept, subtitle, teacher, title, expected):
+    matcher = KeywordMatcher(engine.CONCEPT_KEYWORDS[concept])
+    hits = (matcher.hits(subtitle), matcher.hits(teacher), matcher.hits(title))
+    assert engine._score_concept(concept, *hits) == expected
+
+
+@pytest.mark.parametrize("text, keywords, expected", [
+    ("例如 input 讀取 再 print", ["輸入", "input", "x"], 6),
+    ("For 迴圈 range 注意 邊界", ["for", "迴圈", "while"], 9),
+    ("", ["a"], 0),
+    ("今天天氣很好", [], 0),
+    ("必須 def 定義 return 意思是", ["定義", "def", "", None], 10),
+    ("if else if elif quit", ["if", "else if", "E"], 9),
+])
+def test_subtitle_selector_score_keeps_its_outputs(text, keywords, expected):
+    assert service._score_subtitle_segment_for_selector(text, keywords) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("", "python_syntax"),
+    ("印出 2*i-1 個星號", "star_formula_2i_minus_1"),
+    ("n - i 個空白", "space_formula_n_minus_i"),
+    ("巢狀 for 迴圈", "nested_loop_structure"),
+    ("range 倒著數", "loop_reverse_range"),
+    ("for i in range(3)", "loop_count_control"),
+    ("if elif 分支順序", "if_branch_order"),
+    ("if 沒有資料", "edge_case_condition"),
+    ("if x > 0", "edge_case_condition"),
+    ("input 轉整數", "python_syntax"),
+    ("print sep", "python_syntax"),
+    ("def f(): return 1", "python_syntax"),
+    ("while True", "loop_count_control"),
+    ("其他 0 1", "python_syntax"),
+])
+def test_infer_concept_tag_keeps_its_outputs(text, expected):
+    assert align.infer_concept_tag_from_text(text) == expected
+
+
+_SUGGESTION_SEGMENTS = [
+    {"start": 0, "end": 5, "text": "先用 input( 讀取 再 int(input 轉整數"},
+    {"start": 5, "end": 9, "text": "print( 用 sep= 空格 分隔"},
+    {"start": 9, "end": 14, "text": "for i in range(5) 重複"},
+    {"start": 14, "end": 20, "text": "if 判斷 條件 成立 elif else"},
+    {"start": 20, "end": 25, "text": "最後 特殊 邊界 沒有 例外"},
+    {"start": 25, "end": 30, "text": "def f return 回傳"},
+    {"start": 30, "end": 35, "text": "閒聊"},
+]
+
+
+@pytest.mark.parametrize("drafts, expected", [
+    ([], [
+        ("input_int_cast", 17.5, "字幕中出現 讀取/int/input，但草稿尚未涵蓋這個概念。"),
+        ("print_separator", 12.6, "字幕中出現 sep/空格/分隔，但草稿尚未涵蓋這個概念。"),
+        ("python_syntax", 7.0, "字幕中出現 def/回傳/return，但草稿尚未涵蓋這個概念。"),
+    ]),
+    ([{"start": 0, "end": 10, "label": "輸入與轉型", "concept_tag": "input_int_cast"}], [
+        ("print_separator", 12.6, "字幕中出現 sep/空格/分隔，但草稿尚未涵蓋這個概念。"),
+        ("python_syntax", 7.0, "字幕中出現 def/回傳/return，但草稿尚未涵蓋這個概念。"),
+        ("if_branch_order", 6.0, "字幕中出現 判斷/條件/if，但草稿尚未涵蓋這個概念。"),
+    ]),
+])
+def test_suggestion_candidates_keep_their_scores(drafts, expected):
+    _renames, missing = align._build_ai_chapter_suggestion_candidates(drafts, _SUGGESTION_SEGMENTS)
+    assert [(item["_concept_tag"], round(item["_score"], 2), item["reason"]) for item in missing] == expected
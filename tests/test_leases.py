@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+from app import leases
+
+
+class _Result:
+    def __init__(self, modified_count):
+        self.matched_count = modified_count
+        self.modified_count = modified_count
+
+
+class _LeaseCollection:
+    """The three operations app.leases uses, with MongoDB's semantics."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def create_index(self, *args, **kwargs):
+        return kwargs.get("name")
+
+    def insert_one(self, doc):
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError("duplicate")
+        self.docs[doc["_id"]] = dict(doc)
+
+    def update_one(self, query, update):
+        doc = self.docs.get(query["_id"])
+        if doc is None or doc["expires_at"] > query["expires_at"]["$lte"]:
+            return _Result(0)
+        doc.update(update["$set"])
+        return _Result(1)
+
+    def delete_one(self, query):
+        doc = self.docs.get(query["_id"])
+        if doc is not None and doc["owner"] == query["owner"]:
+            del self.docs[query["_id"]]
+
+
+def test_mongo_lease_is_exclusive_until_released_or_expired(monkeypatch):
+    collection = _LeaseCollection()
+    monkeypatch.setenv("LEASE_BACKEND", "mongo")
+    monkeypatch.setattr(leases, "db", {leases.LEASE_COLLECTION: collection})
+    monkeypatch.setattr(leases, "_INDEX_READY", True)
+    key = leases.lease_key("submit", "s1", "/api/parsons/submit", "abc")
+
+    with leases.held_lease(key, 60) as first:
+        assert first
+        with leases.held_lease(key, 60) as second:
+            assert not second
+        # 未取得租約的一方不得刪除持有者的租約。
+        assert key in collection.docs
+    assert key not in collection.docs
+
+    owner = leases.acquire_lease(key, 60)
+    collection.docs[key]["expires_at"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+    taken_over = leases.acquire_lease(key, 60)
+    assert taken_over and taken_over != owner
+    leases.release_lease(key, owner)
+    assert collection.docs[key]["owner"] == taken_over
+
+    # 過期租約在 DuplicateKeyError 之後、接手之前被 TTL 刪除：改為重新插入。
+    collection.docs[key]["expires_at"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+    update_one = collection.update_one
+
+    def ttl_deletes_first(query, update):
+        collection.docs.pop(query["_id"], None)
+        return update_one(query, update)
+
+    monkeypatch.setattr(collection, "update_one", ttl_deletes_first)
+    assert leases.acquire_lease(key, 60)
+    assert key in collection.docs
+
+
+def test_local_backend_keeps_the_in_process_guard(monkeypatch):
+    monkeypatch.setenv("LEASE_BACKEND", "local")
+    key = leases.lease_key("local-test")
+    owner = leases.acquire_lease(key, 60)
+    assert owner
+    assert leases.acquire_lease(key, 60) is None
+    leases.release_lease(key, owner)
+    assert leases.acquire_lease(key, 0.0)
+    assert leases.acquire_lease(key, 60)
@@ -0,0 +1,59 @@
+from tools.load_simulation import find_saturation, parse_prometheus, percentile, server_stage_stats
+
+
+def test_percentile_interpolates_between_samples():
+    values = [0.010, 0.020, 0.030, 0.040, 0.100]
+    assert percentile(values, 50) == 0.030
+    assert abs(percentile(values, 95) - 0.088) < 1e-9
+    assert percentile([], 99) is None
+
+
+def _stage(concurrency, rps, p95, server=None):
+    return {"concurrency": concurrency, "throughput_rps": rps, "overall": {"p95": p95}, "server": server}
+
+
+def test_saturation_prefers_server_gauges():
+    before = parse_prometheus("mongo_pool_checkout_wait_seconds_sum 0.0\nmongo_pool_checkout_wait_seconds_count 10\n")
+    after = parse_prometheus(
+        "# TYPE http_requests_in_flight_peak gauge\n"
+        "http_requests_in_flight_peak 8\n"
+        "mongo_pool_checked_out_peak 12\n"
+        "mongo_pool_checkout_wait_seconds_sum 0.5\n"
+        "mongo_pool_checkout_wait_seconds_count 20\n"
+        'app_capacity{resource="waitress_threads"} 8\n'
+        'app_capacity{resource="mongo_max_pool_size"} 20\n'
+    )
+    server = server_stage_stats(before, after)
+    assert server["in_flight_peak"] == 8
+    assert server["pool_wait_mean_ms"] == 50.0
+
+    quiet = dict(server, in_flight_peak=3, pool_wait_mean_ms=0.0)
+    result = find_saturation([_stage(5, 10, 80, quiet), _stage(10, 19, 90, server)])
+    assert result["waitress"] == 10
+    assert result["mongo_pool"] == 10
+    assert "checkout wait" in result["mongo_pool_reason"]
+
+
+def test_saturation_falls_back_to_throughput_plateau():
+    stages = [_stage(5, 10.0, 100), _stage(10, 19.0, 150), _stage(20, 20.0, 450)]
+    result = find_saturation(stages)
+    assert result["waitress"] == 20
+    assert result["mongo_pool"] is None
+
+
+def test_login_storm_report_counts_busy_retries():
+    from tools.load_simulation import LOGIN_LABEL, LatencyBook, login_storm_report
+
+    book = LatencyBook()
+    for seconds, status in ((0.05, 429), (0.20, 200), (0.30, 200), (0.01, 429)):
+        book.record(LOGIN_LABEL, seconds, status)
+    book.samples["login (with retries)"].extend([1.2, 0.3])
+    book.record("GET /api/auth/ (probe)", 0.004, 200)
+
+    report = login_storm_report(book, logged_in=2, elapsed=1.25)
+    assert report["logins_per_sec"] == 1.6
+    assert report["attempts"] == 4
+    assert report["busy_responses"] == 2
+    assert report["errors"] == 0
+    assert report["login_latency"]["count"] == 2
+    assert report["probe_latency"]["p50"] == 4.0
@@ -0,0 +1,67 @@
+from flask import Flask
+
+from app import metrics
+
+
+def _app():
+    app = Flask(__name__)
+    metrics.install_request_metrics(app)
+
+    @app.get("/ping")
+    def ping():
+        metrics.record_mongo_command("find", 0.002)
+        metrics.record_mongo_command("find", 0.003)
+        return {"ok": True}
+
+    return app
+
+
+def test_request_latency_size_and_mongo_time_are_attributed_to_endpoint():
+    metrics.reset_metrics()
+    client = _app().test_client()
+    assert client.get("/ping").status_code == 200
+    assert client.get("/missing").status_code == 404
+
+    text = metrics.render_prometheus()
+    assert 'http_request_duration_seconds_count{endpoint="ping",method="GET"} 1' in text
+    assert 'http_requests_total{endpoint="unmatched",method="GET",status="404"} 1' in text
+    assert 'http_request_mongo_commands_total{endpoint="ping"} 2' in text
+    assert 'mongo_commands_total{command="find"} 2' in text
+    assert 'http_response_size_bytes_count{endpoint="ping"} 1' in text
+
+
+def test_llm_failures_are_counted_and_reraised():
+    metrics.reset_metrics()
+    try:
+        with metrics.observe_llm_call("responses"):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    text = metrics.render_prometheus()
+    assert 'llm_call_duration_seconds_count{kind="responses"} 1' in text
+    assert 'llm_call_failures_total{kind="responses"} 1' in text
+
+
+def test_saturation_gauges_track_peaks_until_reset():
+    metrics.reset_metrics()
+    metrics.record_capacity("waitress_threads", 8)
+    pool = metrics.MongoPoolMetrics()
+    checked_out = type("Event", (), {"duration": 0.02})()
+    pool.connection_checked_out(checked_out)
+    pool.connection_checked_out(checked_out)
+    pool.connection_checked_in(None)
+    client = _app().test_client()
+    assert client.get("/ping").status_code == 200
+
+    text = metrics.render_prometheus()
+    assert "http_requests_in_flight 0" in text
+    assert "http_requests_in_flight_peak 1" in text
+    assert "mongo_pool_checked_out 1" in text
+    assert "mongo_pool_checked_out_peak 2" in text
+    assert "mongo_pool_checkout_wait_seconds_count 2" in text
+    assert 'app_capacity{resource="waitress_threads"} 8' in text
+
+    metrics.reset_peaks()
+    text = metrics.render_prometheus()
+    assert "http_requests_in_flight_peak 0" in text
+    assert "mongo_pool_checked_out_peak 1" in text
@@ -0,0 +1,59 @@
+import pytest
+from pymongo.errors import CollectionInvalid
+
+from tools import migrate_logs_to_timeseries as migrate
+
+
+class _Collection:
+    def __init__(self, db, name):
+        self.db, self.name = db, name
+
+    def rename(self, new_name):
+        self.db.collections[new_name] = self.db.collections.pop(self.name)
+
+    def estimated_document_count(self):
+        return len(self.db.collections[self.name]["docs"])
+
+    def find_one(self, query):
+        return None
+
+    def create_index(self, keys, name):
+        self.db.indexes.append(name)
+
+
+class _DB:
+    def __init__(self):
+        self.collections = {"learning_logs": {"type": "collection", "docs": [{"_id": 1}]}}
+        self.indexes = []
+
+    def __getitem__(self, name):
+        return _Collection(self, name)
+
+    def list_collection_names(self):
+        return list(self.collections)
+
+    def list_collections(self, filter):
+        info = self.collections.get(filter["name"])
+        return [{"name": filter["name"], "type": info["type"]}] if info else []
+
+    def create_collection(self, name, **options):
+        if name in self.collections:
+            raise CollectionInvalid(name)
+        self.collections[name] = {"type": "timeseries", "docs": []}
+
+
+def test_migration_stops_when_an_app_write_recreated_a_regular_collection(monkeypatch):
+    db = _DB()
+    original_rename = _Collection.rename
+
+    def rename_then_app_insert(self, new_name):
+        original_rename(self, new_name)
+        # rename 與建立時間序列集合之間，app 的 insert 隱含建立了一般集合。
+        db.collections["learning_logs"] = {"type": "collection", "docs": [{"_id": 2}]}
+
+    monkeypatch.setattr(_Collection, "rename", rename_then_app_insert)
+    with pytest.raises(migrate.MigrationAborted):
+        migrate.migrate_collection(db, "learning_logs")
+
+    assert db.collections["learning_logs_legacy"]["docs"] == [{"_id": 1}]
+    assert db.indexes == []
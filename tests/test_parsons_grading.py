@@ -0,0 +1,89 @@
+from app.parsons_grading import (
+    build_block_results,
+    expected_indentation,
+    grade_parsons_submission,
+)
+
+
+def _task():
+    lines = [
+        "n = int(input())",
+        "for i in range(n):",
+        "    if i % 2 == 0:",
+        "        print(i)",
+        "    else:",
+        "        print(-i)",
+    ]
+    solution = [{"id": f"b{i}", "text": text} for i, text in enumerate(lines)]
+    return {
+        "template_slots": [{"expected_id": block["id"]} for block in solution],
+        "solution_blocks": solution,
+        "pool": solution + [
+            {"id": "d0", "text": "n = int(input())"},
+            {"id": "d1", "text": "while i < n:"},
+        ],
+    }
+
+
+def _lines(task, ids):
+    by_id = {block["id"]: block["text"] for block in task["pool"]}
+    return [by_id.get(block_id, "") for block_id in ids]
+
+
+def test_correct_answer_and_equivalent_distractor_pass_in_both_modes():
+    task = _task()
+    ids = ["d0", "b1", "b2", "b3", "b4", "b5"]
+    for mode in ("practice", "test"):
+        result = grade_parsons_submission(task, ids, _lines(task, ids), mode=mode)
+        assert result["is_correct"] is True
+        assert result["score"] == 1.0
+        assert result["wrong_index"] is None
+
+
+def test_practice_reports_first_error_and_test_counts_every_slot():
+    task = _task()
+    ids = ["b0", "d1", "b2", "b3", "b5", "b4"]
+    lines = _lines(task, ids)
+    practice = grade_parsons_submission(task, ids, lines, mode="practice")
+    test = grade_parsons_submission(task, ids, lines, mode="test")
+
+    assert practice["wrong_indices"] == test["wrong_indices"] == [1, 4, 5]
+    assert practice["reported_wrong_indices"] == [1]
+    assert practice["primary_error_type"] == "calculation"
+    assert practice["slot_label"] == "第2格"
+    assert practice["actual_text"] == "while i < n:"
+    assert practice["score"] == 5 / 6
+    assert test["score"] == 3 / 6
+
+
+def test_indentation_rules_differ_for_blank_slots():
+    task = _task()
+    ids = ["b0", "b1", "b2", "b3", "b4", "b5"]
+    lines = _lines(task, ids)
+    lines[3] = "print(i)"
+    lines[5] = ""
+
+    practice = grade_parsons_submission(task, ids, lines, mode="practice")
+    test = grade_parsons_submission(task, ids, lines, mode="test")
+    assert practice["indent_errors"] == [3]
+    assert practice["primary_error_type"] == "indentation"
+    assert test["indent_errors"] == [3, 5]
+
+
+def test_expected_indentation_is_inferred_when_blocks_are_flat():
+    flat = [{"text": "for i in range(3):", "indent": 0}, {"text": "print(i)", "indent": 0}]
+    assert expected_indentation(flat) == [0, 4]
+
+
+def test_block_results_track_corrections_since_previous_attempt():
+    lookup = {"a": {"text": "x = 1"}, "b": {"text": "print(x)"}}
+    correct = {"order": ["a", "b"], "indentation": [0, 0]}
+    rows, summary = build_block_results(
+        block_lookup=lookup,
+        submitted_order=["a", "b"],
+        submitted_indentation=[0, 0],
+        correct_answer=correct,
+        previous_attempt={"submitted_order": ["b", "a"], "submitted_indentation": [0, 0]},
+    )
+    assert [row["status_change"] for row in rows] == ["corrected", "corrected"]
+    assert summary["corrected_block_ids"] == ["a", "b"]
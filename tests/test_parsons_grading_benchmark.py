@@ -0,0 +1,86 @@
+"""Grading latency/memory benchmarks.
+
+Run with ``python -m pytest tests/test_parsons_grading_benchmark.py
+--benchmark-autosave`` and compare runs with ``--benchmark-compare`` to
+track per-submission grading cost over time.  pytest-benchmark comes from
+``pip install -r requirements-dev.txt``; the module is skipped without it.
+"""
+
+import random
+import tracemalloc
+
+import pytest
+
+from app.parsons_grading import grade_parsons_submission
+
+pytest.importorskip("pytest_benchmark")
+
+_STATEMENTS = [
+    "total = total + i",
+    "print(total)",
+    "count += 1",
+    "value = int(input())",
+    "result.append(value * 2)",
+]
+_HEADERS = ["for i in range(n):", "if value > 0:", "while count < 10:"]
+
+
+def _synthetic_task(slots: int, seed: int):
+    rng = random.Random(seed)
+    solution = []
+    depth = 0
+    for index in range(slots):
+        if depth < 3 and index < slots - 1 and rng.random() < 0.3:
+            text = rng.choice(_HEADERS)
+            solution.append({"id": f"b{index}", "text": "    " * depth + text})
+            depth += 1
+        else:
+            solution.append({"id": f"b{index}", "text": "    " * depth + rng.choice(_STATEMENTS)})
+            if depth and rng.random() < 0.3:
+                depth -= 1
+    distractors = [
+        {"id": f"d{index}", "text": rng.choice(_STATEMENTS + _HEADERS)}
+        for index in range(max(2, slots // 4))
+    ]
+    task = {
+        "template_slots": [{"expected_id": block["id"]} for block in solution],
+        "solution_blocks": solution,
+        "pool": solution + distractors,
+    }
+
+    answer_ids = [block["id"] for block in solution]
+    for _ in range(max(1, slots // 5)):
+        a, b = rng.randrange(slots), rng.randrange(slots)
+        answer_ids[a], answer_ids[b] = answer_ids[b], answer_ids[a]
+    answer_ids[rng.randrange(slots)] = distractors[0]["id"]
+    by_id = {block["id"]: block["text"] for block in task["pool"]}
+    answer_lines = [by_id[block_id] for block_id in answer_ids]
+    return task, answer_ids, answer_lines
+
+
+@pytest.mark.parametrize("mode", ["practice", "test"])
+@pytest.mark.parametrize("slots", [5, 10, 20, 40])
+def test_grade_submission_benchmark(benchmark, slots, mode):
+    task, answer_ids, answer_lines = _synthetic_task(slots, seed=slots)
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        graded = grade_parsons_submission(task, answer_ids, answer_lines, mode=mode)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        # graded 仍被引用：快照差異是結果本身保留的記憶體，峰值則含評分過程的暫存配置。
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    benchmark.extra_info["slots"] = slots
+    benchmark.extra_info["peak_bytes"] = peak
+    benchmark.extra_info["result_blocks"] = sum(max(0, stat.count_diff) for stat in stats)
+    benchmark.extra_info["result_bytes"] = sum(max(0, stat.size_diff) for stat in stats)
+    assert graded["total_slots"] == slots
+
+    result = benchmark(grade_parsons_submission, task, answer_ids, answer_lines, mode=mode)
+    assert result["total_slots"] == slots
+    assert result["is_correct"] is False
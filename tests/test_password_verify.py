@@ -0,0 +1,26 @@
+import threading
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import password_verify
+
+
+def test_pool_verifies_and_admission_rejects_when_saturated(monkeypatch):
+    stored = generate_password_hash("secret", method="pbkdf2:sha256:1000")
+    monkeypatch.setattr(password_verify, "PASSWORD_VERIFY_WORKERS", 1)
+    monkeypatch.setattr(password_verify, "_POOL", None)
+    try:
+        assert password_verify.verify_password(stored, "secret")
+        assert not password_verify.verify_password(stored, "wrong")
+    finally:
+        password_verify.shutdown_password_pool()
+
+    admission = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(password_verify, "_ADMISSION", admission)
+    monkeypatch.setattr(password_verify, "PASSWORD_VERIFY_WORKERS", 0)
+    admission.acquire()
+    with pytest.raises(password_verify.LoginBusy):
+        password_verify.verify_password(stored, "secret")
+    admission.release()
+    assert password_verify.verify_password(stored, "secret")
@@ -0,0 +1,67 @@
+from app.query_shapes import query_shape, recommend_index, redundant_indexes
+
+
+def test_find_shape_classifies_predicates_and_keeps_sort():
+    shape = query_shape("find", {
+        "find": "parsons_attempts_v2",
+        "filter": {
+            "activity_type": "test",
+            "test_role": None,
+            "student_id": {"$in": ["s1", "s2"]},
+            "submitted_at": {"$gte": 1, "$lt": 2},
+            "$or": [{"is_test_data": True}],
+        },
+        "sort": {"student_id": 1, "submitted_at": -1},
+    })
+    assert shape["collection"] == "parsons_attempts_v2"
+    assert shape["filter"] == {
+        "activity_type": "eq",
+        "test_role": "eq",
+        "student_id": "in",
+        "submitted_at": "range",
+        "$or": "other",
+    }
+    assert shape["sort"] == [("student_id", 1), ("submitted_at", -1)]
+
+
+def test_aggregate_uses_leading_match_and_sort():
+    shape = query_shape("aggregate", {
+        "aggregate": "learning_logs",
+        "pipeline": [{"$match": {"student_id": "s1"}}, {"$sort": {"event_at": -1}}, {"$limit": 5}],
+    })
+    assert shape["filter"] == {"student_id": "eq"}
+    assert shape["sort"] == [("event_at", -1)]
+    assert query_shape("insert", {"insert": "learning_logs", "documents": []}) is None
+
+
+def test_recommendation_follows_equality_sort_range():
+    shape = {
+        "filter": {"submitted_at": "range", "activity_type": "eq", "student_id": "in", "$or": "other"},
+        "sort": [("task_id", 1)],
+    }
+    # 有排序時 $in 視為範圍條件。
+    assert recommend_index(shape) == [
+        ("activity_type", 1),
+        ("task_id", 1),
+        ("submitted_at", 1),
+        ("student_id", 1),
+    ]
+    assert recommend_index({"filter": {"student_id": "in", "is_test_data": "eq"}, "sort": []}) == [
+        ("student_id", 1),
+        ("is_test_data", 1),
+    ]
+
+
+def test_prefix_indexes_are_redundant_unless_unique_or_partial():
+    indexes = [
+        {"name": "_id_", "key": {"_id": 1}},
+        {"name": "student_id_1", "key": {"student_id": 1}},
+        {"name": "uniq_student", "key": {"student_id": 1}, "unique": True},
+        {"name": "student_event_at_1", "key": {"student_id": 1, "event_at": -1}},
+        {"name": "activity_type_1", "key": {"activity_type": 1}},
+    ]
+    report = redundant_indexes(indexes, planned=[[("activity_type", 1), ("test_role", 1)]])
+    assert [(item["name"], item["covered_by"]) for item in report] == [
+        ("student_id_1", "student_id_1_event_at_-1"),
+        ("activity_type_1", "activity_type_1_test_role_1"),
+    ]
@@ -0,0 +1,63 @@
+from collections import Counter
+
+from werkzeug.security import check_password_hash
+
+from app.routes.parsons import _validate_attempt_v2_doc
+from tools.seed_dataset import (
+    StudentSemester,
+    build_catalog,
+    build_slots,
+    build_students,
+    scaling_exponents,
+    seeded_password_hash,
+    semester_start,
+    staff_users,
+)
+
+
+def _semester(seed, count=6, weeks=8):
+    start = semester_start("2026-02-23")
+    videos, tasks = build_catalog(units=2, videos_per_unit=2, start=start)
+    tasks_by_video = {}
+    for task in tasks:
+        tasks_by_video.setdefault(task["video_id"], []).append(task)
+    test_tasks = [task for task in tasks if task["level"] == "L2"][::2]
+    slots = build_slots(count, seed, start)
+    password_hash = seeded_password_hash("bench1234", seed)
+    students = build_students(count, seed, password_hash, start, slots)
+    semesters = [
+        StudentSemester(seed, student, videos, tasks_by_video, start, weeks).run(test_tasks)
+        for student in students
+    ]
+    return semesters, slots, staff_users(password_hash, start) + students
+
+
+def test_same_seed_gives_identical_documents():
+    first, _, first_users = _semester(7)
+    second, _, second_users = _semester(7)
+    other, _, other_users = _semester(8)
+    assert first_users == second_users
+    assert first_users[0]["password_hash"] != other_users[0]["password_hash"]
+    assert check_password_hash(first_users[0]["password_hash"], "bench1234")
+    assert [s.attempts for s in first] == [s.attempts for s in second]
+    assert [s.video_logs for s in first] == [s.video_logs for s in second]
+    assert [s.attempts for s in first] != [s.attempts for s in other]
+
+
+def test_slots_are_balanced_and_attempts_pass_v2_validation():
+    semesters, slots, _ = _semester(11, count=12)
+    assert Counter(slot["feedback_strategy"] for slot in slots) == {"A": 4, "B": 4, "C": 4}
+    attempts = [attempt for semester in semesters for attempt in semester.attempts]
+    assert attempts
+    assert {attempt["activity_type"] for attempt in attempts} == {"practice", "test"}
+    assert any(not attempt["is_correct"] for attempt in attempts)
+    for attempt in attempts:
+        assert _validate_attempt_v2_doc(attempt) == [], attempt["_id"]
+
+
+def test_scaling_exponent_compares_smallest_and_largest_scale():
+    results = {"50": {"/a": 0.1, "/b": 0.1}, "500": {"/a": 1.0, "/b": 10.0}}
+    exponents = scaling_exponents(results)
+    assert abs(exponents["/a"] - 1.0) < 1e-9
+    assert abs(exponents["/b"] - 2.0) < 1e-9
+    assert scaling_exponents({"50": {"/a": 0.1}}) == {}
@@ -0,0 +1,134 @@
+from types import SimpleNamespace
+
+from bson import ObjectId
+from flask import Flask
+
+from app import cache_versions, student_progress
+from app.routes import admin_upload
+
+
+class _DB(dict):
+    def __getattr__(self, name):
+        return self[name]
+
+
+class _Videos:
+    def __init__(self, docs):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        self.finds = 0
+
+    def find(self, query, projection=None):
+        self.finds += 1
+        return [dict(doc) for doc in self.docs.values() if not doc.get("deleted")]
+
+    def find_one(self, query):
+        doc = self.docs.get(query["_id"])
+        return dict(doc) if doc else None
+
+    def update_one(self, query, update):
+        doc = self.docs.get(query["_id"])
+        if doc:
+            doc.update(update["$set"])
+        return SimpleNamespace(matched_count=1 if doc else 0)
+
+
+class _Labels:
+    def find(self, query, projection=None):
+        return []
+
+
+class _TestControl:
+    def find_one(self, query):
+        return None
+
+
+class _TestTasks:
+    def __init__(self):
+        self.counts = 0
+
+    def count_documents(self, query):
+        self.counts += 1
+        return 2
+
+
+class _Stamps:
+    def __init__(self):
+        self.docs = {}
+        self.reads = 0
+
+    def find_one(self, query, projection=None):
+        self.reads += 1
+        return self.docs.get(query["_id"])
+
+    def find_one_and_update(self, query, update, **kwargs):
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"], "version": 0})
+        doc["version"] += update["$inc"]["version"]
+        return dict(doc)
+
+
+def _setup(monkeypatch):
+    video_a, video_b = ObjectId(), ObjectId()
+    fake = _DB(
+        videos=_Videos([
+            {"_id": video_a, "unit": "U1", "active": True},
+            {"_id": video_b, "unit": "U2", "active": True},
+        ]),
+        unit_labels=_Labels(),
+        test_control=_TestControl(),
+        parsons_test_tasks=_TestTasks(),
+        cache_versions=_Stamps(),
+    )
+    for module in (student_progress, cache_versions, admin_upload):
+        monkeypatch.setattr(module, "db", fake)
+    monkeypatch.setattr("app.unit_labels.db", fake)
+    monkeypatch.setattr(student_progress, "_CATALOG_STATE", {"version": None, "units": None, "posttest": {}})
+    monkeypatch.setattr(cache_versions, "_LOCAL_STAMPS", {})
+    monkeypatch.setenv("STUDENT_HOME_CATALOG_CHECK_SEC", "60")
+    return fake, video_a, video_b
+
+
+def test_catalog_is_reused_until_the_stamp_moves(monkeypatch):
+    fake, _video_a, _video_b = _setup(monkeypatch)
+
+    units, posttest = student_progress.student_home_catalog("c1")
+    assert [unit["unit"] for unit in units] == ["U1", "U2"]
+    assert posttest == {"post_open": False, "total": 2}
+
+    again, _ = student_progress.student_home_catalog("c1")
+    assert again is units
+    assert (fake.videos.finds, fake.parsons_test_tasks.counts, fake.cache_versions.reads) == (1, 1, 1)
+
+    # 另一個測驗週期只多載入 posttest，單元目錄沿用。
+    student_progress.student_home_catalog("c2")
+    assert (fake.videos.finds, fake.parsons_test_tasks.counts) == (1, 2)
+
+    # 其他行程更新了 stamp：檢查間隔內仍用快取，過了間隔才重建。
+    fake.cache_versions.docs["student_home_catalog"] = {"version": 7}
+    student_progress.student_home_catalog("c1")
+    assert fake.videos.finds == 1
+    monkeypatch.setenv("STUDENT_HOME_CATALOG_CHECK_SEC", "0")
+    student_progress.student_home_catalog("c1")
+    assert fake.videos.finds == 2
+
+
+def test_admin_upload_video_toggle_invalidates_the_catalog(monkeypatch):
+    fake, video_a, _video_b = _setup(monkeypatch)
+    app = Flask(__name__)
+    app.register_blueprint(admin_upload.admin_upload_bp, url_prefix="/api/admin_upload")
+    client = app.test_client()
+
+    units, _ = student_progress.student_home_catalog("c1")
+    assert [unit["unit"] for unit in units] == ["U1", "U2"]
+
+    response = client.patch(f"/api/admin_upload/video/{video_a}/active", json={"active": False})
+    assert response.status_code == 200
+    assert fake.cache_versions.docs["student_home_catalog"]["version"] == 1
+
+    # 寫入的行程立即看到新版本，不必等檢查間隔。
+    units, _ = student_progress.student_home_catalog("c1")
+    assert [unit["unit"] for unit in units] == ["U2"]
+    assert fake.videos.finds == 2
+
+    client.patch(f"/api/admin_upload/video/{video_a}/delete", json={})
+    student_progress.student_home_catalog("c1")
+    assert fake.videos.finds == 3
@@ -0,0 +1,74 @@
+from bson import ObjectId
+
+from app import task_snapshots
+
+
+class _DB(dict):
+    def __getattr__(self, name):
+        return self[name]
+
+
+class _Collection:
+    def __init__(self, docs=()):
+        self.docs = {doc["_id"]: dict(doc) for doc in docs}
+        self.reads = []
+
+    def find_one(self, query, projection=None):
+        self.reads.append(projection)
+        doc = self.docs.get(query["_id"])
+        if doc is None:
+            return None
+        if projection:
+            return {key: value for key, value in doc.items() if key == "_id" or projection.get(key)}
+        return dict(doc)
+
+    def replace_one(self, query, doc, upsert=False):
+        self.docs[query["_id"]] = dict(doc)
+
+    def delete_many(self, query):
+        for oid in query["_id"]["$in"]:
+            self.docs.pop(oid, None)
+
+
+def test_snapshot_is_lean_built_once_and_rebuilt_after_a_drop(monkeypatch):
+    oid = ObjectId()
+    tasks = _Collection([{
+        "_id": oid,
+        "question_text": "印出 1 到 n",
+        "solution_blocks": [{"id": "s0", "text": "for i in range(n):"}],
+        "slot_concept_map": {"0": "for_loop"},
+        "level": "L2",
+        "enabled": True,
+        "ai_debug": {"raw": "x" * 1000},
+        "prompt_source": {"subtitle_preview": "..."},
+        "subtitle_text_used": "...",
+    }])
+    snapshots = _Collection()
+    monkeypatch.setattr(task_snapshots, "db", _DB({
+        "parsons_tasks": tasks,
+        task_snapshots.TASK_SNAPSHOT_COLLECTION: snapshots,
+    }))
+
+    first = task_snapshots.load_task_snapshot(str(oid))
+    assert first == {
+        "_id": oid,
+        "question_text": "印出 1 到 n",
+        "solution_blocks": [{"id": "s0", "text": "for i in range(n):"}],
+        "slot_concept_map": {"0": "for_loop"},
+        "level": "L2",
+    }
+    assert tasks.reads == [task_snapshots.TASK_SNAPSHOT_PROJECTION]
+
+    assert task_snapshots.load_task_snapshot(oid) == first
+    assert len(tasks.reads) == 1
+
+    tasks.docs[oid]["question_text"] = "印出 n 到 1"
+    task_snapshots.drop_task_snapshot(str(oid))
+    assert task_snapshots.load_task_snapshot(oid)["question_text"] == "印出 n 到 1"
+
+    monkeypatch.setenv("TASK_SNAPSHOT_MAX_AGE_SEC", "0.000001")
+    tasks.docs[oid]["level"] = "L3"
+    assert task_snapshots.load_task_snapshot(oid)["level"] == "L3"
+
+    assert task_snapshots.load_task_snapshot("not-an-id") is None
+    assert task_snapshots.load_task_snapshot(ObjectId()) is None
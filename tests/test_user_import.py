@@ -0,0 +1,207 @@
+from pymongo.errors import BulkWriteError
+
+from app import user_import
+from app.user_import import ImportRow
+
+
+class _Result:
+    def __init__(self, matched_count=0):
+        self.matched_count = matched_count
+
+
+class _DB(dict):
+    def __getattr__(self, name):
+        return self[name]
+
+
+class _Users:
+    """``find`` with ``$in`` and an unordered ``bulk_write`` with a unique student_id."""
+
+    def __init__(self, docs):
+        self.docs = {doc["_id"]: dict(doc) for doc in docs}
+        self.queries = []
+
+    def find(self, query):
+        self.queries.append(query)
+        wanted = set(query["student_id"]["$in"])
+        return [dict(doc) for doc in self.docs.values() if doc["student_id"] in wanted]
+
+    def bulk_write(self, operations, ordered=True):
+        errors = []
+        for index, operation in enumerate(operations):
+            if hasattr(operation, "_filter"):
+                self.docs[operation._filter["_id"]].update(operation._doc["$set"])
+            elif any(doc["student_id"] == operation._doc["student_id"] for doc in self.docs.values()):
+                errors.append({"index": index, "code": 11000})
+            else:
+                self.docs[operation._doc["student_id"]] = {"_id": operation._doc["student_id"], **operation._doc}
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+        return _Result(len(operations))
+
+
+def test_import_prefetches_once_and_reports_every_row(monkeypatch):
+    users = _Users([{"_id": "u1", "student_id": "s1", "password_hash": "kept", "name": "old"}])
+    monkeypatch.setattr(user_import, "db", _DB(users=users))
+    monkeypatch.setattr(user_import, "IMPORT_HASH_WORKERS", 0)
+    monkeypatch.setattr(user_import, "generate_password_hash", lambda password: f"hashed:{password}")
+    claimed = []
+    monkeypatch.setattr(
+        user_import,
+        "assign_feedback_strategies_on_import",
+        lambda ids: claimed.extend(ids) or {sid: {"assigned": True, "group_type": "control"} for sid in ids},
+    )
+    # 另一個行程在讀取之後才建立 s3，插入時違反唯一索引。
+    users_race = {"_id": "race", "student_id": "s3"}
+
+    def fields_for(row, existing, now):
+        if row.student_id == "s3":
+            users.docs["race"] = users_race
+        return {"student_id": row.student_id, "name": row.data["name"]}
+
+    rows = [
+        ImportRow(2, "s1", {"name": "first"}),
+        ImportRow(3, "s2", {"name": "new"}),
+        ImportRow(4, "s1", {"name": "last"}),
+        ImportRow(5, "s3", {"name": "raced"}),
+    ]
+    results = user_import.run_user_import(
+        rows,
+        fields_for,
+        lambda row, existing: None if existing and existing.get("password_hash") else row.student_id,
+        randomize=lambda row, fields: True,
+    )
+
+    assert len(users.queries) == 1
+    assert [(result["row"], result["action"]) for result in results] == [
+        (2, "skipped"), (3, "inserted"), (4, "updated"), (5, "failed"),
+    ]
+    assert results[3]["reason"] == "duplicate_student_id"
+    assert users.docs["u1"]["name"] == "last"
+    assert users.docs["u1"]["password_hash"] == "kept"
+    assert users.docs["s2"]["password_hash"] == "hashed:s2"
+    assert claimed == ["s2", "s1"]
+    assert results[1]["assignment"]["group_type"] == "control"
+
+
+class _Cursor(list):
+    def sort(self, keys):
+        field, _direction = keys[0]
+        return _Cursor(sorted(self, key=lambda doc: doc[field]))
+
+    def limit(self, count):
+        return _Cursor(self[:count])
+
+
+def _matches(doc, query):
+    for field, expected in query.items():
+        if isinstance(expected, dict):
+            if doc.get(field) not in expected["$in"]:
+                return False
+        elif doc.get(field) != expected:
+            return False
+    return True
+
+
+class _Collection:
+    def __init__(self, docs, before_write=None):
+        self.docs = [dict(doc) for doc in docs]
+        self.before_write = before_write
+
+    def find(self, query):
+        return _Cursor(dict(doc) for doc in self.docs if _matches(doc, query))
+
+    def bulk_write(self, operations, ordered=True):
+        if self.before_write:
+            self.before_write(self)
+        matched = 0
+        for operation in operations:
+            for doc in self.docs:
+                if _matches(doc, operation._filter):
+                    doc.update(operation._doc["$set"])
+                    matched += 1
+                    break
+        return _Result(matched)
+
+
+def test_batch_slot_claim_keeps_order_and_falls_back_after_a_lost_race(monkeypatch):
+    from app import randomization
+
+    study = {"study_id": randomization.DEFAULT_STUDY_ID, "sequence_version": randomization.DEFAULT_SEQUENCE_VERSION}
+    slots = [
+        {"_id": position, "position": position, "status": "available", "feedback_strategy": "ABC"[position % 3], "block_id": "b1", **study}
+        for position in (1, 2, 3)
+    ]
+    slots.append({"_id": 9, "position": 9, "status": "claimed", "student_id": "back", "feedback_strategy": "A", "block_id": "b3", **study})
+
+    def steal_second_slot(collection):
+        # 另一個匯入在這批寫入前先認領了位置 2。
+        collection.docs[1].update(status="claimed", student_id="other")
+
+    users = _Collection([{"_id": sid, "student_id": sid, "role": "student"} for sid in ("s1", "s2", "back")])
+    slot_collection = _Collection(slots, before_write=steal_second_slot)
+    monkeypatch.setattr(randomization, "db", _DB({"users": users, randomization.SLOT_COLLECTION: slot_collection}))
+    monkeypatch.setattr(randomization, "ensure_randomization_indexes", lambda: None)
+    fallback = []
+    monkeypatch.setattr(
+        randomization,
+        "assign_feedback_strategy_on_import",
+        lambda sid: fallback.append(sid) or {"assigned": True, "recovered": False, "position": 3},
+    )
+
+    results = randomization.assign_feedback_strategies_on_import(["s1", "s2", "back", "missing"])
+
+    assert results["s1"]["position"] == 1 and not results["s1"]["recovered"]
+    assert results["back"]["position"] == 9 and results["back"]["recovered"]
+    assert fallback == ["s2"]
+    assert isinstance(results["missing"], ValueError)
+    assert users.docs[0]["assignment_locked"] is True
+    assert users.docs[2]["randomization_position"] == 9
+
+
+def test_a_corrupt_slot_fails_only_its_own_student(monkeypatch):
+    from app import randomization
+
+    study = {"study_id": randomization.DEFAULT_STUDY_ID, "sequence_version": randomization.DEFAULT_SEQUENCE_VERSION}
+    slots = [
+        {"_id": 1, "position": 1, "status": "available", "feedback_strategy": "bogus", "block_id": "b1", **study},
+        {"_id": 2, "position": 2, "status": "available", "feedback_strategy": "A", "block_id": "b1", **study},
+    ]
+    users = _Collection([{"_id": sid, "student_id": sid, "role": "student"} for sid in ("s1", "s2")])
+    monkeypatch.setattr(randomization, "db", _DB({"users": users, randomization.SLOT_COLLECTION: _Collection(slots)}))
+    monkeypatch.setattr(randomization, "ensure_randomization_indexes", lambda: None)
+
+    results = randomization.assign_feedback_strategies_on_import(["s1", "s2"])
+
+    assert isinstance(results["s1"], ValueError)
+    assert results["s2"]["position"] == 2
+    assert "assignment_locked" not in users.docs[0]
+    assert users.docs[1]["assignment_locked"] is True
+    assert user_import._assignment_error(results["s1"]) == "randomization_assignment_failed"
+
+
+class _Jobs:
+    def __init__(self, docs):
+        self.docs = {doc["_id"]: doc for doc in docs}
+
+    def find_one(self, query):
+        doc = self.docs.get(query["_id"])
+        return dict(doc) if doc and doc["kind"] == query["kind"] else None
+
+
+def test_job_status_is_private_to_its_creator_and_only_running_jobs_go_stale(monkeypatch):
+    from datetime import timedelta
+
+    old = user_import._utc_now() - timedelta(seconds=user_import.JOB_STALE_SEC + 60)
+    jobs = _Jobs([
+        {"_id": "run", "kind": "users_csv", "status": "running", "created_by": "t1", "heartbeat_at": old},
+        {"_id": "wait", "kind": "users_csv", "status": "queued", "created_by": "t1", "heartbeat_at": old},
+        {"_id": "done", "kind": "users_csv", "status": "done", "created_by": "t1", "heartbeat_at": old, "result": []},
+    ])
+    monkeypatch.setattr(user_import, "db", _DB({user_import.USER_IMPORT_JOBS: jobs}))
+
+    assert user_import.import_job_status("run", "users_csv", "t1")["status"] == "stale"
+    assert user_import.import_job_status("wait", "users_csv", "t1")["status"] == "queued"
+    assert user_import.import_job_status("done", "users_csv", "t1")["status"] == "done"
+    assert user_import.import_job_status("run", "users_csv", "t2") is None
+    assert user_import.import_job_status("run", "students_csv", "t1") is None
@@ -0,0 +1,67 @@
+from datetime import datetime, timezone
+
+from app.log_storage import with_timeseries_fields
+from app.video_log_rollup import (
+    summarize_video_events,
+    summary_completed_weight,
+    summary_record_weight,
+    taipei_day_bounds,
+)
+
+
+def _event(event_type, hour, **fields):
+    return {
+        "student_id": "s1",
+        "video_id": "v1",
+        "event_type": event_type,
+        "event_at": datetime(2026, 3, 1, hour, tzinfo=timezone.utc),
+        **fields,
+    }
+
+
+def test_events_fold_into_one_summary_per_taipei_day():
+    summaries = summarize_video_events([
+        _event("video_play", 1, watch_session_id="w1"),
+        _event("video_seek", 2, watch_session_id="w1", seek_delta_sec=-12.0, is_backward_seek=True),
+        _event("video_ended", 3, watch_session_id="w2", reached_end=True, watch_delta_sec=30.0),
+        # 播放器在 ended 之後自動送出的 pause 不計入。
+        _event("video_pause", 3, reached_end=True),
+        # 台北時間 3/2 08:00，屬於隔天。
+        _event("video_progress", 16, watch_seconds=5.0),
+    ])
+    by_day = {summary["day"]: summary for summary in summaries}
+    assert sorted(by_day) == ["2026-03-01", "2026-03-02"]
+
+    first = by_day["2026-03-01"]
+    assert first["_id"] == {"student_id": "s1", "video_id": "v1", "day": "2026-03-01"}
+    assert first["event_count"] == 3
+    assert first["event_type_counts"] == {"video_play": 1, "video_seek": 1, "video_ended": 1}
+    assert first["completed_event_count"] == 1
+    assert first["seek_count"] == 1
+    assert first["backward_seek_count"] == 1
+    assert first["total_seek_distance"] == 12.0
+    assert first["watch_session_count"] == 2
+    assert first["watch_seconds_total"] == 30.0
+    assert by_day["2026-03-02"]["watch_seconds_total"] == 5.0
+
+
+def test_summary_rows_weigh_as_the_events_they_replace():
+    summary_row = {"is_daily_summary": True, "event_count": 7, "completed_event_count": 2}
+    raw_row = {"reached_end": True}
+    assert summary_record_weight(summary_row) == 7
+    assert summary_completed_weight(summary_row) == 2
+    assert summary_record_weight(raw_row) == 1
+    assert summary_completed_weight(raw_row) == 1
+
+
+def test_taipei_day_bounds_are_utc():
+    start, end = taipei_day_bounds("2026-03-01")
+    assert start == datetime(2026, 2, 28, 16, tzinfo=timezone.utc)
+    assert end == datetime(2026, 3, 1, 16, tzinfo=timezone.utc)
+
+
+def test_timeseries_fields_fall_back_to_start_time():
+    started = datetime(2026, 3, 1, 9, 30)
+    doc = with_timeseries_fields("learning_logs", {"student_id": "s1", "start_at": started})
+    assert doc["event_at"] == started.replace(tzinfo=timezone.utc)
+    assert doc["meta"] == {"student_id": "s1", "event_type": None}
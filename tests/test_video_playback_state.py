@@ -0,0 +1,55 @@
+from datetime import datetime, timezone
+
+from app.video_playback_state import is_completed, playback_state_update
+
+
+_AT = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+def _fields(update):
+    return update[1]["$set"]
+
+
+def test_segment_replays_do_not_touch_full_video_state():
+    assert playback_state_update({
+        "student_id": "s1",
+        "video_id": "v1",
+        "event_type": "video_pause",
+        "current_time_sec": 42.0,
+        "segment_start_sec": 30.0,
+        "event_at": _AT,
+    }) is None
+
+
+def test_click_at_zero_counts_watch_time_but_keeps_resume_position():
+    fields = _fields(playback_state_update({
+        "student_id": "s1",
+        "video_id": "v1",
+        "event_type": "video_click",
+        "current_time_sec": 0,
+        "video_duration_sec": 120.0,
+        "event_at": _AT,
+    }))
+    assert "resume_sec" not in fields
+    assert fields["video_duration_sec"] == {"$literal": 120.0}
+    assert fields["event_count"] == {"$add": [{"$ifNull": ["$event_count", 0]}, 1]}
+
+
+def test_pause_moves_position_only_when_newer_and_literals_are_escaped():
+    update = playback_state_update({
+        "student_id": "s1",
+        "video_id": "$where",
+        "event_type": "video_pause",
+        "current_time_sec": 42.0,
+        "event_at": _AT,
+    })
+    fields = _fields(update)
+    assert fields["video_id"] == {"$literal": "$where"}
+    assert fields["resume_sec"] == {"$cond": ["$_fresh", {"$literal": 42.0}, "$resume_sec"]}
+    assert "first_completed_at" not in fields
+
+
+def test_completion_rule_matches_resume_endpoint():
+    assert is_completed("video_ended", False, 10, None)
+    assert is_completed("video_pause", False, 118, 120)
+    assert not is_completed("video_pause", False, 100, 120)
@@ -0,0 +1,726 @@
+"""Compare slot-to-subtitle retrieval strategies on the same Parsons tasks.
+
+``evaluate_precision_at_1``, ``evaluate_slot_alignment`` and
+``evaluate_mdbr_leaf_ir`` each opened their own MongoClient, parsed the
+subtitles again and scored one task at a time, so comparing two strategies
+meant running two scripts over the same data.  This runner does it in one
+pass:
+
+* the tasks are read once (with a projection) and grouped by subtitle text,
+  so every subtitle is parsed and indexed once per strategy;
+* the groups fan out over a process pool; each worker keeps its parsed
+  subtitles, built indexes and the loaded embedding model for its lifetime;
+* the per-slot predictions of every (task, strategy) pair are cached in
+  ``--cache`` under a fingerprint of the slot queries, the subtitle and the
+  strategy version / parameters, so a rerun only recomputes what changed;
+* scoring happens in the parent: precision@1 and overlap against manual
+  labels (``--labels``, same format as ``evaluate_precision_at_1``), overlap
+  against the stored ``ai_segment_map``, monotonicity, uniqueness and the
+  per-task query latency / per-subtitle build latency.
+
+Usage:
+  python -m tools.evaluate_retrieval --labels tools/labels_p1.json
+  python -m tools.evaluate_retrieval --video_id 69bb823ef339ec9732fc7a3f --strategies tfidf,tfidf_window,stored_map
+  python -m tools.evaluate_retrieval --strategies tfidf,mdbr --workers 4 --export_csv retrieval_eval.csv
+  python -m tools.evaluate_retrieval --rerun tfidf_window
+
+Strategies (``--strategies``, default ``tfidf,tfidf_window,stored_map``):
+  tfidf         local TF-IDF index, top-1 segment (``retrieve_best_segment``)
+  tfidf_window  local TF-IDF top-k merged into one window (``merge_top_k_window``)
+  openai        OpenAI embedding index, top-1 (calls the API for every segment)
+  local_dense   local CPU model over the on-disk float16 vectors, top-1 (batched per task)
+  bm25          BM25 over the same tokens as tfidf, top-1
+  bm25_window   BM25 top-k merged into one window
+  hybrid        BM25 + the PARSONS_RETRIEVAL_HYBRID_DENSE mode fused with RRF, top-1
+  mdbr          MongoDB/mdbr-leaf-ir via ``evaluate_mdbr_leaf_ir.LeafIR``
+  stored_map    the ``ai_segment_map`` saved on the task (no retrieval)
+
+Bump a strategy's ``version`` below when its code changes so cached
+predictions are recomputed.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_STRATEGIES = "tfidf,tfidf_window,stored_map"
+DEFAULT_CACHE_FILE = "retrieval_eval_cache.json"
+TASK_PROJECTION = {
+    "solution_blocks": 1,
+    "template_slots": 1,
+    "ai_segment_map": 1,
+    "prompt_source": 1,
+    "source_subtitle": 1,
+    "subtitle_text_used": 1,
+    "subtitle_path": 1,
+    "video_id": 1,
+    "level": 1,
+    "unit": 1,
+    "created_at": 1,
+}
+# 每個 worker 最多保留這麼多份字幕的解析結果與索引。
+WORKER_CACHE_SUBTITLES = 64
+
+
+def fingerprint(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _overlap(pred: Tuple[float, float], truth: Tuple[float, float]) -> float:
+    ov = max(0.0, min(pred[1], truth[1]) - max(pred[0], truth[0]))
+    base = max(1e-6, min(max(pred[1] - pred[0], 0.0), max(truth[1] - truth[0], 0.0)))
+    return ov / base
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * pct / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+# ---------------------------------------------------------------------------
+# Task inputs
+# ---------------------------------------------------------------------------
+
+def subtitle_text_for_task(task: Dict[str, Any]) -> str:
+    """The SRT text the task was generated from ('' when none is reachable)."""
+    prompt_source = task.get("prompt_source") or {}
+    for raw in (
+        (task.get("source_subtitle") or {}).get("text_used"),
+        task.get("subtitle_text_used"),
+        prompt_source.get("subtitle_text"),
+        prompt_source.get("subtitle_preview"),
+    ):
+        raw = str(raw or "").strip()
+        if "-->" in raw:
+            return raw
+
+    path = str(prompt_source.get("subtitle_path") or task.get("subtitle_path") or "").strip()
+    if not path:
+        return ""
+    if not os.path.isabs(path):
+        path = os.path.join(REPO_ROOT, path)
+    try:
+        with open(path, "r", encoding="utf-8-sig", errors="ignore") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def slot_queries(task: Dict[str, Any]) -> List[str]:
+    out = []
+    for block in task.get("solution_blocks") or []:
+        block = block or {}
+        out.append((
+            str(block.get("text") or "").strip()
+            + " "
+            + str(block.get("semantic_zh") or block.get("meaning_zh") or "").strip()
+        ).strip())
+    return out
+
+
+def stored_slot_range(task: Dict[str, Any], slot: int) -> Optional[Tuple[float, float]]:
+    seg_map = task.get("ai_segment_map") or {}
+    if not isinstance(seg_map, dict):
+        return None
+    for key in (str(slot), f"s{slot + 1}", f"第{slot + 1}格"):
+        value = seg_map.get(key)
+        if not isinstance(value, dict):
+            continue
+        try:
+            start = float(value.get("start", value.get("start_ts")))
+            end = float(value.get("end", value.get("end_ts")))
+        except (TypeError, ValueError):
+            continue
+        if end > start:
+            return start, end
+    return None
+
+
+def _task_payload(task: Dict[str, Any]) -> Dict[str, Any]:
+    """The picklable part of a task a worker needs."""
+    queries = slot_queries(task)
+    stored = [stored_slot_range(task, i) for i in range(len(queries))]
+    return {
+        "task_id": str(task.get("_id") or ""),
+        "video_id": str(task.get("video_id") or ""),
+        "level": str(task.get("level") or ""),
+        "unit": str(task.get("unit") or ""),
+        "queries": queries,
+        "stored": stored,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Strategies
+# ---------------------------------------------------------------------------
+
+class Strategy:
+    """``prepare`` runs once per subtitle (cached per worker); ``run`` once per task."""
+
+    def __init__(self, name: str, version: str, prepare: Callable, run: Callable, params: Tuple[str, ...] = ()):
+        self.name = name
+        self.version = version
+        self.prepare = prepare
+        self.run = run
+        self.params = params
+
+    def config(self, options: Dict[str, Any]) -> Dict[str, Any]:
+        return {"version": self.version, **{key: options.get(key) for key in self.params}}
+
+
+def _prediction(seg: Optional[Dict[str, Any]], score: float) -> Optional[Dict[str, Any]]:
+    if not seg:
+        return None
+    return {"start": float(seg.get("start", 0.0)), "end": float(seg.get("end", 0.0)), "score": round(float(score), 4)}
+
+
+def _prepare_tfidf(segments, options, worker):
+    from app.routes.parsons_retrieval import build_subtitle_index
+
+    return build_subtitle_index(segments, mode="local")
+
+
+def _prepare_bm25(segments, options, worker):
+    from app.routes.parsons_retrieval import build_subtitle_index
+
+    return build_subtitle_index(segments, mode="bm25")
+
+
+def _prepare_hybrid(segments, options, worker):
+    from app.routes.parsons_retrieval import build_subtitle_index
+
+    return build_subtitle_index(segments, mode="hybrid")
+
+
+def _prepare_openai(segments, options, worker):
+    from app.routes.parsons_retrieval import build_subtitle_index
+
+    return build_subtitle_index(segments, mode="openai", embed_model=options.get("openai_model") or None)
+
+
+def _run_top1(index, payload, options, worker):
+    from app.routes.parsons_retrieval import retrieve_best_segment
+
+    return [_prediction(*retrieve_best_segment(query, index)) if query else None for query in payload["queries"]]
+
+
+def _prepare_local_dense(segments, options, worker):
+    from app.routes.parsons_retrieval import build_subtitle_index
+
+    index = build_subtitle_index(segments, mode="local_dense")
+    if index.get("mode") != "local_dense":
+        raise RuntimeError("local_dense needs numpy and sentence-transformers")
+    return index
+
+
+def _run_batch_top1(index, payload, options, worker):
+    from app.routes.parsons_retrieval import retrieve_top_k_segments_batch
+
+    # 同一題的所有格子一次編碼、一次矩陣乘法。
+    hits = retrieve_top_k_segments_batch([q or " " for q in payload["queries"]], index, k=1)
+    return [
+        _prediction(rows[0], rows[0]["score"]) if query and rows else None
+        for query, rows in zip(payload["queries"], hits)
+    ]
+
+
+def _run_window(index, payload, options, worker):
+    from app.routes.parsons_retrieval import merge_top_k_window, retrieve_top_k_segments
+
+    k = int(options.get("top_k") or 3)
+    out = []
+    for query in payload["queries"]:
+        hits = retrieve_top_k_segments(query, index, k=k) if query else []
+        out.append(_prediction(*merge_top_k_window(hits)) if hits else None)
+    return out
+
+
+def _prepare_mdbr(segments, options, worker):
+    ir = worker.model(options.get("model") or "MongoDB/mdbr-leaf-ir")
+    return {"segments": segments, "vectors": ir.embed([str(s.get("text") or "") for s in segments]) if segments else []}
+
+
+def _run_mdbr(state, payload, options, worker):
+    from tools.evaluate_mdbr_leaf_ir import _cosine
+
+    ir = worker.model(options.get("model") or "MongoDB/mdbr-leaf-ir")
+    queries = [query for query in payload["queries"] if query]
+    # 同一題的所有格子一次編碼。
+    query_vecs = iter(ir.embed(queries) if queries and state["vectors"] else [])
+    out = []
+    for query in payload["queries"]:
+        vec = next(query_vecs, None) if query else None
+        if vec is None:
+            out.append(None)
+            continue
+        scores = [_cosine(vec, seg_vec) for seg_vec in state["vectors"]]
+        best = max(range(len(scores)), key=scores.__getitem__)
+        out.append(_prediction(state["segments"][best], scores[best]))
+    return out
+
+
+def _prepare_nothing(segments, options, worker):
+    return None
+
+
+def _run_stored_map(state, payload, options, worker):
+    return [
+        {"start": rng[0], "end": rng[1], "score": 1.0} if rng else None
+        for rng in payload["stored"]
+    ]
+
+
+STRATEGIES: Dict[str, Strategy] = {
+    s.name: s
+    for s in (
+        Strategy("tfidf", "1", _prepare_tfidf, _run_top1),
+        Strategy("tfidf_window", "2", _prepare_tfidf, _run_window, params=("top_k",)),
+        Strategy("bm25", "1", _prepare_bm25, _run_top1),
+        Strategy("bm25_window", "1", _prepare_bm25, _run_window, params=("top_k",)),
+        Strategy("hybrid", "1", _prepare_hybrid, _run_batch_top1, params=("hybrid_dense", "local_model")),
+        Strategy("openai", "1", _prepare_openai, _run_top1, params=("openai_model",)),
+        Strategy("local_dense", "1", _prepare_local_dense, _run_batch_top1, params=("local_model",)),
+        Strategy("mdbr", "1", _prepare_mdbr, _run_mdbr, params=("model",)),
+        Strategy("stored_map", "1", _prepare_nothing, _run_stored_map),
+    )
+}
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+class WorkerState:
+    """Parsed subtitles, prepared indexes and loaded models of one process."""
+
+    def __init__(self, options: Dict[str, Any]):
+        self.options = options
+        self.segments: Dict[str, List[Dict[str, Any]]] = {}
+        self.prepared: Dict[Tuple[str, str], Tuple[Any, float]] = {}
+        self.models: Dict[str, Any] = {}
+
+    def model(self, name: str):
+        if name not in self.models:
+            from tools.evaluate_mdbr_leaf_ir import LeafIR
+
+            self.models[name] = LeafIR(name)
+        return self.models[name]
+
+    def subtitle_segments(self, subtitle_hash: str, subtitle_text: str) -> List[Dict[str, Any]]:
+        if subtitle_hash not in self.segments:
+            from app.routes.parsons_service import parse_srt_segments
+
+            if len(self.segments) >= WORKER_CACHE_SUBTITLES:
+                self.segments.clear()
+                self.prepared.clear()
+            self.segments[subtitle_hash] = parse_srt_segments(subtitle_text)
+        return self.segments[subtitle_hash]
+
+    def prepare(self, strategy: Strategy, subtitle_hash: str, segments) -> Tuple[Any, float]:
+        key = (strategy.name, subtitle_hash)
+        if key not in self.prepared:
+            started = time.perf_counter()
+            state = strategy.prepare(segments, self.options, self)
+            self.prepared[key] = (state, (time.perf_counter() - started) * 1000.0)
+        return self.prepared[key]
+
+
+_WORKER: Optional[WorkerState] = None
+
+
+def _init_worker(options: Dict[str, Any]) -> None:
+    global _WORKER
+    _WORKER = WorkerState(options)
+
+
+def run_group(job: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Evaluate every pending (task, strategy) pair of one subtitle."""
+    worker = _WORKER or WorkerState({})
+    segments = worker.subtitle_segments(job["subtitle_hash"], job["subtitle_text"])
+    out = []
+    for item in job["items"]:
+        strategy = STRATEGIES[item["strategy"]]
+        payload = item["task"]
+        try:
+            state, build_ms = worker.prepare(strategy, job["subtitle_hash"], segments)
+            started = time.perf_counter()
+            predictions = strategy.run(state, payload, worker.options, worker)
+            query_ms = (time.perf_counter() - started) * 1000.0
+            error = ""
+        except Exception as exc:
+            predictions, build_ms, query_ms, error = [], 0.0, 0.0, repr(exc)
+        out.append({
+            "key": item["key"],
+            "task_id": payload["task_id"],
+            "strategy": strategy.name,
+            "predictions": predictions,
+            "build_ms": round(build_ms, 3),
+            "query_ms": round(query_ms, 3),
+            "error": error,
+        })
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Parent side
+# ---------------------------------------------------------------------------
+
+def load_cache(path: str) -> Dict[str, Any]:
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError) as exc:
+        print("[evaluate_retrieval] cache unreadable, starting empty:", repr(exc))
+        return {}
+
+
+def save_cache(path: str, cache: Dict[str, Any]) -> None:
+    if not path:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def plan_jobs(
+    tasks: List[Dict[str, Any]],
+    strategies: List[str],
+    options: Dict[str, Any],
+    cache: Dict[str, Any],
+    rerun: Tuple[str, ...] = (),
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]:
+    """Split the (task, strategy) pairs into cached results and per-subtitle jobs.
+
+    Returns ``(jobs, results, skipped)``; ``results`` holds the cache hits and
+    ``skipped`` counts tasks without a reachable subtitle.
+    """
+    groups: Dict[str, Dict[str, Any]] = {}
+    results: List[Dict[str, Any]] = []
+    skipped = 0
+    for task in tasks:
+        subtitle_text = subtitle_text_for_task(task)
+        if not subtitle_text:
+            skipped += 1
+            continue
+        subtitle_hash = fingerprint(subtitle_text)
+        payload = _task_payload(task)
+        for name in strategies:
+            strategy = STRATEGIES[name]
+            key = fingerprint(name, strategy.config(options), subtitle_hash, payload["queries"], payload["stored"])
+            hit = cache.get(key)
+            if hit is not None and name not in rerun:
+                results.append({**hit, "key": key, "task_id": payload["task_id"], "strategy": name, "cached": True})
+                continue
+            group = groups.setdefault(subtitle_hash, {
+                "subtitle_hash": subtitle_hash,
+                "subtitle_text": subtitle_text,
+                "items": [],
+            })
+            group["items"].append({"key": key, "strategy": name, "task": payload})
+    return list(groups.values()), results, skipped
+
+
+def execute_jobs(jobs: List[Dict[str, Any]], options: Dict[str, Any], workers: int) -> List[Dict[str, Any]]:
+    if not jobs:
+        return []
+    if workers <= 1 or len(jobs) == 1:
+        _init_worker(options)
+        return [row for job in jobs for row in run_group(job)]
+
+    out: List[Dict[str, Any]] = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(options,)) as pool:
+        # 字幕多的群組先送，避免最後只剩一個 worker 在跑大影片。
+        ordered = sorted(jobs, key=lambda job: len(job["items"]), reverse=True)
+        for future in as_completed([pool.submit(run_group, job) for job in ordered]):
+            out.extend(future.result())
+    return out
+
+
+def score_result(
+    result: Dict[str, Any],
+    payload: Dict[str, Any],
+    labels: Dict[Tuple[str, int], Tuple[float, float]],
+    overlap_threshold: float,
+) -> Dict[str, Any]:
+    predictions = result.get("predictions") or []
+    hits = [(i, p) for i, p in enumerate(predictions) if p]
+
+    labelled = correct = 0
+    label_overlaps: List[float] = []
+    map_overlaps: List[float] = []
+    for slot, pred in hits:
+        pred_range = (float(pred["start"]), float(pred["end"]))
+        truth = labels.get((payload["task_id"], slot))
+        if truth is not None:
+            ov = _overlap(pred_range, truth)
+            labelled += 1
+            label_overlaps.append(ov)
+            if ov >= overlap_threshold:
+                correct += 1
+        stored = payload["stored"][slot] if slot < len(payload["stored"]) else None
+        if stored is not None and result["strategy"] != "stored_map":
+            map_overlaps.append(_overlap(pred_range, stored))
+
+    starts = [float(p["start"]) for _, p in hits]
+    steps = len(starts) - 1
+    monotonic = sum(1 for a, b in zip(starts, starts[1:]) if b >= a) / float(steps) if steps > 0 else 1.0
+    unique = len({(p["start"], p["end"]) for _, p in hits}) / float(len(hits)) if hits else 0.0
+
+    return {
+        "task_id": payload["task_id"],
+        "video_id": payload["video_id"],
+        "level": payload["level"],
+        "strategy": result["strategy"],
+        "slots": len(payload["queries"]),
+        "predicted_slots": len(hits),
+        "labelled_slots": labelled,
+        "correct_slots": correct,
+        "label_overlap_mean": round(statistics.fmean(label_overlaps), 4) if label_overlaps else "",
+        "map_overlap_mean": round(statistics.fmean(map_overlaps), 4) if map_overlaps else "",
+        "monotonicity_ratio": round(monotonic, 4),
+        "unique_ratio": round(unique, 4),
+        "build_ms": result.get("build_ms", 0.0),
+        "query_ms": result.get("query_ms", 0.0),
+        "cached": int(bool(result.get("cached"))),
+        "error": result.get("error") or "",
+    }
+
+
+def summarize(rows: List[Dict[str, Any]], strategies: List[str]) -> List[Dict[str, Any]]:
+    out = []
+    for name in strategies:
+        mine = [r for r in rows if r["strategy"] == name]
+        if not mine:
+            continue
+        labelled = sum(r["labelled_slots"] for r in mine)
+        correct = sum(r["correct_slots"] for r in mine)
+        label_ov = [r["label_overlap_mean"] for r in mine if r["label_overlap_mean"] != ""]
+        map_ov = [r["map_overlap_mean"] for r in mine if r["map_overlap_mean"] != ""]
+        query_ms = [float(r["query_ms"]) for r in mine if not r["error"]]
+        out.append({
+            "strategy": name,
+            "tasks": len(mine),
+            "slots": sum(r["predicted_slots"] for r in mine),
+            "labelled": labelled,
+            "precision_at_1": round(correct / float(labelled), 4) if labelled else None,
+            "label_overlap": round(statistics.fmean(label_ov), 4) if label_ov else None,
+            "map_overlap": round(statistics.fmean(map_ov), 4) if map_ov else None,
+            "monotonicity": round(statistics.fmean(r["monotonicity_ratio"] for r in mine), 4),
+            "unique": round(statistics.fmean(r["unique_ratio"] for r in mine), 4),
+            "query_ms_p50": round(_percentile(query_ms, 50), 3),
+            "query_ms_p95": round(_percentile(query_ms, 95), 3),
+            "build_ms_max": round(max((float(r["build_ms"]) for r in mine), default=0.0), 3),
+            "cached": sum(r["cached"] for r in mine),
+            "errors": sum(1 for r in mine if r["error"]),
+        })
+    return out
+
+
+def evaluate(
+    tasks: List[Dict[str, Any]],
+    strategies: List[str],
+    labels: Optional[Dict[Tuple[str, int], Tuple[float, float]]] = None,
+    options: Optional[Dict[str, Any]] = None,
+    cache_path: str = "",
+    workers: int = 1,
+    rerun: Tuple[str, ...] = (),
+    overlap_threshold: float = 0.3,
+) -> Dict[str, Any]:
+    options = dict(options or {})
+    cache = load_cache(cache_path)
+    jobs, results, skipped = plan_jobs(tasks, strategies, options, cache, rerun=rerun)
+    fresh = execute_jobs(jobs, options, workers)
+    for row in fresh:
+        # 出錯的結果不寫入快取，下次重跑。
+        if not row["error"]:
+            cache[row["key"]] = {k: row[k] for k in ("predictions", "build_ms", "query_ms", "error")}
+    if fresh:
+        save_cache(cache_path, cache)
+
+    payloads = {}
+    for task in tasks:
+        payloads[str(task.get("_id") or "")] = _task_payload(task)
+    rows = [score_result(r, payloads[r["task_id"]], labels or {}, overlap_threshold) for r in results + fresh]
+    rows.sort(key=lambda r: (r["task_id"], strategies.index(r["strategy"])))
+    return {
+        "summary": summarize(rows, strategies),
+        "rows": rows,
+        "computed": len(fresh),
+        "reused": len(results),
+        "skipped_tasks": skipped,
+    }
+
+
+def print_table(summary: List[Dict[str, Any]]) -> None:
+    columns = (
+        ("strategy", "strategy", 14),
+        ("tasks", "tasks", 6),
+        ("slots", "slots", 6),
+        ("P@1", "precision_at_1", 7),
+        ("lbl_ov", "label_overlap", 7),
+        ("map_ov", "map_overlap", 7),
+        ("mono", "monotonicity", 7),
+        ("uniq", "unique", 7),
+        ("q_p50ms", "query_ms_p50", 9),
+        ("q_p95ms", "query_ms_p95", 9),
+        ("build_ms", "build_ms_max", 9),
+        ("cached", "cached", 7),
+        ("err", "errors", 4),
+    )
+
+    def cell(value, width):
+        if value is None:
+            value = "-"
+        elif isinstance(value, float):
+            value = f"{value:.4f}" if abs(value) < 10 else f"{value:.1f}"
+        return str(value).rjust(width)
+
+    print(" ".join(title.rjust(width) for title, _, width in columns))
+    for row in summary:
+        print(" ".join(cell(row[key], width) for _, key, width in columns))
+
+
+def _load_labels(path: str) -> Dict[Tuple[str, int], Tuple[float, float]]:
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    if not isinstance(items, list):
+        raise SystemExit("labels must be a JSON array")
+    out = {}
+    for item in items:
+        try:
+            task_id = str(item.get("task_id") or "").strip()
+            out[(task_id, int(item.get("slot_index")))] = (float(item.get("true_start")), float(item.get("true_end")))
+        except (TypeError, ValueError, AttributeError):
+            continue
+    return out
+
+
+def _load_tasks(db, args, labels) -> List[Dict[str, Any]]:
+    q: Dict[str, Any] = {}
+    limit = max(1, args.limit)
+    if args.task_id:
+        q["_id"] = ObjectId(args.task_id) if ObjectId.is_valid(args.task_id) else args.task_id
+    elif labels and not args.video_id:
+        # 只給標註檔時評估標註涉及的全部題目。
+        ids = sorted({task_id for task_id, _ in labels})
+        q["_id"] = {"$in": [ObjectId(t) if ObjectId.is_valid(t) else t for t in ids]}
+        limit = 0
+    if args.video_id:
+        if ObjectId.is_valid(args.video_id):
+            q["video_id"] = {"$in": [args.video_id, ObjectId(args.video_id)]}
+        else:
+            q["video_id"] = args.video_id
+    if args.only_published:
+        q["review_status"] = "published"
+    return list(db.parsons_tasks.find(q, TASK_PROJECTION).sort("created_at", -1).limit(limit))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Compare slot-to-subtitle retrieval strategies")
+    ap.add_argument("--mongo_uri", default="mongodb://127.0.0.1:27017")
+    ap.add_argument("--db", default="thesis_system")
+    ap.add_argument("--task_id", default="")
+    ap.add_argument("--video_id", default="")
+    ap.add_argument("--limit", type=int, default=200)
+    ap.add_argument("--only_published", action="store_true")
+    ap.add_argument("--labels", default="")
+    ap.add_argument("--overlap_threshold", type=float, default=0.3)
+    ap.add_argument("--strategies", default=DEFAULT_STRATEGIES)
+    ap.add_argument("--rerun", default="", help="comma-separated strategies to recompute despite the cache")
+    ap.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    ap.add_argument("--cache", default=DEFAULT_CACHE_FILE, help="result cache file ('' disables)")
+    ap.add_argument("--top_k", type=int, default=3)
+    ap.add_argument("--model", default="MongoDB/mdbr-leaf-ir")
+    ap.add_argument("--openai_model", default="")
+    ap.add_argument("--export_csv", default="")
+    ap.add_argument("--export_json", default="")
+    args = ap.parse_args()
+
+    strategies = [s.strip() for s in args.strategies.split(",") if s.strip()]
+    unknown = [s for s in strategies if s not in STRATEGIES]
+    if unknown:
+        raise SystemExit(f"unknown strategies: {', '.join(unknown)} (known: {', '.join(STRATEGIES)})")
+
+    labels = {}
+    if args.labels:
+        if not os.path.exists(args.labels):
+            raise SystemExit(f"labels file not found: {args.labels}")
+        labels = _load_labels(args.labels)
+
+    from pymongo import MongoClient
+
+    client = MongoClient(args.mongo_uri)
+    tasks = _load_tasks(client[args.db], args, labels)
+    client.close()
+    if not tasks:
+        print("No tasks matched.")
+        return
+
+    def resolve(path):
+        return path if not path or os.path.isabs(path) else os.path.join(REPO_ROOT, path)
+
+    started = time.perf_counter()
+    report = evaluate(
+        tasks,
+        strategies,
+        labels=labels,
+        options={
+            "top_k": args.top_k,
+            "model": args.model,
+            "openai_model": args.openai_model,
+            "local_model": os.getenv("PARSONS_RETRIEVAL_LOCAL_MODEL") or "",
+            "hybrid_dense": os.getenv("PARSONS_RETRIEVAL_HYBRID_DENSE") or "",
+        },
+        cache_path=resolve(args.cache),
+        workers=args.workers,
+        rerun=tuple(s.strip() for s in args.rerun.split(",") if s.strip()),
+        overlap_threshold=args.overlap_threshold,
+    )
+    elapsed = time.perf_counter() - started
+
+    print("=" * 100)
+    print("Retrieval strategy comparison")
+    print("=" * 100)
+    print(
+        f"tasks: {len(tasks)} (no subtitle: {report['skipped_tasks']})  "
+        f"computed: {report['computed']}  reused: {report['reused']}  "
+        f"workers: {args.workers}  wall: {elapsed:.2f}s  overlap_threshold: {args.overlap_threshold:.2f}"
+    )
+    print_table(report["summary"])
+
+    if args.export_csv and report["rows"]:
+        out = resolve(args.export_csv)
+        with open(out, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=list(report["rows"][0].keys()))
+            w.writeheader()
+            w.writerows(report["rows"])
+        print(f"csv exported: {out}")
+    if args.export_json:
+        out = resolve(args.export_json)
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"exported: {out}")
+
+
+if __name__ == "__main__":
+    main()
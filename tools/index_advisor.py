@@ -0,0 +1,228 @@
+"""Recommend compound indexes from the queries the app actually sends.
+
+1. Capture query shapes.  Either run the app (or the test suite) with
+   ``MONGO_QUERY_SHAPES_FILE=query_shapes.json``, or let ``capture`` drive the
+   teacher analysis readers (attempts, student logs, video rewatch logs,
+   student options) over every activity / test role / group filter and a
+   sample of classes and students in the target database:
+
+     python -m tools.index_advisor capture --shapes query_shapes.json
+
+2. Explain every captured shape against a seeded local database and print
+   the winning plan, the ESR-ordered index that would serve it, and the
+   existing indexes that are only a prefix of another one:
+
+     python -m tools.index_advisor report --shapes query_shapes.json
+     python -m tools.index_advisor report --shapes query_shapes.json --apply
+     python -m tools.index_advisor report --shapes query_shapes.json --drop-redundant
+
+``--apply`` creates the recommended indexes for shapes whose plan scans the
+collection, sorts in memory, or examines more than ``--min-ratio`` documents
+per returned document.  ``--drop-redundant`` drops the flagged prefix
+indexes; it is never implied by ``--apply``.  Point ``MONGO_URI`` /
+``MONGO_DATABASE`` at a local copy, not at production.
+"""
+
+import argparse
+import os
+import sys
+from collections import defaultdict
+
+from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure, OperationFailure, PyMongoError, ServerSelectionTimeoutError
+
+from app.query_shapes import (
+    index_name,
+    index_serves,
+    load_shapes,
+    recommend_index,
+    redundant_indexes,
+)
+
+
+DEFAULT_SHAPES_FILE = "query_shapes.json"
+BAD_STAGES = {"COLLSCAN", "SORT"}
+
+
+def capture(shapes_file, sample_size=3):
+    """Drive the analysis readers with the recorder attached to app.db."""
+    os.environ["MONGO_QUERY_SHAPES_FILE"] = shapes_file
+    # app.db 建立 client 時才會讀取環境變數，因此必須在設定後才匯入。
+    from app.db import client, db
+    from app.routes import teacher_analysis as analysis
+
+    recorder = next(
+        (listener for listener in client.options.event_listeners if hasattr(listener, "dump")),
+        None,
+    )
+    classes = [None] + [name for name in db.users.distinct("class_name", {"role": "student"}) if name][:sample_size]
+    students = [
+        row["student_id"]
+        for row in db.users.find({"role": "student", "student_id": {"$type": "string"}}, {"student_id": 1}).limit(sample_size)
+    ]
+    groups = [None, analysis.TEST_DATA_GROUP_FILTER, *analysis.FORMAL_GROUP_TYPES]
+    activities = [("practice", None), ("test", "pre"), ("test", "post")]
+
+    for class_name in classes:
+        for group_filter in groups:
+            analysis._read_student_options(class_name, group_filter)
+            analysis._read_video_rewatch_logs(class_name, group_filter)
+            for activity_type, test_role in activities:
+                analysis._read_attempts(activity_type, test_role, class_name, group_filter, None)
+                for student_id in students:
+                    analysis._read_student_logs(student_id, activity_type, test_role, 100, class_name, group_filter)
+    for student_id in students:
+        analysis._read_video_rewatch_logs(None, None, student_id)
+        for activity_type, test_role in activities:
+            analysis._read_attempts(activity_type, test_role, None, None, student_id)
+
+    if recorder is not None:
+        captured = len(recorder.shapes())
+        recorder.dump()
+        print(f"Captured {captured} query shapes into {shapes_file}")
+    return 0
+
+
+def _find_key(value, key):
+    if isinstance(value, dict):
+        if key in value:
+            return value[key]
+        for item in value.values():
+            found = _find_key(item, key)
+            if found is not None:
+                return found
+    elif isinstance(value, list):
+        for item in value:
+            found = _find_key(item, key)
+            if found is not None:
+                return found
+    return None
+
+
+def _plan_stages(plan, stages, indexes):
+    if isinstance(plan, dict):
+        if plan.get("stage"):
+            stages.append(plan["stage"])
+        if plan.get("indexName"):
+            indexes.append(plan["indexName"])
+        for key in ("inputStage", "queryPlan", "inputStages"):
+            _plan_stages(plan.get(key), stages, indexes)
+    elif isinstance(plan, list):
+        for item in plan:
+            _plan_stages(item, stages, indexes)
+
+
+def explain_shape(db, shape):
+    explain = db.command({"explain": shape["sample"], "verbosity": "executionStats"})
+    stages, indexes = [], []
+    _plan_stages(_find_key(explain, "winningPlan"), stages, indexes)
+    stats = _find_key(explain, "executionStats") or {}
+    return {
+        "stages": stages,
+        "indexes": indexes,
+        "docs_examined": int(stats.get("totalDocsExamined") or 0),
+        "keys_examined": int(stats.get("totalKeysExamined") or 0),
+        "returned": int(stats.get("nReturned") or 0),
+    }
+
+
+def _needs_index(plan, min_ratio):
+    if BAD_STAGES & set(plan["stages"]):
+        return True
+    return plan["docs_examined"] > max(1, plan["returned"]) * min_ratio
+
+
+def _existing_keys(collection):
+    return {
+        index["name"]: list(dict(index["key"]).items())
+        for index in collection.list_indexes()
+    }
+
+
+def report(db, shapes_file, min_ratio=10.0, apply=False, drop_redundant=False):
+    shapes = load_shapes(shapes_file)
+    if not shapes:
+        print(f"No query shapes in {shapes_file}; run capture first.")
+        return 1
+
+    planned = defaultdict(dict)
+    for shape in sorted(shapes, key=lambda item: -int(item.get("count") or 0)):
+        collection = shape["collection"]
+        fields = ", ".join(f"{field}:{kind}" for field, kind in shape["filter"].items())
+        sort = ", ".join(f"{field}:{direction}" for field, direction in shape["sort"])
+        print(f"\n[{collection}] {shape['command']} x{shape.get('count', 0)}  filter({fields}) sort({sort})")
+        try:
+            plan = explain_shape(db, shape)
+        except OperationFailure as exc:
+            print(f"  explain failed: {exc}")
+            continue
+        print(
+            f"  plan: {' > '.join(plan['stages']) or '-'}  index: {', '.join(plan['indexes']) or '-'}"
+            f"  examined {plan['docs_examined']} docs / {plan['keys_examined']} keys for {plan['returned']}"
+        )
+        keys = recommend_index(shape)
+        if not keys or not _needs_index(plan, min_ratio):
+            continue
+        existing = _existing_keys(db[collection])
+        serving = next((name for name, index_keys in existing.items() if index_serves(index_keys, keys)), None)
+        if serving:
+            print(f"  {serving} already matches the ESR order; check the sample values")
+            continue
+        planned[collection][index_name(keys)] = keys
+        print(f"  recommend: {index_name(keys)}")
+
+    print("\n== Recommended indexes ==")
+    for collection, indexes in sorted(planned.items()):
+        for name, keys in indexes.items():
+            print(f"  {collection}: {keys}")
+            if apply:
+                db[collection].create_index(keys, name=name)
+                print(f"    [created] {collection}.{name}")
+
+    print("\n== Redundant prefix indexes ==")
+    collections = sorted({shape["collection"] for shape in shapes})
+    for collection in collections:
+        for item in redundant_indexes(db[collection].list_indexes(), planned[collection].values()):
+            print(f"  {collection}.{item['name']} is a prefix of {item['covered_by']}")
+            if drop_redundant:
+                db[collection].drop_index(item["name"])
+                print(f"    [dropped] {collection}.{item['name']}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    capture_parser = subparsers.add_parser("capture")
+    capture_parser.add_argument("--shapes", default=DEFAULT_SHAPES_FILE)
+    capture_parser.add_argument("--sample-size", type=int, default=3)
+    report_parser = subparsers.add_parser("report")
+    report_parser.add_argument("--shapes", default=DEFAULT_SHAPES_FILE)
+    report_parser.add_argument("--min-ratio", type=float, default=10.0)
+    report_parser.add_argument("--apply", action="store_true")
+    report_parser.add_argument("--drop-redundant", action="store_true")
+    args = parser.parse_args()
+
+    try:
+        if args.action == "capture":
+            return capture(os.path.abspath(args.shapes), max(1, args.sample_size))
+        client = MongoClient(
+            os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017"),
+            serverSelectionTimeoutMS=5000,
+        )
+        try:
+            client.admin.command("ping")
+            db = client[os.environ.get("MONGO_DATABASE", "thesis_system")]
+            return report(db, args.shapes, args.min_ratio, apply=args.apply, drop_redundant=args.drop_redundant)
+        finally:
+            client.close()
+    except (ServerSelectionTimeoutError, ConnectionFailure):
+        print("MongoDB 連線失敗，請確認 MongoDB 是否已啟動。")
+        return 1
+    except PyMongoError as exc:
+        print("MongoDB 操作失敗：", repr(exc))
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
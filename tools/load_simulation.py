@@ -0,0 +1,860 @@
+"""Classroom load simulation for the student flows.
+
+Scripted student personas walk the same API sequence the Vue pages do:
+
+  login -> test status -> pretest questionnaire -> pretest (every question)
+  -> units / video list -> learning page -> video watching with rewatch
+  telemetry (batched events, backward seeks, resume) -> Parsons practice
+  with wrong attempts, hint state and hint requests -> posttest
+
+Each concurrency level (``--levels 5,10,20,40``) runs that many personas for
+``--stage-seconds``; a persona that finishes the flow keeps repeating the
+video + practice part until the stage ends.  Every request is timed on the
+client and the report prints p50 / p95 / p99 per endpoint and per level.
+
+With an admin account (``--admin-id`` / ``--admin-password``) the harness
+also reads ``GET /api/admin/metrics?reset_peaks=1`` after every level: the
+peak number of requests in flight against ``WAITRESS_THREADS`` and the peak
+MongoDB pool checkouts / checkout waits against ``MONGO_MAX_POOL_SIZE``.  The
+first level where either reaches its limit is reported as the saturation
+point.  Without metrics the harness falls back to the client-side signal:
+throughput stops growing while p95 keeps climbing.
+
+The LLM is never called for real.  Start the stub endpoint and point the
+backend at it with ``OPENAI_BASE_URL``:
+
+  python -m tools.load_simulation stub-llm --port 8765 --latency-ms 800
+  OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub \\
+      WAITRESS_THREADS=8 MONGO_MAX_POOL_SIZE=20 python run.py
+  python -m tools.load_simulation run --accounts accounts.csv \\
+      --levels 5,10,20,40 --stage-seconds 60 \\
+      --admin-id admin --admin-password admin123 --json-out load_report.json
+
+``login-storm`` measures the start of a lesson on its own: ``--count``
+accounts log in at the same moment (retrying ``429 login_busy`` the way the
+login page does) while a probe polls ``--probe-path``; it prints logins per
+second and how far the probe's latency rises during the burst:
+
+  python -m tools.load_simulation login-storm --student-format "bench{:05d}" \\
+      --password bench1234 --count 60 --rounds 3
+
+``--accounts`` is a CSV with ``student_id,password`` columns (one account
+per concurrent persona: logging in again revokes the previous session), or
+use ``--student-format "load{:04d}" --password ...``.  Run it against a local
+MongoDB seeded for the purpose, never against the classroom database: the
+personas submit questionnaires, tests and practice attempts.
+"""
+
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+
+DEFAULT_LEVELS = "5,10,20,40"
+PERCENTILES = (50, 95, 99)
+STUB_EMBEDDING_DIMS = 64
+# 單一階段 p95 超過第一階段的倍數、且吞吐量成長低於此比例，視為飽和。
+LATENCY_GROWTH_LIMIT = 2.0
+THROUGHPUT_GROWTH_FLOOR = 0.10
+POOL_WAIT_LIMIT_SEC = 0.010
+LOGIN_BUSY_MAX_RETRIES = 8
+LOGIN_LABEL = "POST /api/auth/login"
+
+_METRIC_LINE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*(?:\{[^}]*\})?)\s+(\S+)$")
+
+
+# ---------------------------------------------------------------------------
+# Statistics
+# ---------------------------------------------------------------------------
+
+def percentile(values, q):
+    """Linear-interpolated percentile (``q`` in 0..100); ``None`` when empty."""
+    data = sorted(values)
+    if not data:
+        return None
+    if len(data) == 1:
+        return data[0]
+    rank = (len(data) - 1) * (q / 100.0)
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return data[low]
+    return data[low] + (data[high] - data[low]) * (rank - low)
+
+
+def latency_summary(samples):
+    """``{"count", "p50", "p95", "p99"}`` in milliseconds for a list of seconds."""
+    summary = {"count": len(samples)}
+    for q in PERCENTILES:
+        value = percentile(samples, q)
+        summary[f"p{q}"] = None if value is None else round(value * 1000, 1)
+    return summary
+
+
+class LatencyBook:
+    """Client-side timings and outcomes per endpoint label."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+
+    def record(self, label, seconds, status):
+        self.samples[label].append(seconds)
+        self.statuses[label][str(status)] += 1
+        if not isinstance(status, int) or status >= 500:
+            self.errors[label] += 1
+
+    def total_requests(self):
+        return sum(len(values) for values in self.samples.values())
+
+    def total_errors(self):
+        return sum(self.errors.values())
+
+    def endpoints(self):
+        return {
+            label: dict(
+                latency_summary(values),
+                errors=self.errors.get(label, 0),
+                statuses=dict(self.statuses[label]),
+            )
+            for label, values in sorted(self.samples.items())
+        }
+
+    def overall(self):
+        return latency_summary([value for values in self.samples.values() for value in values])
+
+
+# ---------------------------------------------------------------------------
+# Server-side saturation gauges (app/metrics.py)
+# ---------------------------------------------------------------------------
+
+def parse_prometheus(text):
+    """``{"name{labels}": value}`` for every sample line of a text exposition."""
+    samples = {}
+    for line in (text or "").splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = _METRIC_LINE.match(line.strip())
+        if not match:
+            continue
+        try:
+            samples[match.group(1)] = float(match.group(2))
+        except ValueError:
+            continue
+    return samples
+
+
+def _sum_prefix(samples, prefix):
+    return sum(value for key, value in samples.items() if key.startswith(prefix))
+
+
+def server_stage_stats(before, after):
+    """Peaks and pool-wait deltas between two metric scrapes."""
+    wait_count = after.get("mongo_pool_checkout_wait_seconds_count", 0.0) - before.get("mongo_pool_checkout_wait_seconds_count", 0.0)
+    wait_sum = after.get("mongo_pool_checkout_wait_seconds_sum", 0.0) - before.get("mongo_pool_checkout_wait_seconds_sum", 0.0)
+    return {
+        "in_flight_peak": int(after.get("http_requests_in_flight_peak", 0)),
+        "pool_checked_out_peak": int(after.get("mongo_pool_checked_out_peak", 0)),
+        "pool_wait_mean_ms": round(wait_sum / wait_count * 1000, 2) if wait_count > 0 else 0.0,
+        "pool_checkout_failures": int(
+            _sum_prefix(after, "mongo_pool_checkout_failures_total")
+            - _sum_prefix(before, "mongo_pool_checkout_failures_total")
+        ),
+        "waitress_threads": int(after.get('app_capacity{resource="waitress_threads"}', 0)) or None,
+        "mongo_max_pool_size": int(after.get('app_capacity{resource="mongo_max_pool_size"}', 0)) or None,
+    }
+
+
+def find_saturation(stages, waitress_threads=None, pool_size=None):
+    """First concurrency level at which each resource ran out.
+
+    ``stages`` are the per-level results in increasing order.  Server gauges
+    win when present; otherwise the waitress estimate is the first level
+    whose throughput grew less than ``THROUGHPUT_GROWTH_FLOOR`` while p95
+    exceeded ``LATENCY_GROWTH_LIMIT`` times the first level's.
+    """
+    result = {"waitress": None, "waitress_reason": None, "mongo_pool": None, "mongo_pool_reason": None}
+    baseline_p95 = None
+    previous_rps = None
+    for stage in stages:
+        server = stage.get("server") or {}
+        level = stage["concurrency"]
+        threads = server.get("waitress_threads") or waitress_threads
+        pool = server.get("mongo_max_pool_size") or pool_size
+        p95 = (stage.get("overall") or {}).get("p95")
+        rps = stage.get("throughput_rps") or 0.0
+
+        if result["waitress"] is None:
+            if server and threads and server.get("in_flight_peak", 0) >= threads:
+                result["waitress"] = level
+                result["waitress_reason"] = f"{server['in_flight_peak']} requests in flight >= WAITRESS_THREADS={threads}"
+            elif not server and baseline_p95 and p95 and previous_rps:
+                growth = (rps - previous_rps) / previous_rps
+                if growth < THROUGHPUT_GROWTH_FLOOR and p95 > baseline_p95 * LATENCY_GROWTH_LIMIT:
+                    result["waitress"] = level
+                    result["waitress_reason"] = (
+                        f"throughput +{growth:.0%} while p95 {p95:.0f}ms > {LATENCY_GROWTH_LIMIT:g}x baseline (client-side estimate)"
+                    )
+
+        if result["mongo_pool"] is None and server:
+            if server.get("pool_checkout_failures"):
+                result["mongo_pool"] = level
+                result["mongo_pool_reason"] = f"{server['pool_checkout_failures']} pool checkout failures"
+            elif pool and server.get("pool_checked_out_peak", 0) >= pool:
+                result["mongo_pool"] = level
+                result["mongo_pool_reason"] = f"{server['pool_checked_out_peak']} connections checked out >= MONGO_MAX_POOL_SIZE={pool}"
+            elif server.get("pool_wait_mean_ms", 0) > POOL_WAIT_LIMIT_SEC * 1000:
+                result["mongo_pool"] = level
+                result["mongo_pool_reason"] = f"mean pool checkout wait {server['pool_wait_mean_ms']}ms"
+
+        if baseline_p95 is None and p95:
+            baseline_p95 = p95
+        previous_rps = rps or previous_rps
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Stub LLM endpoint (OpenAI-compatible subset)
+# ---------------------------------------------------------------------------
+
+STUB_HINT_TEXT = "請先檢查迴圈的範圍與縮排，再確認變數在使用前已經指定初值。"
+
+
+def _stub_embedding(text):
+    digest = hashlib.sha256(str(text or "").encode("utf-8")).digest()
+    values = [(digest[index % len(digest)] - 128) / 128.0 for index in range(STUB_EMBEDDING_DIMS)]
+    norm = math.sqrt(sum(value * value for value in values)) or 1.0
+    return [value / norm for value in values]
+
+
+def _stub_output_text():
+    return json.dumps({
+        "hint": STUB_HINT_TEXT,
+        "hint_text": STUB_HINT_TEXT,
+        "feedback": STUB_HINT_TEXT,
+        "explanation": STUB_HINT_TEXT,
+        "diagnosis": "stub",
+        "bullets": [STUB_HINT_TEXT],
+    }, ensure_ascii=False)
+
+
+def stub_llm_payload(path, body):
+    """Response body for one OpenAI API call, or ``None`` for unknown paths."""
+    model = str((body or {}).get("model") or "stub-model")
+    created = int(time.time())
+    if path.endswith("/responses"):
+        text = _stub_output_text()
+        return {
+            "id": f"resp_stub_{created}",
+            "object": "response",
+            "created_at": created,
+            "model": model,
+            "status": "completed",
+            "output": [{
+                "id": f"msg_stub_{created}",
+                "type": "message",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }],
+            "parallel_tool_calls": False,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {"input_tokens": 1, "output_tokens": 1, "total_tokens": 2},
+        }
+    if path.endswith("/chat/completions"):
+        return {
+            "id": f"chatcmpl_stub_{created}",
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": _stub_output_text()},
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }
+    if path.endswith("/embeddings"):
+        inputs = (body or {}).get("input")
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        return {
+            "object": "list",
+            "model": model,
+            "data": [
+                {"object": "embedding", "index": index, "embedding": _stub_embedding(text)}
+                for index, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": 1, "total_tokens": 1},
+        }
+    return None
+
+
+def make_stub_llm_server(host="127.0.0.1", port=8765, latency_ms=800.0, jitter_ms=200.0):
+    """A threading HTTP server answering ``/v1/responses``, chat and embeddings."""
+
+    class StubLLMHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                body = {}
+            delay = max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000.0
+            if not self.path.endswith("/embeddings"):
+                time.sleep(delay)
+            payload = stub_llm_payload(self.path, body)
+            data = json.dumps(payload if payload is not None else {"error": {"message": "not found"}}).encode("utf-8")
+            self.send_response(200 if payload is not None else 404)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), StubLLMHandler)
+    server.daemon_threads = True
+    return server
+
+
+# ---------------------------------------------------------------------------
+# Student persona
+# ---------------------------------------------------------------------------
+
+class StudentPersona:
+    """One simulated student; every request goes through :meth:`call`."""
+
+    def __init__(self, client, account, book, rng, deadline, options):
+        self.client = client
+        self.student_id, self.password = account
+        self.book = book
+        self.rng = rng
+        self.deadline = deadline
+        self.options = options
+        self.headers = {}
+
+    def expired(self):
+        return time.monotonic() >= self.deadline
+
+    async def think(self):
+        mean = self.options.think_ms / 1000.0
+        if mean > 0:
+            await asyncio.sleep(self.rng.uniform(0.5, 1.5) * mean)
+
+    async def call(self, method, path, label=None, **kwargs):
+        label = f"{method} {label or path}"
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, headers=self.headers, **kwargs)
+        except httpx.HTTPError as exc:
+            self.book.record(label, time.perf_counter() - started, type(exc).__name__)
+            return None, {}
+        self.book.record(label, time.perf_counter() - started, response.status_code)
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        return response.status_code, data if isinstance(data, dict) else {}
+
+    # --- flow steps -------------------------------------------------------
+
+    async def login(self):
+        # 後端登入滿載時回 429 login_busy，與登入頁相同地稍候重試。
+        for _attempt in range(LOGIN_BUSY_MAX_RETRIES + 1):
+            status, data = await self.call(
+                "POST", "/api/auth/login",
+                json={"student_id": self.student_id, "password": self.password},
+            )
+            if status != 429 or data.get("error") != "login_busy" or self.expired():
+                break
+            await asyncio.sleep(float(data.get("retry_after_sec") or 1) * self.rng.uniform(1.0, 2.0))
+        if status != 200 or not data.get("token"):
+            return False
+        self.headers = {"Authorization": f"Bearer {data['token']}"}
+        return True
+
+    async def questionnaire(self):
+        _status, data = await self.call("GET", "/api/student/pretest-survey")
+        if data.get("submitted") or not data.get("form"):
+            return
+        await self.think()
+        await self.call(
+            "POST", "/api/student/pretest-survey/submit",
+            json={"answers": self.questionnaire_answers(data["form"])},
+        )
+
+    def questionnaire_answers(self, form):
+        answers = {}
+        for page in form.get("pages") or []:
+            for question in page.get("questions") or []:
+                codes = [option.get("code") for option in question.get("options") or [] if option.get("code") != "other"]
+                if question.get("type") == "single_choice" and codes:
+                    answers[question["id"]] = self.rng.choice(codes)
+                elif question.get("type") == "multiple_choice" and codes:
+                    answers[question["id"]] = [self.rng.choice(codes)]
+                elif question.get("type") == "rating":
+                    answers[question["id"]] = self.rng.randint(int(question.get("min", 1)), int(question.get("max", 5)))
+        return answers
+
+    def parsons_answer(self, task, correct):
+        expected = [str(slot.get("expected_id")) for slot in task.get("template_slots") or [] if isinstance(slot, dict)]
+        if correct or not expected:
+            return expected
+        wrong = list(expected)
+        if len(wrong) > 1:
+            first, second = self.rng.sample(range(len(wrong)), 2)
+            wrong[first], wrong[second] = wrong[second], wrong[first]
+        else:
+            pool_ids = [str(block.get("id")) for block in task.get("pool") or [] if isinstance(block, dict)]
+            wrong = [next((block_id for block_id in pool_ids if block_id not in expected), "d1")]
+        return wrong
+
+    async def take_test(self, test_role):
+        index = 1
+        total = 1
+        while index <= total and not self.expired():
+            _status, task = await self.call(
+                "GET", "/api/parsons/test/task", label="/api/parsons/test/task",
+                params={"test_role": test_role, "index": index},
+            )
+            if not task.get("ok"):
+                return
+            total = int(task.get("total") or 1)
+            await self.think()
+            correct = self.rng.random() >= self.options.wrong_rate
+            body = {
+                "test_role": test_role,
+                "task_id": task.get("task_id"),
+                "duration_seconds": self.rng.randint(20, 120),
+            }
+            if task.get("question_type") == "choice":
+                keys = [option.get("key") for option in task.get("options") or []]
+                body["selected_answer"] = self.rng.choice(keys) if keys else "A"
+            else:
+                body["answer_ids"] = self.parsons_answer(task, correct)
+            await self.call("POST", "/api/parsons/test/submit", json=body)
+            index += 1
+
+    async def watch_video(self, video):
+        video_id = str(video.get("_id") or "")
+        unit = str(video.get("unit") or "")
+        if unit:
+            await self.call("GET", f"/api/student/unit/{unit}/learning", label="/api/student/unit/<unit>/learning")
+        _status, started = await self.call("POST", "/api/student/learning/start", json={"unit": unit or "load"})
+        await self.call("GET", "/api/video_rewatch_logs/resume", label="/api/video_rewatch_logs/resume", params={"video_id": video_id})
+
+        watch_session_id = f"load-{self.student_id}-{int(time.time() * 1000)}"
+        duration = float(self.rng.randint(240, 600))
+        position = 0.0
+        seq = 0
+        events = [{"event_type": "video_play", "current_time_sec": 0}]
+        while position < duration and not self.expired():
+            step = float(self.rng.randint(15, 45))
+            position = min(duration, position + step)
+            events.append({"event_type": "video_progress", "current_time_sec": position, "watch_delta_sec": step})
+            if self.rng.random() < self.options.rewatch_rate and position > 30:
+                back_to = max(0.0, position - self.rng.randint(10, 30))
+                events.append({"event_type": "video_seek", "seek_from_sec": position, "seek_to_sec": back_to})
+                position = back_to
+            if len(events) >= self.options.telemetry_batch:
+                seq = await self.send_video_events(events, video_id, watch_session_id, duration, seq)
+                events = []
+                await self.think()
+        events.append({"event_type": "video_ended" if position >= duration else "video_pause",
+                       "current_time_sec": position, "reached_end": position >= duration})
+        await self.send_video_events(events, video_id, watch_session_id, duration, seq)
+
+        if started.get("log_id"):
+            await self.call(
+                "POST", "/api/student/learning/end",
+                json={"log_id": started["log_id"], "duration_sec": int(duration), "regen_clicks": 0, "understood": True},
+            )
+
+    async def send_video_events(self, events, video_id, watch_session_id, duration, seq):
+        batch = []
+        for event in events:
+            seq += 1
+            batch.append(dict(
+                event,
+                video_id=video_id,
+                watch_session_id=watch_session_id,
+                client_seq=seq,
+                video_duration_sec=duration,
+                watch_seconds=event.get("current_time_sec"),
+            ))
+        await self.call("POST", "/api/video_rewatch_logs/batch", json={"events": batch})
+        return seq
+
+    async def practice(self, video):
+        video_id = str(video.get("_id") or "")
+        _status, task = await self.call(
+            "GET", "/api/parsons/task", label="/api/parsons/task",
+            params={"video_id": video_id, "level": self.options.level},
+        )
+        task_id = task.get("task_id")
+        if not task_id or task.get("noTask"):
+            return
+        await self.call("POST", "/api/learning_logs", json={
+            "event_type": "enter_parsons_task", "task_id": task_id, "activity_type": "practice", "page": "parsons",
+        })
+        wrong_attempts = self.rng.randint(0, self.options.max_wrong_attempts)
+        for attempt_no in range(1, wrong_attempts + 2):
+            if self.expired():
+                return
+            await self.think()
+            correct = attempt_no > wrong_attempts
+            _status, result = await self.call("POST", "/api/parsons/submit", json={
+                "task_id": task_id,
+                "video_id": video_id,
+                "level": self.options.level,
+                "answer_ids": self.parsons_answer(task, correct),
+                "duration_sec": self.rng.randint(10, 90),
+            })
+            if correct or not result.get("attempt_id"):
+                return
+            await self.call("GET", "/api/parsons/hint_state", label="/api/parsons/hint_state", params={"task_id": task_id})
+            if attempt_no >= 2 and self.rng.random() < self.options.hint_rate:
+                await self.call("POST", "/api/parsons/hint", json={"attempt_id": result["attempt_id"], "requested_hint_no": 1})
+
+    async def run(self, videos):
+        if not await self.login():
+            return
+        _status, state = await self.call("GET", "/api/parsons/test/status")
+        if state.get("pretest_questionnaire_required"):
+            await self.questionnaire()
+        if state.get("pre_open") and not state.get("pre_done"):
+            await self.take_test("pre")
+
+        while not self.expired():
+            await self.call("GET", "/api/student/units_progress")
+            if videos:
+                video = self.rng.choice(videos)
+                await self.watch_video(video)
+                if not self.expired():
+                    await self.practice(video)
+            await self.think()
+            _status, state = await self.call("GET", "/api/parsons/test/status")
+            if state.get("post_open") and not state.get("post_done") and not self.expired():
+                await self.take_test("post")
+            if not videos:
+                break
+
+
+# ---------------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------------
+
+async def _admin_metrics(client, options):
+    if not options.admin_id:
+        return None
+    try:
+        response = await client.post("/api/auth/login", json={"student_id": options.admin_id, "password": options.admin_password})
+        token = (response.json() or {}).get("token")
+        if not token:
+            return None
+        response = await client.get(
+            "/api/admin/metrics", params={"reset_peaks": "1"}, headers={"Authorization": f"Bearer {token}"}
+        )
+    except (httpx.HTTPError, ValueError) as exc:
+        print("[load_simulation] metrics scrape failed:", repr(exc))
+        return None
+    return parse_prometheus(response.text) if response.status_code == 200 else None
+
+
+async def _load_videos(client, accounts):
+    persona = StudentPersona(client, accounts[0], LatencyBook(), random.Random(0), time.monotonic() + 60, None)
+    if not await persona.login():
+        return []
+    _status, data = await persona.call("GET", "/api/admin_upload/videos", params={"status": "active", "per_page": 50})
+    return [video for video in data.get("videos") or [] if video.get("_id")]
+
+
+async def run_stage(options, accounts, videos, concurrency, seed):
+    limits = httpx.Limits(max_connections=concurrency * 2 + 4, max_keepalive_connections=concurrency + 2)
+    timeout = httpx.Timeout(options.timeout)
+    async with httpx.AsyncClient(base_url=options.base_url, limits=limits, timeout=timeout) as client:
+        before = await _admin_metrics(client, options)
+        book = LatencyBook()
+        started = time.monotonic()
+        deadline = started + options.stage_seconds
+        personas = [
+            StudentPersona(client, accounts[index], book, random.Random(seed * 100003 + index), deadline, options)
+            for index in range(concurrency)
+        ]
+        if options.ramp_seconds > 0:
+            async def _delayed(persona, delay):
+                await asyncio.sleep(delay)
+                await persona.run(videos)
+            await asyncio.gather(*(
+                _delayed(persona, options.ramp_seconds * index / concurrency) for index, persona in enumerate(personas)
+            ))
+        else:
+            await asyncio.gather(*(persona.run(videos) for persona in personas))
+        elapsed = max(0.001, time.monotonic() - started)
+        after = await _admin_metrics(client, options)
+
+    requests = book.total_requests()
+    stage = {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 1),
+        "requests": requests,
+        "errors": book.total_errors(),
+        "error_rate": round(book.total_errors() / requests, 4) if requests else 0.0,
+        "throughput_rps": round(requests / elapsed, 2),
+        "overall": book.overall(),
+        "endpoints": book.endpoints(),
+        "server": server_stage_stats(before or {}, after) if after is not None else None,
+    }
+    return stage
+
+
+def _fmt_ms(value):
+    return "-" if value is None else f"{value:.0f}"
+
+
+def print_stage(stage):
+    overall = stage["overall"]
+    print(
+        f"\n== concurrency {stage['concurrency']}: {stage['requests']} requests in {stage['seconds']}s "
+        f"({stage['throughput_rps']} req/s), errors {stage['errors']} ({stage['error_rate']:.1%}), "
+        f"p50/p95/p99 {_fmt_ms(overall['p50'])}/{_fmt_ms(overall['p95'])}/{_fmt_ms(overall['p99'])} ms"
+    )
+    server = stage.get("server")
+    if server:
+        print(
+            f"   server: in flight peak {server['in_flight_peak']}/{server['waitress_threads'] or '?'} threads, "
+            f"pool peak {server['pool_checked_out_peak']}/{server['mongo_max_pool_size'] or '?'}, "
+            f"checkout wait {server['pool_wait_mean_ms']}ms, checkout failures {server['pool_checkout_failures']}"
+        )
+    print(f"   {'endpoint':<52} {'n':>6} {'p50':>7} {'p95':>7} {'p99':>7} {'5xx':>5}")
+    for label, row in stage["endpoints"].items():
+        print(
+            f"   {label:<52} {row['count']:>6} {_fmt_ms(row['p50']):>7} {_fmt_ms(row['p95']):>7} "
+            f"{_fmt_ms(row['p99']):>7} {row['errors']:>5}"
+        )
+
+
+def load_accounts(options, count=None):
+    if options.accounts:
+        with open(options.accounts, encoding="utf-8-sig", newline="") as handle:
+            return [
+                (str(row.get("student_id") or "").strip(), str(row.get("password") or options.password or ""))
+                for row in csv.DictReader(handle)
+                if str(row.get("student_id") or "").strip()
+            ]
+    count = count or max(int(level) for level in options.levels)
+    return [(options.student_format.format(index), options.password) for index in range(1, count + 1)]
+
+
+async def run_simulation(options):
+    accounts = load_accounts(options)
+    if not accounts:
+        print("No student accounts; pass --accounts or --student-format/--password.")
+        return 1
+    levels = sorted({int(level) for level in options.levels if int(level) > 0})
+    usable = [level for level in levels if level <= len(accounts)]
+    if len(usable) < len(levels):
+        # 同一帳號重新登入會使前一個 session 失效，因此併發數不能超過帳號數。
+        print(f"Only {len(accounts)} accounts; skipping levels {[level for level in levels if level not in usable]}")
+    if not usable:
+        return 1
+
+    async with httpx.AsyncClient(base_url=options.base_url, timeout=httpx.Timeout(options.timeout)) as client:
+        videos = await _load_videos(client, accounts)
+    print(f"{len(accounts)} accounts, {len(videos)} active videos, levels {usable}")
+
+    stages = []
+    for position, level in enumerate(usable):
+        stage = await run_stage(options, accounts, videos, level, options.seed + position)
+        print_stage(stage)
+        stages.append(stage)
+
+    saturation = find_saturation(stages, options.waitress_threads, options.mongo_pool_size)
+    print("\n== Saturation ==")
+    print(f"   waitress threads: {saturation['waitress'] or 'not reached'}"
+          + (f"  ({saturation['waitress_reason']})" if saturation["waitress_reason"] else ""))
+    print(f"   mongo pool:       {saturation['mongo_pool'] or 'not reached'}"
+          + (f"  ({saturation['mongo_pool_reason']})" if saturation["mongo_pool_reason"] else ""))
+
+    if options.json_out:
+        with open(options.json_out, "w", encoding="utf-8") as handle:
+            json.dump({"stages": stages, "saturation": saturation}, handle, ensure_ascii=False, indent=2)
+        print(f"Report written to {options.json_out}")
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Login storm
+# ---------------------------------------------------------------------------
+
+def login_storm_report(book, logged_in, elapsed):
+    """Summary of one burst: logins/second, attempt and end-to-end latency, probe latency."""
+    attempts = book.statuses.get(LOGIN_LABEL, {})
+    probe = [label for label in book.samples if label.startswith("GET ")]
+    return {
+        "logins": logged_in,
+        "seconds": round(elapsed, 2),
+        "logins_per_sec": round(logged_in / elapsed, 2) if elapsed > 0 else 0.0,
+        "attempts": sum(attempts.values()),
+        "busy_responses": attempts.get("429", 0),
+        "errors": book.errors.get(LOGIN_LABEL, 0),
+        "attempt_latency": latency_summary(book.samples.get(LOGIN_LABEL, [])),
+        "login_latency": latency_summary(book.samples.get("login (with retries)", [])),
+        "probe_latency": latency_summary(book.samples[probe[0]]) if probe else None,
+    }
+
+
+async def run_login_storm(options):
+    """Every account logs in at once while a probe polls a cheap endpoint.
+
+    Measures logins/second on one server and how much the burst delays the
+    rest of the API (the probe), with the 429 ``login_busy`` retries the
+    login page performs.
+    """
+    accounts = load_accounts(options, options.count)
+    if not accounts:
+        print("No student accounts; pass --accounts or --student-format/--password.")
+        return 1
+    limits = httpx.Limits(max_connections=len(accounts) + 4, max_keepalive_connections=len(accounts) + 4)
+    rounds = []
+    for round_index in range(options.rounds):
+        book = LatencyBook()
+        async with httpx.AsyncClient(base_url=options.base_url, limits=limits, timeout=httpx.Timeout(options.timeout)) as client:
+            deadline = time.monotonic() + options.timeout * (LOGIN_BUSY_MAX_RETRIES + 1)
+            personas = [
+                StudentPersona(client, account, book, random.Random(options.seed + round_index * 100003 + index), deadline, None)
+                for index, account in enumerate(accounts)
+            ]
+            done = asyncio.Event()
+
+            async def _probe():
+                prober = StudentPersona(client, ("", ""), book, random.Random(0), deadline, None)
+                while not done.is_set():
+                    await prober.call("GET", options.probe_path, label=f"{options.probe_path} (probe)")
+                    await asyncio.sleep(options.probe_interval_ms / 1000.0)
+
+            async def _login(persona):
+                started = time.perf_counter()
+                ok = await persona.login()
+                if ok:
+                    book.samples["login (with retries)"].append(time.perf_counter() - started)
+                return ok
+
+            probe_task = asyncio.create_task(_probe())
+            started = time.monotonic()
+            results = await asyncio.gather(*(_login(persona) for persona in personas))
+            elapsed = max(0.001, time.monotonic() - started)
+            done.set()
+            await probe_task
+
+        report = login_storm_report(book, sum(1 for ok in results if ok), elapsed)
+        rounds.append(report)
+        print(
+            f"round {round_index + 1}: {report['logins']}/{len(accounts)} logged in in {report['seconds']}s "
+            f"= {report['logins_per_sec']} logins/s; {report['busy_responses']} busy, {report['errors']} errors; "
+            f"login p50/p95 {_fmt_ms(report['login_latency']['p50'])}/{_fmt_ms(report['login_latency']['p95'])} ms, "
+            f"probe p95 {_fmt_ms((report['probe_latency'] or {}).get('p95'))} ms"
+        )
+
+    best = max(rounds, key=lambda item: item["logins_per_sec"])
+    print(f"\nBest: {best['logins_per_sec']} logins/s over {len(accounts)} simultaneous logins")
+    if options.json_out:
+        with open(options.json_out, "w", encoding="utf-8") as handle:
+            json.dump({"accounts": len(accounts), "rounds": rounds}, handle, ensure_ascii=False, indent=2)
+        print(f"Report written to {options.json_out}")
+    return 0 if best["logins"] else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    stub_parser = subparsers.add_parser("stub-llm")
+    stub_parser.add_argument("--host", default="127.0.0.1")
+    stub_parser.add_argument("--port", type=int, default=8765)
+    stub_parser.add_argument("--latency-ms", type=float, default=800.0)
+    stub_parser.add_argument("--jitter-ms", type=float, default=200.0)
+
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    run_parser.add_argument("--accounts")
+    run_parser.add_argument("--student-format", default="load{:04d}")
+    run_parser.add_argument("--password", default="")
+    run_parser.add_argument("--levels", type=lambda value: value.split(","), default=DEFAULT_LEVELS.split(","))
+    run_parser.add_argument("--stage-seconds", type=float, default=60.0)
+    run_parser.add_argument("--ramp-seconds", type=float, default=5.0)
+    run_parser.add_argument("--think-ms", type=float, default=1500.0)
+    run_parser.add_argument("--timeout", type=float, default=30.0)
+    run_parser.add_argument("--wrong-rate", type=float, default=0.4)
+    run_parser.add_argument("--max-wrong-attempts", type=int, default=3)
+    run_parser.add_argument("--hint-rate", type=float, default=0.7)
+    run_parser.add_argument("--rewatch-rate", type=float, default=0.15)
+    run_parser.add_argument("--telemetry-batch", type=int, default=10)
+    run_parser.add_argument("--level", default="L1")
+    run_parser.add_argument("--seed", type=int, default=20240901)
+    run_parser.add_argument("--admin-id")
+    run_parser.add_argument("--admin-password", default="")
+    run_parser.add_argument("--waitress-threads", type=int)
+    run_parser.add_argument("--mongo-pool-size", type=int)
+    run_parser.add_argument("--stub-llm-port", type=int,
+                            help="also serve the stub LLM from this process (backend needs OPENAI_BASE_URL)")
+    run_parser.add_argument("--json-out")
+
+    storm_parser = subparsers.add_parser("login-storm", help="measure logins/second for a simultaneous class login")
+    storm_parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    storm_parser.add_argument("--accounts")
+    storm_parser.add_argument("--student-format", default="load{:04d}")
+    storm_parser.add_argument("--password", default="")
+    storm_parser.add_argument("--count", type=int, default=40)
+    storm_parser.add_argument("--rounds", type=int, default=3)
+    storm_parser.add_argument("--probe-path", default="/api/auth/")
+    storm_parser.add_argument("--probe-interval-ms", type=float, default=100.0)
+    storm_parser.add_argument("--timeout", type=float, default=30.0)
+    storm_parser.add_argument("--seed", type=int, default=20240901)
+    storm_parser.add_argument("--json-out")
+    args = parser.parse_args()
+
+    if args.action == "login-storm":
+        return asyncio.run(run_login_storm(args))
+
+    if args.action == "stub-llm":
+        server = make_stub_llm_server(args.host, args.port, args.latency_ms, args.jitter_ms)
+        print(f"Stub LLM on http://{args.host}:{args.port}/v1 (latency {args.latency_ms:g}±{args.jitter_ms:g}ms)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return 0
+
+    stub = None
+    if args.stub_llm_port:
+        stub = make_stub_llm_server("127.0.0.1", args.stub_llm_port)
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+    try:
+        return asyncio.run(run_simulation(args))
+    except KeyboardInterrupt:
+        return 1
+    finally:
+        if stub is not None:
+            stub.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""Move video_rewatch_logs / learning_logs into MongoDB time-series collections.
+
+Time-series collections cannot be renamed, so the existing collection is
+renamed out of the way first (``<name>_legacy``), a time-series collection is
+created under the original name, and the legacy documents are copied into it
+in ``_id`` order.  If an app write recreates the original name as a regular
+collection between the rename and the create, the migration stops before
+copying and leaves ``<name>_legacy`` untouched.  The copy keeps a checkpoint in ``log_storage_migrations``
+and can be re-run after an interruption; the legacy collection is left in
+place for verification and dropped by hand.
+
+Run it with ``LOG_STORAGE_MODE=timeseries`` already set for the app, so new
+events written during the copy land in the new collection.  Requires MongoDB
+7.0+ (see ``app/log_storage.py``).
+
+Usage:
+  python -m tools.migrate_logs_to_timeseries --dry-run
+  python -m tools.migrate_logs_to_timeseries --collection video_rewatch_logs
+  python -m tools.migrate_logs_to_timeseries --collection all --batch-size 1000
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timezone
+
+from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure, PyMongoError, ServerSelectionTimeoutError
+
+from app.log_storage import (
+    TIMESERIES_INDEXES,
+    TIMESERIES_META_FIELDS,
+    create_timeseries_collection,
+    is_timeseries_collection,
+    with_timeseries_fields,
+)
+
+
+CHECKPOINT_COLLECTION = "log_storage_migrations"
+
+
+class MigrationAborted(RuntimeError):
+    """The target name is not a time-series collection after creating it."""
+
+
+def _legacy_name(collection_name):
+    return f"{collection_name}_legacy"
+
+
+def _checkpoint(db, collection_name):
+    return db[CHECKPOINT_COLLECTION].find_one({"_id": collection_name}) or {}
+
+
+def _save_checkpoint(db, collection_name, **fields):
+    fields["updated_at"] = datetime.now(timezone.utc)
+    db[CHECKPOINT_COLLECTION].update_one({"_id": collection_name}, {"$set": fields}, upsert=True)
+
+
+def migrate_collection(db, collection_name, batch_size=500, dry_run=False):
+    legacy_name = _legacy_name(collection_name)
+    names = set(db.list_collection_names())
+    state = _checkpoint(db, collection_name)
+
+    if state.get("status") == "done":
+        print(f"[{collection_name}] already migrated (legacy: {legacy_name})")
+        return 0
+
+    source_name = legacy_name if legacy_name in names else collection_name
+    if source_name == collection_name and is_timeseries_collection(db, collection_name):
+        print(f"[{collection_name}] already a time-series collection")
+        return 0
+
+    total = db[source_name].estimated_document_count() if source_name in names else 0
+    if dry_run:
+        print(f"[{collection_name}] would copy ~{total} documents from {source_name} (last _id: {state.get('last_id')})")
+        return 0
+
+    if source_name == collection_name and collection_name in names:
+        db[collection_name].rename(legacy_name)
+        print(f"[{collection_name}] renamed to {legacy_name}")
+    create_timeseries_collection(db, collection_name)
+    if not is_timeseries_collection(db, collection_name):
+        # rename 之後 app 寫入可能已隱含建立一般集合；此時不複製，保留 legacy。
+        raise MigrationAborted(
+            f"{collection_name} exists but is not a time-series collection; "
+            f"{legacy_name} was left intact. Move the new documents aside, drop "
+            f"{collection_name} and re-run."
+        )
+    for keys, name in TIMESERIES_INDEXES.get(collection_name, []):
+        db[collection_name].create_index(keys, name=name)
+
+    source = db[legacy_name]
+    target = db[collection_name]
+    last_id = state.get("last_id")
+    copied = int(state.get("copied") or 0)
+    resuming = state.get("status") == "copying"
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        docs = list(source.find(query).sort("_id", 1).limit(batch_size))
+        if not docs:
+            break
+        if resuming:
+            # 時間序列集合不保證 _id 唯一；中斷前可能已寫入但未記錄 checkpoint 的批次先刪除。
+            target.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+            resuming = False
+        target.insert_many([with_timeseries_fields(collection_name, doc) for doc in docs], ordered=False)
+        copied += len(docs)
+        last_id = docs[-1]["_id"]
+        _save_checkpoint(db, collection_name, legacy_collection=legacy_name, last_id=last_id, copied=copied, status="copying")
+        print(f"[{collection_name}] copied {copied}/{total}")
+
+    _save_checkpoint(db, collection_name, legacy_collection=legacy_name, last_id=last_id, copied=copied, status="done")
+    print(f"[{collection_name}] done; verify and drop {legacy_name} when ready")
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", choices=sorted(TIMESERIES_META_FIELDS) + ["all"], default="all")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    client = MongoClient(
+        os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017"),
+        serverSelectionTimeoutMS=5000,
+    )
+    db = client[os.environ.get("MONGO_DATABASE", "thesis_system")]
+    names = sorted(TIMESERIES_META_FIELDS) if args.collection == "all" else [args.collection]
+    try:
+        client.admin.command("ping")
+        for name in names:
+            migrate_collection(db, name, batch_size=max(1, args.batch_size), dry_run=args.dry_run)
+        return 0
+    except (ServerSelectionTimeoutError, ConnectionFailure):
+        print("MongoDB 連線失敗，請確認 MongoDB 是否已啟動。")
+        return 1
+    except PyMongoError as exc:
+        print("MongoDB 操作失敗：", repr(exc))
+        return 2
+    except MigrationAborted as exc:
+        print("遷移中止：", exc)
+        return 3
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
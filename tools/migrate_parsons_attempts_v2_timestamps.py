@@ -2,9 +2,23 @@
 
 import argparse
 import json
+import sys
 from datetime import datetime, timezone
+from pathlib import Path
 
-from pymongo import MongoClient, UpdateOne
+from pymongo import MongoClient
+
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.bulk_migration import (  # noqa: E402
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_WORKERS,
+    Migration,
+    add_migration_arguments,
+    run_migration,
+)
 
 
 COLLECTION_NAME = "parsons_attempts_v2"
@@ -37,14 +51,11 @@ def _as_utc_datetime(value):
     raise ValueError(f"unsupported timestamp type: {type(value).__name__}")
 
 
-def migrate(collection, dry_run=False):
-    operations = []
+def migrate(db, dry_run=False, batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS, restart=False):
+    collection = db[COLLECTION_NAME]
     invalid = []
-    scanned = 0
 
-    projection = {field: 1 for field in TIME_FIELDS}
-    for document in collection.find({}, projection):
-        scanned += 1
+    def transform(document, counters):
         updates = {"timezone": DISPLAY_TIMEZONE}
         for field in TIME_FIELDS:
             value = document.get(field)
@@ -57,12 +68,18 @@ def migrate(collection, dry_run=False):
                     "field": field,
                     "error": str(exc),
                 })
-        operations.append(UpdateOne({"_id": document["_id"]}, {"$set": updates}))
+        return {"$set": updates}
 
-    modified = 0
-    if operations and not dry_run:
-        result = collection.bulk_write(operations, ordered=False)
-        modified = result.modified_count
+    projection = {field: 1 for field in TIME_FIELDS}
+    projection["timezone"] = 1
+    report = run_migration(
+        db,
+        Migration("parsons_attempts_v2_timestamps", COLLECTION_NAME, transform, {}, projection),
+        batch_size=batch_size,
+        workers=workers,
+        dry_run=dry_run,
+        restart=restart,
+    )
 
     type_counts = {}
     for field in TIME_FIELDS:
@@ -73,9 +90,12 @@ def migrate(collection, dry_run=False):
 
     return {
         "collection": COLLECTION_NAME,
-        "scanned": scanned,
-        "modified": modified,
+        "scanned": report.scanned,
+        "changed": report.changed,
+        "modified": report.modified,
         "dry_run": dry_run,
+        "docs_per_sec": round(report.docs_per_sec, 1),
+        "fields": report.fields,
         "timezone": DISPLAY_TIMEZONE,
         "timezone_marked": collection.count_documents({"timezone": DISPLAY_TIMEZONE}),
         "invalid_values": invalid,
@@ -88,6 +108,7 @@ def main():
     parser.add_argument("--mongo-uri", default="mongodb://127.0.0.1:27017")
     parser.add_argument("--database", default="thesis_system")
     parser.add_argument("--dry-run", action="store_true")
+    add_migration_arguments(parser)
     args = parser.parse_args()
 
     client = MongoClient(
@@ -101,7 +122,13 @@ def main():
     )
     try:
         client.admin.command("ping")
-        report = migrate(client[args.database][COLLECTION_NAME], dry_run=args.dry_run)
+        report = migrate(
+            client[args.database],
+            dry_run=args.dry_run,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            restart=args.restart,
+        )
         print(json.dumps(report, ensure_ascii=False, indent=2))
     finally:
         client.close()
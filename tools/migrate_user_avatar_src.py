@@ -1,11 +1,20 @@
+import argparse
 import os
 import re
+import sys
+from pathlib import Path
 from urllib.parse import urlparse
 
 from dotenv import load_dotenv
 from pymongo import MongoClient
 
 
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.bulk_migration import Migration, add_migration_arguments, run_migration  # noqa: E402
+
+
 def _relative_avatar_src(value, avatar_type=None):
     text = str(value or "").strip()
     if not text:
@@ -30,15 +39,28 @@ def _resolve_avatar_src(document):
     return None
 
 
+def _avatar_update(user, counters):
+    avatar_src = _resolve_avatar_src(user)
+    update = {"$unset": {"avatar_url": "", "avatar_value": ""}}
+    if avatar_src is not None:
+        update["$set"] = {"avatar_src": avatar_src}
+    else:
+        update["$unset"]["avatar_src"] = ""
+    return update
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Keep only relative avatar_src values on users.")
+    parser.add_argument("--dry-run", action="store_true")
+    add_migration_arguments(parser)
+    args = parser.parse_args()
+
     load_dotenv()
     client = MongoClient(
         os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017"),
         serverSelectionTimeoutMS=5000,
     )
     db = client[os.environ.get("MONGO_DATABASE", "thesis_system")]
-    matched = 0
-    migrated = 0
     query = {
         "$or": [
             {"avatar_src": {"$exists": True}},
@@ -52,17 +74,14 @@ def main():
         "avatar_url": 1,
         "avatar_value": 1,
     }
-
-    for user in db.users.find(query, projection):
-        matched += 1
-        avatar_src = _resolve_avatar_src(user)
-        update = {"$unset": {"avatar_url": "", "avatar_value": ""}}
-        if avatar_src is not None:
-            update["$set"] = {"avatar_src": avatar_src}
-        else:
-            update["$unset"]["avatar_src"] = ""
-        result = db.users.update_one({"_id": user["_id"]}, update)
-        migrated += int(result.modified_count)
+    report = run_migration(
+        db,
+        Migration("user_avatar_src", "users", _avatar_update, query, projection),
+        batch_size=args.batch_size,
+        workers=args.workers,
+        dry_run=args.dry_run,
+        restart=args.restart,
+    )
 
     field_counts = {
         "avatar_src": db.users.count_documents({"avatar_src": {"$exists": True}}),
@@ -73,7 +92,7 @@ def main():
         }),
     }
     client.close()
-    print(f"matched={matched} migrated={migrated}")
+    print(report.summary())
     print(field_counts)
 
 
@@ -0,0 +1,146 @@
+"""Compact old video_rewatch_logs events into daily summaries.
+
+For every Taipei calendar day older than ``--older-than-days`` the tool:
+
+1. copies that day's raw events into ``video_rewatch_logs_archive``;
+2. recomputes the day's ``video_rewatch_daily`` summaries from the archive
+   (replace-upserts, so re-running a day gives the same result);
+3. deletes the archived events from ``video_rewatch_logs``.
+
+Each step can be repeated after an interruption.  The teacher analysis view
+reads the summaries next to the remaining raw events, and resume positions
+come from ``video_playback_state``, so nothing on the student side changes.
+``--no-delete`` keeps the raw events (archive and summaries only); the
+teacher view counts those days twice until the raw events expire, so pair it
+with ``LOG_TIMESERIES_TTL_DAYS`` set to the same window.  That is the option
+for a time-series log on MongoDB < 7.0, where the deletes fail.
+
+Usage:
+  python -m tools.rollup_video_rewatch_logs --dry-run
+  python -m tools.rollup_video_rewatch_logs --older-than-days 90
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, DESCENDING, MongoClient, ReplaceOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError, ServerSelectionTimeoutError
+
+from app.video_log_rollup import (
+    VIDEO_REWATCH_ARCHIVE_COLLECTION,
+    VIDEO_REWATCH_DAILY_COLLECTION,
+    summarize_video_events,
+    taipei_day,
+    taipei_day_bounds,
+)
+
+
+SOURCE_COLLECTION = "video_rewatch_logs"
+BATCH_SIZE = 500
+DUPLICATE_KEY_ERROR = 11000
+
+
+def _ensure_indexes(db):
+    db[VIDEO_REWATCH_ARCHIVE_COLLECTION].create_index(
+        [("event_at", ASCENDING)], name="event_at_1"
+    )
+    db[VIDEO_REWATCH_ARCHIVE_COLLECTION].create_index(
+        [("student_id", ASCENDING), ("event_at", DESCENDING)], name="student_event_at_1"
+    )
+    db[VIDEO_REWATCH_DAILY_COLLECTION].create_index(
+        [("student_id", ASCENDING), ("last_event_at", DESCENDING)], name="student_last_event_at_1"
+    )
+
+
+def _archive(db, docs):
+    try:
+        db[VIDEO_REWATCH_ARCHIVE_COLLECTION].insert_many(docs, ordered=False)
+    except BulkWriteError as exc:
+        # 上次中斷時已封存的事件會以相同 _id 重複，略過即可。
+        errors = exc.details.get("writeErrors") or []
+        if any(item.get("code") != DUPLICATE_KEY_ERROR for item in errors):
+            raise
+
+
+def rollup_day(db, day, dry_run=False, delete=True):
+    start, end = taipei_day_bounds(day)
+    window = {"event_at": {"$gte": start, "$lt": end}}
+    raw_ids = [doc["_id"] for doc in db[SOURCE_COLLECTION].find(window, {"_id": 1})]
+    if not raw_ids:
+        return 0
+    if dry_run:
+        print(f"[{day}] would archive {len(raw_ids)} events")
+        return len(raw_ids)
+
+    for offset in range(0, len(raw_ids), BATCH_SIZE):
+        chunk = raw_ids[offset:offset + BATCH_SIZE]
+        _archive(db, list(db[SOURCE_COLLECTION].find({"_id": {"$in": chunk}})))
+
+    summaries = summarize_video_events(db[VIDEO_REWATCH_ARCHIVE_COLLECTION].find(window))
+    operations = [ReplaceOne({"_id": summary["_id"]}, summary, upsert=True) for summary in summaries]
+    for offset in range(0, len(operations), BATCH_SIZE):
+        db[VIDEO_REWATCH_DAILY_COLLECTION].bulk_write(operations[offset:offset + BATCH_SIZE], ordered=False)
+
+    if delete:
+        for offset in range(0, len(raw_ids), BATCH_SIZE):
+            db[SOURCE_COLLECTION].delete_many({"_id": {"$in": raw_ids[offset:offset + BATCH_SIZE]}})
+    print(f"[{day}] archived {len(raw_ids)} events into {len(summaries)} summaries")
+    return len(raw_ids)
+
+
+def rollup(db, older_than_days, dry_run=False, delete=True):
+    cutoff_day = taipei_day(datetime.now(timezone.utc) - timedelta(days=older_than_days))
+    cutoff, _ = taipei_day_bounds(cutoff_day)
+    oldest = db[SOURCE_COLLECTION].find_one(
+        {"event_at": {"$lt": cutoff}}, {"event_at": 1}, sort=[("event_at", 1)]
+    )
+    if not oldest:
+        print("No events older than the retention window.")
+        return 0
+
+    if not dry_run:
+        _ensure_indexes(db)
+    total = 0
+    while oldest:
+        day = taipei_day(oldest["event_at"])
+        total += rollup_day(db, day, dry_run=dry_run, delete=delete)
+        # 直接跳到下一個有事件的日期（dry-run 與 --no-delete 不會刪除原始事件）。
+        oldest = db[SOURCE_COLLECTION].find_one(
+            {"event_at": {"$gte": taipei_day_bounds(day)[1], "$lt": cutoff}},
+            {"event_at": 1},
+            sort=[("event_at", 1)],
+        )
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--older-than-days", type=int, default=90)
+    parser.add_argument("--no-delete", action="store_true")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    client = MongoClient(
+        os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017"),
+        serverSelectionTimeoutMS=5000,
+    )
+    db = client[os.environ.get("MONGO_DATABASE", "thesis_system")]
+    try:
+        client.admin.command("ping")
+        total = rollup(db, max(1, args.older_than_days), dry_run=args.dry_run, delete=not args.no_delete)
+        print(f"Total events {'to archive' if args.dry_run else 'archived'}: {total}")
+        return 0
+    except (ServerSelectionTimeoutError, ConnectionFailure):
+        print("MongoDB 連線失敗，請確認 MongoDB 是否已啟動。")
+        return 1
+    except PyMongoError as exc:
+        print("MongoDB 操作失敗：", repr(exc))
+        return 2
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
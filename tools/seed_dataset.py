@@ -0,0 +1,889 @@
+"""Deterministic synthetic classroom data for benchmarking analytics.
+
+``seed`` fills a separate database with a semester of activity shaped like
+the real collections: ``users`` (formal students in classes plus a teacher
+and an admin), ``randomization_slots`` (balanced 3/6 blocks, claimed in
+order), ``videos`` and ``parsons_tasks`` (an L1 and an L2 task per video),
+``parsons_attempts_v2`` (practice, pretest and posttest attempts graded by
+:mod:`app.parsons_grading`), ``learning_logs`` and ``video_rewatch_logs``.
+
+Every student draws from its own ``random.Random(f"{seed}:{student_id}")``
+and every ``_id`` — and the password salt — is derived from a stable key,
+so the same ``--seed`` gives byte-identical documents and the 500-student database contains the
+50-student one.  Ability, engagement and the error mix are drawn per
+student: wrong attempts are order swaps, indentation slips and distractor
+picks, fewer as the semester goes on, and the B arm recovers faster after
+its AI hint.
+
+``bench`` times the teacher dashboard and export endpoints in-process
+against the seeded database named by ``MONGO_DATABASE`` and appends the timings to a results file;
+with two or more scales recorded it prints each endpoint's scaling
+exponent (``log(t2/t1) / log(n2/n1)``) and flags anything super-linear.
+
+  python -m tools.seed_dataset seed --students 50 --database thesis_bench_50 --drop
+  python -m tools.seed_dataset seed --students 500 --database thesis_bench_500 --drop
+  MONGO_DATABASE=thesis_bench_50 python -m tools.seed_dataset bench --results bench_results.json
+  MONGO_DATABASE=thesis_bench_500 python -m tools.seed_dataset bench --results bench_results.json
+
+Scales are ``--scale small|medium|large`` (50 / 500 / 5,000 students) or an
+explicit ``--students``.  The seeded database is refused when it is the
+configured ``MONGO_DATABASE`` so a benchmark never writes into classroom data.
+Student passwords are ``--password`` (default ``bench1234``); the teacher
+is ``bench_teacher`` and the admin ``bench_admin`` with the same password.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure, PyMongoError, ServerSelectionTimeoutError
+
+from app.log_storage import ensure_log_collection, prepare_log_document
+from app.parsons_grading import build_block_results, build_error_analysis, calculate_score
+from app.randomization import (
+    ALLOCATION_RATIO,
+    ASSIGNMENT_METHOD,
+    DEFAULT_SEQUENCE_VERSION,
+    DEFAULT_STUDY_ID,
+    SLOT_COLLECTION,
+)
+
+
+SCALES = {"small": 50, "medium": 500, "large": 5000}
+DEFAULT_SEED = 20260223
+DEFAULT_START_DATE = "2026-02-23"
+DEFAULT_PASSWORD = "bench1234"
+BATCH_SIZE = 5000
+CLASS_SIZE = 50
+TEST_CYCLE_ID = "default"
+TAIPEI_TZ = timezone(timedelta(hours=8))
+FEEDBACK_POLICY_VERSION = "synthetic_v1"
+GROUP_BY_STRATEGY = {"A": "control", "B": "experimental_1", "C": "experimental_2"}
+SUPER_LINEAR_EXPONENT = 1.2
+
+# 錯誤型態比例：順序對調最常見，其次縮排、選到干擾區塊。
+ERROR_MIX = (("order", 0.55), ("indentation", 0.30), ("distractor", 0.15))
+
+PROGRAMS = {
+    "loop": {
+        "title": "累加 1 到 n",
+        "lines": [("n = int(input())", 0), ("total = 0", 0), ("for i in range(1, n + 1):", 0), ("total += i", 1), ("print(total)", 0)],
+        "distractors": ["for i in range(1, n):", "total = i"],
+    },
+    "condition": {
+        "title": "判斷及格",
+        "lines": [("score = int(input())", 0), ("if score >= 60:", 0), ("print('pass')", 1), ("else:", 0), ("print('fail')", 1)],
+        "distractors": ["if score > 60:", "print(score)"],
+    },
+    "while": {
+        "title": "計算位數",
+        "lines": [("n = int(input())", 0), ("count = 0", 0), ("while n > 0:", 0), ("n //= 10", 1), ("count += 1", 1), ("print(count)", 0)],
+        "distractors": ["while n >= 0:", "n /= 10"],
+    },
+    "list": {
+        "title": "找出最大值",
+        "lines": [("nums = [3, 1, 4, 1, 5]", 0), ("largest = nums[0]", 0), ("for x in nums:", 0), ("if x > largest:", 1), ("largest = x", 2), ("print(largest)", 0)],
+        "distractors": ["if x < largest:", "largest = nums"],
+    },
+    "function": {
+        "title": "計算面積",
+        "lines": [("def area(w, h):", 0), ("return w * h", 1), ("w = int(input())", 0), ("h = int(input())", 0), ("print(area(w, h))", 0)],
+        "distractors": ["return w + h", "print(area)"],
+    },
+    "string": {
+        "title": "計算母音",
+        "lines": [("text = input()", 0), ("vowels = 0", 0), ("for ch in text:", 0), ("if ch in 'aeiou':", 1), ("vowels += 1", 2), ("print(vowels)", 0)],
+        "distractors": ["if ch == 'aeiou':", "vowels = 1"],
+    },
+}
+CONCEPTS = list(PROGRAMS)
+
+
+# ---------------------------------------------------------------------------
+# Deterministic identities and time
+# ---------------------------------------------------------------------------
+
+def stable_oid(*parts):
+    """A 12-byte ObjectId derived from ``parts``; identical across runs."""
+    return ObjectId(hashlib.md5("|".join(str(part) for part in parts).encode("utf-8")).digest()[:12])
+
+
+def stable_uuid(*parts):
+    return str(uuid.UUID(bytes=hashlib.md5("|".join(str(part) for part in parts).encode("utf-8")).digest()))
+
+
+def seeded_password_hash(password, seed):
+    """Werkzeug's default ``scrypt`` hash, with the salt derived from ``seed`` instead of random."""
+    salt = hashlib.sha256(f"{seed}:password-salt".encode("utf-8")).hexdigest()[:16]
+    n, r, p = 2 ** 15, 8, 1
+    digest = hashlib.scrypt(password.encode("utf-8"), salt=salt.encode("utf-8"), n=n, r=r, p=p, maxmem=132 * n * r * p)
+    # 與 generate_password_hash 相同的格式，check_password_hash 可直接驗證。
+    return f"scrypt:{n}:{r}:{p}${salt}${digest.hex()}"
+
+
+def taipei_string(value):
+    return value.astimezone(TAIPEI_TZ).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def semester_start(start_date):
+    day = datetime.strptime(start_date, "%Y-%m-%d").replace(tzinfo=TAIPEI_TZ)
+    return day.astimezone(timezone.utc)
+
+
+def class_time(rng, week_start):
+    """A weekday evening or class-hour timestamp inside one week."""
+    day = rng.choice([0, 1, 2, 3, 4, 6])
+    hour = rng.choice([9, 10, 13, 14, 19, 20, 21, 22])
+    return week_start + timedelta(days=day, hours=hour - 8, minutes=rng.randint(0, 59), seconds=rng.randint(0, 59))
+
+
+# ---------------------------------------------------------------------------
+# Catalog: videos and tasks
+# ---------------------------------------------------------------------------
+
+def build_catalog(units, videos_per_unit, start):
+    videos, tasks = [], []
+    for unit_no in range(1, units + 1):
+        unit = f"U{unit_no:02d}"
+        for video_no in range(1, videos_per_unit + 1):
+            concept = CONCEPTS[((unit_no - 1) * videos_per_unit + video_no - 1) % len(CONCEPTS)]
+            video_id = stable_oid("video", unit, video_no)
+            created = start - timedelta(days=14) + timedelta(hours=unit_no * 24 + video_no)
+            videos.append({
+                "_id": video_id,
+                "unit": unit,
+                "title": f"{unit}-{video_no} {PROGRAMS[concept]['title']}",
+                "filename": f"{unit.lower()}_{video_no}.mp4",
+                "path": f"uploads/videos/{unit.lower()}_{video_no}.mp4",
+                "subtitle_path": f"uploads/subtitles/{unit.lower()}_{video_no}.srt",
+                "duration_sec": 300 + 60 * ((unit_no + video_no) % 6),
+                "concept": concept,
+                "active": True,
+                "deleted": False,
+                "is_deleted": False,
+                "created_at": created,
+            })
+            for level in ("L1", "L2"):
+                tasks.append(build_task(video_id, unit, concept, level, created))
+    return videos, tasks
+
+
+def build_task(video_id, unit, concept, level, created):
+    program = PROGRAMS[concept]
+    solution = [
+        {"id": f"b{index}", "text": text, "indent": depth * 4, "type": "solution"}
+        for index, (text, depth) in enumerate(program["lines"], start=1)
+    ]
+    distractors = [] if level == "L1" else [
+        {"id": f"d{index}", "text": text, "indent": 0, "type": "distractor", "enabled": True}
+        for index, text in enumerate(program["distractors"], start=1)
+    ]
+    return {
+        "_id": stable_oid("task", video_id, level),
+        "video_id": str(video_id),
+        "unit": unit,
+        "level": level,
+        "enabled": True,
+        "status": "published",
+        "question_text": f"請排列程式：{program['title']}",
+        "title": program["title"],
+        "target_concept": concept,
+        "concept_tag": concept,
+        "solution_blocks": solution,
+        "distractor_blocks": distractors,
+        "template_slots": [{"slot": index, "expected_id": block["id"]} for index, block in enumerate(solution)],
+        "source_type": "synthetic",
+        "gen_source": "seed_dataset",
+        "created_at": created,
+        "updated_at": created,
+    }
+
+
+def correct_answer(task):
+    blocks = task["solution_blocks"]
+    return {
+        "order": [block["id"] for block in blocks],
+        "lines": [block["text"] for block in blocks],
+        "indentation": [block["indent"] for block in blocks],
+    }
+
+
+def block_lookup(task):
+    return {
+        block["id"]: {"id": block["id"], "text": block["text"], "indent": block["indent"], "type": block["type"]}
+        for block in task["solution_blocks"] + task["distractor_blocks"]
+    }
+
+
+# ---------------------------------------------------------------------------
+# Users and randomization
+# ---------------------------------------------------------------------------
+
+def block_sizes(total_slots, rng):
+    """3/6 balanced block sizes that exactly fill ``total_slots`` (a multiple of 3)."""
+    sizes = []
+    remaining = total_slots
+    while remaining > 0:
+        size = 6 if remaining >= 6 and rng.random() < 0.5 else 3
+        sizes.append(size)
+        remaining -= size
+    return sizes
+
+
+def build_slots(count, seed, created_at):
+    rng = random.Random(f"{seed}:slots")
+    total = int(math.ceil(count / 3.0)) * 3
+    slots = []
+    position = 1
+    for block_no, size in enumerate(block_sizes(total, rng), start=1):
+        strategies = ["A", "B", "C"] * (size // 3)
+        rng.shuffle(strategies)
+        for strategy in strategies:
+            slots.append({
+                "_id": stable_oid("slot", DEFAULT_STUDY_ID, position),
+                "study_id": DEFAULT_STUDY_ID,
+                "sequence_version": DEFAULT_SEQUENCE_VERSION,
+                "position": position,
+                "block_id": f"block_{block_no:04d}",
+                "block_size": size,
+                "feedback_strategy": strategy,
+                "status": "available",
+                "created_at": created_at,
+            })
+            position += 1
+    return slots
+
+
+def build_students(count, seed, password_hash, start, slots):
+    students = []
+    for index in range(1, count + 1):
+        student_id = f"bench{index:05d}"
+        slot = slots[index - 1]
+        strategy = slot["feedback_strategy"]
+        claimed_at = start - timedelta(days=7, minutes=-index)
+        slot.update(status="claimed", student_id=student_id, claimed_at=claimed_at)
+        students.append({
+            "_id": stable_oid("user", student_id),
+            "student_id": student_id,
+            "name": f"學生{index:05d}",
+            "class_name": f"資工系 {chr(ord('A') + (index - 1) // CLASS_SIZE % 26)}{(index - 1) // (CLASS_SIZE * 26) or ''}班",
+            "role": "student",
+            "password_hash": password_hash,
+            "participant_id": stable_uuid(seed, "participant", student_id),
+            "test_cycle_id": TEST_CYCLE_ID,
+            "is_test_data": False,
+            "assignment_status": "assigned",
+            "assignment_method": ASSIGNMENT_METHOD,
+            "allocation_ratio": ALLOCATION_RATIO,
+            "feedback_strategy": strategy,
+            "group_type": GROUP_BY_STRATEGY[strategy],
+            "analysis_group_type": GROUP_BY_STRATEGY[strategy],
+            "feedback_policy_version": FEEDBACK_POLICY_VERSION,
+            "randomization_sequence_version": slot["sequence_version"],
+            "randomization_position": slot["position"],
+            "randomization_block_id": slot["block_id"],
+            "assigned_at": claimed_at,
+            "assignment_locked": True,
+            "created_at": claimed_at,
+            "updated_at": claimed_at,
+        })
+    return students
+
+
+def staff_users(password_hash, start):
+    return [
+        {
+            "_id": stable_oid("user", student_id),
+            "student_id": student_id,
+            "name": name,
+            "class_name": "教師",
+            "role": role,
+            "password_hash": password_hash,
+            "is_test_data": True,
+            "created_at": start - timedelta(days=30),
+        }
+        for student_id, name, role in (("bench_teacher", "測試教師", "teacher"), ("bench_admin", "測試管理員", "admin"))
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Per-student semester
+# ---------------------------------------------------------------------------
+
+def _sigmoid(value):
+    return 1.0 / (1.0 + math.exp(-value))
+
+
+def _pick_error(rng):
+    roll = rng.random()
+    for kind, weight in ERROR_MIX:
+        if roll < weight:
+            return kind
+        roll -= weight
+    return ERROR_MIX[-1][0]
+
+
+def wrong_submission(rng, task, kind):
+    """A plausible wrong answer: swapped lines, an indentation slip or a distractor."""
+    answer = correct_answer(task)
+    order = list(answer["order"])
+    indentation = list(answer["indentation"])
+    if kind == "distractor" and task["distractor_blocks"]:
+        slot = rng.randrange(len(order))
+        order[slot] = rng.choice(task["distractor_blocks"])["id"]
+        indentation[slot] = 0
+    elif kind == "indentation":
+        slot = rng.randrange(len(order))
+        indentation[slot] = max(0, indentation[slot] + rng.choice([-4, 4]))
+        if indentation == answer["indentation"]:
+            indentation[slot] += 4
+    else:
+        first = rng.randrange(len(order) - 1)
+        second = first + 1 if rng.random() < 0.7 else rng.randrange(len(order))
+        if second == first:
+            second = (first + 1) % len(order)
+        order[first], order[second] = order[second], order[first]
+        indentation[first], indentation[second] = indentation[second], indentation[first]
+    return order, indentation
+
+
+class StudentSemester:
+    """Generate one student's attempts and logs; ``documents()`` yields them."""
+
+    def __init__(self, seed, student, videos, tasks_by_video, start, weeks):
+        self.rng = random.Random(f"{seed}:{student['student_id']}")
+        self.seed = seed
+        self.student = student
+        self.videos = videos
+        self.tasks_by_video = tasks_by_video
+        self.start = start
+        self.weeks = weeks
+        self.ability = self.rng.gauss(0.0, 1.0)
+        self.engagement = min(1.0, max(0.15, self.rng.betavariate(4, 2)))
+        self.dropout_week = weeks + 1 if self.rng.random() > 0.08 else self.rng.randint(3, weeks)
+        self.attempts = []
+        self.learning_logs = []
+        self.video_logs = []
+        self.previous_by_task = {}
+
+    # --- common fields ----------------------------------------------------
+
+    def _profile(self):
+        student = self.student
+        return {
+            "student_id": student["student_id"],
+            "class_name": student["class_name"],
+            "group_type": student["group_type"],
+            "is_test_data": False,
+        }
+
+    def _learning_log(self, event_type, event_at, **fields):
+        doc = {
+            "_id": stable_oid("learning_log", self.student["student_id"], len(self.learning_logs)),
+            "schema_version": 1,
+            "log_id": stable_uuid(self.seed, "log", self.student["student_id"], len(self.learning_logs)),
+            "session_id": fields.pop("session_id", None),
+            **self._profile(),
+            "user_id": str(self.student["_id"]),
+            "event_type": event_type,
+            "page": fields.pop("page", "parsons"),
+            "activity_type": fields.pop("activity_type", "practice"),
+            "test_role": fields.pop("test_role", None),
+            "task_id": None,
+            "unit_id": None,
+            "attempt_id": None,
+            "attempt_no": None,
+            "target_concept": None,
+            "event_at": event_at,
+            "event_at_utc": event_at,
+            "event_at_taiwan": taipei_string(event_at),
+            "timezone": "Asia/Taipei",
+            "metadata": fields.pop("metadata", None),
+            "created_at": event_at,
+            "created_at_utc": event_at,
+            "created_at_taiwan": taipei_string(event_at),
+            "error_types": [],
+            "wrong_slots": [],
+        }
+        doc.update(fields)
+        self.learning_logs.append(prepare_log_document("learning_logs", doc))
+
+    # --- practice / tests -------------------------------------------------
+
+    def _attempt(self, task, submitted_at, duration, order, indentation, activity, test_role, session_no, attempt_no, hint):
+        task_id = str(task["_id"])
+        answer = correct_answer(task)
+        is_correct = order == answer["order"] and indentation == answer["indentation"]
+        previous = self.previous_by_task.get((task_id, activity, test_role))
+        analysis = build_error_analysis(
+            is_correct=is_correct,
+            submitted_order=order,
+            submitted_indentation=indentation,
+            correct_answer=answer,
+            target_concept=task["target_concept"],
+            previous_error_types=(previous or {}).get("error_types") or [],
+        )
+        block_results, block_summary = build_block_results(
+            block_lookup=block_lookup(task),
+            submitted_order=order,
+            submitted_indentation=indentation,
+            correct_answer=answer,
+            previous_attempt=previous,
+        )
+        started_at = submitted_at - timedelta(seconds=duration)
+        outlier = duration > 3600
+        hint_text = "請檢查迴圈與縮排的位置。" if hint else None
+        doc = {
+            "_id": stable_oid("attempt", self.student["student_id"], task_id, activity, test_role, attempt_no),
+            "schema_version": 2,
+            **self._profile(),
+            "feedback_strategy": self.student["feedback_strategy"],
+            "analysis_group_type": self.student["analysis_group_type"],
+            "feedback_policy_version": FEEDBACK_POLICY_VERSION,
+            "activity_type": activity,
+            "test_role": test_role,
+            "test_cycle_id": TEST_CYCLE_ID if activity == "test" else None,
+            "task_id": task_id,
+            "video_id": task["video_id"],
+            "unit": task["unit"],
+            "task_title": task["title"],
+            "target_concept": task["target_concept"],
+            "source_type": task["source_type"],
+            "gen_source": task["gen_source"],
+            "task_attempt_session": session_no,
+            "attempt_no": attempt_no,
+            "attempt_sequence_no": attempt_no,
+            "is_correct": is_correct,
+            "score": calculate_score(
+                is_correct=is_correct,
+                error_count=analysis["error_count"],
+                correct_answer=answer,
+                submitted_order=order,
+            ),
+            "submitted_order": order,
+            "submitted_indentation": indentation,
+            "submitted_indentation_by_block": {block_id: indent for block_id, indent in zip(order, indentation)},
+            "correct_answer": answer,
+            "block_results": block_results,
+            **block_summary,
+            "ai_hint_1_text": hint_text,
+            "ai_hint_1_meta": {"source": "synthetic"} if hint else {},
+            "ai_hint_2_text": None,
+            "ai_hint_2_meta": {},
+            "ai_hint_texts": [{"hint_no": 1, "text": hint_text, "meta": {}}] if hint else [],
+            "ai_hint_generation_count": 1 if hint else 0,
+            "ai_hint_view_count": 1 if hint else 0,
+            "ai_hint_clicked": bool(hint),
+            "ai_hint_viewed_numbers": [1] if hint else [],
+            "ai_hint_clicks": [],
+            "submitted_after_ai_hint": bool(hint),
+            "ai_hint_generated_before_submit": bool(hint),
+            "ai_hint_viewed_before_submit": bool(hint),
+            **analysis,
+            "started_at": started_at,
+            "started_at_utc": started_at,
+            "submitted_at": submitted_at,
+            "submitted_at_utc": submitted_at,
+            "submitted_at_taiwan": taipei_string(submitted_at),
+            "elapsed_sec_raw": duration,
+            "duration_sec": None if outlier else duration,
+            "duration_seconds": None if outlier else duration,
+            "duration_outlier": outlier,
+            "duration_outlier_reason": "long_page_open" if outlier else None,
+            "needs_review": outlier,
+            "review_reason": ["invalid_duration_sec"] if outlier else [],
+            "created_at": submitted_at,
+            "created_at_utc": submitted_at,
+            "created_at_taiwan": taipei_string(submitted_at),
+            "updated_at": submitted_at,
+            "updated_at_utc": submitted_at,
+            "updated_at_taiwan": taipei_string(submitted_at),
+            "timezone": "Asia/Taipei",
+        }
+        self.previous_by_task[(task_id, activity, test_role)] = doc
+        self.attempts.append(doc)
+        return doc
+
+    def _duration(self, base):
+        # 對數常態的作答時間，少數學生把頁面開著離開（> 1 小時）。
+        if self.rng.random() < 0.01:
+            return self.rng.randint(3700, 9000)
+        return max(5, int(self.rng.lognormvariate(math.log(base), 0.6)))
+
+    def practice(self, task, when, week):
+        strategy = self.student["feedback_strategy"]
+        difficulty = 0.4 if task["level"] == "L1" else 1.1
+        learning = 0.08 * week
+        session_id = stable_uuid(self.seed, "session", self.student["student_id"], task["_id"])
+        self._learning_log("enter_parsons_task", when, session_id=session_id, task_id=str(task["_id"]),
+                           unit_id=task["unit"], from_video_id=task["video_id"], target_concept=task["target_concept"])
+        attempt_no = 0
+        hint = False
+        while attempt_no < 8:
+            attempt_no += 1
+            boost = 0.9 * (attempt_no - 1) + (0.8 if hint and strategy == "B" else 0.0) + (0.4 if hint and strategy == "C" else 0.0)
+            p_correct = _sigmoid(self.ability - difficulty + learning + boost)
+            when += timedelta(seconds=self._duration(70 if attempt_no == 1 else 40))
+            if self.rng.random() < p_correct:
+                order, indentation = correct_answer(task)["order"], correct_answer(task)["indentation"]
+            else:
+                order, indentation = wrong_submission(self.rng, task, _pick_error(self.rng))
+            duration = self._duration(70 if attempt_no == 1 else 40)
+            attempt = self._attempt(task, when, duration, order, indentation, "practice", None, 1, attempt_no, hint)
+            self._learning_log("answer_submit", when, session_id=session_id, task_id=str(task["_id"]),
+                               attempt_id=str(attempt["_id"]), attempt_no=attempt_no,
+                               target_concept=task["target_concept"],
+                               metadata={"is_correct": attempt["is_correct"], "score": attempt["score"],
+                                         "error_types": attempt["error_types"]},
+                               error_types=attempt["error_types"], wrong_slots=attempt["wrong_slots"],
+                               repeated_error=attempt["repeated_error"])
+            if attempt["is_correct"]:
+                return
+            if attempt_no == 1 and strategy in {"B", "C"}:
+                self._learning_log("first_error_hint_shown", when + timedelta(seconds=2), session_id=session_id,
+                                   task_id=str(task["_id"]), attempt_id=str(attempt["_id"]),
+                                   hint_type="fixed_semantic" if strategy == "C" else "first_error")
+            if attempt_no == 2 and strategy == "B" and self.rng.random() < 0.75:
+                hint = True
+                self._learning_log("ai_hint_view", when + timedelta(seconds=5), session_id=session_id,
+                                   task_id=str(task["_id"]), attempt_id=str(attempt["_id"]),
+                                   hint_no=1, hint_type="ai", hint_source="synthetic")
+            if self.rng.random() > self.engagement + 0.35:
+                return  # 放棄這題
+
+    def test(self, test_role, tasks, when):
+        shift = 0.0 if test_role == "pre" else 0.9 + (0.3 if self.student["feedback_strategy"] == "B" else 0.0)
+        for task in tasks:
+            when += timedelta(seconds=self._duration(90))
+            if self.rng.random() < _sigmoid(self.ability - 0.6 + shift):
+                order, indentation = correct_answer(task)["order"], correct_answer(task)["indentation"]
+            else:
+                order, indentation = wrong_submission(self.rng, task, _pick_error(self.rng))
+            self._attempt(task, when, self._duration(90), order, indentation, "test", test_role, 1, 1, False)
+
+    # --- video telemetry --------------------------------------------------
+
+    def watch(self, video, when):
+        duration = float(video["duration_sec"])
+        session = stable_uuid(self.seed, "watch", self.student["student_id"], video["_id"], when.isoformat())
+        position = 0.0
+        seq = 0
+
+        def _event(event_type, at, **fields):
+            nonlocal seq
+            seq += 1
+            doc = {
+                "_id": stable_oid("video_log", self.student["student_id"], len(self.video_logs)),
+                "schema_version": 3,
+                **self._profile(),
+                "event_type": event_type,
+                "video_id": str(video["_id"]),
+                "watch_session_id": session,
+                "client_seq": seq,
+                "video_title": video["title"],
+                "seek_from_sec": None,
+                "seek_to_sec": None,
+                "seek_delta_sec": None,
+                "seek_direction": None,
+                "is_backward_seek": False,
+                "unit_id": video["unit"],
+                "unit": video["unit"],
+                "watch_seconds": fields.get("current_time_sec"),
+                "watch_delta_sec": None,
+                "current_time_sec": None,
+                "video_duration_sec": duration,
+                "playback_rate": {"current": 1.0, "from": None, "to": None, "direction": None},
+                "reached_end": False,
+                "watch_start_at": when,
+                "watch_end_at": at,
+                "page": "student_learning",
+                "source": "StudentLearning.vue",
+                "event_at": at,
+                "event_at_utc": at,
+                "event_at_taiwan": taipei_string(at),
+                "timezone": "Asia/Taipei",
+                "created_at": at,
+                "created_at_utc": at,
+                "created_at_taiwan": taipei_string(at),
+                "updated_at": at,
+                "updated_at_utc": at,
+                "updated_at_taiwan": taipei_string(at),
+            }
+            doc.update(fields)
+            self.video_logs.append(prepare_log_document("video_rewatch_logs", doc))
+
+        at = when
+        _event("video_click", at)
+        _event("video_play", at, current_time_sec=0.0)
+        target = duration if self.rng.random() < 0.55 + 0.4 * self.engagement else duration * self.rng.uniform(0.2, 0.9)
+        while position < target:
+            step = float(self.rng.randint(20, 40))
+            position = min(target, position + step)
+            at += timedelta(seconds=step)
+            _event("video_progress", at, current_time_sec=position, watch_delta_sec=step, watch_seconds=position)
+            if position > 45 and self.rng.random() < 0.06:
+                back_to = max(0.0, position - self.rng.randint(10, 60))
+                _event("video_seek", at, seek_from_sec=position, seek_to_sec=back_to,
+                       seek_delta_sec=round(back_to - position, 3),
+                       seek_direction="backward" if back_to - position <= -5 else "minor_adjustment",
+                       is_backward_seek=back_to - position <= -5, current_time_sec=back_to)
+                position = back_to
+        if position >= duration:
+            _event("video_ended", at, current_time_sec=duration, reached_end=True, watch_seconds=duration)
+        else:
+            _event("video_pause", at, current_time_sec=position, watch_seconds=position)
+            _event("video_leave", at + timedelta(seconds=3), current_time_sec=position, watch_seconds=position)
+        return at
+
+    # --- semester ---------------------------------------------------------
+
+    def run(self, test_tasks):
+        start = self.start
+        self.test("pre", test_tasks, class_time(self.rng, start))
+        videos_per_week = max(1, int(math.ceil(len(self.videos) / max(1, self.weeks - 2))))
+        for week in range(1, self.weeks - 1):
+            if week >= self.dropout_week:
+                break
+            week_start = start + timedelta(weeks=week)
+            for video in self.videos[(week - 1) * videos_per_week: week * videos_per_week]:
+                if self.rng.random() > self.engagement:
+                    continue
+                when = class_time(self.rng, week_start)
+                when = self.watch(video, when)
+                if self.rng.random() < 0.25:
+                    when = self.watch(video, when + timedelta(minutes=self.rng.randint(5, 600)))
+                for task in self.tasks_by_video[str(video["_id"])]:
+                    if self.rng.random() < 0.4 + 0.6 * self.engagement:
+                        self.practice(task, when + timedelta(minutes=self.rng.randint(1, 20)), week)
+        if self.dropout_week > self.weeks:
+            self.test("post", test_tasks, class_time(self.rng, start + timedelta(weeks=self.weeks - 1)))
+        return self
+
+
+# ---------------------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------------------
+
+SEEDED_COLLECTIONS = (
+    "users",
+    SLOT_COLLECTION,
+    "videos",
+    "parsons_tasks",
+    "parsons_attempts_v2",
+    "learning_logs",
+    "video_rewatch_logs",
+)
+
+
+class BatchWriter:
+    def __init__(self, db):
+        self.db = db
+        self.pending = {}
+        self.counts = {}
+
+    def add(self, collection, docs):
+        bucket = self.pending.setdefault(collection, [])
+        bucket.extend(docs)
+        if len(bucket) >= BATCH_SIZE:
+            self.flush(collection)
+
+    def flush(self, collection=None):
+        for name in [collection] if collection else list(self.pending):
+            docs = self.pending.get(name) or []
+            if docs:
+                self.db[name].insert_many(docs, ordered=False)
+                self.counts[name] = self.counts.get(name, 0) + len(docs)
+            self.pending[name] = []
+
+
+def generate(db, students, seed, start_date, weeks, units, videos_per_unit, password):
+    start = semester_start(start_date)
+    password_hash = seeded_password_hash(password, seed)
+    videos, tasks = build_catalog(units, videos_per_unit, start)
+    tasks_by_video = {}
+    for task in tasks:
+        tasks_by_video.setdefault(task["video_id"], []).append(task)
+    # 前後測沿用每個單元第一部影片的 L2 題目。
+    test_tasks = [task for task in tasks if task["level"] == "L2"][::videos_per_unit]
+    slots = build_slots(students, seed, start - timedelta(days=30))
+    users = build_students(students, seed, password_hash, start, slots)
+
+    for name in ("learning_logs", "video_rewatch_logs"):
+        ensure_log_collection(db, name)
+    writer = BatchWriter(db)
+    writer.add("videos", videos)
+    writer.add("parsons_tasks", tasks)
+    writer.add(SLOT_COLLECTION, slots)
+    writer.add("users", staff_users(password_hash, start) + users)
+    for position, user in enumerate(users, start=1):
+        semester = StudentSemester(seed, user, videos, tasks_by_video, start, weeks).run(test_tasks)
+        writer.add("parsons_attempts_v2", semester.attempts)
+        writer.add("learning_logs", semester.learning_logs)
+        writer.add("video_rewatch_logs", semester.video_logs)
+        if position % 500 == 0:
+            print(f"  {position}/{len(users)} students")
+    writer.flush()
+    return writer.counts
+
+
+def seed_command(client, args):
+    database = args.database
+    if database == os.environ.get("MONGO_DATABASE", "thesis_system") and not args.allow_configured_database:
+        print(f"Refusing to seed {database}: it is the configured MONGO_DATABASE (use another --database).")
+        return 2
+    db = client[database]
+    existing = [name for name in SEEDED_COLLECTIONS if db[name].estimated_document_count()]
+    if existing and not args.drop:
+        print(f"{database} already has data in {existing}; pass --drop to replace it.")
+        return 2
+    for name in SEEDED_COLLECTIONS if args.drop else ():
+        db.drop_collection(name)
+
+    students = args.students or SCALES[args.scale]
+    started = time.perf_counter()
+    print(f"Seeding {students} students into {database} (seed {args.seed}, {args.weeks} weeks)")
+    counts = generate(db, students, args.seed, args.start_date, args.weeks, args.units, args.videos_per_unit, args.password)
+    db.bench_meta.replace_one(
+        {"_id": "seed"},
+        {"_id": "seed", "students": students, "seed": args.seed, "weeks": args.weeks, "counts": counts,
+         "start_date": args.start_date, "seeded_at": datetime.now(timezone.utc)},
+        upsert=True,
+    )
+    for name, count in sorted(counts.items()):
+        print(f"  {name}: {count}")
+    print(f"Done in {time.perf_counter() - started:.1f}s; run scripts/create_indexes.py with MONGO_DATABASE={database} before benchmarking.")
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+BENCH_ENDPOINTS = (
+    "/api/teacher/analysis/parsons?activity_type=practice",
+    "/api/teacher/analysis/parsons?activity_type=test&test_role=pre",
+    "/api/teacher/analysis/video-rewatch",
+    "/api/teacher/analytics/student-options",
+    "/api/teacher/export/student-summary.csv",
+    "/api/teacher/export/learning-logs.csv",
+    "/api/teacher/export/video-rewatch-logs.csv",
+    "/api/teacher/export/group-learning-data.zip",
+)
+
+
+def scaling_exponents(results):
+    """``{endpoint: exponent}`` between the smallest and largest recorded scales."""
+    scales = sorted(results, key=int)
+    if len(scales) < 2:
+        return {}
+    low, high = scales[0], scales[-1]
+    exponents = {}
+    for endpoint, seconds in results[high].items():
+        base = results[low].get(endpoint)
+        if base and seconds and int(high) > int(low):
+            exponents[endpoint] = math.log(seconds / base) / math.log(int(high) / int(low))
+    return exponents
+
+
+def bench_command(args):
+    # app.db 在匯入本模組時就已依 MONGO_DATABASE 連線，因此由環境變數指定資料庫。
+    from app import create_app
+    from app.db import db
+
+    meta = db.bench_meta.find_one({"_id": "seed"})
+    if not meta:
+        print(f"{db.name} was not seeded by this tool; set MONGO_DATABASE to a seeded database.")
+        return 2
+    token = stable_uuid("bench", db.name, time.time())
+    db.users.update_one(
+        {"student_id": "bench_admin"},
+        {"$set": {"active_session_id": token, "active_last_seen_at": datetime.now(timezone.utc)}},
+    )
+    app = create_app()
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    timings = {}
+    print(f"{db.name}: {meta['students']} students")
+    for endpoint in BENCH_ENDPOINTS:
+        samples = []
+        status = None
+        for _ in range(max(1, args.repeat)):
+            started = time.perf_counter()
+            response = client.get(endpoint, headers=headers)
+            samples.append(time.perf_counter() - started)
+            status = response.status_code
+        timings[endpoint] = statistics.median(samples)
+        print(f"  {endpoint:<64} {timings[endpoint] * 1000:>9.0f} ms  (HTTP {status})")
+
+    results = {}
+    if args.results and os.path.exists(args.results):
+        with open(args.results, encoding="utf-8") as handle:
+            results = json.load(handle)
+    results[str(meta["students"])] = timings
+    if args.results:
+        with open(args.results, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+
+    exponents = scaling_exponents(results)
+    if exponents:
+        scales = sorted(results, key=int)
+        print(f"\n== Scaling {scales[0]} -> {scales[-1]} students (1.0 = linear) ==")
+        for endpoint, exponent in sorted(exponents.items(), key=lambda item: -item[1]):
+            flag = "  SUPER-LINEAR" if exponent > SUPER_LINEAR_EXPONENT else ""
+            print(f"  {endpoint:<64} {exponent:5.2f}{flag}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    seed_parser = subparsers.add_parser("seed")
+    seed_parser.add_argument("--database", required=True)
+    seed_parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    seed_parser.add_argument("--students", type=int)
+    seed_parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    seed_parser.add_argument("--start-date", default=DEFAULT_START_DATE)
+    seed_parser.add_argument("--weeks", type=int, default=18)
+    seed_parser.add_argument("--units", type=int, default=6)
+    seed_parser.add_argument("--videos-per-unit", type=int, default=2)
+    seed_parser.add_argument("--password", default=DEFAULT_PASSWORD)
+    seed_parser.add_argument("--drop", action="store_true")
+    seed_parser.add_argument("--allow-configured-database", action="store_true")
+    bench_parser = subparsers.add_parser("bench")
+    bench_parser.add_argument("--repeat", type=int, default=3)
+    bench_parser.add_argument("--results")
+    args = parser.parse_args()
+
+    try:
+        if args.action == "bench":
+            return bench_command(args)
+        client = MongoClient(
+            os.environ.get("MONGO_URI", "mongodb://127.0.0.1:27017"),
+            serverSelectionTimeoutMS=5000,
+        )
+        try:
+            client.admin.command("ping")
+            return seed_command(client, args)
+        finally:
+            client.close()
+    except (ServerSelectionTimeoutError, ConnectionFailure):
+        print("MongoDB 連線失敗，請確認 MongoDB 是否已啟動。")
+        return 1
+    except PyMongoError as exc:
+        print("MongoDB 操作失敗：", repr(exc))
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())